@@ -3,6 +3,7 @@ import json
 import os
 from dotenv import load_dotenv
 from .config import get_config
+from . import replicas, fragment_cache, logs, metrics, profiler, compression, assets, search, analytics
 
 # Load environment variables from .flaskenv
 load_dotenv('.flaskenv')
@@ -12,7 +13,6 @@ from .extensions import (
 	login_manager,
 	csrf_protect,
 	limiter,
-	oauth,
 )
 
 
@@ -31,26 +31,39 @@ def create_app(config_name: str | None = None) -> Flask:
 
 	# init extensions
 	db.init_app(app)
+	replicas.init_app(app)
+	fragment_cache.init_app(app)
 	migrate.init_app(app, db)
 	login_manager.init_app(app)
 	login_manager.login_view = 'auth.login'
 	csrf_protect.init_app(app)
+	logs.init_app(app)
+	metrics.init_app(app)
+	profiler.init_app(app)
+	compression.init_app(app)
+	assets.init_app(app)
+	search.init_app(app)
 	limiter.init_app(app)
-	oauth.init_app(app)
 	
 	# Exempt markdown rendering endpoint from CSRF protection
 	csrf_protect.exempt('posts.render_markdown')
 
 	# register blueprints
-	from .auth import bp as auth_bp
-	from .posts import bp as posts_bp
+	from .auth import bp as auth_bp, oidc
+	from .posts import bp as posts_bp, autosave, hooks
 	from .ai import bp as ai_bp
 	from .main import bp as main_bp
+	from .public import bp as public_bp
 
 	app.register_blueprint(auth_bp, url_prefix='/auth')
 	app.register_blueprint(posts_bp, url_prefix='/posts')
 	app.register_blueprint(ai_bp, url_prefix='/api/ai')
 	app.register_blueprint(main_bp)
+	app.register_blueprint(public_bp)
+	autosave.init_app(app)
+	hooks.init_app(app)
+	analytics.init_app(app)
+	oidc.init_app(app)
 	
 	# Add custom Jinja2 filters
 	@app.template_filter('from_json')
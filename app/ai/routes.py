@@ -1,11 +1,89 @@
-from flask import request, jsonify
+from flask import current_app, request, jsonify
 from flask_login import login_required, current_user
-from . import bp
+from . import bp, usage
+from .. import asgi, metrics, singleflight
 from ..extensions import limiter, db
 from ..models import Blog
-from google import genai
+import asyncio
 import os
 import json
+import time
+
+# google.genai is imported on the first AI call; it is slower to import than the rest of the app
+genai = None
+
+
+def _genai():
+	global genai
+	if genai is None:
+		from google import genai as sdk
+		genai = sdk
+	return genai
+
+
+# Building a client takes ~100 ms, so keep one per SDK and key
+_clients = {}
+
+
+def _client():
+	api_key = os.getenv('GEMINI_API_KEY')
+	sdk = _genai()
+	client = _clients.get((sdk, api_key))
+	if client is None:
+		client = _clients[(sdk, api_key)] = sdk.Client(api_key=api_key)
+	return client
+
+
+async def _generate(endpoint: str, prompt: str) -> str:
+	"""The model's text for ``prompt``, with the cost of the call held against the user's budget.
+
+	Identical calls by the same user while one is running (a double-click, a
+	second tab) wait for it and share its text instead of paying again. Only
+	the provider's async client is awaited on the event loop; the ledger and
+	lock rows are written in threads.
+	"""
+	model = current_app.config.get('AI_MODEL', 'gemini-2.0-flash')
+	# Loaded by login_required, and not expired until the view commits
+	user_id = current_user.id
+	# Under WSGI the login check's transaction is still open; waiting on the leader or the model shouldn't hold its connection
+	await asyncio.to_thread(db.session.close)
+	return await singleflight.do_async(
+		'ai', (user_id, endpoint, model, prompt), lambda: _call_model(user_id, endpoint, model, prompt), shared=True,
+	)
+
+
+async def _call_model(user_id: int, endpoint: str, model: str, prompt: str) -> str:
+	reservation = await asgi.to_thread(usage.reserve, user_id, endpoint, model, prompt)
+	started = time.perf_counter()
+	try:
+		client = await asyncio.to_thread(_client)
+		response = await client.aio.models.generate_content(model=model, contents=prompt)
+	except Exception:
+		metrics.AI_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, model=model, outcome='error')
+		await asgi.to_thread(usage.release, reservation)
+		raise
+	metrics.AI_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, model=model, outcome='ok')
+	prompt_tokens, output_tokens = await asgi.to_thread(usage.settle, reservation, response, prompt)
+	metrics.AI_TOKENS.inc(prompt_tokens, endpoint=endpoint, model=model, kind='prompt')
+	metrics.AI_TOKENS.inc(output_tokens, endpoint=endpoint, model=model, kind='output')
+	return response.text
+
+
+def _own_blog(blog_id) -> Blog | None:
+	return Blog.query.filter_by(id=blog_id, user_id=current_user.id).first()
+
+
+def _save(blog: Blog, field: str, value: str) -> None:
+	db.session.add(blog)
+	setattr(blog, field, value)
+	db.session.commit()
+
+
+def _budget_exceeded(e: usage.BudgetExceeded):
+	response = jsonify({'error': 'AI budget exceeded', 'scope': e.scope})
+	response.status_code = 429
+	response.headers['Retry-After'] = str(e.retry_after)
+	return response
 
 
 @bp.post('/summarize')
@@ -22,7 +100,7 @@ def summarize():
 @bp.post('/blog-to-linkedin')
 @limiter.limit('5/minute;100/day')
 @login_required
-def blog_to_linkedin():
+async def blog_to_linkedin():
 	"""Convert blog post to LinkedIn post using Gemini AI and return the LinkedIn"""
 	try:
 		blog_id = request.json.get('blog_id') if request.is_json else None
@@ -30,13 +108,10 @@ def blog_to_linkedin():
 			return jsonify({'error': 'blog_id required'}), 400
 		
 		# Get the blog
-		blog = Blog.query.filter_by(id=blog_id, user_id=current_user.id).first()
+		blog = await asgi.to_thread(_own_blog, blog_id)
 		if not blog:
 			return jsonify({'error': 'Blog not found'}), 404
 		
-		# Configure Gemini
-		client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-		
 		# Create prompt for LinkedIn conversion
 		prompt = f"""Convert this blog post into a professional LinkedIn post:
 
@@ -56,28 +131,24 @@ Requirements:
 
 Generate a LinkedIn post that captures the essence of the blog while being optimized for LinkedIn's professional audience."""
 		
-		response = client.models.generate_content(
-			model='gemini-2.0-flash',
-			contents=prompt
-		)
-		
-		linkedin_content = response.text.strip()
+		linkedin_content = (await _generate('linkedin', prompt)).strip()
 		
 		# Save to database
-		blog.linkedin_content = linkedin_content
-		db.session.commit()
+		await asgi.to_thread(_save, blog, 'linkedin_content', linkedin_content)
 		
 		return jsonify({'linkedin_content': linkedin_content})
 		
-	except Exception as e:
-		print(f"Error generating LinkedIn content: {e}")
+	except usage.BudgetExceeded as e:
+		return _budget_exceeded(e)
+	except Exception:
+		current_app.logger.exception('Error generating LinkedIn content')
 		return jsonify({'error': 'Failed to generate LinkedIn content'}), 500
 
 
 @bp.post('/blog-to-twitter-thread')
 @limiter.limit('5/minute;100/day')
 @login_required
-def blog_to_twitter_thread():
+async def blog_to_twitter_thread():
 	"""Convert blog post to Twitter thread using Gemini AI"""
 	try:
 		blog_id = request.json.get('blog_id') if request.is_json else None
@@ -85,13 +156,10 @@ def blog_to_twitter_thread():
 			return jsonify({'error': 'blog_id required'}), 400
 		
 		# Get the blog
-		blog = Blog.query.filter_by(id=blog_id, user_id=current_user.id).first()
+		blog = await asgi.to_thread(_own_blog, blog_id)
 		if not blog:
 			return jsonify({'error': 'Blog not found'}), 404
 		
-		# Configure Gemini
-		client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-		
 		# Create prompt for Twitter thread conversion
 		prompt = f"""Convert this blog post into a Twitter thread:
 
@@ -113,13 +181,8 @@ Requirements:
 IMPORTANT: Return ONLY a clean JSON array with no markdown formatting, no code blocks, no extra text. Just the array:
 ["1/5 Tweet content here...", "2/5 Next tweet content...", ...]"""
 		
-		response = client.models.generate_content(
-			model='gemini-2.0-flash',
-			contents=prompt
-		)
-		
 		# Clean up the response and parse JSON
-		response_text = response.text.strip()
+		response_text = (await _generate('twitter-thread', prompt)).strip()
 		
 		# Remove any markdown code blocks or extra formatting
 		if '```json' in response_text:
@@ -154,20 +217,21 @@ IMPORTANT: Return ONLY a clean JSON array with no markdown formatting, no code b
 						twitter_thread.append(line)
 		
 		# Save to database as JSON string
-		blog.twitter_thread = json.dumps(twitter_thread)
-		db.session.commit()
+		await asgi.to_thread(_save, blog, 'twitter_thread', json.dumps(twitter_thread))
 		
 		return jsonify({'twitter_thread': twitter_thread})
 		
-	except Exception as e:
-		print(f"Error generating Twitter thread: {e}")
+	except usage.BudgetExceeded as e:
+		return _budget_exceeded(e)
+	except Exception:
+		current_app.logger.exception('Error generating Twitter thread')
 		return jsonify({'error': 'Failed to generate Twitter thread'}), 500
 
 
 @bp.post('/generate-description')
 @limiter.limit('10/minute;200/day')
 @login_required
-def generate_description():
+async def generate_description():
 	"""Generate a blog description using Gemini AI"""
 	try:
 		data = request.get_json()
@@ -177,9 +241,6 @@ def generate_description():
 		if not title and not content:
 			return jsonify({'error': 'Title or content required'}), 400
 
-		# Configure Gemini
-		client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
-		
 		# Create prompt for description generation
 		prompt = f"""Generate a compelling blog description (max 50 words) for the following blog post:
 
@@ -196,13 +257,7 @@ Requirements:
 
 Generate only the description text, no additional formatting."""
 		
-		response = client.models.generate_content(
-			model='gemini-2.0-flash',
-			contents=prompt
-		)
-		
-
-		description = response.text.strip()
+		description = (await _generate('description', prompt)).strip()
 		
 		# Validate word count
 		word_count = len(description.split())
@@ -213,6 +268,43 @@ Generate only the description text, no additional formatting."""
 		
 		return jsonify({'description': description})
 		
-	except Exception as e:
-		print(f"Error generating description: {e}")
+	except usage.BudgetExceeded as e:
+		return _budget_exceeded(e)
+	except Exception:
+		current_app.logger.exception('Error generating description')
 		return jsonify({'error': 'Failed to generate description'}), 500
+
+
+@bp.get('/usage')
+@login_required
+def my_usage():
+	"""Today's AI spend for the current user against their daily budget"""
+	try:
+		since = usage.day_start(usage.current_hour())
+		spent = usage.spent_micros(since, current_user.id)
+		budget = usage.budget_micros('AI_USER_DAILY_BUDGET')
+		return jsonify({
+			'spent_usd': spent / 1_000_000,
+			'budget_usd': budget / 1_000_000 if budget is not None else None,
+			'remaining_usd': max(budget - spent, 0) / 1_000_000 if budget is not None else None,
+		})
+	except Exception:
+		current_app.logger.exception('Error reading AI usage')
+		return jsonify({'error': 'Failed to read AI usage'}), 500
+
+
+@bp.get('/usage/summary')
+@login_required
+def usage_summary():
+	"""Aggregate AI usage per hour or day, for admins listed in ADMIN_EMAILS"""
+	if not current_user.is_admin:
+		return jsonify({'error': 'Forbidden'}), 403
+	bucket = request.args.get('bucket', 'hour')
+	if bucket not in ('hour', 'day'):
+		return jsonify({'error': 'bucket must be hour or day'}), 400
+	days = min(max(request.args.get('days', 1, type=int), 1), 90)
+	try:
+		return jsonify(usage.summary(days, bucket))
+	except Exception:
+		current_app.logger.exception('Error summarizing AI usage')
+		return jsonify({'error': 'Failed to summarize AI usage'}), 500
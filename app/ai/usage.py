@@ -0,0 +1,197 @@
+"""Token and cost accounting for AI calls, with daily budgets.
+
+Each call goes through :func:`reserve` before the model runs and
+:func:`settle` (or :func:`release`) afterwards, all appending rows to the
+:class:`~app.models.AIUsage` ledger. The reservation holds the estimated cost
+against the budgets while the model is working, and settlement corrects it to
+the tokens the provider reports.
+
+The reservation is one ``INSERT ... SELECT`` that only adds the row while the
+day's spend plus the estimate fits every budget. SQLite runs it under the
+write lock and PostgreSQL behind a transaction-level advisory lock, so
+concurrent calls can't all slip under the cap. The spend sums use the indexes
+over ``(user_id, hour)`` and ``(hour)``, starting at the current UTC day.
+
+A model missing from ``AI_MODEL_PRICES`` is refused rather than counted as
+free, so changing ``AI_MODEL`` can't switch the budgets off.
+"""
+import math
+import time
+
+import sqlalchemy as sa
+from flask import current_app
+
+from ..extensions import db
+from ..models import AIUsage
+
+
+# Output tokens assumed for the reservation, before the real count is known
+OUTPUT_TOKEN_ESTIMATES = {
+	'linkedin': 600,
+	'twitter-thread': 1000,
+	'description': 120,
+}
+DEFAULT_OUTPUT_TOKENS = 500
+
+
+# Key of the PostgreSQL advisory lock serializing reservations
+ADVISORY_LOCK = 0x41490001
+
+
+class UnpricedModel(Exception):
+	"""Raised for a model with no entry in ``AI_MODEL_PRICES``."""
+
+	def __init__(self, model: str):
+		super().__init__(f'no price configured for AI model {model!r}')
+		self.model = model
+
+
+class BudgetExceeded(Exception):
+	"""Raised by :func:`reserve` when a call would go over a daily budget."""
+
+	def __init__(self, scope: str, retry_after: int):
+		super().__init__(f'{scope} AI budget exceeded')
+		self.scope = scope
+		self.retry_after = retry_after
+
+
+def current_hour() -> int:
+	return int(time.time() // 3600)
+
+
+def day_start(hour: int) -> int:
+	return hour - hour % 24
+
+
+def estimate_tokens(text: str) -> int:
+	# About four characters per token for English prose
+	return len(text or '') // 4 + 1
+
+
+def cost_micros(model: str, prompt_tokens: int, output_tokens: int) -> int:
+	"""Cost in millionths of a dollar, rounded up."""
+	prices = current_app.config.get('AI_MODEL_PRICES', {})
+	if model not in prices:
+		current_app.logger.error(f'AI model {model!r} has no price in AI_MODEL_PRICES; refusing the call')
+		raise UnpricedModel(model)
+	input_price, output_price = prices[model]
+	return math.ceil(prompt_tokens * input_price + output_tokens * output_price)
+
+
+def budget_micros(name: str) -> int | None:
+	value = current_app.config.get(name)
+	if value in (None, ''):
+		return None
+	return int(float(value) * 1_000_000)
+
+
+def _spent(since_hour: int, user_id: int | None = None):
+	query = sa.select(sa.func.coalesce(sa.func.sum(AIUsage.cost_micros), 0)).where(AIUsage.hour >= since_hour)
+	if user_id is not None:
+		query = query.where(AIUsage.user_id == user_id)
+	return query
+
+
+def spent_micros(since_hour: int, user_id: int | None = None) -> int:
+	return db.session.execute(_spent(since_hour, user_id)).scalar()
+
+
+def reserve(user_id: int, endpoint: str, model: str, prompt: str) -> AIUsage:
+	"""Append the estimated cost of a call, or raise :class:`BudgetExceeded`."""
+	hour = current_hour()
+	since = day_start(hour)
+	estimate = cost_micros(model, estimate_tokens(prompt), OUTPUT_TOKEN_ESTIMATES.get(endpoint, DEFAULT_OUTPUT_TOKENS))
+	retry_after = (since + 24) * 3600 - int(time.time())
+	scopes = [
+		(scope, budget, owner)
+		for scope, name, owner in (('user', 'AI_USER_DAILY_BUDGET', user_id), ('global', 'AI_GLOBAL_DAILY_BUDGET', None))
+		if (budget := budget_micros(name)) is not None
+	]
+
+	values = {'user_id': user_id, 'hour': hour, 'endpoint': endpoint, 'model': model, 'calls': 1, 'cost_micros': estimate}
+	row = sa.select(*(sa.literal(value).label(column) for column, value in values.items())).where(*(
+		_spent(since, owner).scalar_subquery() + estimate <= budget for _, budget, owner in scopes
+	))
+	if db.session.get_bind(clause=sa.insert(AIUsage)).dialect.name == 'postgresql':
+		db.session.execute(sa.select(sa.func.pg_advisory_xact_lock(ADVISORY_LOCK)))
+	inserted = db.session.execute(sa.insert(AIUsage).from_select(list(values), row)).rowcount
+	db.session.commit()
+	if not inserted:
+		for scope, budget, owner in scopes:
+			if spent_micros(since, owner) + estimate > budget:
+				raise BudgetExceeded(scope, retry_after)
+		# Spend fell back under the cap since the insert; report the narrowest scope
+		raise BudgetExceeded(scopes[0][0], retry_after)
+	return AIUsage(**values)
+
+
+def settle(reservation: AIUsage, response, prompt: str) -> tuple[int, int]:
+	"""Replace the estimate with the tokens reported in ``response.usage_metadata``.
+
+	Returns:
+		tuple: ``(prompt_tokens, output_tokens)`` as recorded.
+	"""
+	metadata = getattr(response, 'usage_metadata', None)
+	prompt_tokens = getattr(metadata, 'prompt_token_count', None) or estimate_tokens(prompt)
+	output_tokens = getattr(metadata, 'candidates_token_count', None) or estimate_tokens(response.text)
+	actual = cost_micros(reservation.model, prompt_tokens, output_tokens)
+	_append(reservation, prompt_tokens=prompt_tokens, output_tokens=output_tokens,
+		cost_micros=actual - reservation.cost_micros)
+	return prompt_tokens, output_tokens
+
+
+def release(reservation: AIUsage) -> None:
+	"""Cancel the estimate of a call that failed before producing anything."""
+	_append(reservation, calls=-1, cost_micros=-reservation.cost_micros)
+
+
+def _append(reservation: AIUsage, **values) -> None:
+	db.session.add(AIUsage(
+		user_id=reservation.user_id, hour=reservation.hour,
+		endpoint=reservation.endpoint, model=reservation.model, **values,
+	))
+	db.session.commit()
+
+
+def summary(days: int, bucket: str = 'hour', top: int = 10) -> dict:
+	"""Usage per time bucket and the top spenders over the last ``days`` days."""
+	since = day_start(current_hour()) - (days - 1) * 24
+	width = 24 if bucket == 'day' else 1
+	totals = (
+		sa.func.sum(AIUsage.calls).label('calls'),
+		sa.func.sum(AIUsage.prompt_tokens).label('prompt_tokens'),
+		sa.func.sum(AIUsage.output_tokens).label('output_tokens'),
+		sa.func.sum(AIUsage.cost_micros).label('cost_micros'),
+	)
+	start = (AIUsage.hour // width * width).label('start')
+	buckets = db.session.execute(
+		sa.select(start, *totals).where(AIUsage.hour >= since).group_by(start).order_by(start)
+	).all()
+	users = db.session.execute(
+		sa.select(AIUsage.user_id, *totals)
+		.where(AIUsage.hour >= since)
+		.group_by(AIUsage.user_id)
+		.order_by(sa.desc('cost_micros'))
+		.limit(top)
+	).all()
+	return {
+		'bucket': bucket,
+		'since': _hour_to_iso(since),
+		'buckets': [_row(row, start=_hour_to_iso(row.start)) for row in buckets],
+		'top_users': [_row(row, user_id=row.user_id) for row in users],
+		'total': _row(db.session.execute(sa.select(*totals).where(AIUsage.hour >= since)).one()),
+	}
+
+
+def _row(row, **extra) -> dict:
+	return {
+		**extra,
+		'calls': row.calls or 0,
+		'prompt_tokens': row.prompt_tokens or 0,
+		'output_tokens': row.output_tokens or 0,
+		'cost_usd': (row.cost_micros or 0) / 1_000_000,
+	}
+
+
+def _hour_to_iso(hour: int) -> str:
+	return time.strftime('%Y-%m-%dT%H:00:00Z', time.gmtime(hour * 3600))
@@ -0,0 +1,202 @@
+"""Buffered view and read-through counters.
+
+Opening a post in the dashboard overlay (``/api/blog/<id>``) or on its public
+page counts a view; the overlay reports a read-through once the reader
+scrolls to the end (``POST /api/blog/<id>/read``). Counting must not write on
+every hit - SQLite would serialize every reader behind the write lock - so
+each worker adds events up in memory and writes them every
+``ANALYTICS_FLUSH_INTERVAL`` seconds, or once ``ANALYTICS_MAX_PENDING`` posts
+are waiting, as one batched upsert into hourly :class:`~app.models.PostViews`
+buckets. Pending counts are flushed on interpreter shutdown; a crash loses at
+most one interval of them.
+
+The dashboard's "popular" sort ranks posts by :func:`popularity` over the last
+``ANALYTICS_POPULAR_DAYS`` days.
+"""
+import atexit
+import threading
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from .extensions import db
+from .models import Blog, PostViews
+
+SORTS = ('latest', 'popular')
+
+
+def hour(moment: datetime | None = None) -> datetime:
+	"""Start of the bucket ``moment`` (default now, UTC) falls in."""
+	return (moment or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+
+
+class ViewCounter:
+	"""Adds up views and read-throughs per post and hour until they are flushed."""
+
+	def __init__(self, app, interval: float = 10.0, max_pending: int = 1000):
+		self.app = app
+		self.interval = interval
+		self.max_pending = max_pending
+		self._pending: dict[tuple[int, datetime], list[int]] = {}
+		self._lock = threading.Lock()
+		self._flush_lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = None
+
+	def add(self, blog_id: int, views: int = 0, reads: int = 0) -> None:
+		key = (blog_id, hour())
+		with self._lock:
+			counts = self._pending.setdefault(key, [0, 0])
+			counts[0] += views
+			counts[1] += reads
+			full = len(self._pending) >= self.max_pending
+		if self.interval <= 0 or full:
+			self.flush()
+		else:
+			self._ensure_thread()
+
+	def pending(self, blog_id: int) -> dict[datetime, tuple[int, int]]:
+		"""Unflushed ``(views, reads)`` of ``blog_id`` by bucket."""
+		with self._lock:
+			return {bucket: tuple(counts) for (pending_id, bucket), counts in self._pending.items() if pending_id == blog_id}
+
+	def flush(self) -> int:
+		"""Write every pending bucket in a single transaction. Returns how many."""
+		with self._flush_lock:
+			with self._lock:
+				batch, self._pending = self._pending, {}
+			if not batch:
+				return 0
+			try:
+				# A context of its own: the write must not join, commit or pin the request's session
+				with self.app.app_context():
+					_write_batch(batch)
+			except Exception as e:
+				# Add the counts back so the next flush retries them
+				with self._lock:
+					for key, (views, reads) in batch.items():
+						counts = self._pending.setdefault(key, [0, 0])
+						counts[0] += views
+						counts[1] += reads
+				self.app.logger.error(f'View counter flush failed: {e}')
+				return 0
+			return len(batch)
+
+	def _ensure_thread(self) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._thread = threading.Thread(target=self._run, name='analytics-flusher', daemon=True)
+		self._thread.start()
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self.flush()
+
+	def close(self) -> None:
+		"""Stop the flusher thread and write anything still pending."""
+		self._stop.set()
+		self.flush()
+
+
+def _write_batch(batch: dict) -> None:
+	# Posts deleted since they were viewed would break the foreign key
+	existing = set(db.session.execute(
+		sa.select(Blog.id).where(Blog.id.in_({blog_id for blog_id, _ in batch}))
+	).scalars())
+	rows = [
+		{'blog_id': blog_id, 'bucket': bucket, 'views': views, 'reads': reads}
+		for (blog_id, bucket), (views, reads) in batch.items() if blog_id in existing
+	]
+	if rows:
+		_upsert(rows)
+	db.session.commit()
+
+
+def _dialect() -> str:
+	return db.session.get_bind(clause=sa.update(PostViews)).dialect.name
+
+
+def _upsert(rows: list[dict]) -> None:
+	"""Add ``rows`` onto their buckets, creating missing ones, in one statement where the database allows."""
+	dialect = _dialect()
+	if dialect in ('sqlite', 'postgresql'):
+		if dialect == 'sqlite':
+			from sqlalchemy.dialects.sqlite import insert
+		else:
+			from sqlalchemy.dialects.postgresql import insert
+		statement = insert(PostViews)
+		db.session.execute(statement.on_conflict_do_update(
+			index_elements=[PostViews.blog_id, PostViews.bucket],
+			set_={'views': PostViews.views + statement.excluded.views, 'reads': PostViews.reads + statement.excluded.reads},
+		), rows)
+		return
+	existing = {tuple(key) for key in db.session.execute(
+		sa.select(PostViews.blog_id, PostViews.bucket)
+		.where(sa.tuple_(PostViews.blog_id, PostViews.bucket).in_([(row['blog_id'], row['bucket']) for row in rows]))
+	)}
+	updates = [
+		{'b_blog_id': row['blog_id'], 'b_bucket': row['bucket'], 'b_views': row['views'], 'b_reads': row['reads']}
+		for row in rows if (row['blog_id'], row['bucket']) in existing
+	]
+	if updates:
+		db.session.execute(
+			sa.update(PostViews.__table__)
+			.where(PostViews.blog_id == sa.bindparam('b_blog_id'), PostViews.bucket == sa.bindparam('b_bucket'))
+			.values(views=PostViews.views + sa.bindparam('b_views'), reads=PostViews.reads + sa.bindparam('b_reads')),
+			updates,
+		)
+	inserts = [row for row in rows if (row['blog_id'], row['bucket']) not in existing]
+	if inserts:
+		db.session.execute(sa.insert(PostViews), inserts)
+
+
+def get_counter() -> ViewCounter:
+	return current_app.extensions['analytics']
+
+
+def record_view(blog_id: int) -> None:
+	get_counter().add(blog_id, views=1)
+
+
+def record_read(blog_id: int) -> None:
+	get_counter().add(blog_id, reads=1)
+
+
+def popularity(query, days: int | None = None) -> list[tuple[int, int]]:
+	"""``(blog_id, views)`` of the posts in ``query`` viewed in the last ``days``, most viewed first."""
+	days = days or current_app.config.get('ANALYTICS_POPULAR_DAYS', 7)
+	ids = query.with_entities(Blog.id).order_by(None).subquery()
+	views = sa.func.sum(PostViews.views).label('views')
+	return [tuple(row) for row in db.session.execute(
+		sa.select(PostViews.blog_id, views)
+		.where(PostViews.blog_id.in_(sa.select(ids.c.id)), PostViews.bucket >= hour() - timedelta(days=days))
+		.group_by(PostViews.blog_id)
+		.order_by(views.desc(), PostViews.blog_id)
+	)]
+
+
+def daily(blog_id: int, days: int = 30) -> list[dict]:
+	"""Views and read-throughs of ``blog_id`` per UTC day, oldest first, including unflushed counts."""
+	since = hour().replace(hour=0) - timedelta(days=days - 1)
+	stored = db.session.execute(
+		sa.select(PostViews.bucket, PostViews.views, PostViews.reads)
+		.where(PostViews.blog_id == blog_id, PostViews.bucket >= since)
+	).all()
+	unflushed = [(bucket, views, reads) for bucket, (views, reads) in get_counter().pending(blog_id).items() if bucket >= since]
+	totals = {}
+	for bucket, views, reads in stored + unflushed:
+		day = totals.setdefault(bucket.date(), [0, 0])
+		day[0] += views
+		day[1] += reads
+	return [{'date': day.isoformat(), 'views': v, 'reads': r} for day, (v, r) in sorted(totals.items())]
+
+
+def init_app(app) -> None:
+	counter = ViewCounter(
+		app,
+		interval=app.config.get('ANALYTICS_FLUSH_INTERVAL', 10.0),
+		max_pending=app.config.get('ANALYTICS_MAX_PENDING', 1000),
+	)
+	app.extensions['analytics'] = counter
+	atexit.register(counter.close)
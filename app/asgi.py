@@ -0,0 +1,308 @@
+"""ASGI serving mode: ``uvicorn asgi:app``.
+
+Under a WSGI server every in-flight request holds a worker thread, including
+one that spends seconds waiting on the AI provider. :class:`ASGIBridge` serves
+the same Flask app from an event loop instead:
+
+* sync views are served by a2wsgi's ``WSGIMiddleware`` in a pool of
+  ``ASGI_THREADS`` (default 32) threads, as under a threaded WSGI server;
+* ``async def`` views are awaited on the event loop. Flask's hooks and the
+  view's decorators (session, login, rate limits) run in a thread first, and
+  the view passes its own database work to :func:`to_thread`, so the loop
+  only awaits slow I/O such as the provider's async client and hundreds of
+  requests can wait at once without a thread each. No step keeps a pooled
+  connection while the request awaits, or requests waiting on the loop could
+  starve the steps that would release theirs. Under WSGI, Flask runs the same
+  views to completion in the request's thread;
+* WebSocket connections to a view marked with :func:`websocket` are handed to
+  its async handler on the loop. Handshakes from another origin are rejected,
+  as browsers send cookies with them.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import io
+from urllib.parse import urlsplit
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import request_started
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Response
+
+from .extensions import db
+
+# Set while an async view is dispatched from the loop, so the app hands back its coroutine
+_on_loop = contextvars.ContextVar('asgi_on_loop', default=False)
+
+# Strong references to spawned tasks, which the loop only holds weakly
+_tasks = set()
+
+
+def websocket(handler):
+	"""Serve WebSocket connections to the decorated view's URL with ``await handler(socket)``.
+
+	The handler gets a :class:`WebSocket` and runs on the event loop inside a
+	request context for the handshake, so ``session`` and ``request`` work as
+	in a view; ``current_user`` loads the user, so read it in a thread. It
+	should :meth:`WebSocket.accept` or :meth:`WebSocket.close` first. The view
+	itself still answers plain HTTP requests, e.g. under a WSGI server.
+	"""
+	def decorator(view):
+		view.websocket = handler
+		return view
+	return decorator
+
+
+def is_async_view(view) -> bool:
+	return view is not None and inspect.iscoroutinefunction(inspect.unwrap(view))
+
+
+def _closing(fn, *args):
+	try:
+		return fn(*args)
+	finally:
+		db.session.close()
+
+
+async def to_thread(fn, *args):
+	"""Run the database work ``fn(*args)`` of an async view or handler in a thread.
+
+	The session is closed afterwards, so the request holds no pooled
+	connection while it awaits. Objects it loaded stay readable but are
+	detached; add one back to the session before changing it.
+	"""
+	return await asyncio.to_thread(_closing, fn, *args)
+
+
+def spawn(coroutine) -> asyncio.Task:
+	"""Run ``coroutine`` as a task of its own on the event loop."""
+	task = asyncio.ensure_future(coroutine)
+	_tasks.add(task)
+	task.add_done_callback(_tasks.discard)
+	return task
+
+
+class WebSocket:
+	"""A WebSocket connection, used from the event loop. Text frames only."""
+
+	def __init__(self, receive, send):
+		self._receive = receive
+		self._send = send
+		# Frames may be sent from several tasks, e.g. a handler and its jobs
+		self._lock = asyncio.Lock()
+		self.closed = False
+
+	async def _put(self, message: dict) -> None:
+		async with self._lock:
+			await self._send(message)
+
+	async def accept(self) -> None:
+		await self._put({'type': 'websocket.accept'})
+
+	async def receive(self) -> str | None:
+		"""The next frame, or ``None`` once the client has gone."""
+		while not self.closed:
+			message = await self._receive()
+			if message['type'] == 'websocket.disconnect':
+				self.closed = True
+			elif message['type'] == 'websocket.receive':
+				text = message.get('text')
+				return text if text is not None else message.get('bytes', b'').decode('utf-8', 'replace')
+		return None
+
+	async def send(self, text: str) -> None:
+		if self.closed:
+			return
+		try:
+			await self._put({'type': 'websocket.send', 'text': text})
+		except OSError:  # the client went away mid-send
+			self.closed = True
+
+	async def close(self, code: int = 1000) -> None:
+		"""Close the connection; before :meth:`accept` this rejects the handshake."""
+		if self.closed:
+			return
+		self.closed = True
+		try:
+			await self._put({'type': 'websocket.close', 'code': code})
+		except OSError:
+			pass
+
+
+def _same_origin(environ) -> bool:
+	origin = environ.get('HTTP_ORIGIN')
+	return origin is None or urlsplit(origin).netloc == environ.get('HTTP_HOST')
+
+
+def _environ(scope, body) -> dict:
+	"""The WSGI environ for an ASGI HTTP or WebSocket ``scope``."""
+	scope = {'query_string': b'', 'http_version': '1.1', **scope}
+	if scope['type'] == 'websocket':
+		scope.update(method='GET', scheme={'wss': 'https'}.get(scope.get('scheme'), 'http'))
+	environ = build_environ(scope, body)
+	# The body is read in full first, so it can be read without a Content-Length
+	environ['wsgi.input_terminated'] = True
+	return environ
+
+
+def _view(app, environ):
+	try:
+		# Routes are plain HTTP rules, so match a handshake as an ordinary GET
+		endpoint, _ = app.url_map.bind_to_environ(environ).match(websocket=False)
+	except HTTPException:
+		return None
+	return app.view_functions.get(endpoint)
+
+
+def _ensure_sync(ensure_sync, func):
+	"""``app.ensure_sync``, except that async views dispatched from the loop return their coroutine."""
+	if _on_loop.get() and inspect.iscoroutinefunction(func):
+		return func
+	return ensure_sync(func)
+
+
+def _dispatch(app):
+	"""Flask's ``full_dispatch_request`` up to the view; an async view's coroutine comes back unawaited."""
+	try:
+		request_started.send(app, _async_wrapper=app.ensure_sync)
+		rv = app.preprocess_request()
+		return app.dispatch_request() if rv is None else rv
+	except Exception as e:
+		return app.handle_user_exception(e)
+
+
+def _handle(handler, error):
+	"""``handler(error)`` while ``error`` is being handled; Flask's handlers re-raise it with a bare ``raise``."""
+	try:
+		raise error
+	except Exception:
+		return handler(error)
+
+
+def _encode(response, environ) -> tuple[int, list, bytes]:
+	app_iter, status, headers = response.get_wsgi_response(environ)
+	try:
+		body = b''.join(app_iter)
+	finally:
+		if hasattr(app_iter, 'close'):
+			app_iter.close()
+	return int(status.split(' ', 1)[0]), headers, body
+
+
+async def _serve_on_loop(app, environ) -> tuple[int, list, bytes]:
+	ctx = app.request_context(environ)
+	ctx.push()
+	token = _on_loop.set(True)
+	error = None
+	try:
+		try:
+			rv = await to_thread(_dispatch, app)
+			if inspect.isawaitable(rv):
+				try:
+					rv = await rv
+				except Exception as e:
+					rv = await to_thread(_handle, app.handle_user_exception, e)
+			response = await to_thread(app.finalize_request, rv)
+		except Exception as e:
+			error = e
+			response = await to_thread(_handle, app.handle_exception, e)
+		return await asyncio.to_thread(_encode, response, environ)
+	finally:
+		_on_loop.reset(token)
+		# Removing the session can talk to the database; popping the context then has nothing left to close
+		await asyncio.to_thread(db.session.remove)
+		ctx.pop(error)
+
+
+def _serve_in_thread(app, environ) -> tuple[int, list, bytes]:
+	response = Response.from_app(app, environ, buffered=True)
+	return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+async def dispatch(app, environ) -> tuple[int, list, bytes]:
+	"""``(status, headers, body)`` of the request ``environ`` to an app served by :class:`ASGIBridge`.
+
+	Async views are awaited on the loop and sync ones run in a thread. Either
+	way the request gets an app context, and so a database session, of its
+	own, even when dispatched from inside another request.
+	"""
+	if is_async_view(_view(app, environ)):
+		return await asyncio.create_task(_serve_on_loop(app, environ), context=contextvars.Context())
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(None, contextvars.Context().run, _serve_in_thread, app, environ)
+
+
+class ASGIBridge:
+	"""ASGI application serving a Flask app; see the module docstring."""
+
+	def __init__(self, app):
+		self.app = app
+		self.wsgi = WSGIMiddleware(app, workers=app.config.get('ASGI_THREADS', 32))
+		self.executor = self.wsgi.executor
+		app.ensure_sync = functools.partial(_ensure_sync, app.ensure_sync)
+
+	async def __call__(self, scope, receive, send):
+		if scope['type'] == 'lifespan':
+			await self._lifespan(receive, send)
+			return
+		# Every connection starts from an empty context, as under a server, even when called from an app context
+		handle = self._http if scope['type'] == 'http' else self._websocket
+		await asyncio.create_task(handle(scope, receive, send), context=contextvars.Context())
+
+	async def _lifespan(self, receive, send):
+		while True:
+			message = await receive()
+			if message['type'] == 'lifespan.startup':
+				await send({'type': 'lifespan.startup.complete'})
+			elif message['type'] == 'lifespan.shutdown':
+				self.executor.shutdown(wait=False)
+				await send({'type': 'lifespan.shutdown.complete'})
+				return
+
+	async def _http(self, scope, receive, send):
+		environ = _environ(scope, io.BytesIO())
+		if not is_async_view(_view(self.app, environ)):
+			await self.wsgi(scope, receive, send)
+			return
+		body = io.BytesIO()
+		while True:
+			message = await receive()
+			if message['type'] == 'http.disconnect':
+				return
+			body.write(message.get('body', b''))
+			if not message.get('more_body'):
+				break
+		body.seek(0)
+		environ['wsgi.input'] = body
+		status, headers, content = await _serve_on_loop(self.app, environ)
+		await send({
+			'type': 'http.response.start',
+			'status': status,
+			'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+		})
+		await send({'type': 'http.response.body', 'body': content})
+
+	async def _websocket(self, scope, receive, send):
+		environ = _environ(scope, io.BytesIO())
+		handler = getattr(_view(self.app, environ), 'websocket', None)
+		if handler is None or not _same_origin(environ):
+			# Closing before accept rejects the handshake
+			await send({'type': 'websocket.close', 'code': 1008})
+			return
+		if (await receive())['type'] != 'websocket.connect':
+			return
+		socket = WebSocket(receive, send)
+		ctx = self.app.request_context(environ)
+		ctx.push()
+		try:
+			await handler(socket)
+		except Exception:
+			self.app.logger.exception('WebSocket handler error')
+			await socket.close(1011)
+		else:
+			await socket.close()
+		finally:
+			await asyncio.to_thread(db.session.remove)
+			ctx.pop()
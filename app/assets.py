@@ -0,0 +1,155 @@
+"""Fingerprinted, minified static assets.
+
+``flask assets build`` minifies every script in ``static/js`` and stylesheet in
+``static/css`` (with ``rjsmin`` / ``rcssmin`` when installed), writes each as
+``static/dist/<name>.<hash>.<ext>`` with ``.gz``/``.br`` siblings, and records
+the names in ``static/dist/manifest.json``. Run it after ``npm run build:css``.
+
+Templates link assets with ``asset_url('js/editor.js')``, which resolves the
+hashed name from the manifest, or the plain file when the asset hasn't been
+built (e.g. in development). A hashed file never changes - new content gets a
+new name - so ``dist/`` is served with ``Cache-Control: immutable`` and repeat
+page loads only transfer HTML. Files from the previous build are kept, so pages
+rendered before a deploy can still load theirs.
+"""
+import hashlib
+import json
+import os
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+
+from . import compression
+
+try:
+	import rcssmin
+	import rjsmin
+except ImportError:  # optional; assets are fingerprinted but not minified
+	rcssmin = rjsmin = None
+
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+SOURCE_DIRS = ('js', 'css')
+# Inputs to other build steps rather than files pages load
+SKIP = {'css/input.css'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class Manifest:
+	"""``dist/manifest.json`` of the app's static folder, re-read whenever the file changes."""
+
+	def __init__(self):
+		self._version = None
+		self._entries = {}
+
+	def get(self, name: str) -> str | None:
+		path = os.path.join(current_app.static_folder, DIST, MANIFEST)
+		try:
+			version = (path, os.stat(path).st_mtime_ns)
+		except OSError:
+			version = (path, None)
+		if version != self._version:
+			self._entries = _read_json(path) if version[1] else {}
+			self._version = version
+		return self._entries.get(name)
+
+
+def _read_json(path: str) -> dict:
+	try:
+		with open(path, encoding='utf-8') as fh:
+			return json.load(fh)
+	except (OSError, ValueError):
+		return {}
+
+
+def asset_url(name: str, **kwargs) -> str:
+	"""URL of static asset ``name``, fingerprinted when it has been built."""
+	built = current_app.extensions['assets'].get(name)
+	return url_for('static', filename=built or name, **kwargs)
+
+
+def minify(name: str, data: bytes) -> bytes:
+	if name.endswith('.js') and rjsmin is not None:
+		return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+	if name.endswith('.css') and rcssmin is not None:
+		return rcssmin.cssmin(data.decode('utf-8')).encode('utf-8')
+	return data
+
+
+def sources(static_folder: str) -> list[str]:
+	names = []
+	for directory in SOURCE_DIRS:
+		for root, _, files in os.walk(os.path.join(static_folder, directory)):
+			for filename in files:
+				name = os.path.relpath(os.path.join(root, filename), static_folder).replace(os.sep, '/')
+				if name.endswith(('.js', '.css')) and name not in SKIP:
+					names.append(name)
+	return sorted(names)
+
+
+def build(static_folder: str) -> dict:
+	"""Write fingerprinted copies of every asset and the manifest; returns the manifest."""
+	dist = os.path.join(static_folder, DIST)
+	manifest_path = os.path.join(dist, MANIFEST)
+	previous = _read_json(manifest_path)
+	manifest = {}
+	for name in sources(static_folder):
+		with open(os.path.join(static_folder, name), 'rb') as fh:
+			data = minify(name, fh.read())
+		stem, ext = os.path.splitext(name)
+		built = f'{DIST}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+		target = os.path.join(static_folder, built)
+		if not os.path.exists(target):
+			os.makedirs(os.path.dirname(target), exist_ok=True)
+			with open(f'{target}.tmp', 'wb') as fh:
+				fh.write(data)
+			os.replace(f'{target}.tmp', target)
+			compression.write_siblings(target, data)
+		manifest[name] = built
+	keep = set(manifest.values()) | set(previous.values())
+	for root, _, files in os.walk(dist):
+		for filename in files:
+			path = os.path.join(root, filename)
+			built = os.path.relpath(path, static_folder).replace(os.sep, '/')
+			for suffix in compression.SUFFIXES.values():
+				if built.endswith(suffix):
+					built = built[:-len(suffix)]
+			if filename != MANIFEST and built not in keep:
+				os.remove(path)
+	os.makedirs(dist, exist_ok=True)
+	with open(f'{manifest_path}.tmp', 'w', encoding='utf-8') as fh:
+		json.dump(manifest, fh, indent=1, sort_keys=True)
+	os.replace(f'{manifest_path}.tmp', manifest_path)
+	return manifest
+
+
+def immutable(view):
+	"""Wrap the ``static`` view so fingerprinted files are cached for good."""
+	def static(filename: str):
+		response = view(filename)
+		if filename.startswith(f'{DIST}/') and filename != f'{DIST}/{MANIFEST}' and response.status_code in (200, 304):
+			response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+		return response
+	return static
+
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+
+@assets_cli.command('build')
+def build_command():
+	"""Minify and fingerprint static/js and static/css into static/dist."""
+	manifest = build(current_app.static_folder)
+	minified = 'minified' if rjsmin is not None else 'not minified (install rjsmin and rcssmin)'
+	click.echo(f'Built {len(manifest)} assets into {os.path.join(current_app.static_folder, DIST)}, {minified}.')
+
+
+def init_app(app) -> None:
+	"""Register ``asset_url`` and ``flask assets``; call after :func:`app.compression.init_app`."""
+	app.extensions['assets'] = Manifest()
+	app.add_template_global(asset_url)
+	if app.has_static_folder:
+		app.view_functions['static'] = immutable(app.view_functions['static'])
+	app.cli.add_command(assets_cli)
@@ -0,0 +1,103 @@
+"""Google sign-in client with cached OpenID discovery metadata and JWKS.
+
+The client is registered once per app, in a registry of that app's own
+(``app.extensions['oidc_client']``, see :func:`client`). Its discovery document
+and signing keys come from a per-process :class:`ProviderCache` instead of
+being fetched on sign-in:
+
+* both are kept for the response's ``Cache-Control: max-age``, or
+  ``OAUTH_METADATA_TTL`` seconds when the provider sends none;
+* an ID token signed with a key id that isn't cached triggers one JWKS
+  refresh (key rotation), at most every ``OAUTH_JWKS_MIN_REFRESH`` seconds so
+  forged key ids can't make us hammer the provider.
+
+ID tokens are verified locally against the cached keys by Authlib (signature,
+issuer, audience, expiry and nonce), so a sign-in costs only the code-for-token
+exchange with Google.
+"""
+import re
+import threading
+import time
+
+import requests
+from authlib.integrations.flask_client import FlaskOAuth2App, OAuth
+from flask import current_app
+
+
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class ProviderCache:
+	"""Discovery metadata and JWKS of one OpenID provider, refreshed by TTL."""
+
+	def __init__(self, metadata_url: str, ttl: int = 3600, min_refresh: int = 60, timeout: float = 5):
+		self.metadata_url = metadata_url
+		self.ttl = ttl
+		self.min_refresh = min_refresh
+		self.timeout = timeout
+		self._metadata = None
+		self._metadata_expires = 0
+		self._jwks = None
+		self._jwks_expires = 0
+		self._jwks_fetched = 0
+		self._lock = threading.Lock()
+
+	def _get(self, url: str) -> tuple[dict, int]:
+		response = requests.get(url, timeout=self.timeout)
+		response.raise_for_status()
+		match = MAX_AGE.search(response.headers.get('Cache-Control', ''))
+		return response.json(), int(match.group(1)) if match else self.ttl
+
+	def metadata(self) -> dict:
+		with self._lock:
+			if self._metadata is None or time.time() >= self._metadata_expires:
+				self._metadata, max_age = self._get(self.metadata_url)
+				self._metadata_expires = time.time() + max_age
+			return self._metadata
+
+	def jwks(self, force: bool = False) -> dict:
+		"""Current key set; ``force`` refetches it unless that happened very recently."""
+		uri = self.metadata()['jwks_uri']
+		with self._lock:
+			now = time.time()
+			stale = self._jwks is None or now >= self._jwks_expires
+			if stale or (force and now - self._jwks_fetched >= self.min_refresh):
+				self._jwks, max_age = self._get(uri)
+				self._jwks_fetched = now
+				self._jwks_expires = now + max_age
+			return self._jwks
+
+
+class CachedOpenIDApp(FlaskOAuth2App):
+	"""Authlib client that reads metadata and keys from the app's :class:`ProviderCache`."""
+
+	def load_server_metadata(self):
+		self.server_metadata.update(current_app.extensions['oidc_cache'].metadata())
+		return self.server_metadata
+
+	def fetch_jwk_set(self, force=False):
+		return current_app.extensions['oidc_cache'].jwks(force=force)
+
+
+def init_app(app) -> None:
+	config = app.config
+	app.extensions['oidc_cache'] = ProviderCache(
+		config['OAUTH_GOOGLE_METADATA_URL'],
+		ttl=config.get('OAUTH_METADATA_TTL', 3600),
+		min_refresh=config.get('OAUTH_JWKS_MIN_REFRESH', 60),
+		timeout=config.get('OAUTH_HTTP_TIMEOUT', 5),
+	)
+	registry = OAuth(app)
+	app.extensions['oidc_client'] = registry.register(
+		name='google',
+		client_id=config['OAUTH_GOOGLE_CLIENT_ID'],
+		client_secret=config['OAUTH_GOOGLE_CLIENT_SECRET'],
+		server_metadata_url=config['OAUTH_GOOGLE_METADATA_URL'],
+		client_kwargs={'scope': 'openid email profile'},
+		client_cls=CachedOpenIDApp,
+	)
+
+
+def client() -> CachedOpenIDApp:
+	"""The Google client of the current app."""
+	return current_app.extensions['oidc_client']
@@ -1,34 +1,33 @@
+import requests
 from flask import redirect, request, url_for, session
 from flask import current_app as app
 from flask_login import login_user, logout_user
-from . import bp
-from ..extensions import oauth, db
+from authlib.integrations.base_client import OAuthError
+from authlib.jose.errors import JoseError
+from . import bp, oidc
+from ..extensions import db
 from ..models import User
 
 
 @bp.get('/login')
 def login():
-	# Register Google OAuth client
-	google = oauth.register(
-		name='google',
-		client_id=app.config['OAUTH_GOOGLE_CLIENT_ID'],
-		client_secret=app.config['OAUTH_GOOGLE_CLIENT_SECRET'],
-		server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-		client_kwargs={'scope': 'openid email profile'},
-	)
+	# The Google client is registered once at startup, see app.auth.oidc
 	# Build an absolute callback URL consistently
 	redirect_uri = url_for('auth.google_callback', _external=True)
-	return google.authorize_redirect(redirect_uri)
+	return oidc.client().authorize_redirect(redirect_uri)
 
 
 # Support both '/auth/callback' and '/auth/google/callback' to avoid mismatch
 @bp.get('/callback')
 @bp.get('/google/callback')
 def google_callback():
-	# Get the registered Google client
-	google = oauth.google
-	token = google.authorize_access_token()
-	userinfo = token.get('userinfo') or google.parse_id_token(token)
+	try:
+		# Exchanges the code and verifies the ID token against the cached keys
+		token = oidc.client().authorize_access_token()
+	except (OAuthError, JoseError, ValueError, requests.RequestException) as e:
+		app.logger.warning(f'Google sign-in failed: {e}')
+		return redirect(url_for('main.index'))
+	userinfo = token.get('userinfo')
 	if not userinfo:
 		return redirect(url_for('main.index'))
 	google_sub = userinfo.get('sub')
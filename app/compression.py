@@ -0,0 +1,174 @@
+"""Negotiated gzip/brotli compression for responses and static files.
+
+* Responses of a text-like type and at least ``COMPRESS_MIN_SIZE`` bytes are
+  compressed after the view runs: brotli when the client accepts it and the
+  ``brotli`` package is installed, otherwise gzip. Their ETag becomes weak,
+  as the bytes now depend on the encoding; ``If-None-Match`` compares weakly.
+* Compressed bodies are kept in an in-process LRU keyed by a hash of the
+  uncompressed body (``COMPRESS_CACHE_ENTRIES``), so a hot page or feed that
+  renders the same bytes again is not recompressed.
+* ``flask compress-static`` writes ``.gz``/``.br`` siblings next to the files
+  in ``app/static``. The static route serves a sibling when the client accepts
+  its encoding and it is newer than the file. The public site builder writes
+  the same siblings for nginx's ``gzip_static`` / ``brotli_static``.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+from . import metrics
+from .fragment_cache import LRUStore
+
+try:
+	import brotli
+except ImportError:  # optional; gzip only
+	brotli = None
+
+
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+COMPRESSIBLE_TYPES = {
+	'application/atom+xml', 'application/javascript', 'application/json', 'application/manifest+json',
+	'application/rss+xml', 'application/xml', 'image/svg+xml',
+}
+# Files smaller than this aren't worth a sibling
+STATIC_MIN_SIZE = 256
+
+
+def available_encodings() -> tuple[str, ...]:
+	return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(encodings=None) -> str | None:
+	"""The encoding the client prefers among ``encodings``; brotli wins ties."""
+	return request.accept_encodings.best_match(encodings or available_encodings())
+
+
+def is_compressible(mimetype: str | None) -> bool:
+	return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+	"""Encode ``data``; ``best`` trades speed for size, for files compressed once at build time."""
+	config = current_app.config
+	if encoding == 'br':
+		quality = 11 if best else config.get('COMPRESS_BROTLI_QUALITY', 5)
+		return brotli.compress(data, quality=quality)
+	level = 9 if best else config.get('COMPRESS_GZIP_LEVEL', 6)
+	return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _cached_compress(data: bytes, encoding: str) -> bytes:
+	cache = current_app.extensions['compression_cache']
+	key = f'{encoding}:{hashlib.blake2b(data, digest_size=16).hexdigest()}'
+	body = cache.get_many([key])[0]
+	metrics.record_cache('compression', hits=int(body is not None), misses=int(body is None))
+	if body is None:
+		body = compress(data, encoding)
+		cache.set_many({key: body})
+	return body
+
+
+def compress_response(response):
+	"""``after_request`` hook compressing eligible responses."""
+	if (
+		response.status_code != 200
+		or response.direct_passthrough
+		or response.is_streamed
+		or 'Content-Encoding' in response.headers
+		or not is_compressible(response.mimetype)
+		or request.method == 'HEAD'
+	):
+		return response
+	response.vary.add('Accept-Encoding')
+	data = response.get_data()
+	if len(data) < current_app.config.get('COMPRESS_MIN_SIZE', 500):
+		return response
+	encoding = negotiate()
+	if encoding is None:
+		return response
+	response.set_data(_cached_compress(data, encoding))
+	response.headers['Content-Encoding'] = encoding
+	etag, weak = response.get_etag()
+	if etag and not weak:
+		response.set_etag(etag, weak=True)
+	return response
+
+
+def send_static(filename: str):
+	"""The ``static`` view, serving a precompressed sibling when there is a usable one."""
+	folder = current_app.static_folder
+	original = safe_join(folder, filename)
+	mimetype = mimetypes.guess_type(filename)[0]
+	if original and is_compressible(mimetype) and os.path.isfile(original):
+		encodings = [encoding for encoding in available_encodings() if _fresh_sibling(original, SUFFIXES[encoding])]
+		encoding = negotiate(encodings) if encodings else None
+		if encoding:
+			response = send_from_directory(
+				folder, filename + SUFFIXES[encoding], mimetype=mimetype,
+				max_age=current_app.get_send_file_max_age(filename),
+			)
+			response.headers['Content-Encoding'] = encoding
+		else:
+			response = current_app.send_static_file(filename)
+		response.vary.add('Accept-Encoding')
+		return response
+	return current_app.send_static_file(filename)
+
+
+def _fresh_sibling(original: str, suffix: str) -> bool:
+	try:
+		return os.stat(original + suffix).st_mtime >= os.stat(original).st_mtime
+	except OSError:
+		return False
+
+
+def write_siblings(path: str, data: bytes) -> list[str]:
+	"""Write a best-compression ``.gz`` (and ``.br``) next to ``path``; returns the files written."""
+	written = []
+	for encoding in available_encodings():
+		target = path + SUFFIXES[encoding]
+		with open(f'{target}.tmp', 'wb') as fh:
+			fh.write(compress(data, encoding, best=True))
+		os.replace(f'{target}.tmp', target)
+		written.append(target)
+	return written
+
+
+def remove_siblings(path: str) -> None:
+	for suffix in SUFFIXES.values():
+		if os.path.exists(path + suffix):
+			os.remove(path + suffix)
+
+
+@click.command('compress-static')
+@click.option('--force', is_flag=True, help='Recompress files whose siblings are up to date.')
+def compress_static_command(force):
+	"""Write .gz/.br siblings for the compressible files in app/static."""
+	written = unchanged = 0
+	for root, _, names in os.walk(current_app.static_folder):
+		for name in names:
+			path = os.path.join(root, name)
+			if name.endswith(tuple(SUFFIXES.values())) or not is_compressible(mimetypes.guess_type(name)[0]):
+				continue
+			if os.path.getsize(path) < STATIC_MIN_SIZE:
+				continue
+			if not force and all(_fresh_sibling(path, SUFFIXES[encoding]) for encoding in available_encodings()):
+				unchanged += 1
+				continue
+			with open(path, 'rb') as fh:
+				write_siblings(path, fh.read())
+			written += 1
+	click.echo(f'Compressed {written} static files, {unchanged} unchanged ({", ".join(available_encodings())}).')
+
+
+def init_app(app) -> None:
+	app.extensions['compression_cache'] = LRUStore(app.config.get('COMPRESS_CACHE_ENTRIES', 512))
+	app.after_request(compress_response)
+	if app.has_static_folder:
+		app.view_functions['static'] = send_static
+	app.cli.add_command(compress_static_command)
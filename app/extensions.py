@@ -1,29 +1,76 @@
+from flask import current_app, g, request, session
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+import click
 from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from authlib.integrations.flask_client import OAuth
+from .replicas import RoutingSession
+from . import ratelimit  # noqa: F401  registers the sqlite:// limiter storage
 
 
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+class LazyMigrate:
+	"""Flask-Migrate, without importing Alembic until a ``flask db`` command runs.
+
+	Alembic is a large import that web workers and other CLI commands never use.
+	"""
+
+	def init_app(self, app, db) -> None:
+		self.db = db
+		app.cli.add_command(_MigrateCommands(self, name='db', help='Perform database migrations.'))
+
+	def load(self, app):
+		if 'migrate' not in app.extensions:
+			from flask_migrate import Migrate
+			Migrate(app, self.db)
+		from flask_migrate.cli import db as commands
+		return commands
+
+
+class _MigrateCommands(click.Group):
+	def __init__(self, migrate: LazyMigrate, **kwargs):
+		super().__init__(**kwargs)
+		self.migrate = migrate
+
+	def list_commands(self, ctx):
+		return self.migrate.load(current_app._get_current_object()).list_commands(ctx)
+
+	def get_command(self, ctx, name):
+		return self.migrate.load(current_app._get_current_object()).get_command(ctx, name)
+
+
+migrate = LazyMigrate()
 login_manager = LoginManager()
 csrf_protect = CSRFProtect()
 
-oauth = OAuth()
-
 
 def _rate_limit_key_func():
-	try:
-		# Defer import to avoid circulars
-		from flask_login import current_user
-		if getattr(current_user, 'is_authenticated', False):
-			return f"user:{getattr(current_user, 'id', 'anon')}"
-	except Exception:
-		pass
-	return get_remote_address()
+	"""Per-user key when signed in, else the client address.
+
+	Flask-Limiter calls this once per limit on every request, so the key is
+	worked out once and kept on ``g``.
+	"""
+	key = g.get('_rate_limit_key')
+	if key is None:
+		key = g._rate_limit_key = _resolve_rate_limit_key()
+	return key
+
+
+def _resolve_rate_limit_key() -> str:
+	# Without a session cookie there is no user; skip the session so
+	# anonymous responses don't get ``Vary: Cookie``
+	if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+		return get_remote_address()
+	# Use the user Flask-Login already loaded, or the id in the session,
+	# rather than loading the user just to build a key
+	user = g.get('_login_user')
+	if user is not None:
+		return f'user:{user.id}' if getattr(user, 'is_authenticated', False) else get_remote_address()
+	user_id = session.get('_user_id')
+	return f'user:{user_id}' if user_id else get_remote_address()
 
 
 limiter = Limiter(key_func=_rate_limit_key_func, default_limits=[])
@@ -0,0 +1,299 @@
+"""Rendered HTML fragment cache for blog cards.
+
+The dashboard and post list render one card per blog. Each card is cached
+under ``(template, blog.id, updated_at, blog version, tag-set version)`` so a
+warm page render is a couple of ``get_many`` calls plus string concatenation.
+
+Versions are opaque tokens kept in the same store. The invalidation hooks
+(:func:`invalidate_blogs`, :func:`invalidate_user_tags`) replace the token, so
+old cards simply stop being addressed and age out. A version that is missing
+(evicted, or never set) gets a fresh token, which can never revive a stale
+card.
+
+Stores are pluggable through ``FRAGMENT_CACHE_TYPE``: ``lru`` (in-process,
+the default), ``filesystem``, ``redis`` or ``null``.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+from markupsafe import Markup
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import metrics
+from .extensions import db
+from .models import Tag, blog_tags
+
+
+class NullStore:
+	"""Caches nothing; every card is rendered."""
+
+	def get_many(self, keys):
+		return [None] * len(keys)
+
+	def set_many(self, mapping: dict, timeout: int | None = None) -> None:
+		pass
+
+	def delete_many(self, keys) -> None:
+		pass
+
+	def clear(self) -> None:
+		pass
+
+
+class LRUStore(NullStore):
+	"""Thread-safe in-process LRU with optional per-entry expiry."""
+
+	def __init__(self, max_entries: int = 5000):
+		self.max_entries = max_entries
+		self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get_many(self, keys):
+		now = time.time()
+		values = []
+		with self._lock:
+			for key in keys:
+				entry = self._data.get(key)
+				if entry is None or (entry[0] and entry[0] < now):
+					values.append(None)
+					continue
+				self._data.move_to_end(key)
+				values.append(entry[1])
+		return values
+
+	def set_many(self, mapping: dict, timeout: int | None = None) -> None:
+		expires = time.time() + timeout if timeout else 0
+		with self._lock:
+			for key, value in mapping.items():
+				self._data[key] = (expires, value)
+				self._data.move_to_end(key)
+			while len(self._data) > self.max_entries:
+				self._data.popitem(last=False)
+
+	def delete_many(self, keys) -> None:
+		with self._lock:
+			for key in keys:
+				self._data.pop(key, None)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+
+
+class FileSystemStore(NullStore):
+	"""One file per key, shared by every worker on the host."""
+
+	def __init__(self, directory: str):
+		self.directory = directory
+		os.makedirs(directory, exist_ok=True)
+
+	def _path(self, key: str) -> str:
+		return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+	def get_many(self, keys):
+		now = time.time()
+		values = []
+		for key in keys:
+			try:
+				with open(self._path(key), encoding='utf-8') as fh:
+					expires, _, value = fh.read().partition('\n')
+			except OSError:
+				values.append(None)
+				continue
+			values.append(None if float(expires or 0) and float(expires) < now else value)
+		return values
+
+	def set_many(self, mapping: dict, timeout: int | None = None) -> None:
+		expires = time.time() + timeout if timeout else 0
+		for key, value in mapping.items():
+			path = self._path(key)
+			tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+			try:
+				with open(tmp, 'w', encoding='utf-8') as fh:
+					fh.write(f'{expires}\n{value}')
+				os.replace(tmp, path)
+			except OSError as e:
+				current_app.logger.warning(f"Fragment cache write error: {e}")
+
+	def delete_many(self, keys) -> None:
+		for key in keys:
+			try:
+				os.remove(self._path(key))
+			except OSError:
+				pass
+
+	def clear(self) -> None:
+		for name in os.listdir(self.directory):
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except OSError:
+				pass
+
+
+class RedisStore(NullStore):
+	"""Any Redis-protocol server; shared by every worker and host."""
+
+	def __init__(self, url: str, prefix: str = 'blogforge:fragments:'):
+		import redis
+
+		self.client = redis.Redis.from_url(url, decode_responses=True)
+		self.prefix = prefix
+
+	def get_many(self, keys):
+		if not keys:
+			return []
+		return self.client.mget([self.prefix + key for key in keys])
+
+	def set_many(self, mapping: dict, timeout: int | None = None) -> None:
+		pipe = self.client.pipeline(transaction=False)
+		for key, value in mapping.items():
+			pipe.set(self.prefix + key, value, ex=timeout or None)
+		pipe.execute()
+
+	def delete_many(self, keys) -> None:
+		if keys:
+			self.client.delete(*[self.prefix + key for key in keys])
+
+	def clear(self) -> None:
+		for key in self.client.scan_iter(f'{self.prefix}*'):
+			self.client.delete(key)
+
+
+class FragmentCache:
+	"""Versioned card cache on top of a store."""
+
+	def __init__(self, store, timeout: int | None = None):
+		self.store = store
+		self.timeout = timeout
+
+	def versions(self, keys) -> list[str]:
+		"""Current token for each version key, minting tokens for missing ones."""
+		values = self.store.get_many(keys)
+		minted = {key: uuid.uuid4().hex for key, value in zip(keys, values) if value is None}
+		if minted:
+			self.store.set_many(minted)
+		return [value if value is not None else minted[key] for key, value in zip(keys, values)]
+
+	def bump(self, keys) -> None:
+		if keys:
+			self.store.set_many({key: uuid.uuid4().hex for key in keys})
+
+	def render_cards(self, template_name: str, blogs, **context) -> list[Markup]:
+		"""Render ``template_name`` once per blog, reusing cached HTML where valid."""
+		if not blogs:
+			return []
+		version_keys = list(dict.fromkeys(
+			[_blog_version_key(blog.id) for blog in blogs]
+			+ [_tags_version_key(blog.user_id) for blog in blogs]
+		))
+		versions = dict(zip(version_keys, self.versions(version_keys)))
+		keys = [
+			':'.join((
+				'card', template_name, str(blog.id), blog.updated_at.isoformat(),
+				versions[_blog_version_key(blog.id)], versions[_tags_version_key(blog.user_id)],
+			))
+			for blog in blogs
+		]
+		cards = self.store.get_many(keys)
+
+		misses = [i for i, card in enumerate(cards) if card is None]
+		metrics.record_cache('cards', hits=len(cards) - len(misses), misses=len(misses))
+		if misses:
+			_load_tags([blogs[i] for i in misses])
+			template = current_app.jinja_env.get_template(template_name)
+			rendered = {}
+			for i in misses:
+				cards[i] = rendered[keys[i]] = template.render(blog=blogs[i], **context)
+			self.store.set_many(rendered, self.timeout)
+		return [Markup(card) for card in cards]
+
+
+def _blog_version_key(blog_id: int) -> str:
+	return f'v:blog:{blog_id}'
+
+
+def _tags_version_key(user_id: int) -> str:
+	return f'v:tags:{user_id}'
+
+
+def _load_tags(blogs) -> None:
+	"""Load ``Blog.tags`` for every blog that hasn't got it in one query."""
+	unloaded = {blog.id: blog for blog in blogs if 'tags' in sa.inspect(blog).unloaded}
+	if not unloaded:
+		return
+	tags = {blog_id: [] for blog_id in unloaded}
+	rows = db.session.execute(
+		sa.select(blog_tags.c.blog_id, Tag)
+		.join(Tag, Tag.id == blog_tags.c.tag_id)
+		.where(blog_tags.c.blog_id.in_(unloaded))
+		.order_by(Tag.id)
+	)
+	for blog_id, tag in rows:
+		tags[blog_id].append(tag)
+	for blog_id, blog in unloaded.items():
+		set_committed_value(blog, 'tags', tags[blog_id])
+
+
+def get_cache() -> FragmentCache | None:
+	if not has_app_context():
+		return None
+	return current_app.extensions.get('fragment_cache')
+
+
+def _invalidate(keys) -> None:
+	cache = get_cache()
+	if cache is None or not keys:
+		return
+	cache.bump(keys)
+	# Bump again once the transaction commits, so a card rendered from the
+	# old rows in between cannot stay addressable.
+	session = db.session()
+	if session.in_transaction():
+		session.info.setdefault('fragment_cache_keys', set()).update(keys)
+
+
+def invalidate_blogs(blog_ids) -> None:
+	"""Hook for edits, auto-saves, publish changes and tag (re)assignment."""
+	_invalidate({_blog_version_key(blog_id) for blog_id in blog_ids if blog_id is not None})
+
+
+def invalidate_user_tags(user_id: int) -> None:
+	"""Hook for tag renames, merges and deletes, which touch every card of the user."""
+	_invalidate({_tags_version_key(user_id)})
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_commit')
+def _bump_after_commit(session):
+	keys = session.info.pop('fragment_cache_keys', None)
+	cache = get_cache()
+	if keys and cache is not None:
+		cache.bump(keys)
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_soft_rollback')
+def _forget_on_rollback(session, previous_transaction):
+	session.info.pop('fragment_cache_keys', None)
+
+
+def create_store(app):
+	kind = app.config.get('FRAGMENT_CACHE_TYPE', 'lru')
+	if kind == 'null':
+		return NullStore()
+	if kind == 'filesystem':
+		return FileSystemStore(app.config.get('FRAGMENT_CACHE_DIR') or os.path.join(app.instance_path, 'fragments'))
+	if kind == 'redis':
+		return RedisStore(app.config['FRAGMENT_CACHE_REDIS_URL'])
+	return LRUStore(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 5000))
+
+
+def init_app(app) -> None:
+	app.extensions['fragment_cache'] = FragmentCache(
+		create_store(app),
+		timeout=app.config.get('FRAGMENT_CACHE_TIMEOUT'),
+	)
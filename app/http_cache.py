@@ -0,0 +1,101 @@
+"""Conditional GET helpers (ETag / Last-Modified).
+
+Views compute a strong ETag from a cheap fingerprint query - ids, timestamps
+and tag names, never the markdown body - and call :func:`not_modified` before
+loading or rendering anything heavy. When the client already has the current
+version it gets an empty ``304``.
+"""
+import hashlib
+import json
+
+import sqlalchemy as sa
+from flask import Response, current_app, request, session
+
+from . import metrics
+from .extensions import db
+from .models import Blog, Tag, User, blog_tags
+
+
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+def make_etag(*parts) -> str:
+	"""Hash arbitrary JSON-able parts into a strong ETag value."""
+	payload = json.dumps(parts, default=str, sort_keys=True, separators=(',', ':'))
+	return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def not_modified(etag: str, last_modified=None, cache_control: str = PRIVATE_CACHE_CONTROL):
+	"""Return a ``304`` response if the request validators match, else ``None``.
+
+	``If-None-Match`` wins over ``If-Modified-Since`` as RFC 9110 requires.
+	Private pages with pending flash messages always render, so the messages
+	are consumed. Public pages never look at the session.
+	"""
+	if cache_control.startswith('private') and session.get('_flashes'):
+		return None
+	if request.if_none_match:
+		# Weak comparison, so the weak ETag of a compressed response still matches
+		matched = request.if_none_match.contains_weak(etag)
+	elif request.if_modified_since and last_modified is not None:
+		matched = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+	else:
+		matched = False
+	metrics.record_cache('http', hits=int(matched), misses=int(not matched))
+	if not matched:
+		return None
+	return set_validators(Response(status=304), etag, last_modified, cache_control)
+
+
+def set_validators(response, etag: str, last_modified=None, cache_control: str = PRIVATE_CACHE_CONTROL):
+	"""Attach ``ETag``, ``Last-Modified``, ``Cache-Control`` and ``Vary`` to ``response``."""
+	response.set_etag(etag)
+	if last_modified is not None:
+		response.last_modified = last_modified
+	response.headers['Cache-Control'] = cache_control
+	if cache_control.startswith('private'):
+		response.vary.add('Cookie')
+	return response
+
+
+def _pending_autosaves(blog_ids):
+	buffer = current_app.extensions.get('autosave')
+	if buffer is None:
+		return []
+	return [(blog_id, buffer.pending(blog_id)) for blog_id in blog_ids if buffer.pending(blog_id)]
+
+
+def blogs_fingerprint(query) -> tuple[list, object]:
+	"""Fingerprint the blogs matched by a ``Blog`` query without loading their bodies.
+
+	Returns:
+		tuple: ``(parts, last_modified)`` where ``parts`` feeds :func:`make_etag`.
+	"""
+	rows = query.with_entities(Blog.id, Blog.updated_at, Blog.user_id).all()
+	blog_ids = [row.id for row in rows]
+	if not blog_ids:
+		return [], None
+
+	tags = db.session.execute(
+		sa.select(blog_tags.c.blog_id, Tag.name)
+		.join(Tag, Tag.id == blog_tags.c.tag_id)
+		.where(blog_tags.c.blog_id.in_(blog_ids))
+		.order_by(blog_tags.c.blog_id, Tag.name)
+	).all()
+	authors = db.session.execute(
+		sa.select(User.id, User.updated_at)
+		.where(User.id.in_({row.user_id for row in rows}))
+		.order_by(User.id)
+	).all()
+
+	pending = _pending_autosaves(blog_ids)
+	# Unflushed auto-saves have no timestamp yet, so only the ETag can cover them
+	last_modified = None if pending else max(
+		[row.updated_at for row in rows] + [author.updated_at for author in authors]
+	)
+	parts = [
+		[list(row) for row in rows],
+		[list(row) for row in tags],
+		[list(row) for row in authors],
+		pending,
+	]
+	return parts, last_modified
@@ -0,0 +1,49 @@
+"""Structured JSON logging.
+
+Each record is one JSON object per line with the request id, so log lines
+from one request can be joined with each other and with ``X-Request-ID`` in
+proxy logs. Set ``LOG_FORMAT=text`` for plain lines during development.
+"""
+import json
+import logging
+import sys
+import time
+
+from flask import g, has_request_context, request
+
+
+request_logger = logging.getLogger('app.requests')
+
+
+class JSONFormatter(logging.Formatter):
+	"""Render a record, its ``fields`` extra and any traceback as JSON."""
+
+	def format(self, record: logging.LogRecord) -> str:
+		entry = {
+			'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+			'level': record.levelname.lower(),
+			'logger': record.name,
+			'message': record.getMessage(),
+		}
+		if has_request_context():
+			entry['request_id'] = g.get('request_id')
+			entry.setdefault('path', request.path)
+		entry.update(getattr(record, 'fields', {}))
+		if record.exc_info:
+			entry['exception'] = self.formatException(record.exc_info)
+		return json.dumps(entry, default=str)
+
+
+handler = logging.StreamHandler(sys.stderr)
+
+
+def init_app(app) -> None:
+	from flask.logging import default_handler
+
+	if app.config.get('LOG_FORMAT', 'json') == 'json':
+		handler.setFormatter(JSONFormatter())
+	else:
+		handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+	app.logger.removeHandler(default_handler)
+	app.logger.addHandler(handler)
+	app.logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
@@ -1,8 +1,13 @@
-from flask import render_template, redirect, url_for, request, jsonify
+from flask import render_template, redirect, url_for, request, jsonify, make_response
 from flask_login import current_user, login_required
 from . import bp
 from ..extensions import login_manager
+from sqlalchemy.orm import lazyload
+from .. import analytics, http_cache, fragment_cache, search, singleflight
 from ..models import User, Blog
+from ..posts import metadata
+from ..posts.autosave import apply_pending
+from ..public import pages, related
 
 
 @login_manager.user_loader
@@ -22,9 +27,17 @@ def index():
 def dashboard():
 	# Get search query from URL parameters
 	search_query = request.args.get('q', '').strip()
+	search_mode = request.args.get('mode', 'keyword')
+	if search_mode not in search.MODES:
+		search_mode = 'keyword'
+	sort = request.args.get('sort', 'latest')
+	if sort not in analytics.SORTS:
+		sort = 'latest'
 	
 	# Start with base query for published blogs
 	query = Blog.query.filter_by(is_published=True)
+	# Blog ids in result order for semantic and hybrid searches
+	ranking = None
 	
 	# Apply search filter if query is provided
 	if search_query:
@@ -44,10 +57,37 @@ def dashboard():
 		)
 		
 		# Apply the search conditions
-		query = query.filter(or_(*search_conditions))
+		keyword_query = query.filter(or_(*search_conditions))
+		
+		# Semantic modes fall back to keyword results until `flask search index` has built an index
+		if search_mode != 'keyword':
+			ranking = search.search(search_query)
+			if ranking is not None and search_mode == 'hybrid':
+				keyword_ids = keyword_query.with_entities(Blog.id).order_by(Blog.updated_at.desc()).all()
+				ranking = search.hybrid([row.id for row in keyword_ids], ranking)
+		query = keyword_query if ranking is None else query.filter(Blog.id.in_(ranking))
+	
+	# Popular order comes from the view counters, so counts that moved the order change the ETag
+	popular = analytics.popularity(query) if sort == 'popular' else None
+	
+	# Answer with 304 if nothing on the page changed since the client's copy
+	parts, last_modified = http_cache.blogs_fingerprint(query)
+	etag = http_cache.make_etag('dashboard', current_user.id, current_user.updated_at, search_query, search_mode, ranking, sort, popular, parts)
+	cached = http_cache.not_modified(etag, last_modified)
+	if cached:
+		return cached
 	
 	# Get blogs sorted by latest first
-	published_blogs = query.order_by(Blog.updated_at.desc()).all()
+	# Tags are only loaded for cards that miss the fragment cache
+	published_blogs = query.options(lazyload(Blog.tags)).order_by(Blog.updated_at.desc()).all()
+	if ranking is not None:
+		position = {blog_id: i for i, blog_id in enumerate(ranking)}
+		published_blogs.sort(key=lambda blog: position[blog.id])
+	if popular is not None:
+		# Most viewed first; unviewed posts keep their order after them
+		position = {blog_id: i for i, (blog_id, _) in enumerate(popular)}
+		published_blogs.sort(key=lambda blog: position.get(blog.id, len(position)))
+	apply_pending(published_blogs)
 	
 	# Define tag colors for random assignment - dark backgrounds with white text
 	tag_colors = [
@@ -63,7 +103,9 @@ def dashboard():
 		'bg-cyan-600 text-white'
 	]
 	
-	return render_template('main/dashboard.html', blogs=published_blogs, tag_colors=tag_colors, search_query=search_query)
+	cards = fragment_cache.get_cache().render_cards('main/_blog_card.html', published_blogs, tag_colors=tag_colors)
+	response = make_response(render_template('main/dashboard.html', blogs=published_blogs, cards=cards, search_query=search_query, search_mode=search_mode, sort=sort))
+	return http_cache.set_validators(response, etag, last_modified)
 
 
 @bp.get('/profile')
@@ -93,15 +135,41 @@ def profile():
 @bp.get('/api/blog/<int:blog_id>')
 @login_required
 def get_blog_content(blog_id):
-	"""Get blog content for overlay display"""
-	blog = Blog.query.filter_by(id=blog_id, is_published=True).first()
-	if not blog:
+	"""Get blog content for overlay display.
+	
+	Supports conditional requests: the ETag is derived from the post's
+	timestamp, tag names and author, checked before the body is loaded.
+	``metadata`` (word count, reading time, outline, ...) was extracted when
+	the post was saved. Readers opening the same version of a post at once
+	share one load of it.
+	"""
+	query = Blog.query.filter_by(id=blog_id, is_published=True)
+	parts, last_modified = http_cache.blogs_fingerprint(query)
+	if not parts:
 		return jsonify({'error': 'Blog not found'}), 404
+	# Revalidated opens count too; the counter batches the writes
+	analytics.record_view(blog_id)
+	etag = http_cache.make_etag('api-blog', parts, related.updated_at([blog_id]).get(blog_id))
+	cached = http_cache.not_modified(etag, last_modified)
+	if cached:
+		return cached
+	
+	payload = singleflight.do('api-blog', (blog_id, etag), lambda: _blog_payload(query))
+	if payload is None:
+		return jsonify({'error': 'Blog not found'}), 404
+	return http_cache.set_validators(jsonify(payload), etag, last_modified)
+
+
+def _blog_payload(query) -> dict | None:
+	blog = query.first()
+	if not blog:
+		return None
+	apply_pending(blog)
 	
 	# Get author information
 	author = blog.user
 	
-	return jsonify({
+	return {
 		'id': blog.id,
 		'title': blog.title,
 		'description': blog.description,
@@ -112,5 +180,20 @@ def get_blog_content(blog_id):
 		},
 		'created_at': blog.created_at.isoformat(),
 		'updated_at': blog.updated_at.isoformat(),
-		'tags': [{'name': tag.name} for tag in blog.tags]
-	})
+		'tags': [{'name': tag.name} for tag in blog.tags],
+		'metadata': metadata.for_blog(blog),
+		'related': [
+			{'id': post.id, 'title': post.title, 'url': pages.post_url(post)}
+			for post in related.related_posts(blog.id)
+		],
+	}
+
+
+@bp.post('/api/blog/<int:blog_id>/read')
+@login_required
+def record_read(blog_id):
+	"""Count a read-through, sent by the overlay once the reader reaches the end of the post."""
+	if not Blog.query.filter_by(id=blog_id, is_published=True).with_entities(Blog.id).first():
+		return jsonify({'error': 'Blog not found'}), 404
+	analytics.record_read(blog_id)
+	return '', 204
@@ -0,0 +1,226 @@
+"""Request instrumentation and a Prometheus ``/metrics`` endpoint.
+
+Every request gets an id (``X-Request-ID``, taken from the proxy when it sends
+one) and is timed, along with the number and total time of the SQL statements
+it ran. Other modules record into the metrics defined here:
+
+* ``AI_DURATION`` / ``AI_TOKENS`` - provider calls in :mod:`app.ai.routes`
+* ``CACHE_LOOKUPS`` - card fragments, feed artifacts and ``304`` answers
+* ``RATE_LIMITED`` - Flask-Limiter breaches
+
+Metrics live in the worker process. With several workers, have Prometheus
+scrape each one (or run one worker per container).
+"""
+import bisect
+import threading
+import time
+import uuid
+
+import sqlalchemy as sa
+from flask import Response, current_app, g, has_app_context, request
+
+from . import logs
+from .extensions import limiter
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+	"""Labelled samples with a name, help text and Prometheus type."""
+
+	kind = 'untyped'
+
+	def __init__(self, name: str, documentation: str, labelnames=()):
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = tuple(labelnames)
+		self._values = {}
+		self._lock = threading.Lock()
+		REGISTRY.append(self)
+
+	def _key(self, labels: dict) -> tuple:
+		return tuple(str(labels[name]) for name in self.labelnames)
+
+	def _labels(self, key: tuple, **extra) -> str:
+		pairs = list(zip(self.labelnames, key)) + list(extra.items())
+		if not pairs:
+			return ''
+		return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+	def clear(self) -> None:
+		with self._lock:
+			self._values.clear()
+
+	def render(self) -> list[str]:
+		lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+		with self._lock:
+			items = sorted(self._values.items())
+		for key, value in items:
+			lines.extend(self._samples(key, value))
+		return lines
+
+
+class Counter(Metric):
+	kind = 'counter'
+
+	def inc(self, amount: float = 1, **labels) -> None:
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0) + amount
+
+	def value(self, **labels) -> float:
+		return self._values.get(self._key(labels), 0)
+
+	def _samples(self, key, value):
+		return [f'{self.name}_total{self._labels(key)} {_number(value)}']
+
+
+class Histogram(Metric):
+	kind = 'histogram'
+
+	def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+		super().__init__(name, documentation, labelnames)
+		self.buckets = tuple(buckets)
+
+	def observe(self, amount: float, **labels) -> None:
+		key = self._key(labels)
+		with self._lock:
+			counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+			counts[bisect.bisect_left(self.buckets, amount)] += 1
+			self._values[key] = (counts, total + amount)
+
+	def count(self, **labels) -> int:
+		entry = self._values.get(self._key(labels))
+		return sum(entry[0]) if entry else 0
+
+	def _samples(self, key, value):
+		counts, total = value
+		lines, cumulative = [], 0
+		for bound, count in zip(self.buckets + (float('inf'),), counts):
+			cumulative += count
+			le = '+Inf' if bound == float('inf') else _number(bound)
+			lines.append(f'{self.name}_bucket{self._labels(key, le=le)} {cumulative}')
+		lines.append(f'{self.name}_sum{self._labels(key)} {_number(total)}')
+		lines.append(f'{self.name}_count{self._labels(key)} {cumulative}')
+		return lines
+
+
+def _escape(value: str) -> str:
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+	return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+REGISTRY: list[Metric] = []
+
+REQUEST_DURATION = Histogram(
+	'http_request_duration_seconds', 'Time spent handling a request.', ('endpoint', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+	'http_request_db_queries', 'SQL statements run per request.', ('endpoint',),
+	buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+REQUEST_DB_SECONDS = Histogram(
+	'http_request_db_seconds', 'Time spent in SQL per request.', ('endpoint',),
+)
+AI_DURATION = Histogram(
+	'ai_provider_duration_seconds', 'Latency of AI provider calls.', ('endpoint', 'model', 'outcome'),
+	buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+AI_TOKENS = Counter('ai_tokens', 'Tokens reported by the AI provider.', ('endpoint', 'model', 'kind'))
+CACHE_LOOKUPS = Counter('cache_lookups', 'Cache lookups by cache and result.', ('cache', 'result'))
+RATE_LIMITED = Counter('rate_limited_requests', 'Requests rejected by the rate limiter.', ('endpoint', 'limit'))
+SINGLEFLIGHT_CALLS = Counter('singleflight_calls', 'Coalesced calls by name and role (leader, follower, shared).', ('name', 'role'))
+
+
+def render() -> str:
+	return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+	if hits:
+		CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+	if misses:
+		CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
+
+
+@sa.event.listens_for(sa.engine.Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+# Called as ``listener(conn, statement, parameters, seconds)`` after every statement
+QUERY_LISTENERS = []
+
+
+@sa.event.listens_for(sa.engine.Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	elapsed = time.perf_counter() - conn.info['query_started'].pop()
+	if has_app_context() and 'request_started' in g:
+		g.db_queries += 1
+		g.db_seconds += elapsed
+	for listener in QUERY_LISTENERS:
+		listener(conn, statement, parameters, elapsed)
+
+
+@sa.event.listens_for(sa.engine.Engine, 'handle_error')
+def _failed_cursor_execute(context):
+	started = context.connection.info.get('query_started') if context.connection is not None else None
+	if started:
+		started.pop()
+
+
+def _start_request():
+	g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+	g.db_queries = 0
+	g.db_seconds = 0.0
+	g.request_started = time.perf_counter()
+
+
+def _finish_request(response):
+	if 'request_started' not in g:
+		return response
+	duration = time.perf_counter() - g.request_started
+	endpoint = request.endpoint or 'unmatched'
+	REQUEST_DURATION.observe(duration, endpoint=endpoint, method=request.method, status=response.status_code)
+	REQUEST_QUERIES.observe(g.db_queries, endpoint=endpoint)
+	REQUEST_DB_SECONDS.observe(g.db_seconds, endpoint=endpoint)
+	response.headers['X-Request-ID'] = g.request_id
+	logs.request_logger.info('request', extra={'fields': {
+		'method': request.method,
+		'path': request.path,
+		'endpoint': endpoint,
+		'status': response.status_code,
+		'duration_ms': round(duration * 1000, 2),
+		'db_queries': g.db_queries,
+		'db_ms': round(g.db_seconds * 1000, 2),
+	}})
+	return response
+
+
+def _on_rate_limit_breach(request_limit):
+	RATE_LIMITED.inc(endpoint=request.endpoint or 'unmatched', limit=str(request_limit.limit))
+
+
+def metrics_view():
+	"""Prometheus metrics; outside development and testing only with ``METRICS_TOKEN`` set."""
+	token = current_app.config.get('METRICS_TOKEN')
+	if not token and not (current_app.debug or current_app.testing):
+		return Response('Not Found\n', status=404, mimetype='text/plain')
+	if token and request.headers.get('Authorization') != f'Bearer {token}':
+		return Response('Unauthorized\n', status=401, mimetype='text/plain')
+	return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app) -> None:
+	"""Install the request hooks and ``/metrics``; call before ``limiter.init_app``."""
+	app.config.setdefault('RATELIMIT_ON_BREACH_CALLBACK', _on_rate_limit_breach)
+	app.before_request(_start_request)
+	app.after_request(_finish_request)
+	if app.config.get('METRICS_ENABLED', True):
+		app.add_url_rule('/metrics', 'metrics', limiter.exempt(metrics_view))
+		if not app.config.get('METRICS_TOKEN') and not (app.debug or app.testing):
+			app.logger.warning('METRICS_TOKEN is not set; /metrics answers 404 until it is')
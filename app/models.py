@@ -1,4 +1,5 @@
 from datetime import datetime
+from flask import current_app
 from sqlalchemy import Enum
 from .extensions import db
 
@@ -39,6 +40,11 @@ class User(db.Model):
 	def get_id(self):
 		return str(self.id)
 
+	@property
+	def is_admin(self):
+		"""Admins are listed by email in ``ADMIN_EMAILS``."""
+		return (self.email or '').lower() in current_app.config.get('ADMIN_EMAILS', [])
+
 
 class Blog(db.Model):
 	__tablename__ = 'blogs'
@@ -59,12 +65,154 @@ class Blog(db.Model):
 
 	tags = db.relationship('Tag', secondary=blog_tags, lazy='subquery', backref=db.backref('blogs', lazy=True))
 
+	__table_args__ = (
+		# Newest-published-first listings and feeds
+		db.Index('ix_blogs_is_published_published_at', 'is_published', 'published_at'),
+	)
+
 
 class Tag(db.Model):
 	__tablename__ = 'tags'
+	__table_args__ = (
+		db.Index('ix_tags_user_id_name', 'user_id', 'name'),
+	)
 	id = db.Column(db.Integer, primary_key=True)
 	user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True, nullable=False)
-	name = db.Column(db.String(64), nullable=False)
+	name = db.Column(db.String(64), index=True, nullable=False)
+	# Denormalized usage counters, maintained by app.posts.tags
+	blog_count = db.Column(db.Integer, default=0, nullable=False)
+	published_count = db.Column(db.Integer, default=0, nullable=False)
+	created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TagNameCount(db.Model):
+	"""Published usage of a tag name across every user, for the tag cloud."""
+	__tablename__ = 'tag_name_counts'
+	name = db.Column(db.String(64), primary_key=True)
+	published_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+
+
+class FeedArtifact(db.Model):
+	"""A pre-rendered, gzipped feed or sitemap file, rebuilt when ``version`` moves past ``built_version``."""
+	__tablename__ = 'feed_artifacts'
+	name = db.Column(db.String(64), primary_key=True)
+	body = db.Column(db.LargeBinary, nullable=False)
+	etag = db.Column(db.String(64), nullable=False)
+	version = db.Column(db.Integer, default=0, nullable=False)
+	built_version = db.Column(db.Integer, default=0, nullable=False)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RelatedPosts(db.Model):
+	"""A published post's term vector and precomputed related posts; see ``app.public.related``.
+
+	``terms``/``weights``/``tags`` are packed int32/float32 arrays; ``neighbors``
+	is a JSON list of ``[blog_id, score]``, best first.
+	"""
+	__tablename__ = 'related_posts'
+	blog_id = db.Column(db.Integer, db.ForeignKey('blogs.id'), primary_key=True)
+	terms = db.Column(db.LargeBinary, nullable=True)
+	weights = db.Column(db.LargeBinary, nullable=True)
+	tags = db.Column(db.LargeBinary, nullable=True)
+	neighbors = db.Column(db.Text, default='[]', nullable=False)
+	version = db.Column(db.Integer, default=1, nullable=False)
+	built_version = db.Column(db.Integer, default=0, nullable=False)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RelatedTerm(db.Model):
+	"""How many posts in the related-posts index contain a hashed term, for its IDF weight."""
+	__tablename__ = 'related_terms'
+	term = db.Column(db.Integer, primary_key=True, autoincrement=False)
+	posts = db.Column(db.Integer, default=0, nullable=False)
+
+
+class SearchDocument(db.Model):
+	"""Change counter of a post for the semantic search index; see ``app.search``.
+
+	The index files record the version each post was embedded at, so every
+	host's index can tell which posts to re-embed.
+	"""
+	__tablename__ = 'search_documents'
+	blog_id = db.Column(db.Integer, db.ForeignKey('blogs.id'), primary_key=True)
+	version = db.Column(db.Integer, default=1, nullable=False)
+
+
+class PostSignature(db.Model):
+	"""MinHash signature of a post's title and content; see ``app.posts.duplicates``.
+
+	``signature`` packs ``PERMUTATIONS`` uint32 minimums.
+	"""
+	__tablename__ = 'post_signatures'
+	blog_id = db.Column(db.Integer, db.ForeignKey('blogs.id'), primary_key=True)
+	signature = db.Column(db.LargeBinary, nullable=False)
+
+
+class PostBucket(db.Model):
+	"""One LSH band of a post's signature; posts sharing a bucket are duplicate candidates."""
+	__tablename__ = 'post_buckets'
+	user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+	bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+	blog_id = db.Column(db.Integer, db.ForeignKey('blogs.id'), primary_key=True, index=True)
+
+
+class PostMetadata(db.Model):
+	"""Facts extracted from a post's markdown when it is saved; see ``app.posts.metadata``.
+
+	``toc``, ``links`` and ``code_languages`` are JSON lists.
+	"""
+	__tablename__ = 'post_metadata'
+	blog_id = db.Column(db.Integer, db.ForeignKey('blogs.id'), primary_key=True)
+	word_count = db.Column(db.Integer, default=0, nullable=False)
+	reading_minutes = db.Column(db.Integer, default=0, nullable=False)
+	first_image = db.Column(db.String(1024), nullable=True)
+	toc = db.Column(db.Text, default='[]', nullable=False)
+	links = db.Column(db.Text, default='[]', nullable=False)
+	code_languages = db.Column(db.Text, default='[]', nullable=False)
+
+
+class PostViews(db.Model):
+	"""Views and read-throughs of a post in one UTC hour; written in batches by ``app.analytics``."""
+	__tablename__ = 'post_views'
+	blog_id = db.Column(db.Integer, db.ForeignKey('blogs.id'), primary_key=True)
+	bucket = db.Column(db.DateTime, primary_key=True, index=True)
+	views = db.Column(db.Integer, default=0, nullable=False)
+	reads = db.Column(db.Integer, default=0, nullable=False)
+
+
+class SingleFlightLock(db.Model):
+	"""A call in flight (or just finished) in some process; see ``app.singleflight``."""
+	__tablename__ = 'singleflight_locks'
+	key = db.Column(db.String(128), primary_key=True)
+	owner = db.Column(db.String(32), nullable=False)
+	done = db.Column(db.Boolean, default=False, nullable=False)
+	result = db.Column(db.Text, nullable=True)
+	expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class AIUsage(db.Model):
+	"""Append-only AI cost ledger; every column is additive so totals are plain SUMs.
+
+	A call appends a reservation row (``calls=1``, estimated cost) before the
+	model runs, then a settlement row with the real tokens and the cost
+	difference, or a row cancelling the estimate if the call failed.
+	"""
+	__tablename__ = 'ai_usage'
+	__table_args__ = (
+		db.Index('ix_ai_usage_user_id_hour', 'user_id', 'hour'),
+		db.Index('ix_ai_usage_hour', 'hour'),
+	)
+	id = db.Column(db.Integer, primary_key=True)
+	user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+	# Hours since the epoch (UTC), the time bucket budgets and summaries group by
+	hour = db.Column(db.Integer, nullable=False)
+	endpoint = db.Column(db.String(32), nullable=False)
+	model = db.Column(db.String(64), nullable=False)
+	calls = db.Column(db.Integer, default=0, nullable=False)
+	prompt_tokens = db.Column(db.Integer, default=0, nullable=False)
+	output_tokens = db.Column(db.Integer, default=0, nullable=False)
+	# Millionths of a US dollar
+	cost_micros = db.Column(db.Integer, default=0, nullable=False)
 	created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
 
@@ -0,0 +1,35 @@
+"""numpy and scipy for the modules that compute with them, imported on first use.
+
+Importing them takes longer than the rest of start-up together, and only
+indexing, related posts, duplicate detection and their commands use them, so
+``create_app`` must not import them (``tests/test_startup.py`` checks). Those
+modules import the names here instead::
+
+	from ..numeric import np, sparse
+
+Each is a stand-in that imports its module the first time one of its
+attributes is read.
+"""
+import importlib
+
+
+class _Lazy:
+	"""A module imported the first time one of its attributes is read."""
+
+	def __init__(self, name: str):
+		self._name = name
+
+	def __getattr__(self, attribute: str):
+		value = getattr(importlib.import_module(self._name), attribute)
+		# Later reads find it in the instance dict and don't come back here
+		self.__dict__[attribute] = value
+		return value
+
+	def __repr__(self) -> str:
+		return f'<lazy module {self._name!r}>'
+
+
+np = _Lazy('numpy')
+sparse = _Lazy('scipy.sparse')
+linalg = _Lazy('scipy.sparse.linalg')
+vq = _Lazy('scipy.cluster.vq')
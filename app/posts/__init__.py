@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('posts', __name__)
 
-from . import routes  # noqa: F401
+from . import routes, commands  # noqa: F401
@@ -0,0 +1,389 @@
+"""Streaming export and batched import of a user's posts.
+
+Two archive formats are supported:
+
+* ``ndjson`` - one JSON object per line: ``{"type": "tag", ...}`` records
+  first, then one ``{"type": "post", ...}`` record per blog with its tag
+  names and social posts inlined.
+* ``tar`` - a gzipped tar of ``posts/<id>-<slug>.md`` files, each starting
+  with a front matter block (``key: <json value>`` lines between ``---``
+  markers, which is also valid YAML) followed by the markdown body.
+
+Exports are generators over a ``yield_per`` query, so memory stays flat no
+matter how many posts a user has. Imports consume the upload as a stream and
+insert in batches of ``IMPORT_BATCH_SIZE`` posts, one transaction per batch.
+Posts that are near-duplicates of the user's existing posts, or of earlier
+posts in the same archive, are skipped unless ``on_duplicate='keep'``.
+"""
+import io
+import json
+import re
+import tarfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.orm import selectinload
+
+from ..extensions import db
+from ..models import Blog, SocialPost, Tag, blog_tags
+from . import duplicates
+from . import metadata
+from . import tags as tag_service
+from .hooks import posts_changed
+
+
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+FORMATS = ('ndjson', 'tar')
+
+POST_FIELDS = (
+	'title', 'slug', 'description', 'content_markdown', 'summary',
+	'linkedin_content', 'twitter_thread', 'is_published',
+)
+DATE_FIELDS = ('published_at', 'created_at', 'updated_at')
+
+
+def _isoformat(value):
+	return value.isoformat() if value else None
+
+
+def _parse_datetime(value):
+	if not value:
+		return None
+	try:
+		return datetime.fromisoformat(value)
+	except (TypeError, ValueError):
+		return None
+
+
+def iter_post_records(user_id: int):
+	"""Yield one export dict per blog, fetched ``EXPORT_BATCH_SIZE`` rows at a time."""
+	query = (
+		sa.select(Blog)
+		.where(Blog.user_id == user_id)
+		.order_by(Blog.id)
+		.options(selectinload(Blog.tags), selectinload(Blog.social_posts))
+		.execution_options(yield_per=EXPORT_BATCH_SIZE)
+	)
+	for blog in db.session.execute(query).scalars():
+		record = {'type': 'post', 'id': blog.id}
+		record.update({field: getattr(blog, field) for field in POST_FIELDS})
+		record.update({field: _isoformat(getattr(blog, field)) for field in DATE_FIELDS})
+		record['tags'] = sorted(tag.name for tag in blog.tags)
+		record['social_posts'] = [
+			{
+				'platform': post.platform,
+				'payload_json': post.payload_json,
+				'created_at': _isoformat(post.created_at),
+			}
+			for post in blog.social_posts
+		]
+		yield record
+
+
+def iter_tag_records(user_id: int):
+	rows = db.session.execute(sa.select(Tag.name).where(Tag.user_id == user_id).order_by(Tag.name))
+	for name in rows.scalars():
+		yield {'type': 'tag', 'name': name}
+
+
+def export_ndjson(user_id: int):
+	"""Yield the user's corpus as NDJSON lines."""
+	for record in iter_tag_records(user_id):
+		yield json.dumps(record) + '\n'
+	for record in iter_post_records(user_id):
+		yield json.dumps(record) + '\n'
+
+
+def _front_matter(record: dict) -> str:
+	lines = ['---']
+	for key, value in record.items():
+		if key in ('type', 'content_markdown'):
+			continue
+		lines.append(f'{key}: {json.dumps(value)}')
+	lines.append('---')
+	return '\n'.join(lines) + '\n' + (record.get('content_markdown') or '')
+
+
+def _parse_bool(value) -> bool:
+	if value is None or isinstance(value, bool):
+		return bool(value)
+	if isinstance(value, int) and value in (0, 1):
+		return bool(value)
+	if isinstance(value, str) and value.strip().lower() in ('true', 'false', '1', '0', 'yes', 'no', ''):
+		return value.strip().lower() in ('true', '1', 'yes')
+	raise ValueError(value)
+
+
+def _check_record(record, where: str) -> dict:
+	"""``record`` with ``is_published`` parsed strictly; raises ``ValueError`` naming ``where``."""
+	if not isinstance(record, dict):
+		raise ValueError(f'{where}: expected a JSON object')
+	if 'is_published' in record:
+		try:
+			record['is_published'] = _parse_bool(record['is_published'])
+		except ValueError:
+			raise ValueError(f'{where}: is_published must be true or false') from None
+	return record
+
+
+def _parse_front_matter(text: str) -> dict:
+	if not text.startswith('---\n'):
+		return {'type': 'post', 'content_markdown': text}
+	header, _, body = text[4:].partition('\n---\n')
+	record = {'type': 'post'}
+	for line in header.splitlines():
+		key, sep, value = line.partition(': ')
+		if not sep:
+			continue
+		try:
+			record[key.strip()] = json.loads(value)
+		except json.JSONDecodeError:
+			record[key.strip()] = value
+	record['content_markdown'] = body
+	return record
+
+
+class _ChunkWriter(io.RawIOBase):
+	"""Write-only file object whose contents are drained after every tar member."""
+
+	def __init__(self):
+		self.chunks = []
+
+	def writable(self):
+		return True
+
+	def write(self, data):
+		self.chunks.append(bytes(data))
+		return len(data)
+
+	def drain(self) -> bytes:
+		data = b''.join(self.chunks)
+		self.chunks = []
+		return data
+
+
+def _safe_filename(value: str) -> str:
+	return re.sub(r'[^a-z0-9-]+', '-', (value or '').lower()).strip('-')[:80] or 'post'
+
+
+def export_tar(user_id: int):
+	"""Yield a gzipped tar of markdown files, one member at a time."""
+	writer = _ChunkWriter()
+	with tarfile.open(fileobj=writer, mode='w|gz') as archive:
+		tags = [record['name'] for record in iter_tag_records(user_id)]
+		_add_member(archive, 'tags.json', json.dumps(tags).encode())
+		yield writer.drain()
+		for record in iter_post_records(user_id):
+			name = f"posts/{record['id']:06d}-{_safe_filename(record['slug'])}.md"
+			_add_member(archive, name, _front_matter(record).encode())
+			data = writer.drain()
+			if data:
+				yield data
+	yield writer.drain()
+
+
+def _add_member(archive, name: str, data: bytes) -> None:
+	info = tarfile.TarInfo(name)
+	info.size = len(data)
+	info.mtime = int(time.time())
+	archive.addfile(info, io.BytesIO(data))
+
+
+def read_ndjson(stream):
+	"""Yield records from an NDJSON byte stream, skipping blank or broken lines.
+
+	A line holding valid JSON that isn't a record raises ``ValueError``.
+	"""
+	for number, line in enumerate(stream, 1):
+		line = line.strip()
+		if not line:
+			continue
+		try:
+			record = json.loads(line)
+		except json.JSONDecodeError:
+			continue
+		yield _check_record(record, f'line {number}')
+
+
+def read_tar(stream):
+	"""Yield records from a (optionally compressed) tar stream without seeking."""
+	with tarfile.open(fileobj=stream, mode='r|*') as archive:
+		for member in archive:
+			if not member.isfile():
+				continue
+			data = archive.extractfile(member).read().decode('utf-8', errors='replace')
+			if member.name.endswith('tags.json'):
+				try:
+					for name in json.loads(data):
+						yield {'type': 'tag', 'name': name}
+				except (json.JSONDecodeError, TypeError):
+					pass
+			elif member.name.endswith('.md'):
+				yield _check_record(_parse_front_matter(data), member.name)
+
+
+class Importer:
+	"""Insert exported records for ``user_id`` in batched transactions.
+
+	Tag names are deduplicated against the user's existing tags, and a slug
+	that is already taken is either suffixed (``on_conflict='rename'``) or the
+	post is skipped (``on_conflict='skip'``). Near-duplicate posts are counted
+	in ``duplicates`` and skipped (``on_duplicate='skip'``) or imported anyway
+	(``on_duplicate='keep'``).
+	"""
+
+	def __init__(self, user_id: int, on_conflict: str = 'rename', batch_size: int = IMPORT_BATCH_SIZE, on_duplicate: str = 'skip'):
+		if on_conflict not in ('rename', 'skip'):
+			raise ValueError("on_conflict must be 'rename' or 'skip'")
+		if on_duplicate not in ('skip', 'keep'):
+			raise ValueError("on_duplicate must be 'skip' or 'keep'")
+		self.user_id = user_id
+		self.on_conflict = on_conflict
+		self.on_duplicate = on_duplicate
+		self.batch_size = batch_size
+		self.stats = {'imported': 0, 'skipped': 0, 'renamed': 0, 'tags_created': 0, 'duplicates': 0}
+		self._tag_ids = dict(db.session.execute(
+			sa.select(Tag.name, Tag.id).where(Tag.user_id == user_id)
+		).all())
+		self._slugs = set(db.session.execute(
+			sa.select(Blog.slug).where(Blog.user_id == user_id)
+		).scalars())
+
+	def run(self, records) -> dict:
+		batch, tag_names = [], set()
+		for number, record in enumerate(records, 1):
+			_check_record(record, f'record {number}')
+			if record.get('type') == 'tag':
+				tag_names.add(record.get('name'))
+			elif record.get('type') != 'post':
+				continue
+			elif not record.get('title'):
+				self.stats['skipped'] += 1
+			else:
+				batch.append(record)
+				if len(batch) >= self.batch_size:
+					self._ensure_tags(tag_names)
+					self._insert_batch(batch)
+					batch, tag_names = [], set()
+		self._ensure_tags(tag_names)
+		if batch:
+			self._insert_batch(batch)
+		db.session.commit()
+		return self.stats
+
+	def _ensure_tags(self, names) -> None:
+		missing = {tag_service.normalize_tag_name(name) for name in names} - {''} - set(self._tag_ids)
+		if not missing:
+			return
+		db.session.execute(
+			sa.insert(Tag),
+			[{'user_id': self.user_id, 'name': name, 'blog_count': 0, 'published_count': 0,
+				'created_at': datetime.utcnow()} for name in sorted(missing)],
+		)
+		self._tag_ids.update(db.session.execute(
+			sa.select(Tag.name, Tag.id).where(Tag.user_id == self.user_id, Tag.name.in_(missing))
+		).all())
+		self.stats['tags_created'] += len(missing)
+
+	def _unique_slug(self, slug: str) -> str | None:
+		if slug not in self._slugs:
+			return slug
+		if self.on_conflict == 'skip':
+			return None
+		suffix = 2
+		while f'{slug}-{suffix}' in self._slugs:
+			suffix += 1
+		self.stats['renamed'] += 1
+		return f'{slug}-{suffix}'
+
+	def _insert_batch(self, records) -> None:
+		now = datetime.utcnow()
+		rows, kept = [], []
+		repeated = [False] * len(records)
+		if self.on_duplicate == 'skip':
+			repeated = duplicates.repeated(self.user_id, [
+				duplicates.signature(str(record['title']).strip()[:255], record.get('content_markdown')) for record in records
+			])
+		for record, duplicate in zip(records, repeated):
+			if duplicate:
+				self.stats['duplicates'] += 1
+				continue
+			title = str(record['title']).strip()[:255]
+			slug = self._unique_slug(record.get('slug') or title.lower().replace(' ', '-'))
+			if slug is None:
+				self.stats['skipped'] += 1
+				continue
+			self._slugs.add(slug)
+			row = {field: record.get(field) for field in POST_FIELDS}
+			row.update(
+				user_id=self.user_id,
+				title=title,
+				slug=slug,
+				content_markdown=record.get('content_markdown') or '',
+				is_published=_parse_bool(record.get('is_published')),
+			)
+			for field in DATE_FIELDS:
+				row[field] = _parse_datetime(record.get(field))
+			row['created_at'] = row['created_at'] or now
+			row['updated_at'] = row['updated_at'] or now
+			if row['is_published'] and not row['published_at']:
+				row['published_at'] = now
+			rows.append(row)
+			kept.append(record)
+		if not rows:
+			return
+
+		self._ensure_tags(name for record in kept for name in record.get('tags') or [])
+		blog_ids = db.session.execute(
+			sa.insert(Blog).returning(Blog.id, sort_by_parameter_order=True), rows
+		).scalars().all()
+
+		pairs, social_rows = set(), []
+		deltas = defaultdict(lambda: (0, 0))
+		for blog_id, row, record in zip(blog_ids, rows, kept):
+			for name in record.get('tags') or []:
+				tag_id = self._tag_ids.get(tag_service.normalize_tag_name(name))
+				if tag_id is None or (blog_id, tag_id) in pairs:
+					continue
+				pairs.add((blog_id, tag_id))
+				blog_delta, published_delta = deltas[tag_id]
+				deltas[tag_id] = (blog_delta + 1, published_delta + int(row['is_published']))
+			for post in record.get('social_posts') or []:
+				if post.get('platform') not in ('linkedin', 'twitter'):
+					continue
+				social_rows.append({
+					'blog_id': blog_id,
+					'user_id': self.user_id,
+					'platform': post['platform'],
+					'payload_json': post.get('payload_json') or '',
+					'created_at': _parse_datetime(post.get('created_at')) or now,
+				})
+
+		if pairs:
+			db.session.execute(blog_tags.insert(), [{'blog_id': b, 'tag_id': t} for b, t in sorted(pairs)])
+		if social_rows:
+			db.session.execute(sa.insert(SocialPost), social_rows)
+		tag_service.apply_count_deltas(dict(deltas))
+		posts_changed(blog_ids, listings=True)
+		duplicates.index(
+			(blog_id, self.user_id, row['title'], row['content_markdown']) for blog_id, row in zip(blog_ids, rows)
+		)
+		metadata.store((blog_id, row['content_markdown']) for blog_id, row in zip(blog_ids, rows))
+		db.session.commit()
+		self.stats['imported'] += len(rows)
+
+
+def detect_format(filename: str | None, content_type: str | None) -> str:
+	filename = (filename or '').lower()
+	if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or ''):
+		return 'ndjson'
+	return 'tar'
+
+
+def read_records(stream, fmt: str):
+	if fmt == 'ndjson':
+		return read_ndjson(stream)
+	return read_tar(stream)
@@ -0,0 +1,221 @@
+"""Write-behind buffer for editor auto-saves.
+
+``/posts/auto-save`` fires every few seconds per open editor. Instead of a
+SELECT + UPDATE + COMMIT per call, the latest state of each blog is kept in
+memory and dirty blogs are written in one batched transaction every
+``AUTOSAVE_FLUSH_INTERVAL`` seconds, or as soon as ``AUTOSAVE_MAX_PENDING``
+blogs are waiting. Pending state is flushed on interpreter shutdown.
+
+Reads overlay the buffered fields with :func:`apply_pending` so authors always
+see what they last typed. The content's metadata is extracted when it is
+buffered, so reads show it at once and the flush writes it as is. The buffer
+is per process: with several workers, other workers see an auto-save once it
+has been flushed. Setting the interval to ``0`` makes the buffer write-through.
+"""
+import atexit
+import threading
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..extensions import db
+from ..fragment_cache import invalidate_blogs
+from ..replicas import mark_written
+from ..models import Blog
+from .duplicates import index_blogs
+from .hooks import posts_changed
+from . import metadata
+from .tags import set_published
+
+# Flushes an entry may fail before it is dropped
+MAX_ATTEMPTS = 3
+
+
+class AutoSaveBuffer:
+	"""Holds the latest auto-saved fields per blog until they are flushed."""
+
+	def __init__(self, app, interval: float = 2.0, max_pending: int = 200):
+		self.app = app
+		self.interval = interval
+		self.max_pending = max_pending
+		self._pending: dict[int, dict] = {}
+		self._metadata: dict[int, dict] = {}
+		self._owners: dict[int, int] = {}
+		self._failures: dict[int, int] = {}
+		self._lock = threading.Lock()
+		self._flush_lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = None
+
+	def owns(self, blog_id: int, user_id: int) -> bool:
+		"""Check ownership, hitting the database only the first time per blog."""
+		owner = self._owners.get(blog_id)
+		if owner is None:
+			owner = db.session.execute(sa.select(Blog.user_id).where(Blog.id == blog_id)).scalar()
+			if owner is None:
+				return False
+			with self._lock:
+				if len(self._owners) >= self.max_pending:
+					# Keep the cache bounded: forget blogs with nothing pending
+					self._owners = {key: value for key, value in self._owners.items() if key in self._pending}
+				self._owners[blog_id] = owner
+		return owner == user_id
+
+	def put(self, blog_id: int, fields: dict) -> None:
+		"""Record the latest state for ``blog_id``, replacing anything pending.
+
+		In write-through mode (interval ``0``) a failed write is raised.
+		"""
+		found = metadata.extract(fields['content_markdown']) if 'content_markdown' in fields else None
+		with self._lock:
+			self._pending[blog_id] = dict(fields)
+			if found is None:
+				self._metadata.pop(blog_id, None)
+			else:
+				self._metadata[blog_id] = found
+			self._failures.pop(blog_id, None)
+			full = len(self._pending) >= self.max_pending
+		invalidate_blogs([blog_id])
+		if self.interval <= 0:
+			self.flush(raise_errors=True)
+			# Written in a context of its own, so the request doesn't know it wrote
+			mark_written()
+		elif full:
+			self.flush()
+		else:
+			self._ensure_thread()
+
+	def pending(self, blog_id: int) -> dict | None:
+		return self._pending.get(blog_id)
+
+	def discard(self, blog_id: int) -> None:
+		"""Drop pending state, e.g. when a full save supersedes it.
+
+		Waits for a flush in progress, so an older auto-save can't commit
+		after the save that discards it.
+		"""
+		with self._flush_lock, self._lock:
+			self._pending.pop(blog_id, None)
+			self._metadata.pop(blog_id, None)
+			self._owners.pop(blog_id, None)
+
+	def flush(self, raise_errors: bool = False) -> int:
+		"""Write every pending blog, each in a savepoint of one transaction. Returns how many were written.
+
+		Entries stay pending, and visible to reads, until the write commits. An
+		entry that fails is retried on later flushes and dropped after
+		``MAX_ATTEMPTS``; the others are written regardless.
+		"""
+		with self._flush_lock:
+			with self._lock:
+				batch = dict(self._pending)
+				extracted = {blog_id: self._metadata[blog_id] for blog_id in batch if blog_id in self._metadata}
+			if not batch:
+				return 0
+			try:
+				# A context of its own: the write must not commit or roll back the request's session
+				with self.app.app_context():
+					failed = _write_batch(batch, extracted)
+			except Exception as e:
+				self.app.logger.error(f"Auto-save flush failed: {e}")
+				if raise_errors:
+					# The caller reports the failure, so don't keep showing the unsaved fields
+					self._drop(batch)
+					raise
+				return 0
+			self._drop({blog_id: fields for blog_id, fields in batch.items() if blog_id not in failed})
+			for blog_id, error in failed.items():
+				attempts = self._failures.get(blog_id, 0) + 1
+				if raise_errors or attempts >= MAX_ATTEMPTS:
+					self.app.logger.error(f"Auto-save of blog {blog_id} dropped after {attempts} failed flushes: {error}")
+					self._drop({blog_id: batch[blog_id]})
+				else:
+					self.app.logger.warning(f"Auto-save of blog {blog_id} failed, will retry: {error}")
+					self._failures[blog_id] = attempts
+			if raise_errors and failed:
+				raise next(iter(failed.values()))
+			return len(batch) - len(failed)
+
+	def _drop(self, batch: dict) -> None:
+		"""Forget the entries of ``batch`` that no newer auto-save has replaced."""
+		with self._lock:
+			for blog_id, fields in batch.items():
+				if self._pending.get(blog_id) is fields:
+					del self._pending[blog_id]
+					self._metadata.pop(blog_id, None)
+					self._owners.pop(blog_id, None)
+					self._failures.pop(blog_id, None)
+
+	def _ensure_thread(self) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._thread = threading.Thread(target=self._run, name='autosave-flusher', daemon=True)
+		self._thread.start()
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self.flush()
+
+	def close(self) -> None:
+		"""Stop the flusher thread and write anything still pending."""
+		self._stop.set()
+		self.flush()
+
+
+def _write_batch(batch: dict, extracted: dict) -> dict[int, Exception]:
+	"""Write each blog of ``batch``, and its ``extracted`` metadata, in its own savepoint and commit.
+
+	Returns the errors by blog id. Entries of blogs deleted since they were
+	auto-saved are skipped.
+	"""
+	failed = {}
+	blogs = db.session.execute(sa.select(Blog).where(Blog.id.in_(batch))).scalars().all()
+	for blog in blogs:
+		try:
+			with db.session.begin_nested():
+				for field, value in batch[blog.id].items():
+					setattr(blog, field, value)
+				# Ensure blog is published when auto-saving (keeps tag counters in step)
+				set_published(blog, True)
+				posts_changed([blog.id])
+				index_blogs([blog])
+				if blog.id in extracted:
+					metadata.save({blog.id: extracted[blog.id]})
+		except Exception as e:
+			failed[blog.id] = e
+	db.session.commit()
+	return failed
+
+
+def get_buffer() -> AutoSaveBuffer:
+	return current_app.extensions['autosave']
+
+
+def pending_metadata(blog_id: int) -> dict | None:
+	"""Metadata of the auto-save of ``blog_id`` waiting to be written, if any."""
+	buffer = current_app.extensions.get('autosave')
+	return buffer._metadata.get(blog_id) if buffer is not None else None
+
+
+def apply_pending(blogs):
+	"""Overlay buffered auto-save fields onto loaded blogs without dirtying them."""
+	buffer = current_app.extensions.get('autosave')
+	if buffer is None or not buffer._pending:
+		return blogs
+	for blog in blogs if isinstance(blogs, (list, tuple)) else [blogs]:
+		fields = buffer.pending(blog.id)
+		if fields:
+			for field, value in fields.items():
+				set_committed_value(blog, field, value)
+	return blogs
+
+
+def init_app(app) -> None:
+	buffer = AutoSaveBuffer(
+		app,
+		interval=app.config.get('AUTOSAVE_FLUSH_INTERVAL', 2.0),
+		max_pending=app.config.get('AUTOSAVE_MAX_PENDING', 200),
+	)
+	app.extensions['autosave'] = buffer
+	atexit.register(buffer.close)
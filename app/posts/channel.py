@@ -0,0 +1,234 @@
+"""Editor channel: one WebSocket per open editor, served under ASGI.
+
+Over HTTP every preview keystroke, auto-save and AI call is a request of its
+own, each paying for cookies, CSRF, the session and a ``user_loader`` query.
+The channel authenticates once, at the handshake, and keeps a copy of the
+document, so typing only sends the edit. Frames are JSON objects with an
+``op``; from the editor:
+
+* ``open``: ``blog_id`` (``null`` for a new post), ``title``, ``description``
+  and ``content``; sent on connect and to resync.
+* ``edit``: replaces ``remove`` characters of ``field`` at ``at`` with
+  ``insert``. Offsets count UTF-16 code units, as JavaScript strings do.
+* ``save``: puts the document into the auto-save buffer, like
+  ``/posts/auto-save``; answered with ``saved``.
+* ``ai``: runs the ``/api/ai/<action>`` view with ``data`` as its JSON body, so
+  rate limits and budgets apply as over HTTP. Answered with ``ai`` frames for
+  job ``id``: ``state: running``, then its ``status`` and ``body``.
+
+The server sends ``preview`` frames as the content changes: the rendered
+document is a list of top-level blocks, and each frame replaces ``remove``
+blocks at ``at`` with the ``insert`` list, so a keystroke usually costs one
+paragraph of HTML. The session runs on the event loop; rendering and database
+work run in threads, and rendering skips revisions that arrive while it is
+busy. ``resync`` asks the editor to send ``open`` again, and
+``error`` reports a frame that could not be handled.
+
+Without ASGI, ``/posts/channel`` answers 426 and the editor falls back to the
+JSON endpoints.
+"""
+import asyncio
+import io
+import json
+
+from flask import current_app, request, url_for
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+from .. import asgi
+from ..extensions import db
+from . import autosave
+
+FIELDS = ('title', 'description', 'content')
+AI_ACTIONS = {
+	'blog-to-linkedin': 'ai.blog_to_linkedin',
+	'blog-to-twitter-thread': 'ai.blog_to_twitter_thread',
+	'generate-description': 'ai.generate_description',
+	'summarize': 'ai.summarize',
+}
+# Handshake headers that mustn't reach the views AI jobs are dispatched to
+_HANDSHAKE_ONLY = ('HTTP_UPGRADE', 'HTTP_CONNECTION', 'HTTP_SEC_WEBSOCKET_', 'HTTP_ACCEPT_ENCODING', 'werkzeug.')
+
+_markdown = None
+
+
+def renderer():
+	"""The markdown-it renderer behind the editor preview."""
+	global _markdown
+	if _markdown is None:
+		from markdown_it import MarkdownIt
+
+		md = MarkdownIt('commonmark', {'breaks': True, 'html': True})
+		md.enable(['table', 'strikethrough'])
+		_markdown = md
+	return _markdown
+
+
+def render_blocks(text: str) -> list[str]:
+	"""HTML for ``text``, one string per top-level block; joined, they are the full render."""
+	md = renderer()
+	env = {}
+	tokens = md.parse(text, env)
+	blocks, start = [], 0
+	for i, token in enumerate(tokens):
+		# A top-level block ends with its closing token, or is a single token (fences, rules, raw HTML)
+		if token.level == 0 and token.nesting <= 0:
+			blocks.append(md.renderer.render(tokens[start:i + 1], md.options, env))
+			start = i + 1
+	return blocks
+
+
+def diff_blocks(old: list[str], new: list[str]) -> tuple[int, int, list[str]]:
+	"""``(at, remove, insert)`` turning ``old`` into ``new``, keeping the common ends."""
+	limit = min(len(old), len(new))
+	prefix = 0
+	while prefix < limit and old[prefix] == new[prefix]:
+		prefix += 1
+	suffix = 0
+	while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+		suffix += 1
+	return prefix, len(old) - prefix - suffix, new[prefix:len(new) - suffix]
+
+
+class Resync(Exception):
+	"""The editor's copy of the document no longer matches ours."""
+
+
+class EditorSession:
+	"""The document and jobs of one connected editor."""
+
+	def __init__(self, socket: asgi.WebSocket, user_id: int):
+		self.socket = socket
+		self.user_id = user_id
+		self.app = current_app._get_current_object()
+		self.blog_id = None
+		# UTF-16 so edit offsets from the browser index the buffer directly
+		self.fields = {name: bytearray() for name in FIELDS}
+		self.blocks: list[str] = []
+		self.stale = False
+		self.rendering = False
+
+	async def send(self, **frame) -> None:
+		await self.socket.send(json.dumps(frame))
+
+	def text(self, field: str) -> str:
+		return self.fields[field].decode('utf-16-le', 'surrogatepass')
+
+	async def run(self) -> None:
+		while (text := await self.socket.receive()) is not None:
+			try:
+				await self.handle(json.loads(text))
+			except Resync:
+				await self.send(op='resync')
+			except (ValueError, KeyError, TypeError):
+				await self.send(op='error', error='Bad frame')
+
+	async def handle(self, frame: dict) -> None:
+		op = frame['op']
+		if op == 'edit':
+			self.edit(frame['field'], int(frame['at']), int(frame['remove']), frame['insert'])
+		elif op == 'open':
+			await self.open(frame)
+		elif op == 'save':
+			await self.save()
+		elif op == 'ai':
+			await self.ai(frame['id'], frame['action'], frame.get('data') or {})
+		else:
+			raise ValueError(op)
+
+	async def open(self, frame: dict) -> None:
+		blog_id = frame.get('blog_id')
+		self.blog_id = None
+		if blog_id:
+			if await asgi.to_thread(autosave.get_buffer().owns, int(blog_id), self.user_id):
+				self.blog_id = int(blog_id)
+			else:
+				await self.send(op='error', error='Blog not found')
+		for name in FIELDS:
+			self.fields[name] = bytearray(str(frame.get(name) or '').encode('utf-16-le', 'surrogatepass'))
+		self.changed()
+
+	def edit(self, field: str, at: int, remove: int, insert: str) -> None:
+		buffer = self.fields[field]
+		start, end = 2 * at, 2 * (at + remove)
+		if at < 0 or remove < 0 or end > len(buffer):
+			raise Resync()
+		buffer[start:end] = insert.encode('utf-16-le', 'surrogatepass')
+		if field == 'content':
+			self.changed()
+
+	async def save(self) -> None:
+		if self.blog_id is None:
+			await self.send(op='saved', success=False, error='Blog ID required')
+			return
+		try:
+			await asgi.to_thread(autosave.get_buffer().put, self.blog_id, {
+				'title': self.text('title').strip(),
+				'description': self.text('description').strip(),
+				'content_markdown': self.text('content').strip(),
+			})
+		except Exception:
+			self.app.logger.exception('Auto-save error')
+			await self.send(op='saved', success=False, error='Auto-save failed')
+			return
+		await self.send(op='saved', success=True)
+
+	def changed(self) -> None:
+		self.stale = True
+		if not self.rendering:
+			self.rendering = True
+			asgi.spawn(self._render())
+
+	async def _render(self) -> None:
+		"""Send preview diffs until the render is current; edits keep arriving meanwhile."""
+		try:
+			while self.stale and not self.socket.closed:
+				self.stale = False
+				blocks = await asyncio.to_thread(render_blocks, self.text('content'))
+				at, remove, insert = diff_blocks(self.blocks, blocks)
+				self.blocks = blocks
+				if remove or insert:
+					await self.send(op='preview', at=at, remove=remove, insert=insert)
+		finally:
+			self.rendering = False
+
+	async def ai(self, job, action: str, data: dict) -> None:
+		endpoint = AI_ACTIONS.get(action)
+		if endpoint is None:
+			await self.send(op='ai', id=job, status=404, body={'error': 'Unknown action'})
+			return
+		body = json.dumps(data).encode('utf-8')
+		environ = {key: value for key, value in request.environ.items() if not key.startswith(_HANDSHAKE_ONLY)}
+		environ.update({
+			'REQUEST_METHOD': 'POST',
+			'PATH_INFO': url_for(endpoint)[len(request.script_root):],
+			'QUERY_STRING': '',
+			'CONTENT_TYPE': 'application/json',
+			'CONTENT_LENGTH': str(len(body)),
+			'HTTP_X_CSRFTOKEN': generate_csrf(),
+			'wsgi.input': io.BytesIO(body),
+		})
+		await self.send(op='ai', id=job, state='running')
+		asgi.spawn(self._run_ai(job, environ))
+
+	async def _run_ai(self, job, environ: dict) -> None:
+		status, _, content = await asgi.dispatch(self.app, environ)
+		try:
+			body = json.loads(content)
+		except ValueError:
+			body = None
+		await self.send(op='ai', id=job, status=status, body=body)
+
+
+def _user_id() -> int | None:
+	return current_user.id if current_user.is_authenticated else None
+
+
+async def serve(socket: asgi.WebSocket) -> None:
+	"""WebSocket handler for ``/posts/channel``."""
+	user_id = await asgi.to_thread(_user_id)
+	if user_id is None:
+		await socket.close(1008)
+		return
+	await socket.accept()
+	await EditorSession(socket, user_id).run()
@@ -0,0 +1,105 @@
+import sys
+import click
+from . import bp
+from . import archive
+from . import duplicates
+from . import metadata
+from . import tags as tag_service
+from ..extensions import db
+from ..models import User
+
+
+@bp.cli.command('recount-tags')
+def recount_tags_command():
+	"""Rebuild the denormalized tag usage counters."""
+	tag_service.refresh_all_counts()
+	db.session.commit()
+	click.echo('Tag counters rebuilt.')
+
+
+def _get_user(email: str) -> User:
+	user = User.query.filter_by(email=email).first()
+	if not user:
+		raise click.ClickException(f'No user with email {email}')
+	return user
+
+
+@bp.cli.command('export')
+@click.argument('email')
+@click.option('--format', 'fmt', type=click.Choice(archive.FORMATS), default='ndjson')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), help='Defaults to stdout.')
+def export_command(email, fmt, output):
+	"""Export every post of the user with EMAIL."""
+	user = _get_user(email)
+	chunks = archive.export_tar(user.id) if fmt == 'tar' else archive.export_ndjson(user.id)
+	out = open(output, 'wb') if output else sys.stdout.buffer
+	try:
+		for chunk in chunks:
+			out.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+	finally:
+		if output:
+			out.close()
+
+
+@bp.cli.command('import')
+@click.argument('email')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(archive.FORMATS), default=None)
+@click.option('--on-conflict', type=click.Choice(['rename', 'skip']), default='rename')
+@click.option('--on-duplicate', type=click.Choice(['skip', 'keep']), default='skip')
+def import_command(email, path, fmt, on_conflict, on_duplicate):
+	"""Import an exported archive at PATH for the user with EMAIL."""
+	user = _get_user(email)
+	fmt = fmt or archive.detect_format(path, None)
+	with open(path, 'rb') as stream:
+		importer = archive.Importer(user.id, on_conflict=on_conflict, on_duplicate=on_duplicate)
+		try:
+			stats = importer.run(archive.read_records(stream, fmt))
+		except ValueError as e:
+			db.session.rollback()
+			raise click.ClickException(str(e))
+	click.echo(', '.join(f'{key}: {value}' for key, value in stats.items()))
+
+
+@bp.cli.command('duplicates')
+@click.argument('email', required=False)
+def duplicates_command(email):
+	"""List groups of near-duplicate posts, for every user or the one with EMAIL."""
+	user_id = _get_user(email).id if email else None
+	duplicates.index_missing()
+	db.session.commit()
+	groups = duplicates.report(user_id)
+	for group in groups:
+		click.echo(f"user {group['user_id']}: keep {group['keep']}, merge {group['merge'] or '-'}")
+		for post in group['posts']:
+			state = 'published' if post['is_published'] else 'draft'
+			click.echo(f"  {post['id']:>8} {state:<9} {post['title']}")
+	click.echo(f'{len(groups)} groups of near-duplicates.')
+
+
+@bp.cli.command('merge-duplicates')
+@click.argument('email', required=False)
+@click.option('--dry-run', is_flag=True, help='Count what would be merged without changing anything.')
+@click.option('--discard-newer', is_flag=True, help='Also merge drafts edited after the published post kept.')
+def merge_duplicates_command(email, dry_run, discard_newer):
+	"""Fold near-duplicate drafts into the post kept for their group."""
+	user_id = _get_user(email).id if email else None
+	duplicates.index_missing()
+	db.session.commit()
+	result = duplicates.merge(user_id, dry_run=dry_run, discard_newer=discard_newer)
+	db.session.commit()
+	for group in result['skipped']:
+		click.echo(f"Skipped user {group['user_id']}: keep {group['keep']}, drafts {group['newer']} are newer (--discard-newer merges them).")
+	if dry_run:
+		click.echo(f"Would merge {result['merged']} drafts in {result['groups']} groups.")
+	else:
+		click.echo(f"Merged {result['merged']} drafts in {result['groups']} groups.")
+
+
+@bp.cli.command('metadata')
+@click.option('--rebuild', is_flag=True, help='Re-extract every post, not only those without metadata.')
+def metadata_command(rebuild):
+	"""Extract word counts, outlines and links for posts saved before extraction existed."""
+	stored = metadata.store_missing(rebuild=rebuild)
+	db.session.commit()
+	click.echo(f'Extracted metadata for {stored} posts.')
@@ -0,0 +1,305 @@
+"""Near-duplicate detection with MinHash signatures and LSH buckets.
+
+A post's title and content are split into overlapping ``SHINGLE``-word
+shingles; its signature keeps the minimum of ``PERMUTATIONS`` hash functions
+over them, so the share of equal positions in two signatures estimates the
+Jaccard similarity of their shingle sets. Signatures are stored packed in
+:class:`~app.models.PostSignature`.
+
+The signature is cut into ``BANDS`` bands of ``ROWS`` values, and each band
+hashes to a bucket in :class:`~app.models.PostBucket`, keyed by author. Posts
+sharing any bucket are candidates; only those are compared, so a check costs
+a few index lookups however many posts the author has. With 16 bands of 4,
+posts at ``DUPLICATE_THRESHOLD`` (0.8) similarity share a bucket with
+probability above 0.999.
+
+Writers call :func:`index_blogs` when a post's title or content changes.
+``flask posts duplicates`` reports groups of near-duplicates and ``flask posts
+merge-duplicates`` folds duplicate drafts into the post kept.
+"""
+import re
+import zlib
+
+import sqlalchemy as sa
+from flask import current_app
+
+from ..extensions import db
+from ..models import Blog, PostBucket, PostMetadata, PostSignature, PostViews, RelatedPosts, SearchDocument, SocialPost, blog_tags
+from ..numeric import np
+from . import tags as tag_service
+
+SHINGLE = 3
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+WORD = re.compile(r'\w+')
+# Bound parameters per IN (...) query
+CHUNK = 900
+
+_hash_parameters = None
+
+
+def _parameters():
+	"""Odd multipliers and offsets of the multiply-shift hash functions, fixed for every process."""
+	global _hash_parameters
+	if _hash_parameters is None:
+		rng = np.random.default_rng(20261019)
+		multipliers = rng.integers(1, 2 ** 63, PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+		offsets = rng.integers(0, 2 ** 63, PERMUTATIONS, dtype=np.uint64)
+		_hash_parameters = multipliers.reshape(-1, 1), offsets.reshape(-1, 1)
+	return _hash_parameters
+
+
+def signature(title: str | None, content: str | None):
+	"""MinHash signature (``PERMUTATIONS`` uint32) of a post's word shingles."""
+	words = WORD.findall(f'{title or ""}\n{content or ""}'.lower())
+	shingles = {' '.join(words[i:i + SHINGLE]) for i in range(max(1, len(words) - SHINGLE + 1))}
+	hashes = np.fromiter(
+		(zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles),
+	)
+	multipliers, offsets = _parameters()
+	return ((multipliers * hashes + offsets) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def similarity(a, b) -> float:
+	"""Estimated Jaccard similarity of the posts behind two signatures."""
+	return float((a == b).mean())
+
+
+def buckets(sig) -> list[int]:
+	"""One bucket key per band; the band number keeps equal values in different bands apart."""
+	return [
+		(band << 32) | zlib.crc32(sig[band * ROWS:(band + 1) * ROWS].tobytes())
+		for band in range(BANDS)
+	]
+
+
+def _unpack(data: bytes):
+	return np.frombuffer(data, dtype=np.uint32)
+
+
+def _threshold() -> float:
+	return current_app.config.get('DUPLICATE_THRESHOLD', 0.8)
+
+
+def _chunks(values):
+	values = list(values)
+	for start in range(0, len(values), CHUNK):
+		yield values[start:start + CHUNK]
+
+
+def index(rows) -> None:
+	"""Store signatures and buckets for ``(blog_id, user_id, title, content)`` rows, replacing old ones."""
+	rows = list(rows)
+	if not rows:
+		return
+	blog_ids = [row[0] for row in rows]
+	forget(blog_ids)
+	signatures, bucket_rows = [], []
+	for blog_id, user_id, title, content in rows:
+		sig = signature(title, content)
+		signatures.append({'blog_id': blog_id, 'signature': sig.tobytes()})
+		bucket_rows.extend({'user_id': user_id, 'bucket': key, 'blog_id': blog_id} for key in set(buckets(sig)))
+	db.session.execute(sa.insert(PostSignature), signatures)
+	db.session.execute(sa.insert(PostBucket), bucket_rows)
+
+
+def index_blogs(blogs) -> None:
+	"""Re-index ``blogs`` after their title or content changed, in the caller's transaction."""
+	index((blog.id, blog.user_id, blog.title, blog.content_markdown) for blog in blogs)
+
+
+def forget(blog_ids) -> None:
+	for chunk in _chunks(blog_ids):
+		db.session.execute(sa.delete(PostBucket).where(PostBucket.blog_id.in_(chunk)))
+		db.session.execute(sa.delete(PostSignature).where(PostSignature.blog_id.in_(chunk)))
+
+
+def index_missing(batch_size: int = 500) -> int:
+	"""Index posts written before signatures existed. Returns how many were indexed."""
+	indexed = 0
+	missing = sa.select(Blog.id, Blog.user_id, Blog.title, Blog.content_markdown).where(
+		~sa.exists(sa.select(PostSignature.blog_id).where(PostSignature.blog_id == Blog.id))
+	).order_by(Blog.id).limit(batch_size)
+	while rows := db.session.execute(missing).all():
+		index(rows)
+		indexed += len(rows)
+	return indexed
+
+
+def _signatures(blog_ids) -> dict:
+	found = {}
+	for chunk in _chunks(blog_ids):
+		found.update(
+			(blog_id, _unpack(data)) for blog_id, data in
+			db.session.execute(sa.select(PostSignature.blog_id, PostSignature.signature).where(PostSignature.blog_id.in_(chunk)))
+		)
+	return found
+
+
+def _candidates(user_id: int, keys) -> dict[int, set[int]]:
+	"""``{bucket: blog ids}`` of the user's posts in any of ``keys``."""
+	members = {}
+	for chunk in _chunks(set(keys)):
+		for bucket, blog_id in db.session.execute(
+			sa.select(PostBucket.bucket, PostBucket.blog_id).where(PostBucket.user_id == user_id, PostBucket.bucket.in_(chunk))
+		):
+			members.setdefault(bucket, set()).add(blog_id)
+	return members
+
+
+def find(user_id: int, title: str | None, content: str | None, exclude=()) -> list[tuple[int, float]]:
+	"""The user's posts similar to this title and content, as ``(blog_id, similarity)``, best first."""
+	return find_many(user_id, [signature(title, content)], exclude)[0]
+
+
+def find_many(user_id: int, sigs, exclude=()) -> list[list[tuple[int, float]]]:
+	""":func:`find` for several signatures with one bucket query."""
+	keys = [buckets(sig) for sig in sigs]
+	members = _candidates(user_id, (key for row in keys for key in row))
+	exclude = set(exclude)
+	candidates = [set().union(*(members.get(key, ()) for key in row)) - exclude for row in keys]
+	stored = _signatures(set().union(*candidates))
+	threshold = _threshold()
+	results = []
+	for sig, ids in zip(sigs, candidates):
+		scores = [(blog_id, similarity(sig, stored[blog_id])) for blog_id in ids if blog_id in stored]
+		results.append(sorted(
+			((blog_id, score) for blog_id, score in scores if score >= threshold), key=lambda item: (-item[1], item[0]),
+		))
+	return results
+
+
+def repeated(user_id: int, sigs) -> list[bool]:
+	"""Whether each signature matches one of the user's posts or an earlier signature of ``sigs``."""
+	threshold = _threshold()
+	seen, flags = {}, []
+	for sig, matches in zip(sigs, find_many(user_id, sigs)):
+		keys = buckets(sig)
+		earlier = {i for key in keys for i in seen.get(key, ())}
+		flag = bool(matches) or any(similarity(sig, sigs[i]) >= threshold for i in earlier)
+		if not flag:
+			for key in keys:
+				seen.setdefault(key, []).append(len(flags))
+		flags.append(flag)
+	return flags
+
+
+def groups(user_id: int | None = None) -> list[list[int]]:
+	"""Groups of near-duplicate posts (blog ids, ascending), per author."""
+	shared = sa.select(PostBucket.user_id, PostBucket.bucket).group_by(PostBucket.user_id, PostBucket.bucket).having(sa.func.count() > 1)
+	if user_id is not None:
+		shared = shared.where(PostBucket.user_id == user_id)
+	shared = shared.subquery()
+	rows = db.session.execute(
+		sa.select(PostBucket.bucket, PostBucket.user_id, PostBucket.blog_id)
+		.join(shared, sa.and_(PostBucket.user_id == shared.c.user_id, PostBucket.bucket == shared.c.bucket))
+	).all()
+	members = {}
+	for bucket, owner, blog_id in rows:
+		members.setdefault((owner, bucket), []).append(blog_id)
+	stored = _signatures({row.blog_id for row in rows})
+
+	parent = {}
+
+	def root(blog_id):
+		while parent.setdefault(blog_id, blog_id) != blog_id:
+			parent[blog_id] = parent[parent[blog_id]]
+			blog_id = parent[blog_id]
+		return blog_id
+
+	threshold = _threshold()
+	checked = set()
+	for ids in members.values():
+		ids.sort()
+		for i, first in enumerate(ids):
+			for second in ids[i + 1:]:
+				if (first, second) in checked:
+					continue
+				checked.add((first, second))
+				if similarity(stored[first], stored[second]) >= threshold:
+					parent[root(second)] = root(first)
+	clusters = {}
+	for blog_id in parent:
+		clusters.setdefault(root(blog_id), []).append(blog_id)
+	return sorted((sorted(ids) for ids in clusters.values() if len(ids) > 1), key=lambda ids: ids[0])
+
+
+def report(user_id: int | None = None) -> list[dict]:
+	"""Near-duplicate groups with the post :func:`merge` would keep and the drafts it would fold in.
+
+	``newer`` lists the drafts edited after the published post kept, which
+	:func:`merge` leaves alone unless told to discard them. Read-only: posts
+	written before signatures existed are left out until :func:`index_missing`
+	has run.
+	"""
+	found = groups(user_id)
+	blogs = {
+		blog.id: blog for blog in
+		Blog.query.filter(Blog.id.in_([blog_id for ids in found for blog_id in ids]))
+	} if found else {}
+	result = []
+	for ids in found:
+		members = [blogs[blog_id] for blog_id in ids]
+		keep = _keeper(members)
+		drafts = [blog for blog in members if blog is not keep and not blog.is_published]
+		result.append({
+			'user_id': keep.user_id,
+			'keep': keep.id,
+			'merge': [blog.id for blog in drafts],
+			'newer': [blog.id for blog in drafts if keep.is_published and blog.updated_at > keep.updated_at],
+			'posts': [
+				{'id': blog.id, 'title': blog.title, 'is_published': bool(blog.is_published), 'updated_at': blog.updated_at.isoformat()}
+				for blog in members
+			],
+		})
+	return result
+
+
+def _keeper(blogs):
+	"""The newest published post of a group, else its newest draft."""
+	return max(blogs, key=lambda blog: (bool(blog.is_published), blog.updated_at, blog.id))
+
+
+def merge(user_id: int | None = None, dry_run: bool = False, discard_newer: bool = False) -> dict:
+	"""Fold duplicate drafts into the post kept for their group; published posts are never removed.
+
+	Tags of merged drafts are added to the kept post and their social posts
+	move to it. A group with a draft edited after its published post may hold
+	work the post lacks, so it is skipped unless ``discard_newer`` is set.
+	Returns ``{'groups', 'merged'}`` counts and the ``skipped`` groups of
+	:func:`report`; a dry run only counts.
+	"""
+	groups_found = report(user_id)
+	skipped = [group for group in groups_found if group['newer'] and not discard_newer]
+	groups_found = [group for group in groups_found if discard_newer or not group['newer']]
+	merged = [blog_id for group in groups_found for blog_id in group['merge']]
+	result = {'groups': len(groups_found), 'merged': len(merged), 'skipped': skipped}
+	if dry_run or not merged:
+		return result
+	from .autosave import get_buffer
+
+	# Before any write: discarding waits for a flush in progress, which needs the write lock
+	buffer = get_buffer()
+	for blog_id in merged:
+		buffer.discard(blog_id)
+	for group in groups_found:
+		if not group['merge']:
+			continue
+		keep = db.session.get(Blog, group['keep'])
+		tag_ids = tag_service.current_tag_ids(keep.id)
+		for blog_id in group['merge']:
+			tag_ids |= tag_service.current_tag_ids(blog_id)
+		tag_service.sync_blog_tags(keep, tag_ids)
+		db.session.execute(
+			sa.update(SocialPost).where(SocialPost.blog_id.in_(group['merge'])).values(blog_id=keep.id)
+			.execution_options(synchronize_session=False)
+		)
+		for blog_id in group['merge']:
+			tag_service.sync_blog_tags(db.session.get(Blog, blog_id), [])
+	forget(merged)
+	for model in (RelatedPosts, SearchDocument, PostMetadata, PostViews):
+		db.session.execute(sa.delete(model).where(model.blog_id.in_(merged)))
+	db.session.execute(blog_tags.delete().where(blog_tags.c.blog_id.in_(merged)))
+	db.session.execute(sa.delete(Blog).where(Blog.id.in_(merged)))
+	return result
@@ -0,0 +1,108 @@
+"""The write hook for posts.
+
+Every write that changes a post's text, tags or published state calls
+:func:`posts_changed` in its transaction, which flags everything derived from
+those posts: cached cards, feeds and sitemaps, related posts and the search
+index. The derived stores don't call each other.
+
+Feeds rebuild on their next read. The related-posts and search indexes are
+brought up to date by :class:`IndexRefresher`, ``INDEX_REFRESH_INTERVAL``
+seconds after a transaction that changed posts commits, in a thread of the
+process that made the change. Setting the interval to ``0`` leaves them to
+``flask public related`` and ``flask search index`` (e.g. from cron).
+"""
+import atexit
+import threading
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from .. import fragment_cache, search
+from ..extensions import db
+from ..public import feeds, related
+
+
+def posts_changed(blog_ids=(), listings: bool = False) -> None:
+	"""Flag what is derived from ``blog_ids``, in the caller's transaction.
+
+	``listings`` also covers author and tag pages (publish, unpublish, tags).
+	"""
+	blog_ids = [blog_id for blog_id in blog_ids if blog_id is not None]
+	fragment_cache.invalidate_blogs(blog_ids)
+	feeds.mark_stale(blog_ids, listings=listings)
+	related.mark_stale(blog_ids)
+	search.mark_stale(blog_ids)
+	if blog_ids:
+		db.session().info['posts_changed'] = True
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_commit')
+def _refresh_after_commit(session):
+	if session.info.pop('posts_changed', False) and has_app_context():
+		refresher = current_app.extensions.get('index_refresher')
+		if refresher is not None:
+			refresher.schedule()
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_soft_rollback')
+def _forget_on_rollback(session, previous_transaction):
+	session.info.pop('posts_changed', None)
+
+
+class IndexRefresher:
+	"""Refreshes the related-posts and search indexes in a thread after posts change."""
+
+	def __init__(self, app, interval: float = 5.0):
+		self.app = app
+		self.interval = interval
+		self._due = threading.Event()
+		self._stop = threading.Event()
+		self._lock = threading.Lock()
+		self._thread = None
+
+	def schedule(self) -> None:
+		"""Refresh within ``interval`` seconds; calls in between share one refresh."""
+		if self.interval <= 0:
+			return
+		self._due.set()
+		self._ensure_thread()
+
+	def refresh(self) -> None:
+		"""Refresh the stale posts of both indexes now, in an app context of its own."""
+		with self._lock, self.app.app_context():
+			try:
+				related.refresh(nearby=True)
+				db.session.commit()
+			except Exception as e:
+				db.session.rollback()
+				self.app.logger.error(f"Related posts refresh failed: {e}")
+			try:
+				if search.refresh(blocking=False) is None:
+					# Another process is writing this host's index; try again next time
+					self._due.set()
+				db.session.commit()
+			except Exception as e:
+				db.session.rollback()
+				self.app.logger.error(f"Search index refresh failed: {e}")
+
+	def _ensure_thread(self) -> None:
+		if self._thread is not None and self._thread.is_alive():
+			return
+		self._thread = threading.Thread(target=self._run, name='index-refresher', daemon=True)
+		self._thread.start()
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			if self._due.is_set():
+				self._due.clear()
+				self.refresh()
+
+	def close(self) -> None:
+		"""Stop the refresher thread; cron or the next write catches up on what's left."""
+		self._stop.set()
+
+
+def init_app(app) -> None:
+	refresher = IndexRefresher(app, interval=app.config.get('INDEX_REFRESH_INTERVAL', 5.0))
+	app.extensions['index_refresher'] = refresher
+	atexit.register(refresher.close)
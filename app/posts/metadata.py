@@ -0,0 +1,170 @@
+"""Facts derived from a post's markdown, extracted once when it is saved.
+
+:func:`extract` parses the markdown with markdown-it and returns the word
+count, reading time, heading outline, first image, outbound links and
+fenced code languages. Writers call :func:`store_blogs` in the same
+transaction that changes a post's content, and views read the stored
+:class:`~app.models.PostMetadata` row through :func:`load` instead of parsing
+the body again. Auto-saves are extracted when they are buffered and written
+with the buffered fields. Posts saved before extraction existed have no
+metadata until ``flask posts metadata`` has run.
+"""
+import json
+import math
+import re
+
+import sqlalchemy as sa
+
+from ..extensions import db
+from ..models import Blog, PostMetadata
+
+WORDS_PER_MINUTE = 200
+WORD = re.compile(r"\w+(?:['’]\w+)*")
+ANCHOR = re.compile(r'[^\w\- ]+')
+# Bound parameters per IN (...) query
+CHUNK = 900
+
+_parser = None
+
+
+def _markdown():
+	"""The same markdown dialect as the editor preview; raw HTML is parsed, not counted."""
+	global _parser
+	if _parser is None:
+		from markdown_it import MarkdownIt
+
+		md = MarkdownIt('commonmark', {'html': True})
+		md.enable(['table', 'strikethrough'])
+		_parser = md
+	return _parser
+
+
+def _anchor(text: str, taken: set) -> str:
+	"""GitHub-style heading anchor, suffixed when the same heading appears again."""
+	base = ANCHOR.sub('', text.lower()).strip().replace(' ', '-') or 'section'
+	anchor, n = base, 1
+	while anchor in taken:
+		anchor = f'{base}-{n}'
+		n += 1
+	taken.add(anchor)
+	return anchor
+
+
+def extract(markdown: str | None) -> dict:
+	"""Metadata of a markdown body, in the shape :func:`load` returns."""
+	tokens = _markdown().parse(markdown or '')
+	words, toc, links, languages = 0, [], [], []
+	first_image, anchors = None, set()
+	for i, token in enumerate(tokens):
+		if token.type == 'fence':
+			language = token.info.split()[0].lower() if token.info.strip() else None
+			if language and language not in languages:
+				languages.append(language)
+		if token.type != 'inline':
+			continue
+		text = []
+		for child in token.children or ():
+			if child.type in ('text', 'code_inline'):
+				text.append(child.content)
+			elif child.type == 'image':
+				first_image = first_image or child.attrs.get('src')
+			elif child.type == 'link_open':
+				href = child.attrs.get('href') or ''
+				if href.startswith(('http://', 'https://')) and href not in links:
+					links.append(href)
+		text = ''.join(text)
+		words += len(WORD.findall(text))
+		if i and tokens[i - 1].type == 'heading_open':
+			heading = ' '.join(text.split())
+			toc.append({'level': int(tokens[i - 1].tag[1]), 'text': heading, 'anchor': _anchor(heading, anchors)})
+	return {
+		'word_count': words,
+		'reading_minutes': max(1, math.ceil(words / WORDS_PER_MINUTE)) if words else 0,
+		'toc': toc,
+		'first_image': first_image,
+		'links': links,
+		'code_languages': languages,
+	}
+
+
+def _chunks(values):
+	values = list(values)
+	for start in range(0, len(values), CHUNK):
+		yield values[start:start + CHUNK]
+
+
+def store(rows) -> None:
+	"""Extract and store metadata for ``(blog_id, content_markdown)`` rows, replacing old rows."""
+	save({blog_id: extract(content) for blog_id, content in rows})
+
+
+def save(extracted: dict) -> None:
+	"""Store already extracted metadata, ``{blog_id: extract(...)}``, replacing old rows."""
+	records = []
+	for blog_id, found in extracted.items():
+		records.append({
+			'blog_id': blog_id,
+			'word_count': found['word_count'],
+			'reading_minutes': found['reading_minutes'],
+			'first_image': (found['first_image'] or '')[:1024] or None,
+			'toc': json.dumps(found['toc']),
+			'links': json.dumps(found['links']),
+			'code_languages': json.dumps(found['code_languages']),
+		})
+	if not records:
+		return
+	forget(record['blog_id'] for record in records)
+	db.session.execute(sa.insert(PostMetadata), records)
+
+
+def store_blogs(blogs) -> None:
+	"""Re-extract metadata of ``blogs`` after their content changed, in the caller's transaction."""
+	store((blog.id, blog.content_markdown) for blog in blogs)
+
+
+def forget(blog_ids) -> None:
+	for chunk in _chunks(blog_ids):
+		db.session.execute(sa.delete(PostMetadata).where(PostMetadata.blog_id.in_(chunk)))
+
+
+def store_missing(batch_size: int = 500, rebuild: bool = False) -> int:
+	"""Extract metadata for posts without it (every post with ``rebuild``). Returns how many."""
+	stored, after = 0, 0
+	query = sa.select(Blog.id, Blog.content_markdown).order_by(Blog.id).limit(batch_size)
+	if not rebuild:
+		query = query.where(~sa.exists(sa.select(PostMetadata.blog_id).where(PostMetadata.blog_id == Blog.id)))
+	while rows := db.session.execute(query.where(Blog.id > after)).all():
+		store(rows)
+		stored += len(rows)
+		after = rows[-1].id
+	return stored
+
+
+def _as_dict(row) -> dict:
+	return {
+		'word_count': row.word_count,
+		'reading_minutes': row.reading_minutes,
+		'toc': json.loads(row.toc),
+		'first_image': row.first_image,
+		'links': json.loads(row.links),
+		'code_languages': json.loads(row.code_languages),
+	}
+
+
+def load(blog_ids) -> dict[int, dict]:
+	"""Stored metadata by blog id; posts not extracted yet are missing."""
+	found = {}
+	for chunk in _chunks(blog_ids):
+		found.update((row.blog_id, _as_dict(row)) for row in PostMetadata.query.filter(PostMetadata.blog_id.in_(chunk)))
+	return found
+
+
+def for_blog(blog) -> dict | None:
+	"""Metadata of ``blog``: that of an auto-save waiting to be written, else the stored row.
+
+	``None`` for a post saved before extraction existed; reads never parse.
+	"""
+	# The auto-save buffer imports this module
+	from .autosave import pending_metadata
+
+	return pending_metadata(blog.id) or load([blog.id]).get(blog.id)
@@ -1,9 +1,17 @@
-from flask import render_template, request, redirect, url_for, abort, jsonify, flash
+from flask import current_app, render_template, request, redirect, url_for, abort, jsonify, flash, Response, stream_with_context, make_response
 from flask_login import login_required, current_user
 from . import bp
 from ..extensions import db
+from sqlalchemy.orm import lazyload
+from .. import analytics, asgi, http_cache, fragment_cache, singleflight
+from .hooks import posts_changed
 from ..models import Blog, Tag
-from markdown_it import MarkdownIt
+from . import tags as tag_service
+from . import autosave
+from . import archive
+from . import channel
+from . import duplicates
+from . import metadata
 from datetime import datetime
 
 
@@ -18,12 +26,20 @@ def list_blogs():
 	
 	# Apply filter based on parameter
 	if filter_type == 'drafts':
-		blogs = query.filter_by(is_published=False).order_by(Blog.updated_at.desc()).all()
+		query = query.filter_by(is_published=False)
 	elif filter_type == 'published':
-		blogs = query.filter_by(is_published=True).order_by(Blog.updated_at.desc()).all()
-	else:
-		# Default to all blogs if no valid filter
-		blogs = query.order_by(Blog.updated_at.desc()).all()
+		query = query.filter_by(is_published=True)
+	
+	# Answer with 304 if nothing on the page changed since the client's copy
+	parts, last_modified = http_cache.blogs_fingerprint(query)
+	etag = http_cache.make_etag('list', current_user.id, current_user.updated_at, filter_type, parts)
+	cached = http_cache.not_modified(etag, last_modified)
+	if cached:
+		return cached
+	
+	# Tags are only loaded for cards that miss the fragment cache
+	blogs = query.options(lazyload(Blog.tags)).order_by(Blog.updated_at.desc()).all()
+	autosave.apply_pending(blogs)
 	
 	# Define tag colors for random assignment - dark backgrounds with white text
 	tag_colors = [
@@ -39,7 +55,9 @@ def list_blogs():
 		'bg-cyan-600 text-white'
 	]
 	
-	return render_template('posts/list.html', blogs=blogs, tag_colors=tag_colors, current_filter=filter_type)
+	cards = fragment_cache.get_cache().render_cards('posts/_blog_card.html', blogs, tag_colors=tag_colors)
+	response = make_response(render_template('posts/list.html', blogs=blogs, cards=cards, current_filter=filter_type))
+	return http_cache.set_validators(response, etag, last_modified)
 
 
 @bp.get('/new')
@@ -64,6 +82,15 @@ def create_blog():
 		flash('A blog with this title already exists. Please choose a different title.', 'error')
 		return redirect(url_for('posts.new_blog'))
 	
+	# A near-duplicate of another post needs confirming; nothing else is changed
+	if not request.form.get('confirm_duplicate'):
+		similar = [db.session.get(Blog, blog_id) for blog_id, _ in duplicates.find(current_user.id, title, content)]
+		if similar:
+			form = {'title': title, 'description': description, 'content': content}
+			return render_template(
+				'posts/edit.html', blog=None, available_tags=[], current_tag_ids=[], form=form, duplicates=similar,
+			)
+	
 	# Create blog as published by default
 	blog = Blog(
 		user_id=current_user.id, 
@@ -75,6 +102,10 @@ def create_blog():
 		published_at=datetime.utcnow()  # Set publish timestamp
 	)
 	db.session.add(blog)
+	db.session.flush()
+	posts_changed([blog.id], listings=True)
+	duplicates.index_blogs([blog])
+	metadata.store_blogs([blog])
 	db.session.commit()
 	return redirect(url_for('posts.edit_blog', blog_id=blog.id))
 
@@ -82,10 +113,37 @@ def create_blog():
 @bp.get('/<int:blog_id>')
 @login_required
 def view_blog(blog_id: int):
-	blog = Blog.query.filter_by(id=blog_id, user_id=current_user.id).first()
+	query = Blog.query.filter_by(id=blog_id, user_id=current_user.id)
+	parts, last_modified = http_cache.blogs_fingerprint(query)
+	if not parts:
+		abort(404)
+	etag = http_cache.make_etag('detail', current_user.updated_at, parts)
+	cached = http_cache.not_modified(etag, last_modified)
+	if cached:
+		return cached
+	
+	blog = query.first()
 	if not blog:
 		abort(404)
-	return render_template('posts/detail.html', blog=blog)
+	autosave.apply_pending(blog)
+	response = make_response(render_template('posts/detail.html', blog=blog))
+	return http_cache.set_validators(response, etag, last_modified)
+
+
+@bp.get('/<int:blog_id>/analytics')
+@login_required
+def blog_analytics(blog_id: int):
+	"""Daily views and read-throughs of one of the user's posts, ``?days=`` back (default 30)."""
+	if not Blog.query.filter_by(id=blog_id, user_id=current_user.id).with_entities(Blog.id).first():
+		abort(404)
+	days = min(max(request.args.get('days', 30, type=int), 1), 365)
+	daily = analytics.daily(blog_id, days)
+	return jsonify({
+		'blog_id': blog_id,
+		'days': daily,
+		'views': sum(day['views'] for day in daily),
+		'reads': sum(day['reads'] for day in daily),
+	})
 
 
 @bp.get('/<int:blog_id>/edit')
@@ -94,6 +152,7 @@ def edit_blog(blog_id: int):
 	blog = Blog.query.filter_by(id=blog_id, user_id=current_user.id).first()
 	if not blog:
 		abort(404)
+	autosave.apply_pending(blog)
 	
 	# Get all user's tags and current blog tags
 	available_tags = Tag.query.filter_by(user_id=current_user.id).order_by(Tag.name).all()
@@ -109,6 +168,10 @@ def update_blog(blog_id: int):
 	if not blog:
 		abort(404)
 	
+	# A full save supersedes anything still waiting in the auto-save buffer
+	autosave.get_buffer().discard(blog.id)
+	posts_changed([blog.id])
+	
 	# Update basic fields
 	blog.title = request.form.get('title', blog.title)
 	blog.description = request.form.get('description', blog.description)
@@ -117,20 +180,17 @@ def update_blog(blog_id: int):
 	# Preserve existing AI-generated content (don't overwrite if not provided in form)
 	# LinkedIn and Twitter content are only updated via AI endpoints, not regular saves
 	
-	# Ensure blog is published when saving
-	blog.is_published = True
-	if not blog.published_at:  # Set publish timestamp if not already set
-		blog.published_at = datetime.utcnow()
+	# Ensure blog is published when saving (keeps tag counters in step)
+	tag_service.set_published(blog, True)
 	
 	# Handle tag assignments
 	selected_tag_ids = request.form.getlist('tags')
 	selected_tag_ids = [int(tag_id) for tag_id in selected_tag_ids if tag_id.isdigit()]
 	
-	# Get tags that belong to the current user
-	user_tags = Tag.query.filter_by(user_id=current_user.id).filter(Tag.id.in_(selected_tag_ids)).all()
-	
-	# Update blog tags
-	blog.tags = user_tags
+	# Only insert/delete the association rows that actually changed
+	tag_service.sync_blog_tags(blog, selected_tag_ids)
+	duplicates.index_blogs([blog])
+	metadata.store_blogs([blog])
 	
 	db.session.commit()
 	return redirect(url_for('posts.edit_blog', blog_id=blog.id))
@@ -164,14 +224,173 @@ def create_tag():
 @bp.delete('/tags/<int:tag_id>')
 @login_required
 def delete_tag(tag_id: int):
-	tag = Tag.query.filter_by(id=tag_id, user_id=current_user.id).first()
-	if not tag:
+	if not tag_service.delete_tags(current_user.id, [tag_id]):
 		abort(404)
-	db.session.delete(tag)
 	db.session.commit()
 	return '', 204
 
 
+@bp.get('/tags/cloud')
+@login_required
+def tag_cloud():
+	"""Popular tags for the tag cloud and tag typeahead.
+	
+	Query parameters:
+		q: Optional name prefix to match.
+		scope: ``global`` (default) ranks tag names across all published posts;
+			``mine`` ranks the current user's tags by how many posts use them.
+		limit: Maximum number of tags to return (default 20, max 100).
+	"""
+	prefix = request.args.get('q', '')
+	limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+	user_id = current_user.id if request.args.get('scope') == 'mine' else None
+	return jsonify({'tags': tag_service.tag_cloud(prefix, limit=limit, user_id=user_id)})
+
+
+@bp.post('/tags/bulk')
+@login_required
+def bulk_tags():
+	"""Create, rename, merge and delete many tags in a single transaction.
+	
+	Expects JSON with any of::
+	
+		{
+			"create": ["python", "flask"],
+			"rename": {"12": "web"},
+			"merge": {"into": 3, "from": [4, 5]},
+			"delete": [7, 8]
+		}
+	
+	Operations run in that order and are committed together; if any of them
+	fails nothing is applied.
+	"""
+	data = request.get_json(silent=True) or {}
+	try:
+		created = tag_service.create_tags(current_user.id, data.get('create') or [])
+		renamed = tag_service.rename_tags(current_user.id, data.get('rename') or {})
+		merged = set()
+		merge = data.get('merge') or {}
+		if merge.get('into') is not None:
+			merged = tag_service.merge_tags(current_user.id, merge.get('from') or [], merge['into'])
+		deleted = tag_service.delete_tags(current_user.id, data.get('delete') or [])
+		db.session.commit()
+	except (ValueError, TypeError) as e:
+		db.session.rollback()
+		return jsonify({'error': str(e)}), 400
+	except Exception:
+		db.session.rollback()
+		current_app.logger.exception('Bulk tag error')
+		return jsonify({'error': 'Bulk tag update failed'}), 500
+	
+	return jsonify({
+		'created': [{'id': tag.id, 'name': tag.name} for tag in created],
+		'renamed': {str(tag_id): name for tag_id, name in renamed.items()},
+		'merged': sorted(merged),
+		'deleted': sorted(deleted),
+	})
+
+
+@bp.post('/bulk-retag')
+@login_required
+def bulk_retag():
+	"""Add and/or remove tags on many posts at once.
+	
+	Expects JSON ``{"blog_ids": [...], "add": [tag ids], "remove": [tag ids]}``.
+	"""
+	data = request.get_json(silent=True) or {}
+	blog_ids = data.get('blog_ids') or []
+	if not blog_ids:
+		return jsonify({'error': 'blog_ids required'}), 400
+	try:
+		counts = tag_service.retag_blogs(
+			current_user.id,
+			blog_ids,
+			add_ids=data.get('add') or [],
+			remove_ids=data.get('remove') or [],
+		)
+		db.session.commit()
+	except (ValueError, TypeError) as e:
+		db.session.rollback()
+		return jsonify({'error': str(e)}), 400
+	except Exception:
+		db.session.rollback()
+		current_app.logger.exception('Bulk retag error')
+		return jsonify({'error': 'Bulk retag failed'}), 500
+	
+	return jsonify(counts)
+
+
+@bp.get('/export')
+@login_required
+def export_blogs():
+	"""Stream all of the current user's posts, tags and social posts.
+	
+	``?format=ndjson`` (default) returns one JSON record per line;
+	``?format=tar`` returns a gzipped tar of markdown files with front matter.
+	"""
+	fmt = request.args.get('format', 'ndjson')
+	if fmt not in archive.FORMATS:
+		return jsonify({'error': f"format must be one of {', '.join(archive.FORMATS)}"}), 400
+	
+	user_id = current_user.id
+	stamp = datetime.utcnow().strftime('%Y%m%d')
+	if fmt == 'tar':
+		body, mimetype, filename = archive.export_tar(user_id), 'application/gzip', f'blogforge-{stamp}.tar.gz'
+	else:
+		body, mimetype, filename = archive.export_ndjson(user_id), 'application/x-ndjson', f'blogforge-{stamp}.ndjson'
+	
+	return Response(
+		stream_with_context(body),
+		mimetype=mimetype,
+		headers={'Content-Disposition': f'attachment; filename={filename}'},
+	)
+
+
+@bp.post('/import')
+@login_required
+def import_blogs():
+	"""Import an archive produced by ``/posts/export``.
+	
+	Accepts a multipart upload in the ``archive`` field or a raw request body.
+	The format is taken from ``?format=`` or guessed from the file name and
+	content type. Taken slugs are suffixed, or with ``?on_conflict=skip`` the
+	post is skipped. Near-duplicates of existing posts are skipped unless
+	``?on_duplicate=keep``.
+	"""
+	upload = request.files.get('archive')
+	if upload is not None:
+		stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+	else:
+		stream, filename, content_type = request.stream, None, request.mimetype
+	fmt = request.args.get('format') or archive.detect_format(filename, content_type)
+	if fmt not in archive.FORMATS:
+		return jsonify({'error': f"format must be one of {', '.join(archive.FORMATS)}"}), 400
+	
+	try:
+		importer = archive.Importer(
+			current_user.id,
+			on_conflict=request.args.get('on_conflict', 'rename'),
+			on_duplicate=request.args.get('on_duplicate', 'skip'),
+		)
+		stats = importer.run(archive.read_records(stream, fmt))
+	except ValueError as e:
+		db.session.rollback()
+		return jsonify({'error': str(e)}), 400
+	except Exception:
+		db.session.rollback()
+		current_app.logger.exception('Import error')
+		return jsonify({'error': 'Import failed'}), 500
+	
+	return jsonify(stats)
+
+
+@bp.get('/duplicates')
+@login_required
+def duplicate_report():
+	"""Groups of the user's near-duplicate posts, with the post each would be merged into."""
+	return jsonify({'groups': duplicates.report(current_user.id)})
+
+
 @bp.route('/render-markdown', methods=['GET'])
 def render_markdown():
 	"""Render markdown text to HTML using markdown-it-py with enhanced features.
@@ -217,20 +436,31 @@ def render_markdown():
 	if not markdown_text:
 		return jsonify({'html': ''})
 	
-	# Configure markdown-it with proper settings like in the image
-	md = MarkdownIt('commonmark', {'breaks': True, 'html': True})
-	
-	# Enable plugins for enhanced features
-	md.enable(['table', 'strikethrough'])
-	
-	html = md.render(markdown_text)
+	# Identical previews requested at once (several tabs, a burst of overlays) render once
+	html = singleflight.do('markdown', (markdown_text,), lambda: channel.renderer().render(markdown_text))
 	return jsonify({'html': html})
 
 
+@bp.get('/channel')
+@asgi.websocket(channel.serve)
+@login_required
+def editor_channel():
+	"""The editor's WebSocket (see ``app.posts.channel``), only served under ASGI.
+
+	Plain HTTP gets 426, and the editor falls back to the JSON endpoints.
+	"""
+	return jsonify({'error': 'WebSocket required'}), 426
+
+
 @bp.route('/auto-save', methods=['POST'])
 @login_required
 def auto_save():
-	"""Auto-save post content without updating timestamps"""
+	"""Auto-save post content into the write-behind buffer.
+	
+	The latest state is kept in memory and written in batches by
+	``app.posts.autosave``; reads overlay it, so the editor never sees stale
+	content.
+	"""
 	try:
 		data = request.get_json()
 		blog_id = data.get('blog_id')
@@ -241,35 +471,32 @@ def auto_save():
 		if not blog_id:
 			return jsonify({'error': 'Blog ID required'}), 400
 		
-		# Get the blog and verify ownership
-		blog = Blog.query.filter_by(id=blog_id, user_id=current_user.id).first()
-		if not blog:
+		# Verify ownership (cached by the buffer after the first auto-save)
+		buffer = autosave.get_buffer()
+		if not buffer.owns(int(blog_id), current_user.id):
 			return jsonify({'error': 'Blog not found'}), 404
 		
-		# Update content without changing updated_at timestamp
-		blog.title = title
-		blog.description = description
-		blog.content_markdown = content
-		
-		# Ensure blog is published when auto-saving
-		blog.is_published = True
-		if not blog.published_at:  # Set publish timestamp if not already set
-			blog.published_at = datetime.utcnow()
-		
-		# Don't update updated_at for auto-save
-		db.session.commit()
+		buffer.put(int(blog_id), {
+			'title': title,
+			'description': description,
+			'content_markdown': content,
+		})
 		
 		return jsonify({'success': True, 'message': 'Auto-saved successfully'})
 		
-	except Exception as e:
-		print(f"Auto-save error: {e}")
+	except Exception:
+		current_app.logger.exception('Auto-save error')
 		return jsonify({'error': 'Auto-save failed'}), 500
 
 
 @bp.route('/save-draft', methods=['POST'])
 @login_required
 def save_draft():
-	"""Save post as draft when user cancels"""
+	"""Save post as draft when user cancels.
+	
+	A near-duplicate of one of the user's posts is not saved unless
+	``confirm_duplicate`` is set; the 409 response names it in ``duplicate_of``.
+	"""
 	try:
 		data = request.get_json()
 		title = data.get('title', '').strip()
@@ -279,6 +506,16 @@ def save_draft():
 		if not title:
 			return jsonify({'error': 'Title required'}), 400
 		
+		if not data.get('confirm_duplicate'):
+			similar = duplicates.find(current_user.id, title, content)
+			if similar:
+				blog_id = similar[0][0]
+				return jsonify({
+					'error': 'A post with nearly the same content already exists',
+					'duplicate_of': blog_id,
+					'url': url_for('posts.edit_blog', blog_id=blog_id),
+				}), 409
+		
 		# Create post as draft
 		blog = Blog(
 			user_id=current_user.id,
@@ -290,10 +527,13 @@ def save_draft():
 			published_at=None
 		)
 		db.session.add(blog)
+		db.session.flush()
+		duplicates.index_blogs([blog])
+		metadata.store_blogs([blog])
 		db.session.commit()
 		
 		return jsonify({'success': True, 'message': 'Saved as draft', 'blog_id': blog.id})
 		
-	except Exception as e:
-		print(f"Save draft error: {e}")
+	except Exception:
+		current_app.logger.exception('Save draft error')
 		return jsonify({'error': 'Failed to save draft'}), 500
@@ -0,0 +1,356 @@
+"""Tag assignment helpers.
+
+These work on the ``blog_tags`` association table directly so a save only
+touches the pairs that actually changed, and bulk operations run as a handful
+of executemany statements inside the caller's transaction. Callers commit.
+
+Every change to an association or to a blog's published state also moves the
+denormalized counters (``Tag.blog_count``, ``Tag.published_count`` and
+``TagNameCount.published_count``) in the same transaction, so the tag cloud
+never has to join ``blog_tags``. The same functions fire the fragment cache
+invalidation hooks for the cards they affect and mark the public feed and
+sitemap artifacts stale.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+import sqlalchemy as sa
+from ..extensions import db
+from ..fragment_cache import invalidate_user_tags
+from ..models import Blog, Tag, TagNameCount, blog_tags
+from .hooks import posts_changed
+
+
+def normalize_tag_name(name) -> str:
+	return str(name or '').strip().lower()
+
+
+def owned_tag_ids(user_id: int, tag_ids) -> set[int]:
+	"""Return the subset of ``tag_ids`` that belong to ``user_id``."""
+	tag_ids = {int(tag_id) for tag_id in tag_ids}
+	if not tag_ids:
+		return set()
+	rows = db.session.execute(
+		sa.select(Tag.id).where(Tag.user_id == user_id, Tag.id.in_(tag_ids))
+	)
+	return set(rows.scalars())
+
+
+def owned_blogs(user_id: int, blog_ids) -> dict[int, bool]:
+	"""Return ``{blog_id: is_published}`` for the ``blog_ids`` owned by ``user_id``."""
+	blog_ids = {int(blog_id) for blog_id in blog_ids}
+	if not blog_ids:
+		return {}
+	rows = db.session.execute(
+		sa.select(Blog.id, Blog.is_published).where(Blog.user_id == user_id, Blog.id.in_(blog_ids))
+	)
+	return {blog_id: bool(is_published) for blog_id, is_published in rows}
+
+
+def current_tag_ids(blog_id: int) -> set[int]:
+	rows = db.session.execute(sa.select(blog_tags.c.tag_id).where(blog_tags.c.blog_id == blog_id))
+	return set(rows.scalars())
+
+
+def apply_count_deltas(deltas: dict) -> None:
+	"""Add ``{tag_id: (blog_delta, published_delta)}`` to the tag counters."""
+	deltas = {tag_id: delta for tag_id, delta in deltas.items() if delta != (0, 0)}
+	if not deltas:
+		return
+	tags = Tag.__table__
+	db.session.execute(
+		sa.update(tags)
+		.where(tags.c.id == sa.bindparam('tag_id'))
+		.values(
+			blog_count=tags.c.blog_count + sa.bindparam('blog_delta'),
+			published_count=tags.c.published_count + sa.bindparam('published_delta'),
+		),
+		[
+			{'tag_id': tag_id, 'blog_delta': blog_delta, 'published_delta': published_delta}
+			for tag_id, (blog_delta, published_delta) in deltas.items()
+		],
+	)
+
+	published = {tag_id: delta[1] for tag_id, delta in deltas.items() if delta[1]}
+	if not published:
+		return
+	by_name = defaultdict(int)
+	for tag_id, name in db.session.execute(sa.select(Tag.id, Tag.name).where(Tag.id.in_(published))):
+		by_name[name] += published[tag_id]
+	_apply_name_deltas(by_name)
+
+
+def _apply_name_deltas(by_name: dict) -> None:
+	by_name = {name: delta for name, delta in by_name.items() if delta}
+	if not by_name:
+		return
+	counts = TagNameCount.__table__
+	existing = set(db.session.execute(
+		sa.select(counts.c.name).where(counts.c.name.in_(by_name))
+	).scalars())
+
+	updates = [{'tag_name': name, 'delta': delta} for name, delta in by_name.items() if name in existing]
+	if updates:
+		db.session.execute(
+			sa.update(counts)
+			.where(counts.c.name == sa.bindparam('tag_name'))
+			.values(published_count=counts.c.published_count + sa.bindparam('delta')),
+			updates,
+		)
+	inserts = [
+		{'name': name, 'published_count': max(delta, 0)}
+		for name, delta in by_name.items()
+		if name not in existing
+	]
+	if inserts:
+		db.session.execute(counts.insert(), inserts)
+
+
+def refresh_counts(tag_ids=(), names=()) -> None:
+	"""Recompute counters from scratch for the given tags and tag names.
+
+	Used by the bulk operations, where working out exact deltas would cost
+	more queries than a targeted recount.
+	"""
+	tags = Tag.__table__
+	tag_ids = set(tag_ids)
+	if tag_ids:
+		usage = (
+			sa.select(sa.func.count())
+			.select_from(blog_tags)
+			.where(blog_tags.c.tag_id == tags.c.id)
+			.scalar_subquery()
+		)
+		published = (
+			sa.select(sa.func.count())
+			.select_from(blog_tags.join(Blog.__table__, Blog.__table__.c.id == blog_tags.c.blog_id))
+			.where(blog_tags.c.tag_id == tags.c.id, Blog.__table__.c.is_published.is_(True))
+			.scalar_subquery()
+		)
+		db.session.execute(
+			sa.update(tags).where(tags.c.id.in_(tag_ids)).values(blog_count=usage, published_count=published)
+		)
+
+	names = set(names)
+	if names:
+		counts = TagNameCount.__table__
+		db.session.execute(sa.delete(counts).where(counts.c.name.in_(names)))
+		db.session.execute(
+			counts.insert().from_select(
+				['name', 'published_count'],
+				sa.select(tags.c.name, sa.func.sum(tags.c.published_count))
+				.where(tags.c.name.in_(names))
+				.group_by(tags.c.name),
+			)
+		)
+
+
+def refresh_all_counts() -> None:
+	"""Rebuild every counter. Used by ``flask posts recount-tags``."""
+	tag_ids = db.session.execute(sa.select(Tag.id)).scalars().all()
+	refresh_counts(tag_ids)
+	db.session.execute(sa.delete(TagNameCount.__table__))
+	refresh_counts(names=db.session.execute(sa.select(Tag.name).distinct()).scalars().all())
+
+
+def set_published(blog: Blog, published: bool) -> None:
+	"""Publish or unpublish ``blog`` and move its tags' published counters with it."""
+	if published and not blog.published_at:
+		blog.published_at = datetime.utcnow()
+	was_published = bool(blog.is_published)
+	blog.is_published = published
+	if was_published == published or blog.id is None:
+		return
+	posts_changed([blog.id], listings=True)
+	delta = 1 if published else -1
+	apply_count_deltas({tag_id: (0, delta) for tag_id in current_tag_ids(blog.id)})
+
+
+def sync_blog_tags(blog: Blog, tag_ids) -> tuple[set[int], set[int]]:
+	"""Make ``blog``'s tags equal ``tag_ids`` by inserting/deleting only the difference.
+
+	Tag ids that do not belong to the blog's author are ignored.
+
+	Returns:
+		tuple: ``(added, removed)`` sets of tag ids.
+	"""
+	wanted = owned_tag_ids(blog.user_id, tag_ids)
+	existing = current_tag_ids(blog.id)
+	added = wanted - existing
+	removed = existing - wanted
+
+	if removed:
+		db.session.execute(
+			blog_tags.delete().where(blog_tags.c.blog_id == blog.id, blog_tags.c.tag_id.in_(removed))
+		)
+	if added:
+		db.session.execute(
+			blog_tags.insert(),
+			[{'blog_id': blog.id, 'tag_id': tag_id} for tag_id in sorted(added)],
+		)
+	if added or removed:
+		published = 1 if blog.is_published else 0
+		deltas = {tag_id: (1, published) for tag_id in added}
+		deltas.update({tag_id: (-1, -published) for tag_id in removed})
+		apply_count_deltas(deltas)
+		db.session.expire(blog, ['tags'])
+		posts_changed([blog.id], listings=True)
+	return added, removed
+
+
+def create_tags(user_id: int, names) -> list[Tag]:
+	"""Create every normalized name the user doesn't already have."""
+	wanted = {normalize_tag_name(name) for name in names} - {''}
+	if not wanted:
+		return []
+	existing = set(db.session.execute(
+		sa.select(Tag.name).where(Tag.user_id == user_id, Tag.name.in_(wanted))
+	).scalars())
+	tags = [Tag(user_id=user_id, name=name, blog_count=0, published_count=0) for name in sorted(wanted - existing)]
+	db.session.add_all(tags)
+	db.session.flush()
+	return tags
+
+
+def rename_tags(user_id: int, renames: dict) -> dict[int, str]:
+	"""Rename tags by id. Raises ``ValueError`` if a new name is already taken."""
+	renames = {int(tag_id): normalize_tag_name(name) for tag_id, name in renames.items()}
+	renames = {tag_id: name for tag_id, name in renames.items() if name}
+	ids = owned_tag_ids(user_id, renames)
+	renames = {tag_id: name for tag_id, name in renames.items() if tag_id in ids}
+	if not renames:
+		return {}
+
+	new_names = list(renames.values())
+	if len(set(new_names)) != len(new_names):
+		raise ValueError('Two tags cannot be renamed to the same name')
+	taken = db.session.execute(
+		sa.select(Tag.id, Tag.name).where(Tag.user_id == user_id, Tag.name.in_(new_names))
+	).all()
+	for tag_id, name in taken:
+		if tag_id not in renames:
+			raise ValueError(f'A tag named "{name}" already exists')
+
+	old_names = set(db.session.execute(sa.select(Tag.name).where(Tag.id.in_(renames))).scalars())
+	# ORM bulk UPDATE by primary key: a single executemany.
+	db.session.execute(
+		sa.update(Tag),
+		[{'id': tag_id, 'name': name} for tag_id, name in renames.items()],
+	)
+	refresh_counts(names=old_names | set(new_names))
+	invalidate_user_tags(user_id)
+	posts_changed(_tagged_blogs(renames), listings=True)
+	return renames
+
+
+def merge_tags(user_id: int, source_ids, target_id: int) -> set[int]:
+	"""Move every blog tagged with ``source_ids`` onto ``target_id`` and delete the sources."""
+	target_id = int(target_id)
+	if not owned_tag_ids(user_id, [target_id]):
+		raise ValueError('Merge target not found')
+	sources = owned_tag_ids(user_id, source_ids) - {target_id}
+	if not sources:
+		return set()
+
+	already_tagged = sa.select(blog_tags.c.blog_id).where(blog_tags.c.tag_id == target_id)
+	db.session.execute(
+		blog_tags.insert().from_select(
+			['blog_id', 'tag_id'],
+			sa.select(blog_tags.c.blog_id, sa.literal(target_id))
+			.where(blog_tags.c.tag_id.in_(sources), blog_tags.c.blog_id.not_in(already_tagged))
+			.distinct(),
+		)
+	)
+	refresh_counts([target_id])
+	delete_tags(user_id, sources, extra_names=_names_of([target_id]))
+	return sources
+
+
+def _tagged_blogs(tag_ids) -> list[int]:
+	return db.session.execute(
+		sa.select(blog_tags.c.blog_id).where(blog_tags.c.tag_id.in_(set(tag_ids))).distinct()
+	).scalars().all()
+
+
+def _names_of(tag_ids) -> set[str]:
+	return set(db.session.execute(sa.select(Tag.name).where(Tag.id.in_(set(tag_ids)))).scalars())
+
+
+def delete_tags(user_id: int, tag_ids, extra_names=()) -> set[int]:
+	"""Delete tags and their associations in two statements."""
+	ids = owned_tag_ids(user_id, tag_ids)
+	if not ids:
+		return set()
+	names = _names_of(ids) | set(extra_names)
+	tagged = _tagged_blogs(ids)
+	db.session.execute(blog_tags.delete().where(blog_tags.c.tag_id.in_(ids)))
+	db.session.execute(
+		sa.delete(Tag).where(Tag.id.in_(ids)).execution_options(synchronize_session=False)
+	)
+	refresh_counts(names=names)
+	invalidate_user_tags(user_id)
+	posts_changed(tagged, listings=True)
+	return ids
+
+
+def retag_blogs(user_id: int, blog_ids, add_ids=(), remove_ids=()) -> dict[str, int]:
+	"""Add and/or remove tags on many of the user's blogs at once."""
+	blogs = owned_blogs(user_id, blog_ids)
+	add = owned_tag_ids(user_id, add_ids)
+	remove = owned_tag_ids(user_id, remove_ids) - add
+	if not blogs or not (add or remove):
+		return {'added': 0, 'removed': 0}
+
+	existing = set(db.session.execute(
+		sa.select(blog_tags.c.blog_id, blog_tags.c.tag_id)
+		.where(blog_tags.c.blog_id.in_(blogs), blog_tags.c.tag_id.in_(add | remove))
+	).all())
+	to_remove = [(blog_id, tag_id) for blog_id, tag_id in existing if tag_id in remove]
+	to_add = [
+		(blog_id, tag_id)
+		for blog_id in sorted(blogs)
+		for tag_id in sorted(add)
+		if (blog_id, tag_id) not in existing
+	]
+
+	deltas = defaultdict(lambda: (0, 0))
+	if to_remove:
+		db.session.execute(
+			blog_tags.delete().where(blog_tags.c.blog_id.in_(blogs), blog_tags.c.tag_id.in_(remove))
+		)
+		for blog_id, tag_id in to_remove:
+			blog_delta, published_delta = deltas[tag_id]
+			deltas[tag_id] = (blog_delta - 1, published_delta - int(blogs[blog_id]))
+	if to_add:
+		db.session.execute(
+			blog_tags.insert(),
+			[{'blog_id': blog_id, 'tag_id': tag_id} for blog_id, tag_id in to_add],
+		)
+		for blog_id, tag_id in to_add:
+			blog_delta, published_delta = deltas[tag_id]
+			deltas[tag_id] = (blog_delta + 1, published_delta + int(blogs[blog_id]))
+	apply_count_deltas(dict(deltas))
+	changed = {blog_id for blog_id, _ in to_add + to_remove}
+	posts_changed(changed, listings=bool(changed))
+	return {'added': len(to_add), 'removed': len(to_remove)}
+
+
+def tag_cloud(prefix: str = '', limit: int = 20, user_id: int | None = None) -> list[dict]:
+	"""Most used tags starting with ``prefix``, read straight from the counters.
+
+	With ``user_id`` this ranks that user's own tags by ``blog_count``;
+	otherwise it ranks tag names across the whole published corpus. The prefix
+	match is an index range scan rather than ``LIKE``.
+	"""
+	prefix = normalize_tag_name(prefix)
+	if user_id is None:
+		name, count = TagNameCount.name, TagNameCount.published_count
+		query = sa.select(name, count).where(count > 0)
+	else:
+		name, count = Tag.name, Tag.blog_count
+		query = sa.select(name, count).where(Tag.user_id == user_id)
+	if prefix:
+		upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+		query = query.where(name >= prefix, name < upper)
+	query = query.order_by(count.desc(), name).limit(limit)
+	return [{'name': tag_name, 'count': tag_count} for tag_name, tag_count in db.session.execute(query)]
@@ -0,0 +1,224 @@
+"""Opt-in per-request profiler and the slow-query log.
+
+A request is profiled when it carries ``X-Profile: <PROFILER_TOKEN>``, when an
+admin adds ``?_profile=1`` to the URL, or at random for a
+``PROFILER_SAMPLE_RATE`` fraction of requests. A profiled request runs under
+:mod:`cProfile` and records every SQL statement with its time. Statements
+slower than ``PROFILER_EXPLAIN_MS`` are run again under ``EXPLAIN`` once the
+response is ready.
+
+Reports go to ``PROFILER_DIR`` (default ``instance/profiles``) as
+``<id>.json`` plus the raw ``<id>.prof`` for ``snakeviz`` or ``pstats``. The
+newest ``PROFILER_MAX_REPORTS`` are kept. Admins can list and download them
+under ``/_profiles``; profiled responses carry the id in ``X-Profile-ID``.
+
+Independently of profiling, every statement slower than ``SLOW_QUERY_MS`` is
+logged to ``app.slow_queries`` with the endpoint that ran it.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+
+from flask import current_app, g, has_app_context, has_request_context, jsonify, request, send_file
+from flask_login import current_user
+
+from . import metrics
+
+
+slow_query_logger = logging.getLogger('app.slow_queries')
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN ', 'mysql': 'EXPLAIN ', 'mariadb': 'EXPLAIN '}
+# Cap per report, so a runaway N+1 can't grow it without bound
+MAX_STATEMENTS = 2000
+TOP_FUNCTIONS = 40
+
+
+def _is_admin() -> bool:
+	return current_user.is_authenticated and current_user.is_admin
+
+
+def _wants_profile() -> bool:
+	config = current_app.config
+	token = config.get('PROFILER_TOKEN')
+	if token and request.headers.get('X-Profile') == token:
+		return True
+	if request.args.get('_profile') and _is_admin():
+		return True
+	rate = config.get('PROFILER_SAMPLE_RATE', 0)
+	return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+	if not _wants_profile():
+		return
+	profiler = cProfile.Profile()
+	try:
+		profiler.enable()
+	except ValueError:
+		# Another profiler is already running on this thread
+		return
+	g.profile = {'id': uuid.uuid4().hex, 'profiler': profiler, 'queries': [], 'started': time.perf_counter()}
+
+
+def _record_query(conn, statement, parameters, seconds):
+	if not has_app_context():
+		return
+	duration_ms = round(seconds * 1000, 3)
+	endpoint = request.endpoint if has_request_context() else None
+	if duration_ms >= current_app.config.get('SLOW_QUERY_MS', 250):
+		slow_query_logger.warning('slow query', extra={'fields': {
+			'endpoint': endpoint,
+			'duration_ms': duration_ms,
+			'statement': statement[:2000],
+		}})
+	profile = g.get('profile')
+	if profile is not None and len(profile['queries']) < MAX_STATEMENTS:
+		profile['queries'].append({
+			'statement': statement,
+			'parameters': parameters,
+			'duration_ms': duration_ms,
+			'engine': conn.engine,
+		})
+
+
+def _finish_profile(response):
+	profile = g.pop('profile', None)
+	if profile is None:
+		return response
+	profile['profiler'].disable()
+	duration_ms = round((time.perf_counter() - profile['started']) * 1000, 3)
+	try:
+		queries = _explain_slow(profile)
+		_write_report(profile, response, duration_ms, queries)
+		response.headers['X-Profile-ID'] = profile['id']
+	except Exception:
+		current_app.logger.exception('Profile report error')
+	return response
+
+
+def _explain_slow(profile) -> list[dict]:
+	# The profile is already off ``g``, so these EXPLAINs aren't recorded themselves
+	threshold = current_app.config.get('PROFILER_EXPLAIN_MS', 50)
+	queries = []
+	for entry in profile['queries']:
+		query = {
+			'statement': entry['statement'],
+			'parameters': repr(entry['parameters'])[:500],
+			'duration_ms': entry['duration_ms'],
+		}
+		prefix = EXPLAIN_PREFIXES.get(entry['engine'].dialect.name)
+		is_read = entry['statement'].lstrip()[:6].upper() in ('SELECT', 'WITH')
+		if prefix and is_read and entry['duration_ms'] >= threshold:
+			try:
+				with entry['engine'].connect() as conn:
+					rows = conn.exec_driver_sql(prefix + entry['statement'], entry['parameters']).fetchall()
+				query['explain'] = [' '.join(str(value) for value in row) for row in rows]
+			except Exception as e:
+				query['explain_error'] = str(e)
+		queries.append(query)
+	return queries
+
+
+def profile_dir() -> str:
+	return current_app.config.get('PROFILER_DIR') or os.path.join(current_app.instance_path, 'profiles')
+
+
+def _write_report(profile, response, duration_ms: float, queries: list[dict]) -> None:
+	directory = profile_dir()
+	os.makedirs(directory, exist_ok=True)
+	stats = pstats.Stats(profile['profiler'], stream=io.StringIO())
+	stats.dump_stats(os.path.join(directory, f"{profile['id']}.prof"))
+	stats.sort_stats('cumulative')
+	top = []
+	for func in stats.fcn_list[:TOP_FUNCTIONS]:
+		_, calls, tottime, cumtime, _ = stats.stats[func]
+		top.append({
+			'function': pstats.func_std_string(func),
+			'calls': calls,
+			'tottime_ms': round(tottime * 1000, 3),
+			'cumtime_ms': round(cumtime * 1000, 3),
+		})
+	report = {
+		'id': profile['id'],
+		'request_id': g.get('request_id'),
+		'method': request.method,
+		'path': request.full_path.rstrip('?'),
+		'endpoint': request.endpoint,
+		'status': response.status_code,
+		'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+		'duration_ms': duration_ms,
+		'query_count': len(queries),
+		'query_ms': round(sum(query['duration_ms'] for query in queries), 3),
+		'queries': queries,
+		'functions': top,
+	}
+	path = os.path.join(directory, f"{profile['id']}.json")
+	with open(f'{path}.tmp', 'w', encoding='utf-8') as fh:
+		json.dump(report, fh, indent=1)
+	os.replace(f'{path}.tmp', path)
+	_prune(directory)
+
+
+def _prune(directory: str) -> None:
+	keep = current_app.config.get('PROFILER_MAX_REPORTS', 200)
+	reports = sorted(
+		(entry for entry in os.scandir(directory) if entry.name.endswith('.json')),
+		key=lambda entry: entry.stat().st_mtime,
+		reverse=True,
+	)
+	for entry in reports[keep:]:
+		for name in (entry.path, entry.path[:-len('.json')] + '.prof'):
+			try:
+				os.remove(name)
+			except OSError:
+				pass
+
+
+def list_profiles():
+	"""Recent profile reports, newest first"""
+	if not _is_admin():
+		return jsonify({'error': 'Forbidden'}), 403
+	directory = profile_dir()
+	if not os.path.isdir(directory):
+		return jsonify({'profiles': []})
+	profiles = []
+	for entry in sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime, reverse=True):
+		if not entry.name.endswith('.json'):
+			continue
+		with open(entry.path, encoding='utf-8') as fh:
+			report = json.load(fh)
+		profiles.append({key: report.get(key) for key in (
+			'id', 'created_at', 'method', 'path', 'status', 'duration_ms', 'query_count', 'query_ms',
+		)})
+	return jsonify({'profiles': profiles})
+
+
+def download_profile(profile_id: str, kind: str):
+	"""One report as JSON, or the raw cProfile dump"""
+	if not _is_admin():
+		return jsonify({'error': 'Forbidden'}), 403
+	path = os.path.join(profile_dir(), f'{profile_id}.{kind}')
+	if not PROFILE_ID.match(profile_id) or not os.path.exists(path):
+		return jsonify({'error': 'Profile not found'}), 404
+	if kind == 'json':
+		return send_file(path, mimetype='application/json')
+	return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=f'{profile_id}.prof')
+
+
+def init_app(app) -> None:
+	"""Install the profiling hooks; call after :func:`app.metrics.init_app`."""
+	if _record_query not in metrics.QUERY_LISTENERS:
+		metrics.QUERY_LISTENERS.append(_record_query)
+	app.before_request(_start_profile)
+	app.after_request(_finish_profile)
+	app.add_url_rule('/_profiles', 'list_profiles', list_profiles)
+	app.add_url_rule('/_profiles/<profile_id>.json', 'download_profile', download_profile, defaults={'kind': 'json'})
+	app.add_url_rule('/_profiles/<profile_id>.prof', 'download_profile_stats', download_profile, defaults={'kind': 'prof'})
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+bp = Blueprint('public', __name__)
+
+from . import routes, commands  # noqa: F401
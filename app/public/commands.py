@@ -0,0 +1,28 @@
+import os
+import click
+from flask import current_app
+from . import bp, related
+from ..extensions import db
+from .static_site import StaticSiteBuilder
+
+
+@bp.cli.command('build')
+@click.option('-o', '--output', type=click.Path(file_okay=False), help='Defaults to PUBLIC_STATIC_DIR or instance/public.')
+@click.option('--force', is_flag=True, help='Re-render every page, e.g. after a template change.')
+def build_command(output, force):
+	"""Pre-generate public posts, author and tag pages, feeds and sitemap."""
+	output = output or current_app.config.get('PUBLIC_STATIC_DIR') or os.path.join(current_app.instance_path, 'public')
+	stats = StaticSiteBuilder(output, force=force).build()
+	click.echo(
+		f"Built {output}: {stats['written']} written, {stats['unchanged']} unchanged, "
+		f"{stats['removed']} removed."
+	)
+
+
+@bp.cli.command('related')
+@click.option('--rebuild', is_flag=True, help='Recompute every list, e.g. to refresh IDF weights.')
+def related_command(rebuild):
+	"""Update the related-posts index for posts changed since the last run."""
+	stats = related.rebuild() if rebuild else related.refresh()
+	db.session.commit()
+	click.echo(f"Indexed {stats['indexed']} posts, {stats['updated']} related lists changed.")
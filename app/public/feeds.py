@@ -0,0 +1,188 @@
+"""Pre-rendered RSS/Atom feeds and paginated sitemaps.
+
+Each file is a :class:`~app.models.FeedArtifact` row holding the gzipped body
+and its ETag, so serving a feed is one primary-key lookup. Writes call
+:func:`mark_stale` (through :func:`app.posts.hooks.posts_changed`), which
+bumps ``version`` on just the artifacts the change touches, inside the
+writer's transaction; the next read rebuilds an artifact
+whose ``built_version`` is behind. Nothing ever scans every published post:
+
+* ``rss`` / ``atom`` - the newest ``FEED_SIZE`` posts, via the
+  ``(is_published, published_at)`` index.
+* ``sitemap-<n>`` - published posts with ids in
+  ``[n * PUBLIC_SITEMAP_PAGE_SIZE, (n + 1) * PUBLIC_SITEMAP_PAGE_SIZE)``, so a
+  post change only rebuilds the page holding it.
+* ``sitemap-pages`` - author and tag pages, from the tag counters.
+* ``sitemap-index`` - the sitemap index served at ``/sitemap.xml``.
+
+Artifacts older than ``PUBLIC_FEED_MAX_AGE`` seconds are rebuilt as well, which
+bounds staleness from any change that was not marked.
+"""
+import gzip
+import hashlib
+import re
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app, url_for
+from sqlalchemy.exc import IntegrityError
+
+from . import pages
+from .. import metrics, replicas
+from ..extensions import db
+from ..models import Blog, FeedArtifact, TagNameCount
+
+
+FIXED_ARTIFACTS = ('rss', 'atom', 'sitemap-index', 'sitemap-pages')
+FILENAMES = {'rss': 'feed.xml', 'atom': 'atom.xml', 'sitemap-index': 'sitemap.xml'}
+MIMETYPES = {'rss': 'application/rss+xml', 'atom': 'application/atom+xml'}
+PAGE_NAME = re.compile(r'^sitemap-(\d+)$')
+
+
+def page_size() -> int:
+	return current_app.config.get('PUBLIC_SITEMAP_PAGE_SIZE', 50000)
+
+
+def page_count() -> int:
+	max_id = db.session.execute(sa.select(sa.func.max(Blog.id))).scalar()
+	return max_id // page_size() + 1 if max_id else 0
+
+
+def artifact_names() -> list[str]:
+	"""Every artifact, with the sitemap index last since it lists the others' lastmod."""
+	sitemap_pages = [f'sitemap-{page}' for page in range(page_count())]
+	return ['rss', 'atom', 'sitemap-pages'] + sitemap_pages + ['sitemap-index']
+
+
+def filename(name: str) -> str:
+	return FILENAMES.get(name, f'{name}.xml')
+
+
+def mimetype(name: str) -> str:
+	return MIMETYPES.get(name, 'application/xml')
+
+
+def mark_stale(blog_ids=(), listings: bool = False) -> None:
+	"""Flag the artifacts affected by a change, in the caller's transaction.
+
+	``blog_ids`` are posts whose feed entry or sitemap URL may have changed.
+	``listings`` covers author/tag page changes (publish, unpublish, tags).
+	"""
+	names = set()
+	blog_ids = [blog_id for blog_id in blog_ids if blog_id is not None]
+	if blog_ids:
+		size = page_size()
+		names |= {'rss', 'atom', 'sitemap-index'} | {f'sitemap-{blog_id // size}' for blog_id in blog_ids}
+	if listings:
+		names |= {'rss', 'atom', 'sitemap-index', 'sitemap-pages'}
+	if names:
+		_bump(names)
+
+
+def _bump(names) -> None:
+	db.session.execute(
+		sa.update(FeedArtifact)
+		.where(FeedArtifact.name.in_(names))
+		.values(version=FeedArtifact.version + 1)
+		.execution_options(synchronize_session=False)
+	)
+
+
+def get_artifact(name: str) -> FeedArtifact | None:
+	"""Return the current artifact, rebuilding it first if it is stale or missing."""
+	match = PAGE_NAME.match(name)
+	if name not in FIXED_ARTIFACTS and not match:
+		return None
+	artifact = db.session.execute(
+		sa.select(FeedArtifact).where(FeedArtifact.name == name).execution_options(populate_existing=True)
+	).scalar()
+	max_age = timedelta(seconds=current_app.config.get('PUBLIC_FEED_MAX_AGE', 3600))
+	if (
+		artifact is not None
+		and artifact.built_version == artifact.version
+		and artifact.updated_at > datetime.utcnow() - max_age
+	):
+		metrics.record_cache('feeds', hits=1)
+		return artifact
+	metrics.record_cache('feeds', misses=1)
+	if match and int(match.group(1)) >= page_count():
+		return None
+	return _rebuild(name, artifact)
+
+
+def _rebuild(name: str, artifact: FeedArtifact | None) -> FeedArtifact:
+	text = _render(name)
+	etag = hashlib.sha1(text.encode()).hexdigest()
+	body = gzip.compress(text.encode(), mtime=0)
+	version = artifact.version if artifact is not None else 0
+	changed = artifact is None or artifact.etag != etag
+	# Keep Last-Modified when the content came out the same
+	updated_at = datetime.utcnow() if changed else artifact.updated_at
+
+	with replicas.unpinned():
+		try:
+			if artifact is None:
+				db.session.execute(sa.insert(FeedArtifact).values(
+					name=name, body=body, etag=etag, version=0, built_version=0, updated_at=updated_at,
+				))
+			else:
+				# Only claim ``version`` if no writer bumped it while we rendered
+				db.session.execute(
+					sa.update(FeedArtifact)
+					.where(FeedArtifact.name == name, FeedArtifact.version == version)
+					.values(body=body, etag=etag, built_version=version, updated_at=updated_at)
+					.execution_options(synchronize_session=False)
+				)
+			if changed and PAGE_NAME.match(name):
+				# The index carries each page's lastmod
+				_bump(['sitemap-index'])
+			db.session.commit()
+		except IntegrityError:
+			# Another request built it first
+			db.session.rollback()
+	return FeedArtifact(name=name, body=body, etag=etag, version=version, built_version=version, updated_at=updated_at)
+
+
+def _render(name: str) -> str:
+	if name in ('rss', 'atom'):
+		blogs = pages.with_listing_options(pages.published_posts().limit(pages.FEED_SIZE)).all()
+		return pages.render_rss(blogs) if name == 'rss' else pages.render_atom(blogs)
+	if name == 'sitemap-index':
+		return _render_index()
+	if name == 'sitemap-pages':
+		return _render_listings()
+	return _render_page(int(PAGE_NAME.match(name).group(1)))
+
+
+def _render_page(page: int) -> str:
+	size = page_size()
+	rows = db.session.execute(
+		sa.select(Blog.id, Blog.slug, Blog.updated_at)
+		.where(Blog.is_published.is_(True), Blog.id >= page * size, Blog.id < (page + 1) * size)
+		.order_by(Blog.id)
+	).all()
+	return pages.render_sitemap([(pages.post_url(row, _external=True), row.updated_at) for row in rows])
+
+
+def _render_listings() -> str:
+	author_ids = db.session.execute(
+		sa.select(Blog.user_id).where(Blog.is_published.is_(True)).distinct().order_by(Blog.user_id)
+	).scalars()
+	tag_names = db.session.execute(
+		sa.select(TagNameCount.name).where(TagNameCount.published_count > 0).order_by(TagNameCount.name)
+	).scalars()
+	urls = [(url_for('public.author_index', user_id=user_id, _external=True), None) for user_id in author_ids]
+	urls += [(url_for('public.tag_index', name=name, _external=True), None) for name in tag_names]
+	return pages.render_sitemap(urls)
+
+
+def _render_index() -> str:
+	built = dict(db.session.execute(
+		sa.select(FeedArtifact.name, FeedArtifact.updated_at).where(FeedArtifact.name.like('sitemap-%'))
+	).all())
+	sitemaps = [(url_for('public.sitemap_listings', _external=True), built.get('sitemap-pages'))]
+	sitemaps += [
+		(url_for('public.sitemap_page', page=page, _external=True), built.get(f'sitemap-{page}'))
+		for page in range(page_count())
+	]
+	return pages.render_template('public/sitemap_index.xml', sitemaps=sitemaps)
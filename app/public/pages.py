@@ -0,0 +1,106 @@
+"""Queries and renderers shared by the public routes and the static builder.
+
+Public pages never read the session or ``current_user``, so the same HTML is
+served to every visitor and can be cached by a proxy or written to disk.
+"""
+import re
+
+import sqlalchemy as sa
+from flask import current_app, url_for
+from sqlalchemy.orm import selectinload
+
+from . import related
+from ..extensions import db
+from ..models import Blog, Tag, User
+
+
+FEED_SIZE = 20
+SAFE_TAG = re.compile(r'^[a-z0-9][a-z0-9._-]*$')
+
+
+def canonical_slug(blog) -> str:
+	"""URL-safe version of ``blog.slug``; the id is what identifies the post."""
+	return re.sub(r'[^a-z0-9-]+', '-', (blog.slug or '').lower()).strip('-')[:80] or 'post'
+
+
+def post_url(blog, **kwargs) -> str:
+	return url_for('public.view_post', blog_id=blog.id, slug=canonical_slug(blog), **kwargs)
+
+
+def render_markdown(text: str) -> str:
+	from markdown_it import MarkdownIt
+
+	# Raw HTML is escaped on public pages, unlike the editor preview
+	md = MarkdownIt('commonmark', {'breaks': True, 'html': False})
+	md.enable(['table', 'strikethrough'])
+	return md.render(text or '')
+
+
+def cache_control() -> str:
+	return f"public, max-age={current_app.config.get('PUBLIC_CACHE_MAX_AGE', 300)}"
+
+
+def published_posts():
+	"""Base query for published blogs, newest first."""
+	return Blog.query.filter_by(is_published=True).order_by(Blog.published_at.desc(), Blog.id.desc())
+
+
+def author_posts(user_id: int):
+	return published_posts().filter(Blog.user_id == user_id)
+
+
+def tag_posts(name: str):
+	return published_posts().filter(Blog.tags.any(Tag.name == name))
+
+
+def with_listing_options(query):
+	"""Load what listing pages show, without the markdown bodies."""
+	return query.options(
+		sa.orm.load_only(Blog.id, Blog.user_id, Blog.title, Blog.slug, Blog.description,
+			Blog.published_at, Blog.created_at, Blog.updated_at),
+		selectinload(Blog.tags),
+	)
+
+
+def render_template(template_name: str, **context) -> str:
+	"""Render without Flask's context processors, which would load ``current_user``."""
+	return current_app.jinja_env.get_template(template_name).render(**context)
+
+
+def render_post(blog) -> str:
+	# app.posts imports the feeds, which import this module
+	from ..posts import metadata
+
+	return render_template(
+		'public/post.html',
+		blog=blog,
+		author=blog.user,
+		content_html=render_markdown(blog.content_markdown),
+		metadata=metadata.for_blog(blog),
+		related_posts=related.related_posts(blog.id),
+	)
+
+
+def render_author(author, blogs) -> str:
+	return render_template('public/listing.html', heading=author.name or 'Author', author=author, blogs=blogs)
+
+
+def render_tag(name: str, blogs) -> str:
+	return render_template('public/listing.html', heading=f'#{name}', author=None, blogs=blogs)
+
+
+def render_rss(blogs) -> str:
+	return render_template('public/rss.xml', blogs=blogs)
+
+
+def render_atom(blogs) -> str:
+	return render_template('public/atom.xml', blogs=blogs)
+
+
+def render_sitemap(urls) -> str:
+	"""``urls`` is a list of ``(absolute_url, lastmod_or_None)``."""
+	return render_template('public/sitemap.xml', urls=urls)
+
+
+def get_author(user_id: int):
+	return db.session.get(User, user_id)
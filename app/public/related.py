@@ -0,0 +1,474 @@
+"""Related posts from precomputed TF-IDF similarity.
+
+Every published post has a :class:`~app.models.RelatedPosts` row holding its
+hashed bag-of-words (words hashed into ``FEATURES`` buckets, title and
+description weighted up), its hashed tag names, and its ``RELATED_COUNT``
+nearest posts. Looking up a post's related posts reads that one row.
+
+Similarity is the cosine of TF-IDF vectors plus ``RELATED_TAG_BOOST`` times the
+Jaccard overlap of the posts' tag names. Writes call :func:`mark_stale` in
+their transaction, like the feed artifacts; :func:`refresh` then re-vectorizes
+only the stale posts, scores each against the corpus with one sparse product,
+and patches the neighbour lists that gain or lose it. A list is recomputed in
+full only when a post drops out of a full list.
+
+A few seconds after a write commits, ``app.posts.hooks`` runs a *nearby*
+refresh, which loads only the stale posts and the posts around them (see
+:func:`_nearby`) and weights terms by the document frequencies kept in
+:class:`~app.models.RelatedTerm`. ``flask public related`` scores stale posts
+against every post instead. IDF weights drift as the corpus grows, and a post
+that moves to a new topic only meets that topic's posts in a full pass, so run
+``flask public related --rebuild`` now and then (e.g. nightly from cron) to
+recompute every list.
+"""
+import json
+import re
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from ..extensions import db
+from ..models import Blog, RelatedPosts, RelatedTerm, Tag, blog_tags
+from ..numeric import np, sparse
+
+
+FEATURES = 2 ** 18
+TAG_FEATURES = 2 ** 16
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+TOKEN = re.compile(r'[^\W_]{2,}')
+STOP_WORDS = frozenset((
+	'about all also an and any are as at be been but by can do does for from had has have he her his how if in '
+	'into is it its just more most my no not of on one or our out so some than that the their them then there '
+	'these they this to too up was we were what when which who will with would you your'
+).split())
+# Scores for this many changed posts are held in memory at once
+SCORE_BATCH = 64
+# Posts sharing a tag name with the changed posts that a nearby refresh loads, at most
+NEARBY_TAGGED = 500
+# Bound parameters per IN (...) query, and LIKE patterns per query
+CHUNK = 900
+LIKE_CHUNK = 50
+
+
+def tokens(text: str | None) -> list[str]:
+	return [word for word in TOKEN.findall((text or '').lower()) if word not in STOP_WORDS]
+
+
+def _bucket(value: str, size: int) -> int:
+	# crc32 rather than hash(), which changes between processes
+	return zlib.crc32(value.encode('utf-8')) & (size - 1)
+
+
+def vectorize(blog) -> tuple[bytes, bytes, bytes]:
+	"""Packed ``(terms, weights, tags)`` for ``blog``; weights are ``1 + log(tf)``."""
+	counts = Counter()
+	for text, weight in ((blog.title, TITLE_WEIGHT), (blog.description, DESCRIPTION_WEIGHT), (blog.content_markdown, 1)):
+		for word in tokens(text):
+			counts[_bucket(word, FEATURES)] += weight
+	terms = np.array(sorted(counts), dtype=np.int32)
+	weights = 1 + np.log(np.array([counts[term] for term in terms], dtype=np.float32))
+	tags = np.unique(np.array([_bucket(tag.name.lower(), TAG_FEATURES) for tag in blog.tags], dtype=np.int32))
+	return terms.tobytes(), weights.astype(np.float32).tobytes(), tags.tobytes()
+
+
+class Corpus:
+	"""TF-IDF and tag matrices of indexed posts, to score posts against each other.
+
+	IDF weights come from ``rows`` themselves unless ``frequencies`` gives the
+	index-wide ``(document frequency per term, post count)``.
+	"""
+
+	def __init__(self, rows, frequencies=None):
+		self.ids = [row.blog_id for row in rows]
+		self.position = {blog_id: i for i, blog_id in enumerate(self.ids)}
+		n = len(rows)
+		terms = [np.frombuffer(row.terms, dtype=np.int32) for row in rows]
+		weights = [np.frombuffer(row.weights, dtype=np.float32) for row in rows]
+		tags = [np.frombuffer(row.tags, dtype=np.int32) for row in rows]
+
+		counts = sparse.csr_matrix(
+			(_concat(weights, np.float32), _concat(terms, np.int32), _indptr(terms)), shape=(n, FEATURES),
+		)
+		self.document_frequency = np.bincount(counts.indices, minlength=FEATURES)
+		document_frequency, posts = frequencies if frequencies is not None else (self.document_frequency, n)
+		idf = np.log((1 + posts) / (1 + document_frequency)) + 1
+		tfidf = counts.multiply(idf.reshape(1, -1)).tocsr()
+		norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+		norms[norms == 0] = 1
+		self.vectors = sparse.diags(1 / norms) @ tfidf
+		self.tags = sparse.csr_matrix(
+			(np.ones(sum(len(t) for t in tags), dtype=np.float32), _concat(tags, np.int32), _indptr(tags)),
+			shape=(n, TAG_FEATURES),
+		)
+		self.tag_counts = np.diff(self.tags.indptr).astype(np.float32)
+
+	@classmethod
+	def load(cls, blog_ids=None) -> 'Corpus':
+		"""Every indexed post, or just ``blog_ids`` weighted by the stored document frequencies."""
+		query = (
+			sa.select(RelatedPosts.blog_id, RelatedPosts.terms, RelatedPosts.weights, RelatedPosts.tags)
+			.where(RelatedPosts.terms.is_not(None))
+			.order_by(RelatedPosts.blog_id)
+		)
+		if blog_ids is None:
+			return cls(db.session.execute(query).all())
+		rows = [
+			row for chunk in _chunks(sorted(blog_ids))
+			for row in db.session.execute(query.where(RelatedPosts.blog_id.in_(chunk)))
+		]
+		return cls(rows, _frequencies(rows))
+
+	def scores(self, blog_ids: list[int]):
+		"""Dense ``len(blog_ids) x len(self.ids)`` similarities; a post's score against itself is ``-inf``."""
+		rows = [self.position[blog_id] for blog_id in blog_ids]
+		cosine = (self.vectors[rows] @ self.vectors.T).toarray()
+		shared = (self.tags[rows] @ self.tags.T).toarray()
+		union = self.tag_counts[rows].reshape(-1, 1) + self.tag_counts.reshape(1, -1) - shared
+		overlap = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+		scores = cosine + current_app.config.get('RELATED_TAG_BOOST', 0.25) * overlap
+		scores[np.arange(len(rows)), rows] = -np.inf
+		return scores
+
+	def top(self, scores) -> list[list]:
+		"""The best ``RELATED_COUNT`` ``[blog_id, score]`` pairs of one row of :meth:`scores`."""
+		count = min(current_app.config.get('RELATED_COUNT', 5), len(scores) - 1)
+		if count <= 0:
+			return []
+		best = np.argpartition(-scores, count - 1)[:count]
+		best = best[np.argsort(-scores[best], kind='stable')]
+		minimum = current_app.config.get('RELATED_MIN_SCORE', 0.05)
+		return [[self.ids[i], round(float(scores[i]), 4)] for i in best if scores[i] >= minimum]
+
+
+def _concat(arrays, dtype):
+	return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+
+def _indptr(arrays):
+	return np.concatenate(([0], np.cumsum([len(a) for a in arrays]))).astype(np.int64)
+
+
+def _chunks(values: list, size: int = CHUNK):
+	for start in range(0, len(values), size):
+		yield values[start:start + size]
+
+
+def _frequencies(rows) -> tuple:
+	"""Stored ``(document frequency per term, indexed post count)`` for the terms of ``rows``."""
+	frequency = np.zeros(FEATURES, dtype=np.int64)
+	terms = np.unique(_concat([np.frombuffer(row.terms, dtype=np.int32) for row in rows], np.int32))
+	for chunk in _chunks(terms.tolist()):
+		for term, posts in db.session.execute(
+			sa.select(RelatedTerm.term, RelatedTerm.posts).where(RelatedTerm.term.in_(chunk))
+		):
+			frequency[term] = posts
+	posts = db.session.execute(
+		sa.select(sa.func.count()).select_from(RelatedPosts).where(RelatedPosts.terms.is_not(None))
+	).scalar()
+	return frequency, posts
+
+
+def _store_frequencies(document_frequency) -> None:
+	"""Make the stored document frequencies equal ``document_frequency``, writing only the terms that changed."""
+	stored = dict(db.session.execute(sa.select(RelatedTerm.term, RelatedTerm.posts)).all())
+	wanted = {int(term): int(document_frequency[term]) for term in np.flatnonzero(document_frequency)}
+	table = RelatedTerm.__table__
+	updates = [{'id': term, 'posts': posts} for term, posts in wanted.items() if stored.get(term, posts) != posts]
+	if updates:
+		db.session.execute(
+			sa.update(table).where(table.c.term == sa.bindparam('id')).values(posts=sa.bindparam('posts')),
+			updates,
+		)
+	inserts = [{'term': term, 'posts': posts} for term, posts in wanted.items() if term not in stored]
+	if inserts:
+		db.session.execute(sa.insert(table), inserts)
+	gone = [term for term in stored if term not in wanted]
+	for chunk in _chunks(gone):
+		db.session.execute(sa.delete(table).where(table.c.term.in_(chunk)))
+
+
+def _apply_frequency_deltas(deltas: dict) -> None:
+	"""Add ``{term: delta}`` to the stored document frequencies."""
+	deltas = {term: delta for term, delta in deltas.items() if delta}
+	if not deltas:
+		return
+	table = RelatedTerm.__table__
+	existing = set()
+	for chunk in _chunks(sorted(deltas)):
+		existing.update(db.session.execute(sa.select(table.c.term).where(table.c.term.in_(chunk))).scalars())
+	updates = [{'id': term, 'delta': delta} for term, delta in deltas.items() if term in existing]
+	if updates:
+		db.session.execute(
+			sa.update(table).where(table.c.term == sa.bindparam('id')).values(posts=table.c.posts + sa.bindparam('delta')),
+			updates,
+		)
+	inserts = [{'term': term, 'posts': delta} for term, delta in deltas.items() if term not in existing and delta > 0]
+	if inserts:
+		db.session.execute(sa.insert(table), inserts)
+
+
+def _claim(rows: list[dict], stale: dict) -> list[dict]:
+	"""Write the stale posts' vectors, skipping posts another refresh has written meanwhile.
+
+	The stored document frequencies move by the written posts' old and new
+	terms. Returns the rows written.
+	"""
+	table = RelatedPosts.__table__
+	written = []
+	deltas = Counter()
+	for row in rows:
+		previous = stale[row['id']]
+		result = db.session.execute(
+			sa.update(table)
+			.where(table.c.blog_id == row['id'], table.c.built_version == previous.built_version)
+			.values(terms=row['terms'], weights=row['weights'], tags=row['tags'], built_version=row['built_version'])
+		)
+		if not result.rowcount:
+			continue
+		written.append(row)
+		for terms, delta in ((previous.terms, -1), (row['terms'], 1)):
+			if terms is not None:
+				deltas.update({int(term): delta for term in np.frombuffer(terms, dtype=np.int32)})
+	_apply_frequency_deltas(deltas)
+	return written
+
+
+def _nearby(blog_ids) -> set[int]:
+	"""``blog_ids`` and the posts around them, for a refresh that doesn't load every post.
+
+	Those are the posts in their lists and in those posts' lists, the posts
+	whose lists hold them, and up to ``NEARBY_TAGGED`` published posts sharing
+	a tag name with them.
+	"""
+	blog_ids = set(blog_ids)
+	around = _entries(blog_ids) | _listing(blog_ids)
+	around |= _entries(around - blog_ids)
+	return blog_ids | around | _sharing_tags(blog_ids)
+
+
+def _entries(blog_ids) -> set[int]:
+	"""The posts in the lists of ``blog_ids``."""
+	found = set()
+	for chunk in _chunks(sorted(blog_ids)):
+		for neighbors in db.session.execute(
+			sa.select(RelatedPosts.neighbors).where(RelatedPosts.blog_id.in_(chunk))
+		).scalars():
+			found.update(entry[0] for entry in json.loads(neighbors))
+	return found
+
+
+def _listing(blog_ids) -> set[int]:
+	"""The posts whose lists hold any of ``blog_ids``."""
+	found = set()
+	for chunk in _chunks(sorted(blog_ids), LIKE_CHUNK):
+		# Entries are stored as "[blog_id, score]"
+		found.update(db.session.execute(
+			sa.select(RelatedPosts.blog_id).where(sa.or_(*(RelatedPosts.neighbors.contains(f'[{blog_id},') for blog_id in chunk)))
+		).scalars())
+	return found
+
+
+def _sharing_tags(blog_ids) -> set[int]:
+	"""Up to ``NEARBY_TAGGED`` published posts, newest first, sharing a tag name with ``blog_ids``."""
+	found = set()
+	for chunk in _chunks(sorted(blog_ids)):
+		names = sa.select(Tag.name).join(blog_tags, blog_tags.c.tag_id == Tag.id).where(blog_tags.c.blog_id.in_(chunk))
+		found.update(db.session.execute(
+			sa.select(Blog.id)
+			.join(blog_tags, blog_tags.c.blog_id == Blog.id)
+			.join(Tag, Tag.id == blog_tags.c.tag_id)
+			.where(Tag.name.in_(names), Blog.is_published.is_(True))
+			.distinct()
+			.order_by(Blog.id.desc())
+			.limit(NEARBY_TAGGED)
+		).scalars())
+	return found
+
+
+def _patch(neighbors: list, blog_id: int, score: float | None) -> tuple[list, bool]:
+	"""Move ``blog_id`` to ``score`` in a neighbour list (``None``: drop it).
+
+	Every post missing from a full list scores at most its last entry, and a
+	list that isn't full holds every post above the minimum. Returns
+	``(neighbors, complete)``; ``complete`` is false when ``blog_id`` fell below
+	that bound, so an unknown post may now belong in the list.
+	"""
+	count = current_app.config.get('RELATED_COUNT', 5)
+	full = len(neighbors) >= count
+	qualifies = score is not None and score >= current_app.config.get('RELATED_MIN_SCORE', 0.05)
+	others = [entry for entry in neighbors if entry[0] != blog_id]
+	if len(others) < len(neighbors):
+		if full and (score is None or score < neighbors[-1][1]):
+			return others, False
+	elif not qualifies or (full and score <= neighbors[-1][1]):
+		return neighbors, True
+	if qualifies:
+		others.append([blog_id, round(float(score), 4)])
+		others.sort(key=lambda entry: -entry[1])
+	return others[:count], True
+
+
+def mark_stale(blog_ids) -> None:
+	"""Flag posts whose text, tags or published state changed, in the caller's transaction."""
+	blog_ids = [blog_id for blog_id in blog_ids if blog_id is not None]
+	if not blog_ids:
+		return
+	db.session.execute(
+		sa.update(RelatedPosts)
+		.where(RelatedPosts.blog_id.in_(blog_ids))
+		.values(version=RelatedPosts.version + 1)
+		.execution_options(synchronize_session=False)
+	)
+	indexed = sa.select(RelatedPosts.blog_id).where(RelatedPosts.blog_id == Blog.id)
+	db.session.execute(
+		sa.insert(RelatedPosts).from_select(
+			['blog_id', 'neighbors', 'version', 'built_version', 'updated_at'],
+			sa.select(Blog.id, sa.literal('[]'), sa.literal(1), sa.literal(0), sa.literal(datetime.utcnow()))
+			.where(Blog.id.in_(blog_ids), ~sa.exists(indexed)),
+		)
+	)
+
+
+def refresh(nearby: bool = False) -> dict:
+	"""Bring stale posts and the neighbour lists they affect up to date. Returns counts.
+
+	Stale posts are scored against every indexed post, or with ``nearby``
+	only against the posts around them (:func:`_nearby`).
+	"""
+	if nearby and db.session.execute(sa.select(RelatedTerm.term).limit(1)).first() is None:
+		# No stored document frequencies yet, e.g. just after upgrading: a full pass stores them
+		nearby = False
+	stale = {
+		row.blog_id: row for row in db.session.execute(
+			sa.select(RelatedPosts.blog_id, RelatedPosts.version, RelatedPosts.built_version, RelatedPosts.terms)
+			.where(RelatedPosts.version != RelatedPosts.built_version)
+		)
+	}
+	if not stale:
+		return {'indexed': 0, 'updated': 0}
+	blogs = {
+		blog.id: blog for blog in
+		Blog.query.filter(Blog.id.in_(stale)).options(selectinload(Blog.tags))
+	}
+	rows = []
+	for blog_id, row in stale.items():
+		blog = blogs.get(blog_id)
+		terms, weights, tags = vectorize(blog) if blog is not None and blog.is_published else (None, None, None)
+		rows.append({'id': blog_id, 'terms': terms, 'weights': weights, 'tags': tags, 'built_version': row.version})
+	if nearby:
+		rows = _claim(rows, stale)
+	else:
+		_write(rows, ['terms', 'weights', 'tags', 'built_version'])
+	versions = {row['id']: row['built_version'] for row in rows}
+	if not versions:
+		return {'indexed': 0, 'updated': 0}
+
+	if nearby:
+		corpus = Corpus.load(_nearby(versions))
+	else:
+		corpus = Corpus.load()
+		_store_frequencies(corpus.document_frequency)
+	lists = {}
+	for chunk in _chunks(sorted(set(corpus.ids) | set(versions))):
+		lists.update(
+			(blog_id, json.loads(neighbors)) for blog_id, neighbors in
+			db.session.execute(sa.select(RelatedPosts.blog_id, RelatedPosts.neighbors).where(RelatedPosts.blog_id.in_(chunk)))
+		)
+	changed = [blog_id for blog_id in versions if blog_id in corpus.position]
+	removed = [blog_id for blog_id in versions if blog_id not in corpus.position]
+	updated = {blog_id: [] for blog_id in removed}
+	incomplete = set()
+
+	# Lists only need patching where a changed post beats their last entry or is already in them
+	count = current_app.config.get('RELATED_COUNT', 5)
+	minimum = current_app.config.get('RELATED_MIN_SCORE', 0.05)
+	thresholds = np.array([
+		np.inf if blog_id in versions
+		else lists[blog_id][-1][1] if len(lists[blog_id]) >= count
+		else minimum
+		for blog_id in corpus.ids
+	])
+	members = defaultdict(set)
+	for blog_id in corpus.ids:
+		if blog_id not in versions:
+			for entry in lists[blog_id]:
+				members[entry[0]].add(blog_id)
+
+	def patch(other: int, blog_id: int, score) -> None:
+		neighbors, complete = _patch(updated.get(other, lists[other]), blog_id, score)
+		if neighbors != lists[other]:
+			updated[other] = neighbors
+		if not complete:
+			incomplete.add(other)
+
+	for start in range(0, len(changed), SCORE_BATCH):
+		batch = changed[start:start + SCORE_BATCH]
+		scores = corpus.scores(batch)
+		for blog_id, row in zip(batch, scores):
+			updated[blog_id] = corpus.top(row)
+			candidates = {corpus.ids[i] for i in np.flatnonzero(row >= thresholds)} | members[blog_id]
+			for other in sorted(candidates):
+				patch(other, blog_id, row[corpus.position[other]])
+	for blog_id in removed:
+		for other in sorted(members[blog_id]):
+			patch(other, blog_id, None)
+
+	incomplete = sorted(incomplete)
+	for start in range(0, len(incomplete), SCORE_BATCH):
+		batch = incomplete[start:start + SCORE_BATCH]
+		for blog_id, row in zip(batch, corpus.scores(batch)):
+			updated[blog_id] = corpus.top(row)
+
+	now = datetime.utcnow()
+	changes = {blog_id: neighbors for blog_id, neighbors in updated.items() if neighbors != lists.get(blog_id)}
+	_write([
+		{'id': blog_id, 'neighbors': json.dumps(neighbors), 'updated_at': now} for blog_id, neighbors in changes.items()
+	], ['neighbors', 'updated_at'])
+	return {'indexed': len(changed), 'updated': len(changes)}
+
+
+def rebuild() -> dict:
+	"""Re-vectorize every post and recompute every list."""
+	blog_ids = db.session.execute(sa.select(Blog.id).where(Blog.is_published.is_(True))).scalars().all()
+	mark_stale(blog_ids)
+	db.session.execute(sa.update(RelatedPosts).values(version=RelatedPosts.version + 1))
+	return refresh()
+
+
+def _write(rows: list[dict], columns: list[str]) -> None:
+	if rows:
+		table = RelatedPosts.__table__
+		db.session.execute(
+			sa.update(table).where(table.c.blog_id == sa.bindparam('id')).values(
+				{column: sa.bindparam(column) for column in columns}
+			),
+			rows,
+		)
+
+
+def related_posts(blog_id: int) -> list:
+	"""Published posts related to ``blog_id``, best first, as ``(id, title, slug)`` rows."""
+	neighbors = db.session.execute(
+		sa.select(RelatedPosts.neighbors).where(RelatedPosts.blog_id == blog_id)
+	).scalar()
+	ids = [entry[0] for entry in json.loads(neighbors or '[]')]
+	if not ids:
+		return []
+	rows = db.session.execute(
+		sa.select(Blog.id, Blog.title, Blog.slug).where(Blog.id.in_(ids), Blog.is_published.is_(True))
+	).all()
+	by_id = {row.id: row for row in rows}
+	return [by_id[blog_id] for blog_id in ids if blog_id in by_id]
+
+
+def updated_at(blog_ids=None) -> dict:
+	"""``{blog_id: when its related list last changed}``, for ETags and the static builder."""
+	query = sa.select(RelatedPosts.blog_id, RelatedPosts.updated_at)
+	if blog_ids is not None:
+		query = query.where(RelatedPosts.blog_id.in_(list(blog_ids)))
+	return dict(db.session.execute(query).all())
@@ -0,0 +1,117 @@
+import gzip
+from email.utils import format_datetime
+from datetime import timezone
+from flask import Response, abort, make_response, redirect, request
+from . import bp
+from . import feeds, pages, related
+from .. import analytics, http_cache
+from ..models import Blog
+
+
+@bp.app_template_global()
+def canonical_slug(blog) -> str:
+	return pages.canonical_slug(blog)
+
+
+@bp.app_template_filter('rfc822')
+def rfc822_filter(value) -> str:
+	return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True) if value else ''
+
+
+@bp.app_template_filter('isodate')
+def isodate_filter(value) -> str:
+	return value.replace(microsecond=0).isoformat() + 'Z' if value else ''
+
+
+def _conditional(etag_key, query, render):
+	"""Serve ``render()`` with public validators, or a 304 from the query's fingerprint."""
+	parts, last_modified = http_cache.blogs_fingerprint(query)
+	if not parts:
+		abort(404)
+	etag = http_cache.make_etag(etag_key, parts)
+	cache_control = pages.cache_control()
+	cached = http_cache.not_modified(etag, last_modified, cache_control)
+	if cached:
+		return cached
+	response = make_response(render())
+	return http_cache.set_validators(response, etag, last_modified, cache_control)
+
+
+@bp.get('/p/<int:blog_id>/')
+@bp.get('/p/<int:blog_id>/<slug>/')
+def view_post(blog_id: int, slug: str | None = None):
+	query = pages.published_posts().filter(Blog.id == blog_id)
+	blog = query.with_entities(Blog.id, Blog.slug).first()
+	if not blog:
+		abort(404)
+	# The id identifies the post; anything but the canonical slug redirects
+	if slug != pages.canonical_slug(blog):
+		return redirect(pages.post_url(blog), code=301)
+	analytics.record_view(blog_id)
+	etag_key = ('post', blog_id, related.updated_at([blog_id]).get(blog_id))
+	return _conditional(etag_key, query, lambda: pages.render_post(query.first()))
+
+
+@bp.get('/u/<int:user_id>/')
+def author_index(user_id: int):
+	query = pages.author_posts(user_id)
+
+	def render():
+		author = pages.get_author(user_id)
+		return pages.render_author(author, pages.with_listing_options(query).all())
+
+	return _conditional(('author', user_id), query, render)
+
+
+@bp.get('/t/<name>/')
+def tag_index(name: str):
+	query = pages.tag_posts(name)
+	return _conditional(
+		('tag', name), query,
+		lambda: pages.render_tag(name, pages.with_listing_options(query).all()),
+	)
+
+
+def _serve_artifact(name: str):
+	"""Serve a pre-rendered feed/sitemap, gzipped when the client accepts it."""
+	artifact = feeds.get_artifact(name)
+	if artifact is None:
+		abort(404)
+	# Each encoding is its own representation, so it gets its own ETag
+	gzipped = 'gzip' in request.accept_encodings
+	etag = f'{artifact.etag}-gz' if gzipped else artifact.etag
+	cache_control = pages.cache_control()
+	response = http_cache.not_modified(etag, artifact.updated_at, cache_control)
+	if response is None:
+		body = artifact.body if gzipped else gzip.decompress(artifact.body)
+		response = Response(body, mimetype=feeds.mimetype(name))
+		if gzipped:
+			response.headers['Content-Encoding'] = 'gzip'
+		http_cache.set_validators(response, etag, artifact.updated_at, cache_control)
+	response.vary.add('Accept-Encoding')
+	return response
+
+
+@bp.get('/feed.xml')
+def rss_feed():
+	return _serve_artifact('rss')
+
+
+@bp.get('/atom.xml')
+def atom_feed():
+	return _serve_artifact('atom')
+
+
+@bp.get('/sitemap.xml')
+def sitemap():
+	return _serve_artifact('sitemap-index')
+
+
+@bp.get('/sitemap-pages.xml')
+def sitemap_listings():
+	return _serve_artifact('sitemap-pages')
+
+
+@bp.get('/sitemap-<int:page>.xml')
+def sitemap_page(page: int):
+	return _serve_artifact(f'sitemap-{page}')
@@ -0,0 +1,164 @@
+"""Pre-generate the public pages into a directory nginx or a CDN can serve.
+
+Layout (serve with ``try_files $uri $uri/index.html``)::
+
+	p/<id>/<slug>/index.html   posts
+	u/<user_id>/index.html     author indexes
+	t/<tag>/index.html         tag pages (names that are safe as a path only)
+	feed.xml, atom.xml, sitemap.xml, sitemap-*.xml
+
+Every file gets ``.gz`` and (with ``brotli`` installed) ``.br`` siblings for
+nginx's ``gzip_static`` / ``brotli_static``, so hot pages are never
+compressed per request.
+
+Builds are incremental: every page gets a fingerprint from a cheap metadata
+query (ids, timestamps, tag names, author), stored in ``.manifest.json``.
+Only pages whose fingerprint changed are rendered, and pages that no longer
+exist (unpublished or deleted posts) are removed. Feeds and sitemaps come
+from the artifacts in :mod:`app.public.feeds`, fingerprinted by their ETag.
+"""
+import gzip
+import json
+import os
+from collections import defaultdict
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from . import feeds, pages, related
+from .. import compression
+from ..extensions import db
+from ..http_cache import make_etag
+from ..models import Blog, Tag, User, blog_tags
+
+
+MANIFEST = '.manifest.json'
+RENDER_BATCH_SIZE = 200
+
+
+class StaticSiteBuilder:
+	"""Render changed public pages into ``output_dir``."""
+
+	def __init__(self, output_dir: str, force: bool = False):
+		self.output_dir = output_dir
+		self.force = force
+		self.stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+
+	def build(self) -> dict:
+		site_url = current_app.config.get('PUBLIC_SITE_URL') or 'http://localhost'
+		with current_app.test_request_context(base_url=site_url):
+			previous = {} if self.force else self._read_manifest()
+			wanted = self._plan()
+			changed = {path: job for path, (fingerprint, job) in wanted.items() if previous.get(path) != fingerprint}
+			self.stats['unchanged'] = len(wanted) - len(changed)
+			self._render(changed)
+			self._remove(set(previous) - set(wanted))
+			self._write_manifest({path: fingerprint for path, (fingerprint, _) in wanted.items()})
+		return self.stats
+
+	def _plan(self) -> dict:
+		"""Map every output path to ``(fingerprint, job)`` without loading post bodies."""
+		rows = pages.published_posts().with_entities(Blog.id, Blog.slug, Blog.user_id, Blog.updated_at).all()
+		tags = defaultdict(list)
+		for blog_id, name in db.session.execute(
+			sa.select(blog_tags.c.blog_id, Tag.name)
+			.join(Tag, Tag.id == blog_tags.c.tag_id)
+			.join(Blog, Blog.id == blog_tags.c.blog_id)
+			.where(Blog.is_published.is_(True))
+			.order_by(blog_tags.c.blog_id, Tag.name)
+		):
+			tags[blog_id].append(name)
+		authors = dict(db.session.execute(
+			sa.select(User.id, User.updated_at).where(User.id.in_({row.user_id for row in rows}))
+		).all())
+		related_lists = related.updated_at()
+
+		wanted = {}
+		by_author, by_tag = defaultdict(list), defaultdict(list)
+		for row in rows:
+			entry = (row.id, row.updated_at, tags[row.id])
+			wanted[f'p/{row.id}/{pages.canonical_slug(row)}/index.html'] = (
+				make_etag(entry, authors.get(row.user_id), related_lists.get(row.id)), ('post', row.id),
+			)
+			by_author[row.user_id].append(entry)
+			for name in tags[row.id]:
+				by_tag[name].append(entry)
+
+		for user_id, entries in by_author.items():
+			wanted[f'u/{user_id}/index.html'] = (make_etag(authors.get(user_id), entries), ('author', user_id))
+		for name, entries in by_tag.items():
+			if pages.SAFE_TAG.match(name):
+				wanted[f't/{name}/index.html'] = (make_etag(entries), ('tag', name))
+
+		# Feeds and sitemaps are maintained incrementally as artifacts already
+		for name in feeds.artifact_names():
+			artifact = feeds.get_artifact(name)
+			if artifact is not None:
+				wanted[feeds.filename(name)] = (artifact.etag, ('artifact', name))
+		return wanted
+
+	def _render(self, changed: dict) -> None:
+		post_paths = {job[1]: path for path, job in changed.items() if job[0] == 'post'}
+		post_ids = list(post_paths)
+		for start in range(0, len(post_ids), RENDER_BATCH_SIZE):
+			blogs = Blog.query.filter(Blog.id.in_(post_ids[start:start + RENDER_BATCH_SIZE])).options(
+				selectinload(Blog.tags), selectinload(Blog.user),
+			).all()
+			for blog in blogs:
+				self._write(post_paths[blog.id], pages.render_post(blog))
+
+		for path, (kind, key) in changed.items():
+			if kind == 'author':
+				blogs = pages.with_listing_options(pages.author_posts(key)).all()
+				self._write(path, pages.render_author(pages.get_author(key), blogs))
+			elif kind == 'tag':
+				self._write(path, pages.render_tag(key, pages.with_listing_options(pages.tag_posts(key)).all()))
+			elif kind == 'artifact':
+				self._write(path, gzip.decompress(feeds.get_artifact(key).body).decode('utf-8'))
+
+	def _write(self, path: str, content: str) -> None:
+		target = os.path.join(self.output_dir, path)
+		_atomic_write(target, content)
+		compression.write_siblings(target, content.encode('utf-8'))
+		self.stats['written'] += 1
+
+	def _remove(self, paths) -> None:
+		for path in paths:
+			target = os.path.join(self.output_dir, path)
+			try:
+				os.remove(target)
+			except OSError:
+				continue
+			compression.remove_siblings(target)
+			self.stats['removed'] += 1
+			# Drop directories left empty, e.g. p/<id>/<old-slug>/
+			directory = os.path.dirname(target)
+			while os.path.abspath(directory) != os.path.abspath(self.output_dir):
+				try:
+					os.rmdir(directory)
+				except OSError:
+					break
+				directory = os.path.dirname(directory)
+
+	def _read_manifest(self) -> dict:
+		try:
+			with open(os.path.join(self.output_dir, MANIFEST), encoding='utf-8') as fh:
+				return json.load(fh)
+		except (OSError, json.JSONDecodeError):
+			return {}
+
+	def _write_manifest(self, manifest: dict) -> None:
+		_atomic_write(os.path.join(self.output_dir, MANIFEST), json.dumps(manifest, indent=0, sort_keys=True))
+
+
+def _atomic_write(target: str, content: str | bytes) -> None:
+	os.makedirs(os.path.dirname(target), exist_ok=True)
+	tmp = f'{target}.tmp'
+	if isinstance(content, bytes):
+		with open(tmp, 'wb') as fh:
+			fh.write(content)
+	else:
+		with open(tmp, 'w', encoding='utf-8') as fh:
+			fh.write(content)
+	os.replace(tmp, target)
@@ -0,0 +1,170 @@
+"""SQLite storage backend for Flask-Limiter.
+
+``memory://`` keeps counters per worker process, so with four gunicorn workers
+a ``5/minute`` limit really allows twenty. This backend keeps them in one
+SQLite file that every worker on the host shares. Use ``redis://`` when the
+app runs on more than one host.
+
+Importing this module registers the ``sqlite`` scheme with :mod:`limits`::
+
+	RATELIMIT_STORAGE_URI = 'sqlite:////abs/path/ratelimit.db'
+	RATELIMIT_STORAGE_URI = 'sqlite:///relative/path/ratelimit.db'
+
+Both the fixed-window and the moving-window strategies are supported. Every
+check-and-update runs in one ``BEGIN IMMEDIATE`` transaction, so two workers
+can never both take the last slot of a window.
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from limits.storage import MovingWindowSupport, Storage
+
+
+SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)',
+	'CREATE TABLE IF NOT EXISTS events (key TEXT NOT NULL, ts REAL NOT NULL, amount INTEGER NOT NULL, expires_at REAL NOT NULL)',
+	'CREATE INDEX IF NOT EXISTS ix_events_key_ts ON events (key, ts)',
+	'CREATE INDEX IF NOT EXISTS ix_events_expires_at ON events (expires_at)',
+)
+# Expired rows are deleted every this many writes per connection
+PURGE_EVERY = 1000
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+	"""Rate limit counters in a SQLite file shared by every local worker."""
+
+	STORAGE_SCHEME = ['sqlite']
+
+	def __init__(self, uri: str, wrap_exceptions: bool = False, timeout: float = 5.0, **options):
+		super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+		self.path = urlparse(uri).path[1:]
+		if not self.path or self.path == ':memory:':
+			raise ValueError('SQLite rate limit storage needs a file path, e.g. sqlite:////tmp/ratelimit.db')
+		self.timeout = timeout
+		self._local = threading.local()
+		directory = os.path.dirname(os.path.abspath(self.path))
+		os.makedirs(directory, exist_ok=True)
+
+	@property
+	def base_exceptions(self):
+		return sqlite3.Error
+
+	def _connection(self) -> sqlite3.Connection:
+		# sqlite3 connections can't be shared between threads, so keep one each
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=NORMAL')
+			for statement in SCHEMA:
+				conn.execute(statement)
+			self._local.conn = conn
+			self._local.writes = 0
+		return conn
+
+	def _write(self):
+		"""Open an immediate (write-locked) transaction on this thread's connection."""
+		conn = self._connection()
+		conn.execute('BEGIN IMMEDIATE')
+		self._local.writes += 1
+		if self._local.writes % PURGE_EVERY == 0:
+			now = time.time()
+			conn.execute('DELETE FROM counters WHERE expires_at <= ?', (now,))
+			conn.execute('DELETE FROM events WHERE expires_at <= ?', (now,))
+		return conn
+
+	def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+		conn = self._write()
+		try:
+			now = time.time()
+			row = conn.execute('SELECT value, expires_at FROM counters WHERE key = ?', (key,)).fetchone()
+			if row is None or row[1] <= now:
+				value, expires_at = amount, now + expiry
+			else:
+				value = row[0] + amount
+				expires_at = now + expiry if elastic_expiry else row[1]
+			conn.execute(
+				'INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?) '
+				'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at',
+				(key, value, expires_at),
+			)
+			conn.execute('COMMIT')
+		except BaseException:
+			conn.execute('ROLLBACK')
+			raise
+		return value
+
+	def get(self, key: str) -> int:
+		row = self._connection().execute(
+			'SELECT value FROM counters WHERE key = ? AND expires_at > ?', (key, time.time())
+		).fetchone()
+		return row[0] if row else 0
+
+	def get_expiry(self, key: str) -> int:
+		now = time.time()
+		row = self._connection().execute(
+			'SELECT expires_at FROM counters WHERE key = ? AND expires_at > ?', (key, now)
+		).fetchone()
+		return int(row[0] if row else now)
+
+	def check(self) -> bool:
+		try:
+			self._connection().execute('SELECT 1')
+		except sqlite3.Error:
+			return False
+		return True
+
+	def reset(self) -> int:
+		conn = self._write()
+		try:
+			count = conn.execute('SELECT (SELECT COUNT(*) FROM counters) + (SELECT COUNT(DISTINCT key) FROM events)').fetchone()[0]
+			conn.execute('DELETE FROM counters')
+			conn.execute('DELETE FROM events')
+			conn.execute('COMMIT')
+		except BaseException:
+			conn.execute('ROLLBACK')
+			raise
+		return count
+
+	def clear(self, key: str) -> None:
+		conn = self._write()
+		try:
+			conn.execute('DELETE FROM counters WHERE key = ?', (key,))
+			conn.execute('DELETE FROM events WHERE key = ?', (key,))
+			conn.execute('COMMIT')
+		except BaseException:
+			conn.execute('ROLLBACK')
+			raise
+
+	def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+		"""Record ``amount`` hits if the last ``expiry`` seconds leave room for them."""
+		if amount > limit:
+			return False
+		conn = self._write()
+		try:
+			now = time.time()
+			used = conn.execute(
+				'SELECT COALESCE(SUM(amount), 0) FROM events WHERE key = ? AND ts > ?', (key, now - expiry)
+			).fetchone()[0]
+			acquired = used + amount <= limit
+			if acquired:
+				conn.execute(
+					'INSERT INTO events (key, ts, amount, expires_at) VALUES (?, ?, ?, ?)',
+					(key, now, amount, now + expiry),
+				)
+			conn.execute('COMMIT')
+		except BaseException:
+			conn.execute('ROLLBACK')
+			raise
+		return acquired
+
+	def get_moving_window(self, key: str, limit: int, expiry: int) -> tuple[int, int]:
+		"""Return ``(start of window, hits in window)``."""
+		now = time.time()
+		start, used = self._connection().execute(
+			'SELECT MIN(ts), COALESCE(SUM(amount), 0) FROM events WHERE key = ? AND ts > ?', (key, now - expiry)
+		).fetchone()
+		return int(start if start is not None else now), used
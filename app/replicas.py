@@ -0,0 +1,147 @@
+"""Read-replica routing for the shared ``db.session``.
+
+Reads issued while handling ``GET``/``HEAD`` requests, or inside a function
+decorated with :func:`read_only`, go to one of the engines built from
+``SQLALCHEMY_REPLICA_URLS``. Everything else - flushes, ``UPDATE``/``DELETE``
+statements and any request that has already written - goes to the primary.
+
+After a request writes, the user's session is pinned to the primary for
+``SQLALCHEMY_REPLICA_STICKY_SECONDS`` so they always read their own writes,
+even if the replicas are lagging behind.
+"""
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+
+
+READ_METHODS = frozenset({'GET', 'HEAD'})
+STICKY_SESSION_KEY = '_db_primary_until'
+
+
+class RoutingSession(Session):
+	"""Session that sends reads to a replica bind when the request allows it."""
+
+	def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+		if bind is None and not self._flushing and not isinstance(clause, sa.UpdateBase):
+			replica = _current_replica()
+			if replica is not None and not _has_explicit_bind(mapper):
+				return replica
+		return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+	if has_app_context():
+		g._db_wrote = True
+
+
+@sa.event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement_written(orm_execute_state):
+	# Core INSERT/UPDATE/DELETE run through session.execute() skip the flush.
+	if not orm_execute_state.is_select and has_app_context():
+		g._db_wrote = True
+
+
+def _has_explicit_bind(mapper) -> bool:
+	if mapper is None:
+		return False
+	table = getattr(sa.inspect(mapper), 'local_table', None)
+	return table is not None and table.metadata.info.get('bind_key') is not None
+
+
+def engines(app) -> list:
+	"""Return the replica engines configured for ``app``."""
+	return app.extensions.get('db_replicas', [])
+
+
+def _current_replica():
+	"""Return the replica engine for the current scope, or ``None`` for primary."""
+	if not has_app_context() or not getattr(g, '_db_read_only', False):
+		return None
+	if getattr(g, '_db_wrote', False):
+		return None
+	index = getattr(g, '_db_replica_index', None)
+	if index is None:
+		return None
+	return engines(current_app)[index]
+
+
+def _pick_replica_index(app):
+	replicas = engines(app)
+	if not replicas:
+		return None
+	return random.randrange(len(replicas))
+
+
+def _is_sticky() -> bool:
+	if not has_request_context() or not engines(current_app):
+		return False
+	# Don't touch the session for anonymous requests, so public pages stay cacheable
+	if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+		return False
+	return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+def read_only(func):
+	"""Route the reads made inside ``func`` to a replica.
+
+	Use this on service functions that only read and may be called from write
+	requests. Callers that have already written in this request, or that are
+	pinned to the primary after a recent save, keep using the primary.
+	"""
+	@wraps(func)
+	def wrapper(*args, **kwargs):
+		previous = (getattr(g, '_db_read_only', False), getattr(g, '_db_replica_index', None))
+		if not previous[0] and not _is_sticky():
+			g._db_read_only = True
+			g._db_replica_index = _pick_replica_index(current_app)
+		try:
+			return func(*args, **kwargs)
+		finally:
+			g._db_read_only, g._db_replica_index = previous
+	return wrapper
+
+
+def mark_written() -> None:
+	"""Pin the visitor to the primary for a write made outside the request's session."""
+	if has_app_context():
+		g._db_wrote = True
+
+
+@contextmanager
+def unpinned():
+	"""Writes inside the block don't pin the visitor to the primary.
+
+	For cache maintenance done while serving a read, where the visitor has
+	nothing of their own to read back.
+	"""
+	wrote = getattr(g, '_db_wrote', False)
+	try:
+		yield
+	finally:
+		g._db_wrote = wrote
+
+
+def init_app(app) -> None:
+	"""Create the replica engines and register the request routing hooks."""
+	options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+	app.extensions['db_replicas'] = [
+		sa.create_engine(url, **options) for url in app.config.get('SQLALCHEMY_REPLICA_URLS') or []
+	]
+
+	@app.before_request
+	def _route_request():
+		g._db_wrote = False
+		g._db_read_only = request.method in READ_METHODS and not _is_sticky()
+		g._db_replica_index = _pick_replica_index(app) if g._db_read_only else None
+
+	@app.after_request
+	def _pin_writer(response):
+		if getattr(g, '_db_wrote', False) and engines(app):
+			session[STICKY_SESSION_KEY] = time.time() + app.config['SQLALCHEMY_REPLICA_STICKY_SECONDS']
+		return response
@@ -0,0 +1,572 @@
+"""Semantic search over published posts with a local vector index.
+
+Keyword search only finds posts that use the query's words. Here posts are
+embedded as vectors by a pluggable embedder (``SEARCH_EMBEDDER``):
+
+* ``hashing`` (default) works offline: hashed TF-IDF bags of words reduced by
+  truncated SVD (latent semantic analysis) to ``SEARCH_DIMENSIONS``, so words
+  that occur in similar posts end up close even when a query shares none of a
+  post's words.
+* ``gemini`` uses the AI provider's embedding model (``SEARCH_GEMINI_MODEL``);
+  every search then embeds its query with one API call.
+* A dotted path (``package.module:Class``) loads any class with the same
+  ``fit``/``load``/``embed``/``embed_query`` interface.
+
+Vectors are kept in ``SEARCH_INDEX_DIR`` as one float32 file that every worker
+memory-maps, with an inverted-file (IVF) index on top: k-means centroids
+partition the vectors, and a query scores only the vectors of the
+``SEARCH_PROBES`` partitions whose centroids are nearest. Indexes smaller than
+``SEARCH_IVF_MIN_POSTS`` are scanned in full.
+
+Writes flag posts with :func:`mark_stale` through
+:func:`app.posts.hooks.posts_changed`, in their transaction. :func:`refresh`
+embeds only posts whose version differs from the one recorded in the index and
+writes their rows in place; the process that made a write runs it a few
+seconds after the commit. The index is per host, so with several hosts also
+run ``flask search index`` on each (e.g. from cron); ``--rebuild`` refits the
+embedder and the partitions. Writers hold a lock file in the index directory.
+"""
+import fcntl
+import json
+import math
+import os
+import warnings
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.orm import selectinload
+from werkzeug.utils import import_string
+
+from .extensions import db
+from .models import Blog, SearchDocument
+from .numeric import linalg, np, sparse, vq
+from .public.related import DESCRIPTION_WEIGHT, TITLE_WEIGHT, tokens
+
+MODES = ('keyword', 'semantic', 'hybrid')
+HASH_FEATURES = 2 ** 15
+# Posts loaded and embedded per batch while indexing
+BATCH = 256
+# Reciprocal rank fusion constant; higher flattens the difference between ranks
+RRF_K = 60
+
+def _normalize(vectors):
+	norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+	return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def _replace(path: str, write) -> None:
+	"""Write a file next to ``path`` and move it into place, so readers never see half of it."""
+	tmp = f'{path}.tmp'
+	with open(tmp, 'wb') as f:
+		write(f)
+	os.replace(tmp, path)
+
+
+def _save_array(path: str, array) -> None:
+	_replace(path, lambda f: np.save(f, array))
+
+
+def document(blog) -> tuple:
+	"""``(title, description, content, tag names)``: what an embedder sees of a post."""
+	return blog.title or '', blog.description or '', blog.content_markdown or '', [tag.name for tag in blog.tags]
+
+
+class HashingEmbedder:
+	"""Hashed TF-IDF reduced by truncated SVD; needs no network or model download."""
+
+	name = 'hashing'
+
+	def __init__(self, directory: str, dimensions: int):
+		self.directory = directory
+		self.dimensions = dimensions
+		self.idf = None
+		self.components = None
+
+	def _path(self, part: str) -> str:
+		return os.path.join(self.directory, f'hashing-{part}.npy')
+
+	def _counts(self, documents):
+		"""Sparse ``1 + log(tf)`` rows over hashed words; tags and titles weigh more."""
+		indptr, indices, data = [0], [], []
+		for title, description, content, tag_names in documents:
+			counts = Counter()
+			for text, weight in (
+				(title, TITLE_WEIGHT), (description, DESCRIPTION_WEIGHT), (content, 1), (' '.join(tag_names), DESCRIPTION_WEIGHT),
+			):
+				for word, count in Counter(tokens(text)).items():
+					counts[zlib.crc32(word.encode('utf-8')) & (HASH_FEATURES - 1)] += weight * count
+			indices.extend(counts)
+			data.extend(1 + math.log(count) for count in counts.values())
+			indptr.append(len(indices))
+		return sparse.csr_matrix(
+			(np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+			shape=(len(indptr) - 1, HASH_FEATURES),
+		)
+
+	def fit(self, documents) -> None:
+		counts = self._counts(documents)
+		n = counts.shape[0]
+		document_frequency = np.bincount(counts.indices, minlength=HASH_FEATURES)
+		self.idf = (np.log((1 + n) / (1 + document_frequency)) + 1).astype(np.float32)
+		tfidf = (counts @ sparse.diags(self.idf)).astype(np.float64)
+		components = np.zeros((HASH_FEATURES, self.dimensions), dtype=np.float32)
+		k = min(self.dimensions, n - 1)
+		if k >= 1:
+			_, _, vt = linalg.svds(tfidf, k=k, random_state=0)
+			components[:, :k] = vt.T
+		self.components = components
+		_save_array(self._path('idf'), self.idf)
+		_save_array(self._path('components'), components)
+
+	def load(self) -> bool:
+		try:
+			self.idf = np.load(self._path('idf'))
+			self.components = np.load(self._path('components'), mmap_mode='r')
+		except FileNotFoundError:
+			return False
+		return self.components.shape[1] == self.dimensions
+
+	def embed(self, documents):
+		counts = self._counts(documents)
+		return _normalize((counts @ sparse.diags(self.idf)) @ self.components)
+
+	def embed_query(self, text: str):
+		return self.embed([(text, '', '', [])])[0]
+
+
+class GeminiEmbedder:
+	"""Embeddings from the Gemini API; nothing to fit."""
+
+	name = 'gemini'
+	# Texts per API call, and characters kept of each
+	BATCH = 100
+	MAX_CHARS = 8000
+
+	def __init__(self, directory: str, dimensions: int):
+		self.dimensions = dimensions
+
+	def fit(self, documents) -> None:
+		pass
+
+	def load(self) -> bool:
+		return True
+
+	def _embed_texts(self, texts: list[str]):
+		from .ai.routes import _client
+
+		model = current_app.config.get('SEARCH_GEMINI_MODEL', 'text-embedding-004')
+		vectors = []
+		for start in range(0, len(texts), self.BATCH):
+			response = _client().models.embed_content(
+				model=model,
+				contents=[text[:self.MAX_CHARS] for text in texts[start:start + self.BATCH]],
+				config={'output_dimensionality': self.dimensions},
+			)
+			vectors.extend(embedding.values for embedding in response.embeddings)
+		return _normalize(np.array(vectors, dtype=np.float32).reshape(len(texts), self.dimensions))
+
+	def embed(self, documents):
+		return self._embed_texts([
+			'\n\n'.join(part for part in (title, description, ', '.join(tag_names), content) if part)
+			for title, description, content, tag_names in documents
+		])
+
+	def embed_query(self, text: str):
+		return self._embed_texts([text])[0]
+
+
+EMBEDDERS = {
+	'hashing': HashingEmbedder,
+	'gemini': GeminiEmbedder,
+}
+
+
+def index_dir() -> str:
+	return current_app.config.get('SEARCH_INDEX_DIR') or os.path.join(current_app.instance_path, 'search')
+
+
+def create_embedder(directory: str):
+	name = current_app.config.get('SEARCH_EMBEDDER', 'hashing')
+	cls = EMBEDDERS.get(name) or import_string(name)
+	return cls(directory, current_app.config.get('SEARCH_DIMENSIONS', 128))
+
+
+class VectorIndex:
+	"""A read-only view of the index files in ``directory``.
+
+	``ids`` holds the blog id of each row of the vector file (0 for a free row)
+	and ``assign`` its IVF partition; ``order``/``offsets`` list the rows of
+	each partition.
+	"""
+
+	def __init__(self, directory: str, meta: dict):
+		self.directory = directory
+		self.meta = meta
+		self.ids = np.load(os.path.join(directory, 'ids.npy'))
+		self.versions = np.load(os.path.join(directory, 'versions.npy'))
+		self.vectors = np.memmap(
+			os.path.join(directory, 'vectors.f32'), dtype=np.float32, mode='r',
+			shape=(meta['capacity'], meta['dimensions']),
+		)
+		self.centroids = None
+		if meta.get('partitions'):
+			self.centroids = np.load(os.path.join(directory, 'centroids.npy'))
+			assign = np.load(os.path.join(directory, 'assign.npy'))
+			self.order = np.argsort(assign, kind='stable')
+			self.offsets = np.searchsorted(assign[self.order], np.arange(len(self.centroids) + 1))
+		self.embedder = None
+
+	def rows(self, vector, probes: int):
+		"""Rows to score for ``vector``: those in the ``probes`` nearest partitions, or all."""
+		if self.centroids is None or not 0 < probes < len(self.centroids):
+			return None
+		nearest = np.argpartition(-(self.centroids @ vector), probes - 1)[:probes]
+		return np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in nearest])
+
+	def search(self, vector, limit: int, min_score: float = 0.0, probes: int = 0) -> list[tuple[int, float]]:
+		"""``(blog_id, score)`` of the ``limit`` most similar posts, best first."""
+		rows = self.rows(vector, probes)
+		if rows is None:
+			rows = np.arange(len(self.ids))
+			scores = self.vectors[:len(self.ids)] @ vector
+		else:
+			scores = self.vectors[rows] @ vector
+		keep = (scores >= min_score) & (self.ids[rows] > 0)
+		rows, scores = rows[keep], scores[keep]
+		if len(rows) > limit:
+			best = np.argpartition(-scores, limit - 1)[:limit]
+			rows, scores = rows[best], scores[best]
+		order = np.argsort(-scores, kind='stable')
+		return [(int(self.ids[rows[i]]), float(scores[i])) for i in order]
+
+
+_indexes = {}
+
+
+def _read_meta(directory: str) -> dict | None:
+	try:
+		with open(os.path.join(directory, 'meta.json')) as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return None
+
+
+def open_index() -> VectorIndex | None:
+	"""This worker's view of the index, reopened when ``flask search index`` writes a new generation.
+
+	``None`` when there is no index or it was built with another embedder.
+	"""
+	directory = index_dir()
+	meta = _read_meta(directory)
+	config = current_app.config
+	if (
+		meta is None
+		or meta['embedder'] != config.get('SEARCH_EMBEDDER', 'hashing')
+		or meta['dimensions'] != config.get('SEARCH_DIMENSIONS', 128)
+	):
+		return None
+	index = _indexes.get(directory)
+	if index is None or index.meta['generation'] != meta['generation']:
+		index = VectorIndex(directory, meta)
+		embedder = create_embedder(directory)
+		if not embedder.load():
+			return None
+		index.embedder = embedder
+		_indexes[directory] = index
+	return index
+
+
+def search(text: str) -> list[int] | None:
+	"""Ids of the posts most similar to ``text``, best first; ``None`` without an index."""
+	index = open_index()
+	if index is None:
+		return None
+	config = current_app.config
+	vector = index.embedder.embed_query(text)
+	hits = index.search(
+		vector, config.get('SEARCH_RESULTS', 50), config.get('SEARCH_MIN_SCORE', 0.15), config.get('SEARCH_PROBES', 12),
+	)
+	return [blog_id for blog_id, _ in hits]
+
+
+def hybrid(*rankings) -> list[int]:
+	"""Merge ranked id lists by reciprocal rank fusion."""
+	scores = Counter()
+	for ranking in rankings:
+		for rank, blog_id in enumerate(ranking):
+			scores[blog_id] += 1 / (RRF_K + rank + 1)
+	return [blog_id for blog_id, _ in scores.most_common()]
+
+
+def _track(blog_ids) -> None:
+	"""Create counters for posts that have none."""
+	tracked = sa.select(SearchDocument.blog_id).where(SearchDocument.blog_id == Blog.id)
+	db.session.execute(
+		sa.insert(SearchDocument).from_select(
+			['blog_id', 'version'],
+			sa.select(Blog.id, sa.literal(1)).where(Blog.id.in_(blog_ids), ~sa.exists(tracked)),
+		)
+	)
+
+
+def mark_stale(blog_ids) -> None:
+	"""Flag posts whose text, tags or published state changed, in the caller's transaction."""
+	blog_ids = [blog_id for blog_id in blog_ids if blog_id is not None]
+	if not blog_ids:
+		return
+	db.session.execute(
+		sa.update(SearchDocument)
+		.where(SearchDocument.blog_id.in_(blog_ids))
+		.values(version=SearchDocument.version + 1)
+		.execution_options(synchronize_session=False)
+	)
+	_track(blog_ids)
+
+
+class IndexWriter:
+	"""Changes to the index files, written by :meth:`save`.
+
+	Vector rows are written in place; readers pick up the new ids, partitions
+	and metadata when ``meta.json`` gets its next generation.
+	"""
+
+	def __init__(self, directory: str, embedder_name: str, dimensions: int, fresh: bool = False):
+		self.directory = directory
+		previous = _read_meta(directory)
+		meta = None if fresh else previous
+		if meta is not None and (meta['embedder'] != embedder_name or meta['dimensions'] != dimensions):
+			meta = None
+		self.fresh = meta is None
+		self.meta = meta or {
+			'embedder': embedder_name, 'dimensions': dimensions, 'capacity': 0, 'partitions': 0, 'trained_on': 0,
+			# Keeps counting across rebuilds so workers notice the new files
+			'generation': previous['generation'] if previous else 0,
+		}
+		if self.fresh:
+			self.ids = np.zeros(0, dtype=np.int64)
+			self.versions = np.zeros(0, dtype=np.int64)
+			self.assign = np.zeros(0, dtype=np.int32)
+		else:
+			self.ids = np.load(os.path.join(directory, 'ids.npy'))
+			self.versions = np.load(os.path.join(directory, 'versions.npy'))
+			self.assign = np.load(os.path.join(directory, 'assign.npy'))
+		self.slots = {int(blog_id): slot for slot, blog_id in enumerate(self.ids) if blog_id}
+		self.free = [int(slot) for slot in np.flatnonzero(self.ids == 0)][::-1]
+		self.pending = {}
+
+	def indexed_versions(self) -> dict[int, int]:
+		return {blog_id: int(self.versions[slot]) for blog_id, slot in self.slots.items()}
+
+	def _slot(self, blog_id: int) -> int:
+		slot = self.slots.get(blog_id)
+		if slot is None:
+			if self.free:
+				slot = self.free.pop()
+			else:
+				slot = len(self.ids)
+				self.ids = np.append(self.ids, 0)
+				self.versions = np.append(self.versions, 0)
+				self.assign = np.append(self.assign, np.int32(-1))
+			self.slots[blog_id] = slot
+			self.ids[slot] = blog_id
+		return slot
+
+	def put(self, blog_id: int, version: int, vector) -> None:
+		slot = self._slot(blog_id)
+		self.versions[slot] = version
+		self.pending[slot] = vector
+
+	def remove(self, blog_id: int) -> None:
+		slot = self.slots.pop(blog_id, None)
+		if slot is not None:
+			self.ids[slot] = self.versions[slot] = 0
+			self.assign[slot] = -1
+			self.pending[slot] = np.zeros(self.meta['dimensions'], dtype=np.float32)
+			self.free.append(slot)
+
+	def _write_vectors(self):
+		"""Write pending rows, growing the file into a new one if needed; returns it mapped."""
+		path = os.path.join(self.directory, 'vectors.f32')
+		dimensions = self.meta['dimensions']
+		capacity = self.meta['capacity']
+		grow = self.fresh or len(self.ids) > capacity
+		if grow:
+			grown = max(1024, len(self.ids), 2 * capacity)
+			vectors = np.memmap(f'{path}.tmp', dtype=np.float32, mode='w+', shape=(grown, dimensions))
+			if not self.fresh:
+				vectors[:capacity] = np.memmap(path, dtype=np.float32, mode='r', shape=(capacity, dimensions))
+			self.meta['capacity'] = grown
+		else:
+			vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, dimensions))
+		if self.pending:
+			slots = np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))
+			vectors[slots] = np.stack(list(self.pending.values()))
+		vectors.flush()
+		if grow:
+			os.replace(f'{path}.tmp', path)
+		return vectors
+
+	def _partition(self, vectors, retrain: bool) -> None:
+		"""Train IVF centroids when the index is big enough, else assign new rows to the nearest one."""
+		live = np.flatnonzero(self.ids > 0)
+		trained_on = self.meta['trained_on']
+		minimum = current_app.config.get('SEARCH_IVF_MIN_POSTS', 5000)
+		centroids_path = os.path.join(self.directory, 'centroids.npy')
+		if len(live) >= minimum and (retrain or not self.meta['partitions'] or len(live) > 4 * trained_on):
+			centroids = _train(vectors[live])
+			_save_array(centroids_path, centroids)
+			self.meta.update(partitions=len(centroids), trained_on=len(live))
+			self.assign[:] = -1
+			self.assign[live] = _nearest(vectors[live], centroids)
+		elif self.meta['partitions']:
+			changed = np.array([slot for slot in self.pending if self.ids[slot] > 0], dtype=np.int64)
+			if len(changed):
+				self.assign[changed] = _nearest(vectors[changed], np.load(centroids_path))
+
+	def save(self, retrain: bool = False) -> None:
+		os.makedirs(self.directory, exist_ok=True)
+		vectors = self._write_vectors()
+		self._partition(vectors, retrain or self.fresh)
+		_save_array(os.path.join(self.directory, 'ids.npy'), self.ids)
+		_save_array(os.path.join(self.directory, 'versions.npy'), self.versions)
+		_save_array(os.path.join(self.directory, 'assign.npy'), self.assign)
+		self.meta['generation'] += 1
+		_replace(os.path.join(self.directory, 'meta.json'), lambda f: f.write(json.dumps(self.meta).encode('utf-8')))
+
+
+def _train(vectors):
+	"""About sqrt(n) k-means centroids over unit ``vectors``, fitted on a sample."""
+	partitions = max(1, int(math.sqrt(len(vectors))))
+	rng = np.random.default_rng(0)
+	sample = vectors[rng.choice(len(vectors), min(len(vectors), 64 * partitions), replace=False)]
+	with warnings.catch_warnings():
+		# Empty clusters are fine: their partitions just stay empty
+		warnings.simplefilter('ignore')
+		# Random starting points: k-means++ seeding costs more than the iterations at this size
+		centroids, _ = vq.kmeans2(sample.astype(np.float64), partitions, iter=10, minit='points', seed=rng)
+	return _normalize(centroids)
+
+
+def _nearest(vectors, centroids):
+	assign = np.empty(len(vectors), dtype=np.int32)
+	for start in range(0, len(vectors), 4096):
+		assign[start:start + 4096] = np.argmax(vectors[start:start + 4096] @ centroids.T, axis=1)
+	return assign
+
+
+def _published(blog_ids=None):
+	"""Published posts with tags loaded, in batches; ``blog_ids`` limits them."""
+	query = Blog.query.filter(Blog.is_published.is_(True)).options(selectinload(Blog.tags))
+	if blog_ids is None:
+		yield from _batches(query.order_by(Blog.id).yield_per(BATCH))
+		return
+	blog_ids = sorted(blog_ids)
+	for start in range(0, len(blog_ids), BATCH):
+		yield query.filter(Blog.id.in_(blog_ids[start:start + BATCH])).all()
+
+
+def _batches(rows):
+	batch = []
+	for row in rows:
+		batch.append(row)
+		if len(batch) == BATCH:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+
+@contextmanager
+def _writing(directory: str, blocking: bool = True):
+	"""Hold the index's write lock; yields ``False`` if ``blocking`` is off and another process holds it."""
+	os.makedirs(directory, exist_ok=True)
+	with open(os.path.join(directory, 'write.lock'), 'a') as lock:
+		try:
+			fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except BlockingIOError:
+			yield False
+			return
+		try:
+			yield True
+		finally:
+			fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def refresh(blocking: bool = True) -> dict | None:
+	"""Embed posts changed since they were indexed and drop unpublished ones. Returns counts.
+
+	Returns ``None`` without waiting when ``blocking`` is off and another
+	process is writing the index.
+	"""
+	directory = index_dir()
+	with _writing(directory, blocking) as locked:
+		return _refresh(directory) if locked else None
+
+
+def rebuild() -> dict:
+	"""Refit the embedder on every published post and index them all again."""
+	directory = index_dir()
+	with _writing(directory):
+		return _rebuild(directory)
+
+
+def _refresh(directory: str) -> dict:
+	embedder = create_embedder(directory)
+	writer = IndexWriter(directory, current_app.config.get('SEARCH_EMBEDDER', 'hashing'), embedder.dimensions)
+	if writer.fresh or not embedder.load():
+		return _rebuild(directory)
+	versions = dict(db.session.execute(sa.select(SearchDocument.blog_id, SearchDocument.version)).all())
+	indexed = writer.indexed_versions()
+	stale = {blog_id for blog_id, version in versions.items() if indexed.get(blog_id) != version}
+	stale |= indexed.keys() - versions.keys()
+	if not stale:
+		return {'indexed': 0, 'removed': 0}
+	embedded = 0
+	for blogs in _published(stale):
+		vectors = embedder.embed([document(blog) for blog in blogs])
+		for blog, vector in zip(blogs, vectors):
+			writer.put(blog.id, versions.get(blog.id, 0), vector)
+			stale.discard(blog.id)
+		embedded += len(blogs)
+	for blog_id in stale:
+		writer.remove(blog_id)
+	writer.save()
+	return {'indexed': embedded, 'removed': len(stale)}
+
+
+def _rebuild(directory: str) -> dict:
+	blog_ids = db.session.execute(sa.select(Blog.id).where(Blog.is_published.is_(True))).scalars().all()
+	if blog_ids:
+		_track(blog_ids)
+	versions = dict(db.session.execute(sa.select(SearchDocument.blog_id, SearchDocument.version)).all())
+	embedder = create_embedder(directory)
+	embedder.fit(document(blog) for blogs in _published() for blog in blogs)
+	writer = IndexWriter(directory, current_app.config.get('SEARCH_EMBEDDER', 'hashing'), embedder.dimensions, fresh=True)
+	embedded = 0
+	for blogs in _published():
+		for blog, vector in zip(blogs, embedder.embed([document(blog) for blog in blogs])):
+			writer.put(blog.id, versions.get(blog.id, 0), vector)
+		embedded += len(blogs)
+	writer.save(retrain=True)
+	return {'indexed': embedded, 'removed': 0}
+
+
+search_cli = AppGroup('search', help='Maintain the semantic search index.')
+
+
+@search_cli.command('index')
+@click.option('--rebuild', 'full', is_flag=True, help='Refit the embedder and re-embed every post.')
+def index_command(full):
+	"""Embed posts changed since the last run into the search index."""
+	stats = rebuild() if full else refresh()
+	db.session.commit()
+	click.echo(f"Indexed {stats['indexed']} posts, removed {stats['removed']}.")
+
+
+def init_app(app) -> None:
+	app.cli.add_command(search_cli)
@@ -0,0 +1,230 @@
+"""Single-flight coalescing of identical expensive work.
+
+A double-click, several open tabs or a burst of readers can ask for the same
+expensive result at once. :func:`do` runs ``fn`` once per key at a time in
+this process: the first caller computes, and callers arriving while it runs
+wait for it and get its result (or its exception) instead of starting their
+own. Keys are a name plus a SHA-256 of the JSON-encoded parts, so they are
+stable across processes. :func:`do_async` does the same for async views (see
+``app.asgi``): waiting suspends only the request, and the lock table is read
+and written in a thread.
+
+With ``shared=True`` and ``SINGLEFLIGHT_SHARED`` set, the call is also
+coalesced across processes through :class:`~app.models.SingleFlightLock`: the
+process that inserts the key's row computes and stores the JSON-encoded
+result for ``SINGLEFLIGHT_RESULT_TTL`` seconds, and the others poll the row
+for it. A lock whose holder died expires after ``SINGLEFLIGHT_LEASE``
+seconds. Waiters give up after ``SINGLEFLIGHT_TIMEOUT`` seconds and compute
+the result themselves.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app
+
+from . import metrics
+from .extensions import db
+from .models import SingleFlightLock
+
+# Seconds between checks of another process's lock
+POLL_INTERVAL = 0.1
+
+
+def key(name: str, *parts) -> str:
+	digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+	return f'{name}:{digest}'
+
+
+class Group:
+	"""Calls in flight in this process, by key."""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._calls: dict[str, Future] = {}
+
+	def _join(self, key: str) -> tuple[Future, bool]:
+		"""The future for ``key``'s call, and whether this caller makes it."""
+		with self._lock:
+			future = self._calls.get(key)
+			leader = future is None
+			if leader:
+				future = self._calls[key] = Future()
+		metrics.SINGLEFLIGHT_CALLS.inc(name=key.split(':', 1)[0], role='leader' if leader else 'follower')
+		return future, leader
+
+	def _leave(self, key: str, future: Future, result=None, error: BaseException | None = None) -> None:
+		if error is not None:
+			future.set_exception(error)
+		else:
+			future.set_result(result)
+		with self._lock:
+			self._calls.pop(key, None)
+
+	def do(self, key: str, fn, timeout: float | None = None):
+		"""``fn()``, unless a call for ``key`` is already running; then that call's outcome."""
+		future, leader = self._join(key)
+		if not leader:
+			try:
+				return future.result(timeout)
+			except TimeoutError:
+				_timed_out(key)
+				return fn()
+		try:
+			result = fn()
+		except BaseException as e:
+			self._leave(key, future, error=e)
+			raise
+		self._leave(key, future, result)
+		return result
+
+	async def do_async(self, key: str, fn, timeout: float | None = None):
+		"""Like :meth:`do` for a coroutine function ``fn``; followers wait without blocking the loop."""
+		future, leader = self._join(key)
+		if not leader:
+			try:
+				# Shielded, so a follower giving up doesn't cancel the leader's future
+				return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+			except TimeoutError:
+				_timed_out(key)
+				return await fn()
+		try:
+			result = await fn()
+		except BaseException as e:
+			self._leave(key, future, error=e)
+			raise
+		self._leave(key, future, result)
+		return result
+
+	def in_flight(self) -> int:
+		return len(self._calls)
+
+
+_group = Group()
+
+
+def _timed_out(key: str) -> None:
+	current_app.logger.warning(f"single-flight wait for {key.split(':', 1)[0]} timed out; running it again")
+
+
+def do(name: str, parts, fn, shared: bool = False):
+	"""Run ``fn()`` once for concurrent callers with the same ``name`` and ``parts``.
+
+	``shared`` results must be JSON-serializable; they are coalesced across
+	processes when ``SINGLEFLIGHT_SHARED`` is set.
+	"""
+	config = current_app.config
+	flight_key = key(name, *parts)
+	timeout = config.get('SINGLEFLIGHT_TIMEOUT', 60)
+	run = fn
+	if shared and config.get('SINGLEFLIGHT_SHARED'):
+		def run():
+			return _across_processes(flight_key, fn, timeout)
+	return _group.do(flight_key, run, timeout)
+
+
+async def do_async(name: str, parts, fn, shared: bool = False):
+	"""Like :func:`do` for a coroutine function ``fn``, on the event loop."""
+	config = current_app.config
+	flight_key = key(name, *parts)
+	timeout = config.get('SINGLEFLIGHT_TIMEOUT', 60)
+	run = fn
+	if shared and config.get('SINGLEFLIGHT_SHARED'):
+		async def run():
+			return await _across_processes_async(flight_key, fn, timeout)
+	return await _group.do_async(flight_key, run, timeout)
+
+
+def _across_processes(flight_key: str, fn, timeout: float):
+	config = current_app.config
+	owner = uuid.uuid4().hex
+	deadline = time.monotonic() + timeout
+	while True:
+		claimed, found = _claim(flight_key, owner, config.get('SINGLEFLIGHT_LEASE', 120))
+		if claimed:
+			break
+		if found is not None:
+			metrics.SINGLEFLIGHT_CALLS.inc(name=flight_key.split(':', 1)[0], role='shared')
+			return json.loads(found)
+		if time.monotonic() >= deadline:
+			current_app.logger.warning(f'single-flight lock {flight_key} still held; running it here')
+			return fn()
+		time.sleep(POLL_INTERVAL)
+	try:
+		result = fn()
+	except BaseException:
+		_release(flight_key, owner)
+		raise
+	_publish(flight_key, owner, json.dumps(result), config.get('SINGLEFLIGHT_RESULT_TTL', 10))
+	return result
+
+
+async def _across_processes_async(flight_key: str, fn, timeout: float):
+	""":func:`_across_processes` for a coroutine function, with the lock table used from a thread."""
+	config = current_app.config
+	owner = uuid.uuid4().hex
+	deadline = time.monotonic() + timeout
+	while True:
+		claimed, found = await asyncio.to_thread(_claim, flight_key, owner, config.get('SINGLEFLIGHT_LEASE', 120))
+		if claimed:
+			break
+		if found is not None:
+			metrics.SINGLEFLIGHT_CALLS.inc(name=flight_key.split(':', 1)[0], role='shared')
+			return json.loads(found)
+		if time.monotonic() >= deadline:
+			current_app.logger.warning(f'single-flight lock {flight_key} still held; running it here')
+			return await fn()
+		await asyncio.sleep(POLL_INTERVAL)
+	try:
+		result = await fn()
+	except BaseException:
+		await asyncio.to_thread(_release, flight_key, owner)
+		raise
+	await asyncio.to_thread(_publish, flight_key, owner, json.dumps(result), config.get('SINGLEFLIGHT_RESULT_TTL', 10))
+	return result
+
+
+def _claim(flight_key: str, owner: str, lease: float) -> tuple[bool, str | None]:
+	"""``(True, None)`` if this call now holds the lock, else ``(False, result or None while it runs)``.
+
+	Lock rows are written on connections of their own, committed at once, so
+	other processes see them whatever the request's session is doing.
+	"""
+	now = datetime.utcnow()
+	with db.engine.begin() as connection:
+		connection.execute(sa.delete(SingleFlightLock).where(SingleFlightLock.expires_at < now))
+	try:
+		with db.engine.begin() as connection:
+			connection.execute(sa.insert(SingleFlightLock).values(
+				key=flight_key, owner=owner, done=False, expires_at=now + timedelta(seconds=lease),
+			))
+		return True, None
+	except sa.exc.IntegrityError:
+		pass
+	with db.engine.connect() as connection:
+		row = connection.execute(
+			sa.select(SingleFlightLock.done, SingleFlightLock.result).where(SingleFlightLock.key == flight_key)
+		).first()
+	return False, row.result if row is not None and row.done else None
+
+
+def _publish(flight_key: str, owner: str, result: str, ttl: float) -> None:
+	with db.engine.begin() as connection:
+		connection.execute(
+			sa.update(SingleFlightLock)
+			.where(SingleFlightLock.key == flight_key, SingleFlightLock.owner == owner)
+			.values(done=True, result=result, expires_at=datetime.utcnow() + timedelta(seconds=ttl))
+		)
+
+
+def _release(flight_key: str, owner: str) -> None:
+	with db.engine.begin() as connection:
+		connection.execute(
+			sa.delete(SingleFlightLock).where(SingleFlightLock.key == flight_key, SingleFlightLock.owner == owner)
+		)
@@ -0,0 +1,178 @@
+document.addEventListener('DOMContentLoaded', function() {
+	const blogCards = document.querySelectorAll('.blog-card');
+	const overlay = document.getElementById('blogOverlay');
+	const closeOverlay = document.getElementById('closeOverlay');
+	
+	console.log('Blog cards found:', blogCards.length);
+	console.log('Overlay element:', overlay);
+	console.log('Close overlay element:', closeOverlay);
+	
+	// Tag colors for overlay
+	const tagColors = [
+		'bg-blue-600 text-white',
+		'bg-green-600 text-white',
+		'bg-purple-600 text-white',
+		'bg-pink-600 text-white',
+		'bg-yellow-600 text-white',
+		'bg-indigo-600 text-white',
+		'bg-red-600 text-white',
+		'bg-orange-600 text-white',
+		'bg-teal-600 text-white',
+		'bg-cyan-600 text-white'
+	];
+	
+	// Count a read-through once per opening, when the reader reaches the end of the post
+	const overlayScroll = document.getElementById('overlayScroll');
+	let unreadBlogId = null;
+	overlayScroll.addEventListener('scroll', function() {
+		if (unreadBlogId === null || overlayScroll.scrollTop + overlayScroll.clientHeight < overlayScroll.scrollHeight - 40) {
+			return;
+		}
+		fetch(`/api/blog/${unreadBlogId}/read`, {
+			method: 'POST',
+			keepalive: true,
+			headers: { 'X-CSRFToken': document.querySelector('meta[name="csrf-token"]').content }
+		}).catch(() => {});
+		unreadBlogId = null;
+	});
+	
+	// Open overlay when blog card is clicked
+	blogCards.forEach(card => {
+		card.addEventListener('click', async function(e) {
+			e.preventDefault();
+			e.stopPropagation();
+			
+			const blogId = this.getAttribute('data-blog-id');
+			console.log('Blog card clicked, blog ID:', blogId);
+			
+			try {
+				// Show loading state
+				console.log('Showing overlay...');
+				overlay.classList.remove('hidden');
+				overlay.style.display = 'flex';
+				overlay.style.position = 'fixed';
+				overlay.style.top = '0';
+				overlay.style.left = '0';
+				overlay.style.width = '100vw';
+				overlay.style.height = '100vh';
+				overlay.style.zIndex = '9999';
+				overlay.style.backgroundColor = 'rgba(0, 0, 0, 0.5)';
+				document.getElementById('overlayTitle').textContent = 'Loading...';
+				document.getElementById('overlayContent').innerHTML = '<p class="text-slate-500">Loading blog content...</p>';
+				
+				// Fetch blog content
+				const response = await fetch(`/api/blog/${blogId}`);
+				const blog = await response.json();
+				
+				if (response.ok) {
+					// Populate overlay content
+					document.getElementById('overlayTitle').textContent = blog.title;
+					document.getElementById('overlayAuthor').textContent = `By ${blog.author.name}`;
+					document.getElementById('overlayDescription').textContent = blog.description || '';
+					
+					// Set author avatar
+					const authorAvatar = document.getElementById('overlayAuthorAvatar');
+					if (blog.author.avatar_url) {
+						authorAvatar.innerHTML = `<img src="${blog.author.avatar_url}" alt="${blog.author.name}" class="w-10 h-10 rounded-full object-cover">`;
+					}
+					
+					// Render tags
+					const tagsContainer = document.getElementById('overlayTags');
+					tagsContainer.innerHTML = '';
+					blog.tags.forEach((tag, index) => {
+						const tagElement = document.createElement('span');
+						tagElement.className = `tag-color text-sm text-white px-4 py-2 rounded-full font-medium ${tagColors[index % tagColors.length]}`;
+						tagElement.textContent = tag.name;
+						tagsContainer.appendChild(tagElement);
+					});
+					
+					// Reading time and outline come precomputed, so they show before the body renders
+					renderMetadata(blog.metadata);
+					
+					// Render markdown content
+					await renderMarkdownContent(blog.content);
+					overlayScroll.scrollTop = 0;
+					unreadBlogId = blog.id;
+					
+				} else {
+					document.getElementById('overlayTitle').textContent = 'Error';
+					document.getElementById('overlayContent').innerHTML = '<p class="text-red-500">Failed to load blog content.</p>';
+				}
+			} catch (error) {
+				console.error('Error loading blog:', error);
+				document.getElementById('overlayTitle').textContent = 'Error';
+				document.getElementById('overlayContent').innerHTML = '<p class="text-red-500">Failed to load blog content.</p>';
+			}
+		});
+	});
+	
+	// Close overlay
+	closeOverlay.addEventListener('click', function() {
+		console.log('Closing overlay...');
+		overlay.classList.add('hidden');
+		overlay.style.display = 'none';
+	});
+	
+	// Close overlay when clicking outside
+	overlay.addEventListener('click', function(e) {
+		if (e.target === overlay) {
+			console.log('Closing overlay by clicking outside...');
+			overlay.classList.add('hidden');
+			overlay.style.display = 'none';
+		}
+	});
+	
+	// Show reading time and a heading outline that scrolls to each heading
+	function renderMetadata(metadata) {
+		const meta = document.getElementById('overlayMeta');
+		const toc = document.getElementById('overlayToc');
+		meta.textContent = metadata && metadata.word_count
+			? `${metadata.reading_minutes} min read · ${metadata.word_count} words`
+			: '';
+		toc.innerHTML = '';
+		const headings = metadata ? metadata.toc : [];
+		toc.classList.toggle('hidden', headings.length < 2);
+		headings.forEach((heading, index) => {
+			const item = document.createElement('li');
+			item.style.paddingLeft = `${(heading.level - 1) * 0.75}rem`;
+			const link = document.createElement('a');
+			link.href = `#${heading.anchor}`;
+			link.className = 'hover:text-orange-600';
+			link.textContent = heading.text;
+			link.addEventListener('click', function(e) {
+				e.preventDefault();
+				const target = document.getElementById('overlayContent').querySelectorAll('h1, h2, h3, h4, h5, h6')[index];
+				if (target) {
+					target.scrollIntoView({ behavior: 'smooth', block: 'start' });
+				}
+			});
+			item.appendChild(link);
+			toc.appendChild(item);
+		});
+	}
+	
+	// Render markdown content
+	async function renderMarkdownContent(markdown) {
+		try {
+			const encodedText = encodeURIComponent(markdown);
+			const response = await fetch(`/posts/render-markdown?text=${encodedText}`, {
+				method: 'GET',
+				headers: {
+					'X-Requested-With': 'XMLHttpRequest'
+				}
+			});
+			
+			if (response.ok) {
+				const data = await response.json();
+				document.getElementById('overlayContent').innerHTML = data.html;
+			} else {
+				// Fallback to simple text display
+				document.getElementById('overlayContent').innerHTML = `<p class="text-slate-600">${markdown.replace(/\n/g, '<br>')}</p>`;
+			}
+		} catch (error) {
+			console.error('Error rendering markdown:', error);
+			document.getElementById('overlayContent').innerHTML = `<p class="text-slate-600">${markdown.replace(/\n/g, '<br>')}</p>`;
+		}
+	}
+	
+});
@@ -0,0 +1,147 @@
+// One connection per open editor (see app/posts/channel.py): preview, auto-save
+// and AI calls share a WebSocket when the app is served over ASGI, and fall back
+// to the JSON endpoints when it isn't.
+window.EditorChannel = class {
+	// read() returns the editor's {title, description, content}
+	constructor(url, blogId, read) {
+		this.url = url;
+		this.blogId = blogId;
+		this.read = read;
+		this.socket = null;
+		this.sent = null;
+		this.blocks = [];
+		this.saves = [];
+		this.jobs = new Map();
+		this.nextJob = 1;
+		this.previewSeq = 0;
+		this.onPreview = function () {};
+		this.connect();
+	}
+
+	connect() {
+		if (!this.url || !window.WebSocket) return;
+		const url = new URL(this.url, window.location.href);
+		url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+		const socket = new WebSocket(url);
+		socket.addEventListener('open', () => {
+			this.socket = socket;
+			this.blocks = [];
+			this.open();
+		});
+		socket.addEventListener('message', (event) => this.receive(JSON.parse(event.data)));
+		socket.addEventListener('close', () => {
+			if (this.socket !== socket) return;  // never opened: stay on HTTP
+			this.socket = null;
+			this.saves.splice(0).forEach((resolve) => resolve({ success: false, error: 'Connection lost' }));
+			this.jobs.forEach((job) => job.reject(new Error('Connection lost')));
+			this.jobs.clear();
+			setTimeout(() => this.connect(), 2000);
+		});
+	}
+
+	send(frame) {
+		this.socket.send(JSON.stringify(frame));
+	}
+
+	open() {
+		this.sent = this.read();
+		this.send(Object.assign({ op: 'open', blog_id: this.blogId ? parseInt(this.blogId) : null }, this.sent));
+	}
+
+	receive(frame) {
+		if (frame.op === 'preview') {
+			this.blocks.splice(frame.at, frame.remove, ...frame.insert);
+			this.onPreview(this.blocks.join(''));
+		} else if (frame.op === 'saved') {
+			const resolve = this.saves.shift();
+			if (resolve) resolve(frame);
+		} else if (frame.op === 'ai') {
+			const job = this.jobs.get(frame.id);
+			if (job && frame.status !== undefined) {
+				this.jobs.delete(frame.id);
+				job.resolve(frame.body || {});
+			}
+		} else if (frame.op === 'resync') {
+			this.open();
+		} else if (frame.op === 'error') {
+			console.error('Editor channel:', frame.error);
+		}
+	}
+
+	// Send what changed since the last call; the preview follows via onPreview
+	update() {
+		const state = this.read();
+		if (!this.socket) {
+			this.previewOverHttp(state.content).catch((error) => console.error('Error rendering markdown:', error));
+			return;
+		}
+		for (const field of ['title', 'description', 'content']) {
+			const before = this.sent[field];
+			const after = state[field];
+			if (before === after) continue;
+			let start = 0;
+			while (start < before.length && start < after.length && before[start] === after[start]) start++;
+			let end = 0;
+			while (end < before.length - start && end < after.length - start
+				&& before[before.length - 1 - end] === after[after.length - 1 - end]) end++;
+			this.send({ op: 'edit', field: field, at: start, remove: before.length - start - end, insert: after.slice(start, after.length - end) });
+		}
+		this.sent = state;
+	}
+
+	async previewOverHttp(text) {
+		const seq = ++this.previewSeq;
+		let html = '';
+		if (text.trim()) {
+			const response = await fetch(`/posts/render-markdown?text=${encodeURIComponent(text)}`, {
+				headers: { 'X-Requested-With': 'XMLHttpRequest' }
+			});
+			if (!response.ok) throw new Error(`Failed to render markdown: ${response.status}`);
+			html = (await response.json()).html;
+		}
+		// Responses can overtake each other; only show the latest
+		if (seq === this.previewSeq) this.onPreview(html);
+	}
+
+	// Resolves with {success, error}
+	save() {
+		if (this.socket) {
+			this.update();
+			return new Promise((resolve) => {
+				this.saves.push(resolve);
+				this.send({ op: 'save' });
+			});
+		}
+		const state = this.read();
+		return this.post('/posts/auto-save', {
+			blog_id: this.blogId,
+			title: state.title,
+			description: state.description,
+			content: state.content
+		});
+	}
+
+	// Calls /api/ai/<action>; resolves with its JSON body
+	ai(action, data) {
+		if (this.socket) {
+			const id = this.nextJob++;
+			return new Promise((resolve, reject) => {
+				this.jobs.set(id, { resolve: resolve, reject: reject });
+				this.send({ op: 'ai', id: id, action: action, data: data });
+			});
+		}
+		return this.post(`/api/ai/${action}`, data);
+	}
+
+	async post(path, data) {
+		const response = await fetch(path, {
+			method: 'POST',
+			headers: {
+				'Content-Type': 'application/json',
+				'X-CSRFToken': document.querySelector('meta[name="csrf-token"]').content
+			},
+			body: JSON.stringify(data)
+		});
+		return response.json();
+	}
+};
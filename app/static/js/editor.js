@@ -10,39 +10,20 @@ document.addEventListener('DOMContentLoaded', function () {
 	let autoSaveTimeout;
 	let isFullscreen = false;
 
-	// Markdown rendering function using server-side markdown-it-py
-	async function renderMarkdown(text) {
-		if (!text.trim()) return '<p class="text-slate-400 italic">Start typing to see preview...</p>';
-		
-		try {
-			console.log('Rendering markdown server-side:', text);
-			
-			// URL encode the markdown text for GET request
-			const encodedText = encodeURIComponent(text);
-			const response = await fetch(`/posts/render-markdown?text=${encodedText}`, {
-				method: 'GET',
-				headers: {
-					'X-Requested-With': 'XMLHttpRequest'
-				}
-			});
-			
-			console.log('Response status:', response.status);
-			
-			if (!response.ok) {
-				const errorText = await response.text();
-				console.error('Response error:', errorText);
-				throw new Error(`Failed to render markdown: ${response.status}`);
-			}
-			
-			const data = await response.json();
-			console.log('Server rendered HTML:', data.html);
-			return data.html;
-		} catch (error) {
-			console.error('Error rendering markdown:', error);
-			// Fallback to simple text display
-			return `<p class="text-slate-600">${text.replace(/\n/g, '<br>')}</p>`;
-		}
-	}
+	// Preview, auto-save and AI calls go over one channel (editor-channel.js)
+	const form = document.querySelector('form[data-blog-id]');
+	const channel = window.editorChannel = new EditorChannel(
+		form ? form.getAttribute('data-channel-url') : null,
+		form ? form.getAttribute('data-blog-id') : null,
+		() => ({
+			title: document.querySelector('input[name="title"]').value,
+			description: document.querySelector('textarea[name="description"]').value,
+			content: mdInput.value
+		})
+	);
+	channel.onPreview = function (html) {
+		mdPreview.innerHTML = html.trim() ? html : '<p class="text-slate-400 italic">Start typing to see preview...</p>';
+	};
 
 	// Fallback markdown renderer for when server-side fails
 	function renderMarkdownFallback(text) {
@@ -136,40 +117,9 @@ document.addEventListener('DOMContentLoaded', function () {
 		// Auto-save every 15 seconds when editing
 		autoSaveTimeout = setTimeout(async () => {
 			try {
-				// Get blog ID from form data attribute
-				const form = document.querySelector('form[data-blog-id]');
-				const blogId = form ? form.getAttribute('data-blog-id') : null;
-				
-				if (!blogId) {
-					console.error('Blog ID not found');
-					saveStatus.textContent = 'Save failed';
-					saveStatus.className = 'text-red-600';
-					return;
-				}
-				
-				// Get form data
-				const title = document.querySelector('input[name="title"]').value;
-				const description = document.querySelector('textarea[name="description"]').value;
-				const content = mdInput.value;
+				const data = await channel.save();
 				
-				// Send auto-save request to backend
-				const response = await fetch('/posts/auto-save', {
-					method: 'POST',
-					headers: {
-						'Content-Type': 'application/json',
-						'X-CSRFToken': document.querySelector('meta[name="csrf-token"]').content
-					},
-					body: JSON.stringify({
-						blog_id: blogId,
-						title: title,
-						description: description,
-						content: content
-					})
-				});
-				
-				const data = await response.json();
-				
-				if (response.ok && data.success) {
+				if (data.success) {
 					saveStatus.textContent = 'Saved';
 					saveStatus.className = 'text-green-600';
 				} else {
@@ -185,14 +135,8 @@ document.addEventListener('DOMContentLoaded', function () {
 	}
 
 	// Live preview update
-	async function updatePreview() {
-		const text = mdInput.value;
-		const html = await renderMarkdown(text);
-		console.log('Setting innerHTML to:', html);
-		mdPreview.innerHTML = html;
-		console.log('Preview element after setting:', mdPreview.innerHTML);
-		console.log('Preview element children:', mdPreview.children);
-		console.log('First child tag name:', mdPreview.children[0]?.tagName);
+	function updatePreview() {
+		channel.update();
 		updateWordCount();
 		autoSave();
 	}
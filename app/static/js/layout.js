@@ -0,0 +1,9 @@
+// Clear header search function
+window.clearHeaderSearch = function() {
+	window.location.href = document.body.getAttribute('data-dashboard-url');
+};
+
+// Re-sort the feed as soon as a different order is picked
+document.querySelectorAll('select[name="sort"]').forEach(select => {
+	select.addEventListener('change', () => select.form.submit());
+});
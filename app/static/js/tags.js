@@ -0,0 +1,49 @@
+document.addEventListener('DOMContentLoaded', function() {
+	const addTagBtn = document.getElementById('addTagBtn');
+	const addFirstTag = document.getElementById('addFirstTag');
+	const addTagForm = document.getElementById('addTagForm');
+	const cancelAddTag = document.getElementById('cancelAddTag');
+	
+	function showAddForm() {
+		addTagForm.classList.remove('hidden');
+		document.getElementById('tagName').focus();
+	}
+	
+	function hideAddForm() {
+		addTagForm.classList.add('hidden');
+		document.getElementById('tagName').value = '';
+	}
+	
+	if (addTagBtn) addTagBtn.addEventListener('click', showAddForm);
+	if (addFirstTag) addFirstTag.addEventListener('click', showAddForm);
+	if (cancelAddTag) cancelAddTag.addEventListener('click', hideAddForm);
+	
+	// Hide form when clicking outside
+	document.addEventListener('click', function(e) {
+		if (!addTagForm.contains(e.target) && !addTagBtn.contains(e.target) && !addFirstTag.contains(e.target)) {
+			hideAddForm();
+		}
+	});
+});
+
+function deleteTag(tagId) {
+	if (confirm('Are you sure you want to delete this tag? This action cannot be undone.')) {
+		fetch(`/posts/tags/${tagId}`, {
+			method: 'DELETE',
+			headers: {
+				'Content-Type': 'application/json',
+			},
+		})
+		.then(response => {
+			if (response.ok) {
+				location.reload();
+			} else {
+				alert('Error deleting tag');
+			}
+		})
+		.catch(error => {
+			console.error('Error:', error);
+			alert('Error deleting tag');
+		});
+	}
+}
@@ -0,0 +1,5 @@
+from app import create_app
+from app.asgi import ASGIBridge
+
+# Serve with an ASGI server, e.g. ``uvicorn asgi:app``
+app = ASGIBridge(create_app())
@@ -0,0 +1,182 @@
+"""Compare sync workers with the ASGI mode under a burst of AI requests.
+
+Usage::
+
+	python benchmarks/asgi_concurrency.py [--requests 500] [--threads 32] [--latency 1.0]
+
+Sends ``--requests`` simultaneous ``/api/ai/generate-description`` calls
+against a fake Gemini provider that answers after ``--latency`` seconds, first
+through a pool of ``--threads`` sync workers (as a threaded WSGI server would
+serve them), then through :class:`app.asgi.ASGIBridge` on one event loop.
+Requests are made in-process, so the numbers show the serving model rather
+than the network stack.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+os.environ['RATELIMIT_STORAGE_URI'] = 'memory://'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.ai import routes as ai_routes  # noqa: E402
+from app.asgi import ASGIBridge  # noqa: E402
+from app.extensions import db, limiter  # noqa: E402
+from app.models import User  # noqa: E402
+
+BODY = b'{"title": "Benchmarking", "content": "Serving many slow AI calls at once."}'
+
+
+class FakeProvider:
+	"""Stands in for ``google.genai``; every call takes ``latency`` seconds."""
+
+	def __init__(self, latency: float):
+		self.latency = latency
+
+	def Client(self, api_key=None):
+		return SimpleNamespace(
+			models=SimpleNamespace(generate_content=self.generate_content),
+			aio=SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content_async)),
+		)
+
+	def _response(self):
+		usage = SimpleNamespace(prompt_token_count=120, candidates_token_count=40)
+		return SimpleNamespace(text='A short description.', usage_metadata=usage)
+
+	def generate_content(self, model, contents):
+		time.sleep(self.latency)
+		return self._response()
+
+	async def generate_content_async(self, model, contents):
+		await asyncio.sleep(self.latency)
+		return self._response()
+
+
+class PeakThreads:
+	"""Samples the number of live threads while a run is in progress."""
+
+	def __init__(self):
+		self.peak = threading.active_count()
+		self._done = threading.Event()
+		self._thread = threading.Thread(target=self._sample, daemon=True)
+
+	def _sample(self):
+		while not self._done.wait(0.01):
+			self.peak = max(self.peak, threading.active_count())
+
+	def __enter__(self):
+		self._thread.start()
+		return self
+
+	def __exit__(self, *exc):
+		self._done.set()
+		self._thread.join()
+
+
+def setup(latency: float):
+	app = create_app('production')
+	app.config.update(WTF_CSRF_ENABLED=False, AI_USER_DAILY_BUDGET='', AI_GLOBAL_DAILY_BUDGET='')
+	limiter.enabled = False
+	ai_routes.genai = FakeProvider(latency)
+	with app.app_context():
+		db.create_all()
+		user = User(google_sub='bench', email='bench@example.com', name='Bench')
+		db.session.add(user)
+		db.session.commit()
+		user_id = user.id
+	client = app.test_client()
+	with client.session_transaction() as session:
+		session['_user_id'] = str(user_id)
+	return app, f"session={client.get_cookie('session').value}"
+
+
+def run_sync(app, cookie: str, requests: int, threads: int):
+	def one(submitted):
+		environ = EnvironBuilder(
+			path='/api/ai/generate-description', method='POST', data=BODY,
+			headers={'Content-Type': 'application/json', 'Cookie': cookie},
+		).get_environ()
+		status = []
+		body = app(environ, lambda s, h, e=None: status.append(int(s[:3])))
+		b''.join(body)
+		return status[0], time.perf_counter() - submitted
+
+	with ThreadPoolExecutor(threads) as pool:
+		futures = [pool.submit(one, time.perf_counter()) for _ in range(requests)]
+		return [future.result() for future in futures]
+
+
+async def run_asgi(bridge, cookie: str, requests: int):
+	headers = [(b'content-type', b'application/json'), (b'cookie', cookie.encode())]
+
+	async def one():
+		submitted = time.perf_counter()
+		scope = {
+			'type': 'http', 'method': 'POST', 'path': '/api/ai/generate-description', 'query_string': b'',
+			'root_path': '', 'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80),
+			'client': ('127.0.0.1', 0), 'headers': headers,
+		}
+		messages = iter([{'type': 'http.request', 'body': BODY, 'more_body': False}])
+		status = []
+
+		async def receive():
+			return next(messages)
+
+		async def send(message):
+			if message['type'] == 'http.response.start':
+				status.append(message['status'])
+
+		await bridge(scope, receive, send)
+		return status[0], time.perf_counter() - submitted
+
+	return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def report(name: str, results, wall: float, peak: int) -> None:
+	latencies = sorted(latency for _, latency in results)
+	errors = sum(1 for status, _ in results if status != 200)
+	p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+	print(f'{name:<22} {wall:7.2f} s {len(results) / wall:8.1f} req/s  p50 {statistics.median(latencies):6.2f} s'
+		f'  p99 {p99:6.2f} s  errors {errors:3d}  peak threads {peak}')
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--requests', type=int, default=500)
+	parser.add_argument('--threads', type=int, default=32)
+	parser.add_argument('--latency', type=float, default=1.0)
+	args = parser.parse_args()
+
+	app, cookie = setup(args.latency)
+	print(f'{args.requests} simultaneous AI requests, provider latency {args.latency:.2f} s')
+
+	with PeakThreads() as peak:
+		started = time.perf_counter()
+		results = run_sync(app, cookie, args.requests, args.threads)
+		report(f'sync, {args.threads} threads', results, time.perf_counter() - started, peak.peak)
+
+	bridge = ASGIBridge(app)
+	with PeakThreads() as peak:
+		started = time.perf_counter()
+		results = asyncio.run(run_asgi(bridge, cookie, args.requests))
+		report('asgi, event loop', results, time.perf_counter() - started, peak.peak)
+	bridge.executor.shutdown()
+	shutil.rmtree(TMP, ignore_errors=True)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,68 @@
+"""Measure what rate limiting adds to each request.
+
+Usage::
+
+	python benchmarks/ratelimit_overhead.py [--hits 5000]
+
+Times a ``moving-window`` hit against each storage backend, with the two
+limits an AI route checks per request (``RATELIMIT_DEFAULT`` plus the route's
+own), and the cost of the limiter key function on a signed-in request.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import session  # noqa: E402
+from limits import parse_many  # noqa: E402
+from limits.storage import storage_from_string  # noqa: E402
+from limits.strategies import MovingWindowRateLimiter  # noqa: E402
+
+from app import create_app, extensions  # noqa: E402
+
+
+def time_hits(uri: str, hits: int) -> float:
+	"""Average microseconds to check every limit of one request."""
+	limiter = MovingWindowRateLimiter(storage_from_string(uri))
+	limits = parse_many('1000000/day;1000000/minute')
+	started = time.perf_counter()
+	for i in range(hits):
+		key = f'user:{i % 50}'
+		for limit in limits:
+			limiter.hit(limit, key)
+	return (time.perf_counter() - started) / hits * 1e6
+
+
+def time_key_func(app, hits: int) -> float:
+	with app.test_request_context(headers={'Cookie': 'session=bench'}):
+		session['_user_id'] = '1'
+		started = time.perf_counter()
+		for _ in range(hits):
+			extensions._rate_limit_key_func()
+		return (time.perf_counter() - started) / hits * 1e6
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--hits', type=int, default=5000)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		backends = {
+			'memory://': 'memory://',
+			'sqlite (shared file)': f"sqlite:///{os.path.join(tmp, 'ratelimit.db')}",
+		}
+		if os.getenv('BENCH_REDIS_URL'):
+			backends['redis'] = os.environ['BENCH_REDIS_URL']
+		for name, uri in backends.items():
+			print(f'{name:<24} {time_hits(uri, args.hits):8.1f} us/request')
+
+	app = create_app('testing')
+	print(f"{'key function':<24} {time_key_func(app, args.hits):8.2f} us/request")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,117 @@
+"""Measure semantic search latency and IVF recall on a synthetic corpus.
+
+Usage::
+
+	python benchmarks/semantic_search.py [--posts 100000] [--queries 200] [--probes 12]
+
+Inserts ``--posts`` published posts written from a few hundred topic
+vocabularies, builds the index with the default hashing embedder
+(``flask search index --rebuild``), then times :func:`app.search.search` for
+short topical queries. Recall is the share of the exact top results (every
+vector scanned) that the IVF search also returns.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TMP = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'bench.db')}"
+os.environ['SEARCH_INDEX_DIR'] = os.path.join(TMP, 'search')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import sqlalchemy as sa  # noqa: E402
+
+from app import create_app, search  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Blog, User  # noqa: E402
+
+TOPICS = 300
+WORDS_PER_TOPIC = 40
+
+
+def vocabulary(rng: random.Random) -> list[list[str]]:
+	syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'zi', 'pe', 'su', 'do', 'fa']
+	words = set()
+	while len(words) < TOPICS * WORDS_PER_TOPIC:
+		words.add(''.join(rng.choices(syllables, k=rng.randint(2, 4))))
+	words = sorted(words)
+	rng.shuffle(words)
+	return [words[i * WORDS_PER_TOPIC:(i + 1) * WORDS_PER_TOPIC] for i in range(TOPICS)]
+
+
+def populate(posts: int, topics: list[list[str]], rng: random.Random) -> None:
+	user = User(google_sub='bench', email='bench@example.com', name='Bench')
+	db.session.add(user)
+	db.session.commit()
+	for start in range(0, posts, 5000):
+		rows = []
+		for i in range(start, min(posts, start + 5000)):
+			words = rng.choice(topics)
+			rows.append({
+				'user_id': user.id, 'title': ' '.join(rng.choices(words, k=4)), 'slug': f'post-{i}',
+				'content_markdown': ' '.join(rng.choices(words, k=150)), 'is_published': True,
+			})
+		db.session.execute(sa.insert(Blog), rows)
+		db.session.commit()
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--posts', type=int, default=100000)
+	parser.add_argument('--queries', type=int, default=200)
+	parser.add_argument('--probes', type=int, default=12)
+	args = parser.parse_args()
+
+	app = create_app('development')
+	app.config['SEARCH_PROBES'] = args.probes
+	rng = random.Random(0)
+	try:
+		with app.app_context():
+			db.create_all()
+			topics = vocabulary(rng)
+			started = time.perf_counter()
+			populate(args.posts, topics, rng)
+			print(f'inserted {args.posts} posts in {time.perf_counter() - started:.1f} s')
+
+			started = time.perf_counter()
+			search.rebuild()
+			db.session.commit()
+			meta = search.open_index().meta
+			print(f"indexed in {time.perf_counter() - started:.1f} s, {meta['partitions']} partitions")
+
+			queries = [' '.join(rng.choices(rng.choice(topics), k=3)) for _ in range(args.queries)]
+			search.search(queries[0])
+			timings = []
+			for query in queries:
+				started = time.perf_counter()
+				search.search(query)
+				timings.append((time.perf_counter() - started) * 1000)
+			timings.sort()
+			print(
+				f'query: median {statistics.median(timings):.2f} ms, '
+				f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, max {timings[-1]:.2f} ms'
+			)
+
+			index = search.open_index()
+			limit = app.config['SEARCH_RESULTS']
+			found = total = 0
+			for query in queries:
+				vector = index.embedder.embed_query(query)
+				exact = {blog_id for blog_id, _ in index.search(vector, limit)}
+				approximate = {blog_id for blog_id, _ in index.search(vector, limit, probes=args.probes)}
+				found += len(exact & approximate)
+				total += len(exact)
+			print(f'recall@{limit} with {args.probes} probes: {found / max(total, 1):.3f}')
+	finally:
+		shutil.rmtree(TMP, ignore_errors=True)
+
+
+if __name__ == '__main__':
+	main()
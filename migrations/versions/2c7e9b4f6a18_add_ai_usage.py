@@ -0,0 +1,44 @@
+"""Add append-only AI usage ledger
+
+Revision ID: 2c7e9b4f6a18
+Revises: 8d4f2a6c1e73
+Create Date: 2026-10-19 17:02:44.507211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e9b4f6a18'
+down_revision = '8d4f2a6c1e73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ai_usage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('endpoint', sa.String(length=32), nullable=False),
+    sa.Column('model', sa.String(length=64), nullable=False),
+    sa.Column('calls', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('output_tokens', sa.Integer(), nullable=False),
+    sa.Column('cost_micros', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ai_usage', schema=None) as batch_op:
+        batch_op.create_index('ix_ai_usage_hour', ['hour'], unique=False)
+        batch_op.create_index('ix_ai_usage_user_id_hour', ['user_id', 'hour'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ai_usage', schema=None) as batch_op:
+        batch_op.drop_index('ix_ai_usage_user_id_hour')
+        batch_op.drop_index('ix_ai_usage_hour')
+
+    op.drop_table('ai_usage')
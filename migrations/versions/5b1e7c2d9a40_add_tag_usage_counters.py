@@ -0,0 +1,58 @@
+"""Add denormalized tag usage counters
+
+Revision ID: 5b1e7c2d9a40
+Revises: f3f078aed823
+Create Date: 2026-10-19 10:12:31.406215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e7c2d9a40'
+down_revision = 'f3f078aed823'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blog_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('published_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index(batch_op.f('ix_tags_name'), ['name'], unique=False)
+        batch_op.create_index('ix_tags_user_id_name', ['user_id', 'name'], unique=False)
+
+    op.create_table('tag_name_counts',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('published_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('tag_name_counts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tag_name_counts_published_count'), ['published_count'], unique=False)
+
+    # Backfill the counters from the existing associations
+    op.execute("""
+        UPDATE tags SET
+            blog_count = (SELECT COUNT(*) FROM blog_tags WHERE blog_tags.tag_id = tags.id),
+            published_count = (
+                SELECT COUNT(*) FROM blog_tags JOIN blogs ON blogs.id = blog_tags.blog_id
+                WHERE blog_tags.tag_id = tags.id AND blogs.is_published
+            )
+    """)
+    op.execute("""
+        INSERT INTO tag_name_counts (name, published_count)
+        SELECT name, SUM(published_count) FROM tags GROUP BY name
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('tag_name_counts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tag_name_counts_published_count'))
+
+    op.drop_table('tag_name_counts')
+    with op.batch_alter_table('tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_tags_user_id_name')
+        batch_op.drop_index(batch_op.f('ix_tags_name'))
+        batch_op.drop_column('published_count')
+        batch_op.drop_column('blog_count')
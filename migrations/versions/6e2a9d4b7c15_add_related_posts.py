@@ -0,0 +1,35 @@
+"""Add the related-posts index
+
+Revision ID: 6e2a9d4b7c15
+Revises: 2c7e9b4f6a18
+Create Date: 2026-10-19 18:12:40.503117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2a9d4b7c15'
+down_revision = '2c7e9b4f6a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('related_posts',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('terms', sa.LargeBinary(), nullable=True),
+    sa.Column('weights', sa.LargeBinary(), nullable=True),
+    sa.Column('tags', sa.LargeBinary(), nullable=True),
+    sa.Column('neighbors', sa.Text(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('built_version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    sa.PrimaryKeyConstraint('blog_id')
+    )
+
+
+def downgrade():
+    op.drop_table('related_posts')
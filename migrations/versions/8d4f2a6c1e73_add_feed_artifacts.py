@@ -0,0 +1,37 @@
+"""Add pre-rendered feed artifacts and published listing index
+
+Revision ID: 8d4f2a6c1e73
+Revises: 5b1e7c2d9a40
+Create Date: 2026-10-19 15:41:08.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f2a6c1e73'
+down_revision = '5b1e7c2d9a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('feed_artifacts',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('body', sa.LargeBinary(), nullable=False),
+    sa.Column('etag', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('built_version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('blogs', schema=None) as batch_op:
+        batch_op.create_index('ix_blogs_is_published_published_at', ['is_published', 'published_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blogs', schema=None) as batch_op:
+        batch_op.drop_index('ix_blogs_is_published_published_at')
+
+    op.drop_table('feed_artifacts')
@@ -0,0 +1,29 @@
+"""Add change counters for the semantic search index
+
+Revision ID: 9b4d1f7e3a20
+Revises: 6e2a9d4b7c15
+Create Date: 2026-10-19 20:41:07.318652
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4d1f7e3a20'
+down_revision = '6e2a9d4b7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_documents',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    sa.PrimaryKeyConstraint('blog_id')
+    )
+
+
+def downgrade():
+    op.drop_table('search_documents')
@@ -0,0 +1,31 @@
+"""Add the cross-process single-flight lock table
+
+Revision ID: a4d8c2f6e195
+Revises: f7b3e9a1c480
+Create Date: 2026-10-20 02:14:39.650271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8c2f6e195'
+down_revision = 'f7b3e9a1c480'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('singleflight_locks',
+    sa.Column('key', sa.String(length=128), nullable=False),
+    sa.Column('owner', sa.String(length=32), nullable=False),
+    sa.Column('done', sa.Boolean(), nullable=False),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('singleflight_locks')
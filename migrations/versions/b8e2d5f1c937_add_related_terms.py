@@ -0,0 +1,28 @@
+"""Add document frequencies of the related-posts index
+
+Revision ID: b8e2d5f1c937
+Revises: a4d8c2f6e195
+Create Date: 2026-10-21 09:41:12.284530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d5f1c937'
+down_revision = 'a4d8c2f6e195'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('related_terms',
+    sa.Column('term', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('posts', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('term')
+    )
+
+
+def downgrade():
+    op.drop_table('related_terms')
@@ -0,0 +1,43 @@
+"""Add MinHash signatures and LSH buckets for near-duplicate detection
+
+Revision ID: c3f8a2e6d914
+Revises: 9b4d1f7e3a20
+Create Date: 2026-10-19 22:05:33.871240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2e6d914'
+down_revision = '9b4d1f7e3a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_signatures',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('signature', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    sa.PrimaryKeyConstraint('blog_id')
+    )
+    op.create_table('post_buckets',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'bucket', 'blog_id')
+    )
+    with op.batch_alter_table('post_buckets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_post_buckets_blog_id'), ['blog_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post_buckets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_post_buckets_blog_id'))
+
+    op.drop_table('post_buckets')
+    op.drop_table('post_signatures')
@@ -0,0 +1,34 @@
+"""Add metadata extracted from post markdown at write time
+
+Revision ID: e5a1c7d3b962
+Revises: c3f8a2e6d914
+Create Date: 2026-10-19 23:41:12.504318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c7d3b962'
+down_revision = 'c3f8a2e6d914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_metadata',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('word_count', sa.Integer(), nullable=False),
+    sa.Column('reading_minutes', sa.Integer(), nullable=False),
+    sa.Column('first_image', sa.String(length=1024), nullable=True),
+    sa.Column('toc', sa.Text(), nullable=False),
+    sa.Column('links', sa.Text(), nullable=False),
+    sa.Column('code_languages', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    sa.PrimaryKeyConstraint('blog_id')
+    )
+
+
+def downgrade():
+    op.drop_table('post_metadata')
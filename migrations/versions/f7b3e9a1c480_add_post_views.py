@@ -0,0 +1,36 @@
+"""Add hourly view and read-through counters
+
+Revision ID: f7b3e9a1c480
+Revises: e5a1c7d3b962
+Create Date: 2026-10-20 00:52:07.118349
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7b3e9a1c480'
+down_revision = 'e5a1c7d3b962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_views',
+    sa.Column('blog_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('views', sa.Integer(), nullable=False),
+    sa.Column('reads', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['blog_id'], ['blogs.id'], ),
+    sa.PrimaryKeyConstraint('blog_id', 'bucket')
+    )
+    with op.batch_alter_table('post_views', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_post_views_bucket'), ['bucket'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post_views', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_post_views_bucket'))
+
+    op.drop_table('post_views')
@@ -0,0 +1,164 @@
+"""
+Tests for AI token/cost accounting and daily budgets.
+"""
+from types import SimpleNamespace
+
+import pytest
+from app.ai import routes as ai_routes
+from app.ai import usage
+from app.models import db, AIUsage, Blog, User
+
+
+class FakeGenai:
+    """Stands in for ``google.genai``; records prompts and returns canned usage."""
+
+    def __init__(self, text='A LinkedIn post', prompt_tokens=1000, output_tokens=200, error=None):
+        self.calls = []
+        self.text = text
+        self.usage_metadata = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+        self.error = error
+
+    def Client(self, api_key=None):
+        return SimpleNamespace(
+            models=SimpleNamespace(generate_content=self.generate_content),
+            aio=SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content_async)),
+        )
+
+    def generate_content(self, model, contents):
+        self.calls.append(contents)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(text=self.text, usage_metadata=self.usage_metadata)
+
+    async def generate_content_async(self, model, contents):
+        return self.generate_content(model, contents)
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    fake = FakeGenai()
+    monkeypatch.setattr(ai_routes, 'genai', fake)
+    return fake
+
+
+@pytest.fixture
+def blog_id(existing_blog):
+    return Blog.query.filter_by(slug='existing-blog-post').one().id
+
+
+def totals(user_id=None):
+    query = db.session.query(
+        db.func.sum(AIUsage.calls), db.func.sum(AIUsage.prompt_tokens),
+        db.func.sum(AIUsage.output_tokens), db.func.sum(AIUsage.cost_micros),
+    )
+    if user_id is not None:
+        query = query.filter(AIUsage.user_id == user_id)
+    return tuple(query.one())
+
+
+class TestAccounting:
+    """Each call nets out to the provider-reported tokens and their cost."""
+
+    def test_call_records_actual_tokens_and_cost(self, authenticated_client, test_user, blog_id, fake_genai):
+        response = authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        assert response.status_code == 200
+        # 1000 input tokens at $0.10/M plus 200 output tokens at $0.40/M
+        assert totals(test_user) == (1, 1000, 200, 180)
+        # Reservation plus settlement, both appended
+        assert AIUsage.query.count() == 2
+
+    def test_failed_call_releases_reservation(self, authenticated_client, test_user, blog_id, monkeypatch):
+        monkeypatch.setattr(ai_routes, 'genai', FakeGenai(error=RuntimeError('provider down')))
+        response = authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        assert response.status_code == 500
+        assert totals(test_user) == (0, 0, 0, 0)
+
+    def test_missing_usage_metadata_falls_back_to_estimate(self, authenticated_client, test_user, fake_genai):
+        fake_genai.usage_metadata = None
+        fake_genai.text = 'x' * 400
+        response = authenticated_client.post('/api/ai/generate-description', json={'title': 'Title', 'content': 'Body'})
+        assert response.status_code == 200
+        calls, prompt_tokens, output_tokens, cost = totals(test_user)
+        assert calls == 1
+        assert prompt_tokens == usage.estimate_tokens(fake_genai.calls[0])
+        assert output_tokens == 101
+
+
+class TestBudgets:
+    """Budgets are enforced before the model is called."""
+
+    def test_user_budget_blocks_call(self, app, authenticated_client, test_user, blog_id, fake_genai):
+        app.config['AI_USER_DAILY_BUDGET'] = '0.0001'
+        response = authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        assert response.status_code == 429
+        assert response.get_json()['scope'] == 'user'
+        assert 0 < int(response.headers['Retry-After']) <= 86400
+        assert fake_genai.calls == []
+        assert AIUsage.query.count() == 0
+
+    def test_global_budget_counts_other_users(self, app, authenticated_client, test_user, blog_id, fake_genai):
+        other = User(google_sub='other-sub', email='other@example.com', name='Other')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(AIUsage(user_id=other.id, hour=usage.current_hour(), endpoint='linkedin',
+                               model='gemini-2.0-flash', calls=1, cost_micros=999_900))
+        db.session.commit()
+        app.config['AI_USER_DAILY_BUDGET'] = ''
+        app.config['AI_GLOBAL_DAILY_BUDGET'] = '1'
+        response = authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        assert response.status_code == 429
+        assert response.get_json()['scope'] == 'global'
+
+    def test_yesterdays_spend_does_not_count(self, app, authenticated_client, test_user, blog_id, fake_genai):
+        db.session.add(AIUsage(user_id=test_user, hour=usage.day_start(usage.current_hour()) - 1,
+                               endpoint='linkedin', model='gemini-2.0-flash', calls=1, cost_micros=10_000_000))
+        db.session.commit()
+        response = authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        assert response.status_code == 200
+
+    def test_cap_is_checked_by_the_insert(self, app, test_user, monkeypatch):
+        app.config['AI_USER_DAILY_BUDGET'] = '0.0001'
+        # A stale read can't let the reservation through
+        monkeypatch.setattr(usage, 'spent_micros', lambda since, user_id=None: 0)
+        usage.reserve(test_user, 'description', 'gemini-2.0-flash', 'x' * 100)
+        with pytest.raises(usage.BudgetExceeded):
+            usage.reserve(test_user, 'linkedin', 'gemini-2.0-flash', 'x' * 4000)
+        assert AIUsage.query.count() == 1
+
+    def test_unpriced_model_is_refused(self, app, authenticated_client, blog_id, fake_genai):
+        app.config['AI_MODEL'] = 'gemini-9-ultra'
+        response = authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        assert response.status_code == 500
+        assert fake_genai.calls == []
+        assert AIUsage.query.count() == 0
+
+    def test_my_usage(self, authenticated_client, blog_id, fake_genai):
+        authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+        data = authenticated_client.get('/api/ai/usage').get_json()
+        assert data['spent_usd'] == pytest.approx(0.00018)
+        assert data['remaining_usd'] == pytest.approx(0.5 - 0.00018)
+
+
+class TestSummary:
+    """The admin summary aggregates the ledger per time bucket."""
+
+    def test_requires_admin(self, authenticated_client):
+        assert authenticated_client.get('/api/ai/usage/summary').status_code == 403
+
+    def test_hourly_and_daily_buckets(self, app, authenticated_client, test_user, blog_id, fake_genai):
+        app.config['ADMIN_EMAILS'] = ['test@example.com']
+        hour = usage.current_hour()
+        db.session.add(AIUsage(user_id=test_user, hour=hour - 1, endpoint='description',
+                               model='gemini-2.0-flash', calls=1, prompt_tokens=10, output_tokens=5, cost_micros=3))
+        db.session.commit()
+        authenticated_client.post('/api/ai/blog-to-linkedin', json={'blog_id': blog_id})
+
+        data = authenticated_client.get('/api/ai/usage/summary?days=2').get_json()
+        assert [bucket['calls'] for bucket in data['buckets']] == [1, 1]
+        assert data['total']['cost_usd'] == pytest.approx(0.000183)
+        assert data['top_users'][0]['user_id'] == test_user
+
+        data = authenticated_client.get('/api/ai/usage/summary?days=2&bucket=day').get_json()
+        assert sum(bucket['calls'] for bucket in data['buckets']) == 2
+        assert len(data['buckets']) in (1, 2)
+        assert authenticated_client.get('/api/ai/usage/summary?bucket=week').status_code == 400
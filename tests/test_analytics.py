@@ -0,0 +1,156 @@
+"""
+Tests for buffered view counters and the popular sort.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import url_for
+
+from app import analytics
+from app.models import db, Blog, PostViews, User
+
+
+@pytest.fixture
+def counter(app):
+    """Replace the write-through test counter with a buffering one."""
+    counter = analytics.ViewCounter(app, interval=3600, max_pending=3)
+    app.extensions['analytics'] = counter
+    yield counter
+    counter._stop.set()
+
+
+def add_post(user_id, title, age=0):
+    blog = Blog(
+        user_id=user_id, title=title, slug=title.lower().replace(' ', '-'), content_markdown=f'About {title}.',
+        is_published=True, published_at=datetime.utcnow(), updated_at=datetime.utcnow() - timedelta(minutes=age),
+    )
+    db.session.add(blog)
+    db.session.commit()
+    return blog.id
+
+
+def stored(blog_id):
+    db.session.expire_all()
+    rows = PostViews.query.filter_by(blog_id=blog_id).all()
+    return sum(row.views for row in rows), sum(row.reads for row in rows)
+
+
+class TestCounter:
+    """Views are added up in memory and written in batches."""
+
+    def test_views_are_buffered_until_flush(self, authenticated_client, test_user, counter):
+        blog_id = add_post(test_user, 'Buffered')
+        for _ in range(3):
+            assert authenticated_client.get(url_for('main.get_blog_content', blog_id=blog_id)).status_code == 200
+        assert stored(blog_id) == (0, 0)
+        assert counter.flush() == 1
+        assert stored(blog_id) == (3, 0)
+
+    def test_flushes_add_onto_the_bucket(self, app, test_user, counter):
+        blog_id = add_post(test_user, 'Twice')
+        counter.add(blog_id, views=2)
+        counter.flush()
+        counter.add(blog_id, views=1, reads=1)
+        counter.flush()
+        assert stored(blog_id) == (3, 1)
+        assert PostViews.query.count() == 1
+
+    def test_generic_upsert(self, app, test_user, counter, monkeypatch):
+        monkeypatch.setattr(analytics, '_dialect', lambda: 'mysql')
+        blog_id = add_post(test_user, 'Portable')
+        counter.add(blog_id, views=2)
+        counter.flush()
+        counter.add(blog_id, views=1)
+        counter.flush()
+        assert stored(blog_id) == (3, 0)
+
+    def test_max_pending_flushes(self, app, test_user, counter):
+        ids = [add_post(test_user, f'Post {i}') for i in range(3)]
+        counter.add(ids[0], views=1)
+        counter.add(ids[1], views=1)
+        assert stored(ids[0]) == (0, 0)
+        counter.add(ids[2], views=1)
+        assert [stored(blog_id) for blog_id in ids] == [(1, 0)] * 3
+
+    def test_failed_flush_keeps_counts(self, app, test_user, counter, monkeypatch):
+        blog_id = add_post(test_user, 'Retry')
+        counter.add(blog_id, views=2)
+
+        def broken(batch):
+            raise RuntimeError('database is locked')
+
+        monkeypatch.setattr(analytics, '_write_batch', broken)
+        assert counter.flush() == 0
+        counter.add(blog_id, views=1)
+        monkeypatch.undo()
+        counter.flush()
+        assert stored(blog_id) == (3, 0)
+
+    def test_missing_posts_are_dropped(self, app, test_user, counter):
+        blog_id = add_post(test_user, 'Real')
+        counter.add(blog_id, views=1)
+        counter.add(9999, views=1)
+        assert counter.flush() == 2
+        assert PostViews.query.count() == 1
+
+    def test_public_page_and_read_through(self, authenticated_client, client, test_user):
+        blog_id = add_post(test_user, 'Public')
+        client.get(f'/p/{blog_id}/public/')
+        assert authenticated_client.post(f'/api/blog/{blog_id}/read').status_code == 204
+        assert stored(blog_id) == (1, 1)
+
+    def test_reads_of_unpublished_or_missing_posts_are_rejected(self, authenticated_client, test_user, counter):
+        draft = Blog(user_id=test_user, title='Draft', slug='draft', content_markdown='Draft', is_published=False)
+        db.session.add(draft)
+        db.session.commit()
+        assert authenticated_client.post(f'/api/blog/{draft.id}/read').status_code == 404
+        assert authenticated_client.post('/api/blog/9999/read').status_code == 404
+        assert counter.flush() == 0
+
+    def test_author_analytics(self, authenticated_client, test_user, counter):
+        blog_id = add_post(test_user, 'Stats')
+        db.session.add(PostViews(blog_id=blog_id, bucket=analytics.hour() - timedelta(days=1), views=4, reads=1))
+        db.session.commit()
+        counter.add(blog_id, views=2)
+        data = authenticated_client.get(f'/posts/{blog_id}/analytics?days=7').get_json()
+        assert (data['views'], data['reads']) == (6, 1)
+        assert [day['views'] for day in data['days']] == [4, 2]
+
+    def test_analytics_are_private(self, authenticated_client, app):
+        other = User(google_sub='other', email='other@example.com', name='Other')
+        db.session.add(other)
+        db.session.commit()
+        blog_id = add_post(other.id, 'Theirs')
+        assert authenticated_client.get(f'/posts/{blog_id}/analytics').status_code == 404
+
+
+class TestPopular:
+    """The dashboard can sort by recent views."""
+
+    def test_popular_sort(self, authenticated_client, test_user):
+        quiet = add_post(test_user, 'Quiet post', age=1)
+        busy = add_post(test_user, 'Busy post', age=30)
+        stale = add_post(test_user, 'Stale post', age=20)
+        db.session.add_all([
+            PostViews(blog_id=busy, bucket=analytics.hour(), views=5),
+            PostViews(blog_id=quiet, bucket=analytics.hour(), views=1),
+            # Outside the popular window
+            PostViews(blog_id=stale, bucket=analytics.hour() - timedelta(days=30), views=100),
+        ])
+        db.session.commit()
+
+        html = authenticated_client.get('/dashboard?sort=popular').get_data(as_text=True)
+        assert html.index('Busy post') < html.index('Quiet post') < html.index('Stale post')
+        html = authenticated_client.get('/dashboard').get_data(as_text=True)
+        assert html.index('Quiet post') < html.index('Stale post') < html.index('Busy post')
+
+    def test_new_views_change_the_etag(self, authenticated_client, test_user):
+        first = add_post(test_user, 'First', age=1)
+        second = add_post(test_user, 'Second', age=2)
+        db.session.add(PostViews(blog_id=first, bucket=analytics.hour(), views=1))
+        db.session.commit()
+        etag = authenticated_client.get('/dashboard?sort=popular').headers['ETag']
+        assert authenticated_client.get('/dashboard?sort=popular', headers={'If-None-Match': etag}).status_code == 304
+        authenticated_client.get(url_for('main.get_blog_content', blog_id=second))
+        authenticated_client.get(url_for('main.get_blog_content', blog_id=second))
+        assert authenticated_client.get('/dashboard?sort=popular', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,173 @@
+"""
+Tests for the ASGI serving mode.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from flask import abort
+
+from app import asgi, create_app
+from app.ai import routes as ai_routes
+from app.config import TestingConfig
+from app.models import db, AIUsage
+from tests.test_ai_usage import FakeGenai
+
+
+class SlowGenai(FakeGenai):
+    """Fake provider whose async calls take ``delay`` seconds and note the thread they ran on."""
+
+    def __init__(self, delay=0.3):
+        super().__init__()
+        self.delay = delay
+        self.threads = set()
+
+    async def generate_content_async(self, model, contents):
+        self.threads.add(threading.current_thread().name)
+        await asyncio.sleep(self.delay)
+        return self.generate_content(model, contents)
+
+
+async def call(bridge, method, path, body=b'', headers=()):
+    """Send one HTTP request through the bridge; returns the status, headers and body messages."""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'root_path': '',
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    messages = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await bridge(scope, receive, send)
+    start, chunks = messages[0], messages[1:]
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), chunks
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The test app on a SQLite file: under ASGI, views use the database from several threads at once."""
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'asgi.db'}")
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def bridge(app):
+    bridge = asgi.ASGIBridge(app)
+    yield bridge
+    bridge.executor.shutdown()
+
+
+@pytest.fixture
+def session_cookie(app, test_user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(test_user)
+    return f"session={client.get_cookie('session').value}"
+
+
+class TestServing:
+    """Sync views use the thread pool; async views are awaited on the loop."""
+
+    def test_sync_view_runs_in_thread_pool(self, app, bridge):
+        threads = []
+        app.before_request(lambda: threads.append(threading.current_thread().name))
+        status, headers, chunks = asyncio.run(call(bridge, 'GET', '/feed.xml'))
+        assert status == 200
+        assert headers['content-type'].startswith('application/rss+xml')
+        assert b''.join(chunk['body'] for chunk in chunks).startswith(b'<?xml')
+        assert threads[0].startswith('WSGI')
+
+    def test_ai_calls_wait_concurrently_on_the_loop(self, app, bridge, session_cookie, monkeypatch):
+        fake = SlowGenai(delay=0.3)
+        monkeypatch.setattr(ai_routes, 'genai', fake)
+        headers = (('Content-Type', 'application/json'), ('Cookie', session_cookie))
+        # Different posts, so the calls aren't coalesced into one
+        bodies = [f'{{"title": "Title {i}", "content": "Body"}}'.encode() for i in range(5)]
+
+        async def burst():
+            return await asyncio.gather(*(
+                call(bridge, 'POST', '/api/ai/generate-description', body, headers) for body in bodies
+            ))
+
+        started = time.perf_counter()
+        results = asyncio.run(burst())
+        elapsed = time.perf_counter() - started
+        assert [status for status, _, _ in results] == [200] * 5
+        # Five 0.3 s calls overlapped instead of running one after another
+        assert elapsed < 1.0
+        assert fake.threads == {threading.current_thread().name}
+        assert not bridge.executor._threads
+        assert AIUsage.query.with_entities(AIUsage.calls).count() == 10
+
+    def test_async_view_runs_its_hooks_and_work_in_threads(self, app, bridge):
+        loop = threading.current_thread().name
+        threads = {}
+
+        @app.before_request
+        def hook():
+            threads['hook'] = threading.current_thread().name
+
+        async def view():
+            threads['view'] = threading.current_thread().name
+            threads['work'] = await asyncio.to_thread(lambda: threading.current_thread().name)
+            return {'ok': True}
+
+        app.add_url_rule('/_async', 'async_view', view)
+        status, headers, chunks = asyncio.run(call(bridge, 'GET', '/_async'))
+        assert status == 200
+        assert b''.join(chunk['body'] for chunk in chunks) == b'{"ok":true}\n'
+        assert threads['view'] == loop
+        assert threads['hook'] != loop and threads['work'] != loop
+        assert not bridge.executor._threads
+
+    def test_async_view_errors_reach_the_error_handlers(self, app, bridge):
+        async def view():
+            abort(418)
+
+        app.add_url_rule('/_teapot', 'teapot', view)
+        app.register_error_handler(418, lambda e: ({'error': 'teapot'}, 418))
+        status, _, chunks = asyncio.run(call(bridge, 'GET', '/_teapot'))
+        assert status == 418
+        assert b'teapot' in b''.join(chunk['body'] for chunk in chunks)
+
+
+class TestProtocol:
+    """Lifespan and unsupported scopes."""
+
+    def test_lifespan(self, bridge):
+        sent = []
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(bridge({'type': 'lifespan'}, receive, send))
+        assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+    def test_websocket_is_rejected(self, bridge):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(bridge({'type': 'websocket', 'path': '/'}, None, send))
+        assert sent[0]['type'] == 'websocket.close'
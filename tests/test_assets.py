@@ -0,0 +1,82 @@
+"""
+Tests for fingerprinted static assets.
+"""
+import json
+import os
+
+import pytest
+from app import assets
+
+
+@pytest.fixture
+def static_dir(app, tmp_path):
+    app.static_folder = str(tmp_path)
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js' / 'dashboard.js').write_text('// Cards\nfunction open(card) {\n\treturn card;\n}\n' * 20)
+    (tmp_path / 'css' / 'tailwind.css').write_text('body {\n\tcolor: #333;\n}\n' * 20)
+    (tmp_path / 'css' / 'input.css').write_text('@tailwind base;\n')
+    return tmp_path
+
+
+def manifest(static_dir):
+    return json.loads((static_dir / 'dist' / 'manifest.json').read_text())
+
+
+class TestBuild:
+    """``flask assets build`` writes minified, content-hashed copies."""
+
+    def test_build_command(self, runner, static_dir):
+        result = runner.invoke(args=['assets', 'build'])
+        assert result.exit_code == 0
+        assert 'Built 2 assets' in result.output
+        entries = manifest(static_dir)
+        assert sorted(entries) == ['css/tailwind.css', 'js/dashboard.js']
+        built = static_dir / entries['js/dashboard.js']
+        assert entries['js/dashboard.js'].startswith('dist/js/dashboard.')
+        assert built.stat().st_size < (static_dir / 'js' / 'dashboard.js').stat().st_size
+        assert os.path.exists(f'{built}.gz')
+
+    def test_changed_file_gets_new_name_and_old_builds_age_out(self, app, static_dir):
+        source = static_dir / 'js' / 'dashboard.js'
+        first = assets.build(str(static_dir))['js/dashboard.js']
+        source.write_text('var a = 1;\n')
+        second = assets.build(str(static_dir))['js/dashboard.js']
+        assert second != first
+        # The previous build is kept for pages rendered before the deploy
+        assert (static_dir / first).exists()
+        source.write_text('var a = 2;\n')
+        assets.build(str(static_dir))
+        assert not (static_dir / first).exists()
+        assert not os.path.exists(f'{static_dir / first}.gz')
+        assert (static_dir / second).exists()
+
+
+class TestServing:
+    """Templates resolve hashed names, which are cached as immutable."""
+
+    def test_asset_url_resolves_built_name(self, app, static_dir):
+        with app.test_request_context():
+            assert assets.asset_url('js/dashboard.js') == '/static/js/dashboard.js'
+            built = assets.build(str(static_dir))['js/dashboard.js']
+            assert assets.asset_url('js/dashboard.js') == f'/static/{built}'
+            assert assets.asset_url('js/missing.js') == '/static/js/missing.js'
+
+    def test_built_assets_are_immutable(self, client, static_dir):
+        built = assets.build(str(static_dir))['css/tailwind.css']
+        response = client.get(f'/static/{built}', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == assets.IMMUTABLE_CACHE_CONTROL
+        assert response.headers['Content-Encoding'] == 'gzip'
+        response.close()
+
+        response = client.get('/static/css/tailwind.css')
+        assert 'immutable' not in response.headers.get('Cache-Control', '')
+        response.close()
+
+    def test_pages_link_scripts_instead_of_inlining_them(self, authenticated_client, static_dir):
+        built = assets.build(str(static_dir))
+        html = authenticated_client.get('/dashboard').get_data(as_text=True)
+        assert f"src='/static/{built['js/dashboard.js']}'" in html
+        assert f"href='/static/{built['css/tailwind.css']}'" in html
+        assert 'blogCards' not in html
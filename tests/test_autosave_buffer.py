@@ -0,0 +1,175 @@
+"""
+Tests for the auto-save write-behind buffer.
+"""
+import threading
+
+import pytest
+from flask import url_for
+from app.models import db, Blog
+from app.posts import autosave
+from app.posts.autosave import AutoSaveBuffer
+
+
+@pytest.fixture
+def buffer(app):
+    """Replace the write-through test buffer with a buffering one."""
+    buffer = AutoSaveBuffer(app, interval=3600, max_pending=3)
+    app.extensions['autosave'] = buffer
+    yield buffer
+    buffer._stop.set()
+
+
+@pytest.fixture
+def blog_id(existing_blog):
+    """Id of the conftest blog (the fixture object itself is detached)."""
+    return Blog.query.filter_by(slug='existing-blog-post').one().id
+
+
+def _autosave(client, blog_id, title, content='Buffered content'):
+    return client.post(
+        url_for('posts.auto_save'),
+        json={'blog_id': blog_id, 'title': title, 'description': '', 'content': content},
+    )
+
+
+def _stored_title(blog_id):
+    return db.session.execute(db.select(Blog.title).where(Blog.id == blog_id)).scalar()
+
+
+class TestAutoSaveBuffer:
+    """Auto-saves are coalesced in memory and flushed in batches."""
+
+    def test_autosave_is_buffered_until_flush(self, authenticated_client, blog_id, buffer):
+
+        for i in range(5):
+            assert _autosave(authenticated_client, blog_id, f'Draft {i}').status_code == 200
+
+        assert _stored_title(blog_id) == 'Existing Blog Post'
+        assert buffer.pending(blog_id)['title'] == 'Draft 4'
+
+        assert buffer.flush() == 1
+        db.session.expire_all()
+        assert _stored_title(blog_id) == 'Draft 4'
+        assert buffer.pending(blog_id) is None
+
+    def test_reads_see_buffered_content(self, authenticated_client, blog_id, buffer):
+        _autosave(authenticated_client, blog_id, 'Unflushed Title', content='Unflushed body')
+
+        api = authenticated_client.get(url_for('main.get_blog_content', blog_id=blog_id))
+        assert api.get_json()['title'] == 'Unflushed Title'
+        assert api.get_json()['content'] == 'Unflushed body'
+
+        edit = authenticated_client.get(url_for('posts.edit_blog', blog_id=blog_id))
+        assert b'Unflushed body' in edit.data
+
+        # Overlaying must not turn the read into a write
+        db.session.commit()
+        db.session.expire_all()
+        assert _stored_title(blog_id) == 'Existing Blog Post'
+
+    def test_full_buffer_flushes_inline(self, authenticated_client, test_user, buffer):
+        blogs = [
+            Blog(user_id=test_user, title=f'Post {i}', slug=f'post-{i}', content_markdown='x')
+            for i in range(3)
+        ]
+        db.session.add_all(blogs)
+        db.session.commit()
+        ids = [blog.id for blog in blogs]
+
+        _autosave(authenticated_client, ids[0], 'A')
+        _autosave(authenticated_client, ids[1], 'B')
+        assert _stored_title(ids[0]) == 'Post 0'
+
+        _autosave(authenticated_client, ids[2], 'C')
+        db.session.expire_all()
+        assert [_stored_title(blog_id) for blog_id in ids] == ['A', 'B', 'C']
+        assert all(db.session.get(Blog, blog_id).is_published for blog_id in ids)
+
+    def test_full_save_discards_pending_autosave(self, authenticated_client, blog_id, buffer):
+        _autosave(authenticated_client, blog_id, 'Stale autosave')
+
+        authenticated_client.post(
+            url_for('posts.update_blog', blog_id=blog_id),
+            data={'title': 'Saved Title', 'content': 'Saved'},
+        )
+        buffer.flush()
+        db.session.expire_all()
+        assert _stored_title(blog_id) == 'Saved Title'
+
+    def test_close_flushes_pending(self, authenticated_client, blog_id, buffer):
+        _autosave(authenticated_client, blog_id, 'Shutdown Title')
+        buffer.close()
+        db.session.expire_all()
+        assert _stored_title(blog_id) == 'Shutdown Title'
+
+    def test_autosave_rejects_other_users_blog(self, authenticated_client, blog_id, buffer):
+        db.session.get(Blog, blog_id).user_id = 999
+        db.session.commit()
+        assert _autosave(authenticated_client, blog_id, 'Nope').status_code == 404
+
+    def test_pending_stays_visible_until_commit(self, authenticated_client, blog_id, buffer, monkeypatch):
+        _autosave(authenticated_client, blog_id, 'In flight')
+        write_batch = autosave._write_batch
+        seen = []
+
+        def writing(batch, extracted):
+            seen.append(authenticated_client.get(url_for('main.get_blog_content', blog_id=blog_id)).get_json()['title'])
+            # An auto-save arriving mid-write must survive the flush
+            buffer.put(blog_id, {'title': 'Newer', 'description': '', 'content_markdown': 'x'})
+            return write_batch(batch, extracted)
+
+        monkeypatch.setattr(autosave, '_write_batch', writing)
+        assert buffer.flush() == 1
+        assert seen == ['In flight']
+        assert buffer.pending(blog_id)['title'] == 'Newer'
+        db.session.expire_all()
+        assert _stored_title(blog_id) == 'In flight'
+
+    def test_discard_waits_for_flush_in_progress(self, authenticated_client, blog_id, buffer):
+        _autosave(authenticated_client, blog_id, 'Older')
+        with buffer._flush_lock:
+            discarding = threading.Thread(target=buffer.discard, args=(blog_id,))
+            discarding.start()
+            discarding.join(0.05)
+            assert discarding.is_alive()
+        discarding.join(5)
+        assert buffer.pending(blog_id) is None
+
+    def test_flushed_owners_are_forgotten(self, authenticated_client, blog_id, buffer):
+        _autosave(authenticated_client, blog_id, 'Owned')
+        assert blog_id in buffer._owners
+        buffer.flush()
+        assert buffer._owners == {}
+
+    def test_write_through_failure_is_reported(self, app, authenticated_client, blog_id, monkeypatch):
+        def broken(batch, extracted):
+            raise RuntimeError('database is locked')
+
+        monkeypatch.setattr(autosave, '_write_batch', broken)
+        assert _autosave(authenticated_client, blog_id, 'Lost').status_code == 500
+        assert app.extensions['autosave'].pending(blog_id) is None
+
+    def test_failing_entry_does_not_block_others(self, authenticated_client, test_user, buffer, monkeypatch):
+        blogs = [Blog(user_id=test_user, title=f'Post {i}', slug=f'post-{i}', content_markdown='x') for i in range(2)]
+        db.session.add_all(blogs)
+        db.session.commit()
+        good, bad = [blog.id for blog in blogs]
+        save = autosave.metadata.save
+
+        def failing(extracted):
+            if bad in extracted:
+                raise ValueError('value too long')
+            save(extracted)
+
+        monkeypatch.setattr(autosave.metadata, 'save', failing)
+        _autosave(authenticated_client, good, 'Good')
+        _autosave(authenticated_client, bad, 'Bad')
+        assert buffer.flush() == 1
+        db.session.expire_all()
+        assert (_stored_title(good), _stored_title(bad)) == ('Good', 'Post 1')
+        assert buffer.pending(good) is None and buffer.pending(bad)['title'] == 'Bad'
+
+        for _ in range(autosave.MAX_ATTEMPTS - 1):
+            buffer.flush()
+        assert buffer.pending(bad) is None
+        assert _stored_title(bad) == 'Post 1'
@@ -0,0 +1,120 @@
+"""
+Tests for response compression and precompressed static files.
+"""
+import gzip
+import os
+from datetime import datetime
+
+import pytest
+from app import compression, metrics
+from app.models import db, Blog
+
+brotli = pytest.importorskip('brotli')
+
+
+@pytest.fixture
+def post(app, test_user):
+    """A published post long enough to be compressed; returns its URL."""
+    blog = Blog(
+        user_id=test_user, title='Long read', slug='long-read', content_markdown='Lorem ipsum dolor. ' * 400,
+        is_published=True, published_at=datetime.utcnow(),
+    )
+    db.session.add(blog)
+    db.session.commit()
+    return f'/p/{blog.id}/long-read/'
+
+
+class TestDynamicResponses:
+    """HTML and JSON are compressed with the encoding the client prefers."""
+
+    def test_gzip_and_brotli_are_negotiated(self, client, post):
+        plain = client.get(post)
+        assert 'Content-Encoding' not in plain.headers
+        assert 'Accept-Encoding' in plain.headers['Vary']
+
+        gzipped = client.get(post, headers={'Accept-Encoding': 'gzip'})
+        assert gzipped.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(gzipped.data) == plain.data
+        assert int(gzipped.headers['Content-Length']) < len(plain.data) // 5
+
+        encoded = client.get(post, headers={'Accept-Encoding': 'gzip, deflate, br'})
+        assert encoded.headers['Content-Encoding'] == 'br'
+        assert brotli.decompress(encoded.data) == plain.data
+
+    def test_json_is_compressed(self, authenticated_client, test_user, post):
+        blog_id = Blog.query.filter_by(slug='long-read').one().id
+        response = authenticated_client.get(f'/api/blog/{blog_id}', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert b'Lorem ipsum' in gzip.decompress(response.data)
+
+    def test_small_responses_are_left_alone(self, app, client, post):
+        app.config['COMPRESS_MIN_SIZE'] = 10 ** 6
+        response = client.get(post, headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+
+    def test_compressed_etag_is_weak_and_revalidates(self, client, post):
+        response = client.get(post, headers={'Accept-Encoding': 'gzip'})
+        etag = response.headers['ETag']
+        assert etag.startswith('W/')
+        revalidated = client.get(post, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert revalidated.status_code == 304
+
+    def test_hot_responses_are_not_recompressed(self, client, post, monkeypatch):
+        calls = []
+        real = compression.compress
+        monkeypatch.setattr(compression, 'compress', lambda *args, **kwargs: calls.append(args[1]) or real(*args, **kwargs))
+        hits = metrics.CACHE_LOOKUPS.value(cache='compression', result='hit')
+        for _ in range(3):
+            client.get(post, headers={'Accept-Encoding': 'br'})
+        assert calls == ['br']
+        assert metrics.CACHE_LOOKUPS.value(cache='compression', result='hit') == hits + 2
+
+    def test_feeds_keep_their_stored_gzip(self, client, post):
+        response = client.get('/feed.xml', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['ETag'].endswith('-gz"')
+
+
+class TestStaticFiles:
+    """``compress-static`` writes siblings that the static route serves."""
+
+    @pytest.fixture
+    def static_dir(self, app, tmp_path):
+        app.static_folder = str(tmp_path)
+        (tmp_path / 'css').mkdir()
+        (tmp_path / 'css' / 'site.css').write_text('body { color: #333; }\n' * 200)
+        (tmp_path / 'tiny.js').write_text('1')
+        return tmp_path
+
+    def test_command_writes_siblings(self, runner, static_dir):
+        result = runner.invoke(args=['compress-static'])
+        assert result.exit_code == 0
+        assert 'Compressed 1 static files, 0 unchanged' in result.output
+        assert (static_dir / 'css' / 'site.css.gz').exists()
+        assert (static_dir / 'css' / 'site.css.br').exists()
+        assert not (static_dir / 'tiny.js.gz').exists()
+        assert 'Compressed 0 static files, 1 unchanged' in runner.invoke(args=['compress-static']).output
+
+    def test_precompressed_sibling_is_served(self, runner, client, static_dir):
+        runner.invoke(args=['compress-static'])
+        response = client.get('/static/css/site.css', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert response.mimetype == 'text/css'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert brotli.decompress(response.get_data()) == (static_dir / 'css' / 'site.css').read_bytes()
+        response.close()
+
+        response = client.get('/static/css/site.css')
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_data() == (static_dir / 'css' / 'site.css').read_bytes()
+        response.close()
+
+    def test_stale_sibling_is_ignored(self, runner, client, static_dir):
+        runner.invoke(args=['compress-static'])
+        source = static_dir / 'css' / 'site.css'
+        later = os.stat(source).st_mtime + 10
+        os.utime(source, (later, later))
+        response = client.get('/static/css/site.css', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        response.close()
@@ -0,0 +1,97 @@
+"""
+Tests for ETag / Last-Modified conditional responses on blog reads.
+"""
+import pytest
+from datetime import datetime, timedelta
+from flask import url_for
+from werkzeug.http import http_date
+from app.models import db, Blog, Tag
+
+
+@pytest.fixture
+def blog_id(existing_blog):
+    """Id of the conftest blog (the fixture object itself is detached)."""
+    return Blog.query.filter_by(slug='existing-blog-post').one().id
+
+
+class TestBlogContentApi:
+    """The overlay API answers 304 when the client's copy is current."""
+
+    def test_sets_validators(self, authenticated_client, blog_id):
+        response = authenticated_client.get(url_for('main.get_blog_content', blog_id=blog_id))
+        assert response.status_code == 200
+        assert response.headers['ETag']
+        assert response.headers['Last-Modified']
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert 'Cookie' in response.headers['Vary']
+
+    def test_if_none_match_returns_304(self, authenticated_client, blog_id):
+        url = url_for('main.get_blog_content', blog_id=blog_id)
+        etag = authenticated_client.get(url).headers['ETag']
+
+        response = authenticated_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+    def test_etag_changes_when_post_or_tags_change(self, authenticated_client, blog_id, test_user):
+        url = url_for('main.get_blog_content', blog_id=blog_id)
+        etag = authenticated_client.get(url).headers['ETag']
+
+        tag = Tag(user_id=test_user, name='python')
+        db.session.add(tag)
+        blog = db.session.get(Blog, blog_id)
+        blog.tags.append(tag)
+        db.session.commit()
+        tagged = authenticated_client.get(url, headers={'If-None-Match': etag})
+        assert tagged.status_code == 200
+
+        # Renaming a tag does not touch the blog row but must still invalidate
+        tag.name = 'python3'
+        db.session.commit()
+        renamed = authenticated_client.get(url, headers={'If-None-Match': tagged.headers['ETag']})
+        assert renamed.status_code == 200
+        assert renamed.get_json()['tags'] == [{'name': 'python3'}]
+
+    def test_if_modified_since(self, authenticated_client, blog_id):
+        url = url_for('main.get_blog_content', blog_id=blog_id)
+        future = http_date(datetime.utcnow() + timedelta(hours=1))
+        past = http_date(datetime.utcnow() - timedelta(days=1))
+
+        assert authenticated_client.get(url, headers={'If-Modified-Since': future}).status_code == 304
+        assert authenticated_client.get(url, headers={'If-Modified-Since': past}).status_code == 200
+
+    def test_missing_blog_is_404(self, authenticated_client):
+        response = authenticated_client.get(url_for('main.get_blog_content', blog_id=9999))
+        assert response.status_code == 404
+
+
+class TestConditionalPages:
+    """Dashboard, list and detail pages revalidate instead of re-rendering."""
+
+    @pytest.mark.parametrize('endpoint', ['main.dashboard', 'posts.list_blogs'])
+    def test_listing_pages_return_304(self, authenticated_client, blog_id, endpoint):
+        url = url_for(endpoint)
+        etag = authenticated_client.get(url).headers['ETag']
+        assert authenticated_client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    def test_detail_page_revalidates_after_update(self, authenticated_client, blog_id):
+        url = url_for('posts.view_blog', blog_id=blog_id)
+        etag = authenticated_client.get(url).headers['ETag']
+        assert authenticated_client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        blog = db.session.get(Blog, blog_id)
+        blog.title = 'Changed Title'
+        db.session.commit()
+        response = authenticated_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'Changed Title' in response.data
+
+    def test_pending_flash_forces_render(self, authenticated_client, blog_id):
+        url = url_for('posts.list_blogs')
+        etag = authenticated_client.get(url).headers['ETag']
+        with authenticated_client.session_transaction() as sess:
+            sess['_flashes'] = [('success', 'Saved!')]
+
+        response = authenticated_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
@@ -0,0 +1,227 @@
+"""
+Tests for near-duplicate detection with MinHash signatures and LSH buckets.
+"""
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import url_for
+
+from app.models import db, Blog, PostBucket, PostSignature, SocialPost, Tag
+from app.posts import archive, duplicates
+from app.posts import tags as tag_service
+
+ESSAY = (
+    'Sourdough starts with a starter of flour and water that ferments for days. '
+    'Feed it twice a day, keep it warm, and bake once it doubles within six hours. '
+    'A long cold proof in the fridge gives the crumb its open texture and tang. '
+    'Shape the loaf gently so the gas stays in, score the top with a sharp blade, '
+    'and bake it in a covered pot for the first twenty minutes to trap the steam. '
+    'Uncover it for the last half hour until the crust turns a deep brown and sounds hollow.'
+)
+EDITED = ESSAY.replace('keep it warm', 'keep it cosy')
+OTHER = (
+    'Tomato seedlings need sixteen hours of light and a gentle breeze to grow strong stems. '
+    'Harden them off for a week before planting them out after the last frost.'
+)
+
+
+def add_post(user_id, title, content, published=False, age=0):
+    blog = Blog(
+        user_id=user_id, title=title, slug=title.lower().replace(' ', '-'), content_markdown=content,
+        is_published=published, published_at=datetime.utcnow() if published else None,
+        updated_at=datetime.utcnow() - timedelta(minutes=age),
+    )
+    db.session.add(blog)
+    db.session.flush()
+    duplicates.index_blogs([blog])
+    db.session.commit()
+    return blog.id
+
+
+class TestSignatures:
+    """Signatures estimate similarity and buckets find candidates."""
+
+    def test_similarity_tracks_overlap(self):
+        same = duplicates.signature('Sourdough', ESSAY)
+        assert duplicates.similarity(same, duplicates.signature('Sourdough', ESSAY)) == 1.0
+        assert duplicates.similarity(same, duplicates.signature('Sourdough', EDITED)) >= 0.8
+        assert duplicates.similarity(same, duplicates.signature('Seedlings', OTHER)) < 0.2
+
+    def test_find_uses_the_authors_buckets(self, app, test_user):
+        first = add_post(test_user, 'Sourdough', ESSAY)
+        add_post(test_user, 'Seedlings', OTHER)
+        assert [blog_id for blog_id, _ in duplicates.find(test_user, 'Sourdough', EDITED)] == [first]
+        assert duplicates.find(test_user, 'Sourdough', EDITED, exclude=[first]) == []
+        assert duplicates.find(test_user + 1, 'Sourdough', EDITED) == []
+        assert PostBucket.query.filter_by(blog_id=first).count() == duplicates.BANDS
+
+    def test_threshold_is_configurable(self, app, test_user):
+        add_post(test_user, 'Sourdough', ESSAY)
+        app.config['DUPLICATE_THRESHOLD'] = 1.0
+        assert duplicates.find(test_user, 'Sourdough', EDITED) == []
+
+    def test_index_missing(self, app, test_user):
+        db.session.add(Blog(user_id=test_user, title='Old', slug='old', content_markdown=ESSAY))
+        db.session.commit()
+        assert duplicates.index_missing() == 1
+        assert duplicates.index_missing() == 0
+        assert PostSignature.query.count() == 1
+
+
+class TestWrites:
+    """Create, save-draft and import detect near-duplicates."""
+
+    def test_create_asks_before_adding_a_copy(self, authenticated_client, test_user):
+        draft = add_post(test_user, 'Sourdough', ESSAY)
+        response = authenticated_client.post('/posts/', data={'title': 'Sourdough bread', 'content': EDITED})
+        html = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert f'/posts/{draft}/edit' in html and 'confirm_duplicate' in html
+        # The submitted post is kept in the form and the draft is untouched
+        assert 'keep it cosy' in html
+        blog = db.session.get(Blog, draft)
+        assert (blog.title, blog.content_markdown, blog.is_published) == ('Sourdough', ESSAY, False)
+        assert Blog.query.count() == 1
+
+    def test_create_confirmed_copy(self, authenticated_client, test_user):
+        add_post(test_user, 'Sourdough', ESSAY, published=True)
+        response = authenticated_client.post(
+            '/posts/', data={'title': 'Sourdough again', 'content': EDITED, 'confirm_duplicate': '1'},
+        )
+        assert response.status_code == 302
+        assert Blog.query.count() == 2
+
+    def test_create_indexes_new_posts(self, authenticated_client, test_user):
+        authenticated_client.post('/posts/', data={'title': 'Sourdough', 'content': ESSAY})
+        authenticated_client.post('/posts/', data={'title': 'Seedlings', 'content': OTHER})
+        assert Blog.query.count() == 2
+        assert PostSignature.query.count() == 2
+
+    def test_save_draft_reports_the_matching_post(self, authenticated_client, test_user):
+        draft = add_post(test_user, 'Sourdough', ESSAY)
+        response = authenticated_client.post('/posts/save-draft', json={'title': 'Sourdough', 'content': EDITED})
+        assert response.status_code == 409
+        assert response.get_json()['duplicate_of'] == draft
+        assert response.get_json()['url'].endswith(f'/posts/{draft}/edit')
+        assert db.session.get(Blog, draft).content_markdown == ESSAY
+        assert Blog.query.count() == 1
+
+        confirmed = authenticated_client.post(
+            '/posts/save-draft', json={'title': 'Sourdough', 'content': EDITED, 'confirm_duplicate': True},
+        ).get_json()
+        assert confirmed['success'] and confirmed['blog_id'] != draft
+        fresh = authenticated_client.post('/posts/save-draft', json={'title': 'Seedlings', 'content': OTHER}).get_json()
+        assert 'duplicate_of' not in fresh
+        assert Blog.query.count() == 3
+
+    def test_updates_are_reindexed(self, authenticated_client, test_user):
+        blog_id = add_post(test_user, 'Sourdough', ESSAY, published=True)
+        authenticated_client.post(f'/posts/{blog_id}', data={'title': 'Seedlings', 'content': OTHER})
+        assert duplicates.find(test_user, 'Sourdough', ESSAY) == []
+        assert [blog_id for blog_id, _ in duplicates.find(test_user, 'Seedlings', OTHER)] == [blog_id]
+
+    def test_import_skips_near_duplicates(self, app, test_user):
+        add_post(test_user, 'Sourdough', ESSAY, published=True)
+        records = [
+            {'type': 'post', 'title': 'Sourdough copy', 'slug': 'copy', 'content_markdown': EDITED},
+            {'type': 'post', 'title': 'Seedlings', 'slug': 'seedlings', 'content_markdown': OTHER},
+            {'type': 'post', 'title': 'Seedlings', 'slug': 'seedlings-2', 'content_markdown': OTHER},
+        ]
+        stats = archive.Importer(test_user).run(iter(records))
+        assert (stats['imported'], stats['duplicates']) == (1, 2)
+        assert PostSignature.query.count() == 2
+
+    def test_import_can_keep_duplicates(self, authenticated_client, test_user):
+        add_post(test_user, 'Sourdough', ESSAY)
+        body = json.dumps({'type': 'post', 'title': 'Sourdough', 'slug': 'copy', 'content_markdown': ESSAY}).encode()
+        response = authenticated_client.post(
+            url_for('posts.import_blogs', on_duplicate='keep'),
+            data={'archive': (io.BytesIO(body), 'export.ndjson')},
+            content_type='multipart/form-data',
+        )
+        assert response.get_json()['imported'] == 1
+        assert len(duplicates.find(test_user, 'Sourdough', ESSAY)) == 2
+
+    def test_unknown_duplicate_option(self, app, test_user):
+        with pytest.raises(ValueError):
+            archive.Importer(test_user, on_duplicate='merge')
+
+
+class TestReportAndMerge:
+    """Duplicate drafts are reported and folded into the post kept."""
+
+    @pytest.fixture
+    def copies(self, test_user):
+        published = add_post(test_user, 'Sourdough', ESSAY, published=True, age=30)
+        newer = add_post(test_user, 'Sourdough v2', EDITED, age=10)
+        older = add_post(test_user, 'Sourdough v1', ESSAY + ' Draft.', age=20)
+        add_post(test_user, 'Seedlings', OTHER)
+        return published, newer, older
+
+    def test_report(self, authenticated_client, copies):
+        published, newer, older = copies
+        groups = authenticated_client.get('/posts/duplicates').get_json()['groups']
+        assert len(groups) == 1
+        assert groups[0]['keep'] == published
+        assert sorted(groups[0]['merge']) == sorted([newer, older])
+        assert sorted(groups[0]['newer']) == sorted([newer, older])
+
+    def test_report_is_read_only(self, authenticated_client, test_user):
+        db.session.add(Blog(user_id=test_user, title='Old', slug='old', content_markdown=ESSAY))
+        db.session.commit()
+        assert authenticated_client.get('/posts/duplicates').get_json()['groups'] == []
+        assert PostSignature.query.count() == 0
+
+    def test_newest_draft_is_kept_without_a_published_post(self, app, test_user):
+        older = add_post(test_user, 'Sourdough', ESSAY, age=20)
+        newer = add_post(test_user, 'Sourdough v2', EDITED, age=10)
+        assert duplicates.report(test_user)[0]['keep'] == newer
+        assert duplicates.report(test_user)[0]['merge'] == [older]
+
+    def test_merge_folds_tags_and_social_posts(self, app, test_user, copies):
+        published, newer, older = copies
+        tag = tag_service.create_tags(test_user, ['bread'])[0]
+        tag_service.sync_blog_tags(db.session.get(Blog, newer), [tag.id])
+        db.session.add(SocialPost(blog_id=older, user_id=test_user, platform='twitter', payload_json='[]'))
+        db.session.commit()
+
+        assert duplicates.merge(test_user, discard_newer=True) == {'groups': 1, 'merged': 2, 'skipped': []}
+        db.session.commit()
+        assert {blog.id for blog in Blog.query} == {published, published + 3}
+        kept = db.session.get(Blog, published)
+        assert [t.name for t in kept.tags] == ['bread']
+        assert db.session.get(Tag, tag.id).blog_count == 1
+        assert SocialPost.query.one().blog_id == published
+        assert PostSignature.query.count() == 2
+        assert duplicates.report(test_user) == []
+
+    def test_merge_skips_groups_with_drafts_newer_than_the_kept_post(self, app, test_user, copies):
+        published, newer, older = copies
+        result = duplicates.merge(test_user)
+        db.session.commit()
+        assert (result['groups'], result['merged']) == (0, 0)
+        assert [(group['keep'], group['newer']) for group in result['skipped']] == [(published, sorted([newer, older]))]
+        assert db.session.get(Blog, newer) is not None and db.session.get(Blog, older) is not None
+
+    def test_merge_folds_drafts_older_than_the_kept_post(self, app, test_user):
+        published = add_post(test_user, 'Sourdough', ESSAY, published=True, age=5)
+        add_post(test_user, 'Sourdough v1', EDITED, age=20)
+        assert duplicates.merge(test_user) == {'groups': 1, 'merged': 1, 'skipped': []}
+        db.session.commit()
+        assert [blog.id for blog in Blog.query] == [published]
+
+    def test_commands(self, runner, copies):
+        published, newer, older = copies
+        result = runner.invoke(args=['posts', 'duplicates', 'test@example.com'])
+        assert result.exit_code == 0
+        assert '1 groups of near-duplicates.' in result.output
+        output = runner.invoke(args=['posts', 'merge-duplicates']).output
+        assert f'keep {published}, drafts {sorted([newer, older])} are newer' in output
+        assert 'Merged 0 drafts in 0 groups.' in output
+        assert Blog.query.count() == 4
+        assert 'Would merge 2 drafts in 1 groups.' in runner.invoke(args=['posts', 'merge-duplicates', '--dry-run', '--discard-newer']).output
+        assert Blog.query.count() == 4
+        assert 'Merged 2 drafts in 1 groups.' in runner.invoke(args=['posts', 'merge-duplicates', '--discard-newer']).output
+        assert Blog.query.count() == 2
@@ -0,0 +1,148 @@
+"""
+Tests for the editor's WebSocket channel.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.ai import routes as ai_routes
+from app.models import db, Blog
+from app.posts import channel
+from tests.test_ai_usage import FakeGenai
+from tests.test_asgi import app, bridge, session_cookie  # noqa: F401
+
+
+class Socket:
+    """The browser end of one WebSocket connection to the bridge."""
+
+    def __init__(self, bridge, headers=()):
+        self.scope = {
+            'type': 'websocket', 'path': '/posts/channel', 'query_string': b'', 'root_path': '',
+            'http_version': '1.1', 'scheme': 'ws', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+            'headers': [(b'host', b'testserver')] + [(name.lower().encode(), value.encode()) for name, value in headers],
+        }
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        self.task = asyncio.ensure_future(bridge(self.scope, self.incoming.get, self.outgoing.put))
+
+    async def message(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+
+    def send(self, **frame):
+        self.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps(frame)})
+
+    async def frame(self):
+        message = await self.message()
+        assert message['type'] == 'websocket.send', message
+        return json.loads(message['text'])
+
+    async def close(self):
+        self.incoming.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+def connect(bridge, cookie, *headers):
+    return Socket(bridge, (('Cookie', cookie),) + headers)
+
+
+@pytest.fixture
+def blog(app, test_user):
+    blog = Blog(user_id=test_user, title='Draft', slug='draft', content_markdown='# Draft')
+    db.session.add(blog)
+    db.session.commit()
+    return blog.id
+
+
+class TestRendering:
+    """Previews are sent as block diffs that add up to the full render."""
+
+    def test_blocks_join_to_full_render(self):
+        text = '# Title\n\nSome *text*\nover lines.\n\n- a\n- b\n\n```\ncode\n```\n\n---\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\n[x][ref]\n\n[ref]: /url\n'
+        blocks = channel.render_blocks(text)
+        assert len(blocks) == 7
+        assert ''.join(blocks) == channel.renderer().render(text)
+
+    def test_diff_keeps_common_ends(self):
+        assert channel.diff_blocks(['a', 'b', 'c'], ['a', 'x', 'c']) == (1, 1, ['x'])
+        assert channel.diff_blocks(['a', 'b'], ['a', 'b', 'c']) == (2, 0, ['c'])
+        assert channel.diff_blocks(['a', 'a'], ['a']) == (1, 1, [])
+        assert channel.diff_blocks([], []) == (0, 0, [])
+
+
+class TestChannel:
+    """One authenticated connection carries preview, saves and AI jobs."""
+
+    def test_plain_http_is_told_to_upgrade(self, authenticated_client):
+        assert authenticated_client.get('/posts/channel').status_code == 426
+
+    def test_handshake_needs_a_user_and_same_origin(self, bridge, session_cookie):
+        async def scenario():
+            anonymous = Socket(bridge)
+            assert (await anonymous.message())['type'] == 'websocket.close'
+            foreign = connect(bridge, session_cookie, ('Origin', 'https://evil.example'))
+            assert (await foreign.message())['type'] == 'websocket.close'
+            await asyncio.gather(anonymous.task, foreign.task)
+
+        asyncio.run(scenario())
+
+    def test_edits_get_preview_diffs(self, bridge, session_cookie):
+        async def scenario():
+            socket = connect(bridge, session_cookie, ('Origin', 'http://testserver'))
+            assert (await socket.message())['type'] == 'websocket.accept'
+            socket.send(op='open', blog_id=None, title='', description='', content='# Hi 😀\n\nOne\n\nTwo')
+            first = await socket.frame()
+            assert first == {'op': 'preview', 'at': 0, 'remove': 0, 'insert': ['<h1>Hi 😀</h1>\n', '<p>One</p>\n', '<p>Two</p>\n']}
+            # 'Two' starts at UTF-16 offset 14: the emoji counts twice, as in the browser
+            socket.send(op='edit', field='content', at=14, remove=3, insert='Three')
+            assert await socket.frame() == {'op': 'preview', 'at': 2, 'remove': 1, 'insert': ['<p>Three</p>\n']}
+            socket.send(op='edit', field='content', at=100, remove=1, insert='')
+            assert await socket.frame() == {'op': 'resync'}
+            await socket.close()
+
+        asyncio.run(scenario())
+
+    def test_save_goes_to_the_autosave_buffer(self, app, bridge, session_cookie, blog):
+        async def scenario():
+            socket = connect(bridge, session_cookie)
+            await socket.message()
+            socket.send(op='open', blog_id=blog, title='Draft', description='', content='# Draft')
+            await socket.frame()
+            socket.send(op='edit', field='title', at=5, remove=0, insert=' two')
+            socket.send(op='save')
+            assert await socket.frame() == {'op': 'saved', 'success': True}
+            await socket.close()
+
+        asyncio.run(scenario())
+        db.session.expire_all()
+        assert db.session.get(Blog, blog).title == 'Draft two'
+
+    def test_save_needs_an_owned_blog(self, bridge, session_cookie, blog):
+        async def scenario():
+            socket = connect(bridge, session_cookie)
+            await socket.message()
+            socket.send(op='open', blog_id=blog + 1, title='', description='', content='')
+            assert await socket.frame() == {'op': 'error', 'error': 'Blog not found'}
+            socket.send(op='save')
+            assert (await socket.frame())['success'] is False
+            await socket.close()
+
+        asyncio.run(scenario())
+
+    def test_ai_jobs_run_the_ai_views(self, bridge, session_cookie, monkeypatch):
+        monkeypatch.setattr(ai_routes, 'genai', FakeGenai())
+
+        async def scenario():
+            socket = connect(bridge, session_cookie)
+            await socket.message()
+            socket.send(op='ai', id=7, action='generate-description', data={'title': 'Title', 'content': 'Body'})
+            assert await socket.frame() == {'op': 'ai', 'id': 7, 'state': 'running'}
+            done = await socket.frame()
+            assert done['id'] == 7 and done['status'] == 200
+            assert done['body']['description']
+            socket.send(op='ai', id=8, action='../auth/logout', data={})
+            assert (await socket.frame())['status'] == 404
+            await socket.close()
+
+        asyncio.run(scenario())
@@ -0,0 +1,163 @@
+"""
+Tests for streaming export and batched import of a user's corpus.
+"""
+import io
+import json
+import tarfile
+import pytest
+from datetime import datetime
+from flask import url_for
+from app.models import db, Blog, SocialPost, Tag, User
+from app.posts import archive
+from app.posts import tags as tag_service
+
+
+@pytest.fixture
+def corpus(app, test_user):
+    """Three posts with tags and a social post for the test user."""
+    python = Tag(user_id=test_user, name='python')
+    flask_tag = Tag(user_id=test_user, name='flask')
+    db.session.add_all([python, flask_tag, Tag(user_id=test_user, name='unused')])
+    db.session.commit()
+    for i in range(3):
+        blog = Blog(
+            user_id=test_user,
+            title=f'Post {i}',
+            slug=f'post-{i}',
+            description=f'Description {i}',
+            content_markdown=f'# Post {i}\n\nBody with ---\nlines.',
+            linkedin_content='LinkedIn text' if i == 0 else None,
+            is_published=i != 2,
+            published_at=datetime.utcnow() if i != 2 else None,
+        )
+        db.session.add(blog)
+        db.session.flush()
+        tag_service.sync_blog_tags(blog, [python.id] if i else [python.id, flask_tag.id])
+        if i == 0:
+            db.session.add(SocialPost(blog_id=blog.id, user_id=test_user, platform='twitter', payload_json='["1/1 hi"]'))
+    db.session.commit()
+    return test_user
+
+
+@pytest.fixture
+def importer_user(app):
+    user = User(google_sub='importer', email='importer@example.com', name='Importer')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+class TestExport:
+    """Exports stream every post with its tags and social posts."""
+
+    def test_ndjson_export(self, authenticated_client, corpus):
+        response = authenticated_client.get(url_for('posts.export_blogs', format='ndjson'))
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+
+        records = [json.loads(line) for line in response.data.decode().splitlines()]
+        tags = [r['name'] for r in records if r['type'] == 'tag']
+        posts = [r for r in records if r['type'] == 'post']
+        assert tags == ['flask', 'python', 'unused']
+        assert [p['title'] for p in posts] == ['Post 0', 'Post 1', 'Post 2']
+        assert posts[0]['tags'] == ['flask', 'python']
+        assert posts[0]['social_posts'][0]['platform'] == 'twitter'
+        assert posts[2]['is_published'] is False
+
+    def test_tar_export_has_front_matter(self, authenticated_client, corpus):
+        response = authenticated_client.get(url_for('posts.export_blogs', format='tar'))
+        assert response.status_code == 200
+
+        with tarfile.open(fileobj=io.BytesIO(response.data), mode='r:gz') as tar:
+            names = tar.getnames()
+            first = tar.extractfile([n for n in names if n.startswith('posts/')][0]).read().decode()
+        assert 'tags.json' in names
+        assert len([n for n in names if n.endswith('.md')]) == 3
+        assert first.startswith('---\nid: 1\ntitle: "Post 0"\n')
+        assert first.endswith('# Post 0\n\nBody with ---\nlines.')
+
+    def test_unknown_format_rejected(self, authenticated_client, corpus):
+        response = authenticated_client.get(url_for('posts.export_blogs', format='zip'))
+        assert response.status_code == 400
+
+
+class TestImport:
+    """Imports insert in batches with tag dedup and slug conflict handling."""
+
+    @pytest.mark.parametrize('fmt', ['ndjson', 'tar'])
+    def test_round_trip(self, app, corpus, importer_user, fmt):
+        chunks = archive.export_ndjson(corpus) if fmt == 'ndjson' else archive.export_tar(corpus)
+        data = b''.join(c if isinstance(c, bytes) else c.encode() for c in chunks)
+
+        db.session.add(Tag(user_id=importer_user, name='python'))
+        db.session.add(Blog(user_id=importer_user, title='Old', slug='post-1', content_markdown='x'))
+        db.session.commit()
+
+        stats = archive.Importer(importer_user, batch_size=2).run(archive.read_records(io.BytesIO(data), fmt))
+        assert stats == {'imported': 3, 'skipped': 0, 'renamed': 1, 'tags_created': 2, 'duplicates': 0}
+
+        slugs = {b.slug for b in Blog.query.filter_by(user_id=importer_user)}
+        assert slugs == {'post-0', 'post-1', 'post-1-2', 'post-2'}
+        python = Tag.query.filter_by(user_id=importer_user, name='python').one()
+        assert (python.blog_count, python.published_count) == (3, 2)
+        imported = Blog.query.filter_by(user_id=importer_user, slug='post-0').one()
+        assert imported.content_markdown == '# Post 0\n\nBody with ---\nlines.'
+        assert imported.linkedin_content == 'LinkedIn text'
+        assert SocialPost.query.filter_by(user_id=importer_user).count() == 1
+
+    def test_import_endpoint_skip_conflicts(self, authenticated_client, corpus):
+        lines = [
+            {'type': 'tag', 'name': 'New'},
+            {'type': 'post', 'title': 'Post 0', 'slug': 'post-0', 'content_markdown': 'dup', 'tags': ['new']},
+            {'type': 'post', 'title': 'Fresh', 'slug': 'fresh', 'content_markdown': 'body', 'tags': ['New', 'python']},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines).encode()
+
+        response = authenticated_client.post(
+            url_for('posts.import_blogs', on_conflict='skip'),
+            data={'archive': (io.BytesIO(body), 'export.ndjson')},
+            content_type='multipart/form-data',
+        )
+        assert response.status_code == 200
+        assert response.get_json() == {'imported': 1, 'skipped': 1, 'renamed': 0, 'tags_created': 1, 'duplicates': 0}
+
+        fresh = Blog.query.filter_by(user_id=corpus, slug='fresh').one()
+        assert sorted(tag.name for tag in fresh.tags) == ['new', 'python']
+
+    @pytest.mark.parametrize('line, error', [
+        ('[]', 'line 2: expected a JSON object'),
+        ('"x"', 'line 2: expected a JSON object'),
+        ('{"type": "post", "title": "T", "is_published": "maybe"}', 'line 2: is_published must be true or false'),
+    ])
+    def test_malformed_records_are_rejected(self, authenticated_client, corpus, line, error):
+        body = ('{"type": "tag", "name": "ok"}\n' + line + '\n').encode()
+        response = authenticated_client.post(
+            url_for('posts.import_blogs'),
+            data={'archive': (io.BytesIO(body), 'export.ndjson')},
+            content_type='multipart/form-data',
+        )
+        assert response.status_code == 400
+        assert response.get_json()['error'] == error
+
+    def test_published_flags_are_parsed_strictly(self, app, importer_user):
+        archive.Importer(importer_user).run(iter([
+            {'type': 'post', 'title': 'Draft', 'content_markdown': 'a', 'is_published': 'false'},
+            {'type': 'post', 'title': 'Live', 'content_markdown': 'b', 'is_published': 'true'},
+        ]))
+        assert {blog.title: blog.is_published for blog in Blog.query.filter_by(user_id=importer_user)} == {
+            'Draft': False, 'Live': True,
+        }
+
+
+class TestArchiveCommands:
+    """`flask posts export` / `flask posts import` wrap the same code."""
+
+    def test_cli_round_trip(self, runner, corpus, importer_user, tmp_path):
+        path = tmp_path / 'export.tar.gz'
+        result = runner.invoke(args=['posts', 'export', 'test@example.com', '--format', 'tar', '-o', str(path)])
+        assert result.exit_code == 0, result.output
+
+        result = runner.invoke(args=['posts', 'import', 'importer@example.com', str(path)])
+        assert result.exit_code == 0, result.output
+        assert 'imported: 3' in result.output
+        assert Blog.query.filter_by(user_id=importer_user).count() == 3
@@ -0,0 +1,117 @@
+"""
+Tests for the incrementally maintained feed and sitemap artifacts.
+"""
+import gzip
+import pytest
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from flask import url_for
+from sqlalchemy import event
+from app.models import db, Blog, FeedArtifact
+from app.posts import tags as tag_service
+
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+
+@pytest.fixture
+def posts(app, test_user):
+    """Five published posts, with two ids per sitemap page; returns their ids."""
+    app.config['PUBLIC_SITEMAP_PAGE_SIZE'] = 2
+    created = [
+        Blog(user_id=test_user, title=f'Post {i}', slug=f'post-{i}', content_markdown='x',
+             is_published=True, published_at=datetime.utcnow())
+        for i in range(5)
+    ]
+    db.session.add_all(created)
+    db.session.commit()
+    return [blog.id for blog in created]
+
+
+def _versions():
+    rows = db.session.execute(db.select(FeedArtifact.name, FeedArtifact.version, FeedArtifact.built_version))
+    return {name: (version, built) for name, version, built in rows}
+
+
+def _locs(data):
+    return [loc.text for loc in ET.fromstring(data).iter(f'{SITEMAP_NS}loc')]
+
+
+class TestSitemapPagination:
+    """The sitemap is an index over fixed id ranges."""
+
+    def test_index_lists_each_page(self, client, posts):
+        index = _locs(client.get(url_for('public.sitemap')).data)
+        # ids 1-5 in pages of 2: [0, 2), [2, 4), [4, 6)
+        assert len(index) == 4
+        assert index[0].endswith('/sitemap-pages.xml')
+        assert index[-1].endswith('/sitemap-2.xml')
+
+        page = _locs(client.get(url_for('public.sitemap_page', page=1)).data)
+        assert [loc.split('/p/')[1] for loc in page] == ['2/post-1/', '3/post-2/']
+        assert client.get(url_for('public.sitemap_page', page=9)).status_code == 404
+
+    def test_publish_only_marks_the_affected_page(self, client, posts):
+        for page in range(3):
+            client.get(url_for('public.sitemap_page', page=page))
+        client.get(url_for('public.rss_feed'))
+        before = _versions()
+
+        blog = db.session.get(Blog, posts[0])
+        tag_service.set_published(blog, False)
+        db.session.commit()
+
+        after = _versions()
+        assert after['sitemap-0'][0] == before['sitemap-0'][0] + 1
+        assert after['rss'][0] == before['rss'][0] + 1
+        assert after['sitemap-1'] == before['sitemap-1']
+        assert after['sitemap-2'] == before['sitemap-2']
+
+        page = _locs(client.get(url_for('public.sitemap_page', page=0)).data)
+        assert page == []
+
+    def test_fresh_artifacts_do_not_touch_blogs(self, client, posts):
+        client.get(url_for('public.rss_feed'))
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert client.get(url_for('public.rss_feed')).status_code == 200
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert statements and not any('FROM blogs' in s for s in statements)
+
+
+class TestFeedServing:
+    """Feeds are served gzipped with per-encoding ETags and revalidate to 304."""
+
+    def test_gzip_and_identity(self, client, posts):
+        plain = client.get(url_for('public.rss_feed'))
+        zipped = client.get(url_for('public.rss_feed'), headers={'Accept-Encoding': 'gzip'})
+
+        assert zipped.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(zipped.data) == plain.data
+        assert zipped.headers['ETag'] != plain.headers['ETag']
+        assert 'Accept-Encoding' in plain.headers['Vary']
+
+        revalidated = client.get(
+            url_for('public.rss_feed'),
+            headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']},
+        )
+        assert revalidated.status_code == 304
+
+    def test_feed_follows_updates(self, authenticated_client, posts):
+        url = url_for('public.atom_feed')
+        etag = authenticated_client.get(url).headers['ETag']
+
+        authenticated_client.post(
+            url_for('posts.update_blog', blog_id=posts[-1]),
+            data={'title': 'Renamed Post', 'content': 'x'},
+        )
+        response = authenticated_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'Renamed Post' in response.data
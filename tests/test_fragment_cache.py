@@ -0,0 +1,107 @@
+"""
+Tests for the rendered blog card fragment cache.
+"""
+import pytest
+from flask import url_for
+from sqlalchemy import event
+from app.models import db, Blog, Tag
+from app.fragment_cache import LRUStore, FileSystemStore
+from app.posts.autosave import AutoSaveBuffer
+
+
+@pytest.fixture
+def blog_id(existing_blog, test_user):
+    """Tag the conftest blog and return its id."""
+    blog = Blog.query.filter_by(slug='existing-blog-post').one()
+    blog.tags.append(Tag(user_id=test_user, name='python'))
+    db.session.commit()
+    return blog.id
+
+
+@pytest.fixture
+def statements(app):
+    """Record every SQL statement run while the test executes."""
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield recorded
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class TestStores:
+    """Store backends share the get_many/set_many contract."""
+
+    def test_lru_evicts_least_recently_used(self):
+        store = LRUStore(max_entries=2)
+        store.set_many({'a': '1', 'b': '2'})
+        store.get_many(['a'])
+        store.set_many({'c': '3'})
+        assert store.get_many(['a', 'b', 'c']) == ['1', None, '3']
+
+    def test_filesystem_round_trip_and_expiry(self, tmp_path):
+        store = FileSystemStore(str(tmp_path))
+        store.set_many({'card': '<div>é</div>'})
+        store.set_many({'gone': 'x'}, timeout=-1)
+        assert store.get_many(['card', 'gone', 'missing']) == ['<div>é</div>', None, None]
+        store.clear()
+        assert store.get_many(['card']) == [None]
+
+    def test_filesystem_write_errors_are_logged(self, app, tmp_path, capsys, monkeypatch):
+        store = FileSystemStore(str(tmp_path / 'cards'))
+        (tmp_path / 'cards').rmdir()
+        warnings = []
+        monkeypatch.setattr(app.logger, 'warning', warnings.append)
+        store.set_many({'card': '<div></div>'})
+        assert len(warnings) == 1 and 'Fragment cache write error' in warnings[0]
+        assert capsys.readouterr().out == ''
+
+
+class TestCardCache:
+    """Warm renders reuse cards; invalidation hooks refresh them."""
+
+    def test_warm_render_skips_tag_queries(self, authenticated_client, blog_id, statements):
+        first = authenticated_client.get(url_for('posts.list_blogs'))
+        assert b'python' in first.data
+
+        statements.clear()
+        second = authenticated_client.get(url_for('posts.list_blogs'))
+        assert second.data == first.data
+        # Full tag rows are only loaded to render cards that missed
+        assert not any('tags.blog_count' in s for s in statements)
+
+    def test_tag_rename_refreshes_cards(self, authenticated_client, blog_id):
+        authenticated_client.get(url_for('main.dashboard'))
+        tag = Tag.query.filter_by(name='python').one()
+
+        response = authenticated_client.post(url_for('posts.bulk_tags'), json={'rename': {str(tag.id): 'python3'}})
+        assert response.status_code == 200
+
+        page = authenticated_client.get(url_for('main.dashboard'))
+        assert b'python3' in page.data
+
+    def test_publish_refreshes_cards(self, authenticated_client, test_user):
+        draft = Blog(user_id=test_user, title='Draft Post', slug='draft-post', content_markdown='x', is_published=False)
+        db.session.add(draft)
+        db.session.commit()
+        url = url_for('posts.list_blogs', filter='all')
+        assert b'Draft</span>' in authenticated_client.get(url).data
+
+        authenticated_client.post(url_for('posts.update_blog', blog_id=draft.id), data={'title': 'Draft Post', 'content': 'x'})
+        page = authenticated_client.get(url).data
+        assert b'Published</span>' in page
+        assert b'Draft</span>' not in page
+
+    def test_autosave_refreshes_cards(self, app, authenticated_client, blog_id):
+        buffer = AutoSaveBuffer(app, interval=3600, max_pending=10)
+        app.extensions['autosave'] = buffer
+        authenticated_client.get(url_for('posts.list_blogs'))
+
+        authenticated_client.post(
+            url_for('posts.auto_save'),
+            json={'blog_id': blog_id, 'title': 'Buffered Title', 'description': '', 'content': 'x'},
+        )
+        assert b'Buffered Title' in authenticated_client.get(url_for('posts.list_blogs')).data
+        buffer._stop.set()
@@ -0,0 +1,102 @@
+"""
+Tests for request instrumentation, /metrics and JSON request logs.
+"""
+import json
+import logging
+import sys
+
+from app import metrics
+from app.logs import JSONFormatter
+from app.models import db, Blog
+
+
+def request_records(caplog):
+    return [record for record in caplog.records if record.name == 'app.requests']
+
+
+class TestRequestInstrumentation:
+    """Every request is timed, counted and logged with its id."""
+
+    def test_request_id_is_generated_or_propagated(self, client):
+        generated = client.get('/feed.xml').headers['X-Request-ID']
+        assert len(generated) == 32
+        response = client.get('/feed.xml', headers={'X-Request-ID': 'abc-123'})
+        assert response.headers['X-Request-ID'] == 'abc-123'
+
+    def test_latency_and_sql_per_endpoint(self, client, existing_blog):
+        before = metrics.REQUEST_DURATION.count(endpoint='public.rss_feed', method='GET', status='200')
+        client.get('/feed.xml')
+        assert metrics.REQUEST_DURATION.count(endpoint='public.rss_feed', method='GET', status='200') == before + 1
+
+        body = client.get('/metrics').get_data(as_text=True)
+        assert '# TYPE http_request_duration_seconds histogram' in body
+        assert 'http_request_duration_seconds_bucket{endpoint="public.rss_feed",method="GET",status="200",le="+Inf"}' in body
+        assert 'http_request_db_queries_count{endpoint="public.rss_feed"}' in body
+
+    def test_request_log_is_json_with_query_stats(self, client, existing_blog, caplog):
+        caplog.set_level(logging.INFO, logger='app.requests')
+        client.get('/feed.xml', headers={'X-Request-ID': 'req-1'})
+        record = request_records(caplog)[-1]
+        entry = json.loads(JSONFormatter().format(record))
+        assert entry['endpoint'] == 'public.rss_feed'
+        assert entry['status'] == 200
+        assert entry['db_queries'] > 0
+        assert entry['duration_ms'] >= entry['db_ms']
+
+    def test_formatter_includes_request_id_and_traceback(self, app):
+        with app.test_request_context('/x', headers={'X-Request-ID': 'req-2'}):
+            metrics._start_request()
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                record = logging.getLogger('app').makeRecord(
+                    'app', logging.ERROR, __file__, 1, 'Import error', (), exc_info=sys.exc_info(),
+                )
+            entry = json.loads(JSONFormatter().format(record))
+        assert entry['request_id'] == 'req-2'
+        assert entry['message'] == 'Import error'
+        assert 'ValueError: boom' in entry['exception']
+
+
+class TestRecordedMetrics:
+    """Caches and the rate limiter report into the shared registry."""
+
+    def test_card_cache_hits_and_misses(self, authenticated_client, existing_blog):
+        hits = metrics.CACHE_LOOKUPS.value(cache='cards', result='hit')
+        misses = metrics.CACHE_LOOKUPS.value(cache='cards', result='miss')
+        authenticated_client.get('/posts/?filter=all')
+        authenticated_client.get('/posts/?filter=all')
+        assert metrics.CACHE_LOOKUPS.value(cache='cards', result='miss') == misses + 1
+        assert metrics.CACHE_LOOKUPS.value(cache='cards', result='hit') == hits + 1
+
+    def test_not_modified_counts_as_http_hit(self, client, existing_blog):
+        blog = Blog.query.filter_by(slug='existing-blog-post').one()
+        blog.is_published = True
+        db.session.commit()
+        etag = client.get('/feed.xml').headers['ETag']
+        hits = metrics.CACHE_LOOKUPS.value(cache='feeds', result='hit')
+        assert client.get('/feed.xml', headers={'If-None-Match': etag}).status_code == 304
+        assert metrics.CACHE_LOOKUPS.value(cache='feeds', result='hit') == hits + 1
+
+    def test_rate_limit_rejections(self, authenticated_client):
+        before = metrics.RATE_LIMITED.value(endpoint='ai.summarize', limit='5 per 1 minute')
+        statuses = [authenticated_client.post('/api/ai/summarize', json={'post_id': 1}).status_code for _ in range(6)]
+        assert statuses[-1] == 429
+        assert metrics.RATE_LIMITED.value(endpoint='ai.summarize', limit='5 per 1 minute') == before + 1
+
+
+class TestMetricsEndpoint:
+    """/metrics can be put behind a bearer token."""
+
+    def test_token_required_in_production(self, app, client):
+        app.testing = False
+        assert client.get('/metrics').status_code == 404
+        app.config['METRICS_TOKEN'] = 'secret'
+        assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+    def test_token_required_when_configured(self, app, client):
+        app.config['METRICS_TOKEN'] = 'secret'
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
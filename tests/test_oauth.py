@@ -0,0 +1,163 @@
+"""
+Tests for Google sign-in against a local OpenID provider stub.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from authlib.jose import JsonWebKey, jwt
+
+from app.auth import oidc
+from app.models import User
+
+
+class StubProvider:
+    """Serves discovery, JWKS and a token endpoint issuing signed ID tokens."""
+
+    def __init__(self):
+        self.hits = {}
+        self.max_age = None
+        self.key = self.new_key('key-1')
+        self.published = [self.key]
+        self.signing_key = self.key
+        self.nonce = None
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def new_key(kid):
+        return JsonWebKey.generate_key('RSA', 2048, {'kid': kid}, is_private=True)
+
+    def id_token(self):
+        now = int(time.time())
+        claims = {
+            'iss': self.url, 'aud': 'client-id', 'sub': 'google-sub-1', 'iat': now, 'exp': now + 300,
+            'nonce': self.nonce, 'email': 'new@example.com', 'name': 'New User',
+        }
+        header = {'alg': 'RS256', 'kid': self.signing_key.kid}
+        return jwt.encode(header, claims, self.signing_key).decode()
+
+    def respond(self, path):
+        if path == '/.well-known/openid-configuration':
+            return {
+                'issuer': self.url,
+                'authorization_endpoint': f'{self.url}/authorize',
+                'token_endpoint': f'{self.url}/token',
+                'jwks_uri': f'{self.url}/jwks',
+                'id_token_signing_alg_values_supported': ['RS256'],
+            }
+        if path == '/jwks':
+            return {'keys': [key.as_dict(is_private=False) for key in self.published]}
+        if path == '/token':
+            return {'access_token': 'access', 'token_type': 'Bearer', 'expires_in': 3600, 'id_token': self.id_token()}
+        return None
+
+    def handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_one(self):
+                path = urlparse(self.path).path
+                provider.hits[path] = provider.hits.get(path, 0) + 1
+                body = provider.respond(path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if provider.max_age is not None:
+                    self.send_header('Cache-Control', f'public, max-age={provider.max_age}')
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.handle_one()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.handle_one()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def provider(app):
+    provider = StubProvider()
+    app.config.update(
+        OAUTH_GOOGLE_CLIENT_ID='client-id',
+        OAUTH_GOOGLE_CLIENT_SECRET='client-secret',
+        OAUTH_GOOGLE_METADATA_URL=f'{provider.url}/.well-known/openid-configuration',
+        OAUTH_JWKS_MIN_REFRESH=60,
+    )
+    oidc.init_app(app)
+    yield provider
+    provider.server.shutdown()
+
+
+def sign_in(client, provider):
+    location = client.get('/auth/login').headers['Location']
+    query = parse_qs(urlparse(location).query)
+    provider.nonce = query['nonce'][0]
+    return client.get(f"/auth/callback?code=abc&state={query['state'][0]}")
+
+
+class TestProviderCache:
+    """Discovery and keys are fetched once, not on every sign-in."""
+
+    def test_two_sign_ins_fetch_metadata_and_keys_once(self, app, provider):
+        for _ in range(2):
+            response = sign_in(app.test_client(), provider)
+            assert response.status_code == 302
+            assert response.headers['Location'].endswith('/dashboard')
+        assert provider.hits['/.well-known/openid-configuration'] == 1
+        assert provider.hits['/jwks'] == 1
+        assert provider.hits['/token'] == 2
+        assert User.query.filter_by(google_sub='google-sub-1').count() == 1
+
+    def test_key_rotation_refetches_once(self, app, provider):
+        sign_in(app.test_client(), provider)
+        provider.signing_key = provider.new_key('key-2')
+        provider.published = [provider.key, provider.signing_key]
+        app.extensions['oidc_cache'].min_refresh = 0
+        assert sign_in(app.test_client(), provider).headers['Location'].endswith('/dashboard')
+        assert provider.hits['/jwks'] == 2
+        sign_in(app.test_client(), provider)
+        assert provider.hits['/jwks'] == 2
+
+    def test_unknown_key_rejected_without_hammering(self, app, provider):
+        sign_in(app.test_client(), provider)
+        provider.signing_key = provider.new_key('forged')
+        for _ in range(3):
+            response = sign_in(app.test_client(), provider)
+            assert response.status_code == 302
+            assert not response.headers['Location'].endswith('/dashboard')
+        assert provider.hits['/jwks'] == 1
+
+    def test_max_age_expiry_refetches(self, app, provider, monkeypatch):
+        provider.max_age = 10
+        cache = app.extensions['oidc_cache']
+        sign_in(app.test_client(), provider)
+        now = time.time()
+        monkeypatch.setattr(oidc.time, 'time', lambda: now + 11)
+        sign_in(app.test_client(), provider)
+        assert provider.hits['/.well-known/openid-configuration'] == 2
+        assert provider.hits['/jwks'] == 2
+        assert cache.ttl == app.config['OAUTH_METADATA_TTL']
+
+    def test_each_app_has_its_own_client(self, app, provider):
+        from app import create_app
+
+        other = create_app('testing')
+        assert isinstance(oidc.client(), oidc.CachedOpenIDApp)
+        assert oidc.client().client_id == 'client-id'
+        assert other.extensions['oidc_client'] is not oidc.client()
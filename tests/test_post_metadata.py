@@ -0,0 +1,128 @@
+"""
+Tests for metadata extracted from post markdown at write time.
+"""
+from app.models import db, Blog, PostMetadata
+from app.posts import archive, metadata
+from app.posts.autosave import AutoSaveBuffer
+
+BODY = """# Getting started
+
+Read the [docs](https://example.com/docs) and the [guide](/guide) first.
+
+![Diagram](/img/diagram.png)
+
+## Install
+
+```python
+import flask
+```
+
+```bash
+pip install flask
+```
+
+## Install
+
+<div>Raw HTML is not counted</div>
+
+See [docs again](https://example.com/docs) or <https://flask.palletsprojects.com>.
+"""
+
+
+class TestExtract:
+    """Parsing the markdown yields the facts views show."""
+
+    def test_extracts_every_field(self):
+        found = metadata.extract(BODY)
+        assert found['toc'] == [
+            {'level': 1, 'text': 'Getting started', 'anchor': 'getting-started'},
+            {'level': 2, 'text': 'Install', 'anchor': 'install'},
+            {'level': 2, 'text': 'Install', 'anchor': 'install-1'},
+        ]
+        assert found['first_image'] == '/img/diagram.png'
+        assert found['links'] == ['https://example.com/docs', 'https://flask.palletsprojects.com']
+        assert found['code_languages'] == ['python', 'bash']
+        assert found['reading_minutes'] == 1
+
+    def test_counts_prose_words_only(self):
+        found = metadata.extract("It's *very* simple.\n\n```\nnot counted here\n```\n\n<p>nor here</p>\n")
+        assert found['word_count'] == 3
+
+    def test_reading_time_rounds_up(self):
+        assert metadata.extract('word ' * 401)['reading_minutes'] == 3
+        assert metadata.extract('')['reading_minutes'] == 0
+
+
+class TestWrites:
+    """Every save path stores the extracted metadata."""
+
+    def test_create_and_update(self, authenticated_client, test_user):
+        authenticated_client.post('/posts/', data={'title': 'Guide', 'content': BODY})
+        blog = Blog.query.one()
+        assert metadata.load([blog.id])[blog.id]['code_languages'] == ['python', 'bash']
+        authenticated_client.post(f'/posts/{blog.id}', data={'title': 'Guide', 'content': 'Just two words'})
+        assert metadata.load([blog.id])[blog.id]['word_count'] == 3
+        assert PostMetadata.query.count() == 1
+
+    def test_save_draft(self, authenticated_client, test_user):
+        blog_id = authenticated_client.post('/posts/save-draft', json={'title': 'Draft', 'content': '## Plan'}).get_json()['blog_id']
+        assert metadata.load([blog_id])[blog_id]['toc'] == [{'level': 2, 'text': 'Plan', 'anchor': 'plan'}]
+
+    def test_auto_save_flush(self, app, authenticated_client, test_user, existing_blog):
+        blog_id = Blog.query.filter_by(slug='existing-blog-post').one().id
+        authenticated_client.post('/posts/auto-save', json={'blog_id': blog_id, 'title': 'T', 'content': '![x](/a.png)'})
+        app.extensions['autosave'].flush()
+        assert metadata.load([blog_id])[blog_id]['first_image'] == '/a.png'
+
+    def test_buffered_auto_save_is_extracted_on_put(self, app, authenticated_client, test_user, existing_blog, monkeypatch):
+        blog_id = Blog.query.filter_by(slug='existing-blog-post').one().id
+        buffer = AutoSaveBuffer(app, interval=3600)
+        monkeypatch.setitem(app.extensions, 'autosave', buffer)
+        authenticated_client.post('/posts/auto-save', json={'blog_id': blog_id, 'title': 'T', 'content': '## Buffered'})
+        monkeypatch.setattr(metadata, 'extract', None)
+        data = authenticated_client.get(f'/api/blog/{blog_id}').get_json()
+        assert data['metadata']['toc'] == [{'level': 2, 'text': 'Buffered', 'anchor': 'buffered'}]
+        assert buffer.flush() == 1
+        assert metadata.load([blog_id])[blog_id]['toc'][0]['text'] == 'Buffered'
+        buffer._stop.set()
+
+    def test_import(self, app, test_user):
+        archive.Importer(test_user).run(iter([{'type': 'post', 'title': 'Imported', 'content_markdown': BODY}]))
+        blog = Blog.query.filter_by(title='Imported').one()
+        assert metadata.load([blog.id])[blog.id]['links'][0] == 'https://example.com/docs'
+
+
+class TestReads:
+    """Views read the stored values."""
+
+    def test_api_returns_metadata(self, authenticated_client, test_user):
+        authenticated_client.post('/posts/', data={'title': 'Guide', 'content': BODY})
+        blog = Blog.query.one()
+        data = authenticated_client.get(f'/api/blog/{blog.id}').get_json()
+        assert data['metadata']['toc'][0]['anchor'] == 'getting-started'
+        assert data['metadata']['word_count'] == metadata.extract(BODY)['word_count']
+
+    def test_reads_never_parse_stored_posts(self, authenticated_client, test_user, monkeypatch):
+        authenticated_client.post('/posts/', data={'title': 'Guide', 'content': BODY})
+        blog = Blog.query.one()
+        monkeypatch.setattr(metadata, 'extract', None)
+        assert authenticated_client.get(f'/api/blog/{blog.id}').status_code == 200
+        assert '1 min read' in authenticated_client.get(f'/p/{blog.id}/guide/').get_data(as_text=True)
+
+    def test_posts_without_metadata_show_none(self, authenticated_client, test_user, monkeypatch):
+        blog = Blog(user_id=test_user, title='Old', slug='old', content_markdown='# Old', is_published=True)
+        db.session.add(blog)
+        db.session.commit()
+        monkeypatch.setattr(metadata, 'extract', None)
+        assert authenticated_client.get(f'/api/blog/{blog.id}').get_json()['metadata'] is None
+        assert authenticated_client.get(f'/p/{blog.id}/old/').status_code == 200
+
+    def test_backfill_command(self, runner, test_user):
+        db.session.add_all([
+            Blog(user_id=test_user, title=f'Old {i}', slug=f'old-{i}', content_markdown='One two three') for i in range(3)
+        ])
+        db.session.commit()
+        assert 'Extracted metadata for 3 posts.' in runner.invoke(args=['posts', 'metadata']).output
+        assert 'Extracted metadata for 0 posts.' in runner.invoke(args=['posts', 'metadata']).output
+        assert 'Extracted metadata for 3 posts.' in runner.invoke(args=['posts', 'metadata', '--rebuild']).output
+        assert PostMetadata.query.count() == 3
@@ -0,0 +1,107 @@
+"""
+Tests for the opt-in request profiler and the slow-query log.
+"""
+import json
+import logging
+import os
+
+import pytest
+
+
+@pytest.fixture
+def profiling(app, tmp_path):
+    app.config.update(PROFILER_TOKEN='let-me-profile', PROFILER_DIR=str(tmp_path), PROFILER_EXPLAIN_MS=0)
+    return tmp_path
+
+
+@pytest.fixture
+def admin_client(app, authenticated_client):
+    app.config['ADMIN_EMAILS'] = ['test@example.com']
+    return authenticated_client
+
+
+def read_report(directory, profile_id):
+    with open(os.path.join(directory, f'{profile_id}.json'), encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+class TestProfiling:
+    """Profiles are opt-in per request and stored for download."""
+
+    def test_unprofiled_by_default(self, client, profiling):
+        response = client.get('/feed.xml')
+        assert 'X-Profile-ID' not in response.headers
+        assert os.listdir(profiling) == []
+
+    def test_wrong_token_is_ignored(self, client, profiling):
+        assert 'X-Profile-ID' not in client.get('/feed.xml', headers={'X-Profile': 'guess'}).headers
+
+    def test_token_header_profiles_request(self, client, existing_blog, profiling):
+        response = client.get('/feed.xml', headers={'X-Profile': 'let-me-profile', 'X-Request-ID': 'req-9'})
+        profile_id = response.headers['X-Profile-ID']
+        report = read_report(profiling, profile_id)
+        assert report['endpoint'] == 'public.rss_feed'
+        assert report['request_id'] == 'req-9'
+        assert report['query_count'] == len(report['queries']) > 0
+        assert any('rss_feed' in entry['function'] for entry in report['functions'])
+        assert os.path.exists(os.path.join(profiling, f'{profile_id}.prof'))
+
+    def test_slow_selects_are_explained(self, client, existing_blog, profiling):
+        profile_id = client.get('/feed.xml', headers={'X-Profile': 'let-me-profile'}).headers['X-Profile-ID']
+        selects = [query for query in read_report(profiling, profile_id)['queries']
+                   if query['statement'].lstrip().upper().startswith('SELECT')]
+        assert selects
+        assert all(query.get('explain') for query in selects)
+
+    def test_admin_flag_profiles_request(self, admin_client, profiling):
+        assert 'X-Profile-ID' in admin_client.get('/posts/?_profile=1').headers
+
+    def test_admin_flag_ignored_for_other_users(self, authenticated_client, profiling):
+        assert 'X-Profile-ID' not in authenticated_client.get('/posts/?_profile=1').headers
+
+    def test_sampling(self, app, client, profiling):
+        app.config['PROFILER_SAMPLE_RATE'] = 1.0
+        assert 'X-Profile-ID' in client.get('/feed.xml').headers
+
+    def test_old_reports_are_pruned(self, app, client, profiling):
+        app.config['PROFILER_MAX_REPORTS'] = 2
+        for _ in range(3):
+            client.get('/feed.xml', headers={'X-Profile': 'let-me-profile'})
+        assert len([name for name in os.listdir(profiling) if name.endswith('.json')]) == 2
+        assert len([name for name in os.listdir(profiling) if name.endswith('.prof')]) == 2
+
+
+class TestDownloads:
+    """Only admins can list and download reports."""
+
+    def test_list_and_download(self, admin_client, profiling):
+        profile_id = admin_client.get('/feed.xml', headers={'X-Profile': 'let-me-profile'}).headers['X-Profile-ID']
+        listing = admin_client.get('/_profiles').get_json()['profiles']
+        assert [entry['id'] for entry in listing] == [profile_id]
+        assert admin_client.get(f'/_profiles/{profile_id}.json').get_json()['id'] == profile_id
+        stats = admin_client.get(f'/_profiles/{profile_id}.prof')
+        assert stats.status_code == 200
+        assert stats.mimetype == 'application/octet-stream'
+        assert admin_client.get('/_profiles/not-an-id.json').status_code == 404
+
+    def test_forbidden_for_non_admins(self, authenticated_client, client, profiling):
+        assert authenticated_client.get('/_profiles').status_code == 403
+        assert client.get('/_profiles').status_code == 403
+
+
+class TestSlowQueryLog:
+    """Slow statements are logged with their endpoint, profiled or not."""
+
+    def test_logs_slow_queries(self, app, client, caplog):
+        app.config['SLOW_QUERY_MS'] = 0
+        caplog.set_level(logging.WARNING, logger='app.slow_queries')
+        client.get('/feed.xml')
+        records = [record for record in caplog.records if record.name == 'app.slow_queries']
+        assert records
+        assert records[0].fields['endpoint'] == 'public.rss_feed'
+        assert 'SELECT' in records[0].fields['statement']
+
+    def test_fast_queries_not_logged(self, client, caplog):
+        caplog.set_level(logging.WARNING, logger='app.slow_queries')
+        client.get('/feed.xml')
+        assert not [record for record in caplog.records if record.name == 'app.slow_queries']
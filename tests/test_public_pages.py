@@ -0,0 +1,122 @@
+"""
+Tests for the anonymous public pages and the static site builder.
+"""
+import os
+import pytest
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from flask import url_for
+from app.models import db, Blog
+from app.posts import tags as tag_service
+from app.public.static_site import StaticSiteBuilder
+
+
+@pytest.fixture
+def post(app, test_user):
+    """A published, tagged post with an awkward slug; returns its id."""
+    blog = Blog(
+        user_id=test_user,
+        title="What's New?",
+        slug="what's-new?",
+        description='Release notes',
+        content_markdown='# Hello\n\n<script>alert(1)</script>',
+        is_published=True,
+        published_at=datetime.utcnow(),
+    )
+    db.session.add(blog)
+    db.session.flush()
+    tag_service.sync_blog_tags(blog, [tag.id for tag in tag_service.create_tags(test_user, ['news'])])
+    db.session.commit()
+    return blog.id
+
+
+class TestPublicRoutes:
+    """Public pages are anonymous, cacheable and addressed by id + slug."""
+
+    def test_post_page_is_public_and_cacheable(self, client, post):
+        response = client.get(f'/p/{post}/what-s-new/')
+        assert response.status_code == 200
+        assert b'<h1>Hello</h1>' in response.data
+        assert b'<script>alert(1)</script>' not in response.data
+        assert response.headers['Cache-Control'].startswith('public, max-age=')
+        assert 'Set-Cookie' not in response.headers
+        assert 'Cookie' not in response.headers.get('Vary', '')
+
+    def test_non_canonical_slug_redirects(self, client, post):
+        response = client.get(f'/p/{post}/old-title/')
+        assert response.status_code == 301
+        assert response.headers['Location'].endswith(f'/p/{post}/what-s-new/')
+
+    def test_revalidation_returns_304(self, client, post):
+        url = f'/p/{post}/what-s-new/'
+        etag = client.get(url).headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    def test_drafts_are_not_public(self, client, post):
+        db.session.get(Blog, post).is_published = False
+        db.session.commit()
+        assert client.get(f'/p/{post}/what-s-new/').status_code == 404
+
+    def test_author_and_tag_indexes(self, client, post, test_user):
+        author = client.get(url_for('public.author_index', user_id=test_user))
+        assert author.status_code == 200
+        assert b'Test User' in author.data and b'What&#39;s New?' in author.data
+
+        tag = client.get(url_for('public.tag_index', name='news'))
+        assert tag.status_code == 200
+        assert f'/p/{post}/what-s-new/'.encode() in tag.data
+        assert client.get(url_for('public.tag_index', name='missing')).status_code == 404
+
+    def test_feeds_and_sitemap_are_valid_xml(self, client, post):
+        rss = client.get(url_for('public.rss_feed'))
+        assert rss.mimetype == 'application/rss+xml'
+        assert ET.fromstring(rss.data).find('channel/item/title').text == "What's New?"
+
+        atom = client.get(url_for('public.atom_feed'))
+        ns = {'a': 'http://www.w3.org/2005/Atom'}
+        assert len(ET.fromstring(atom.data).findall('a:entry', ns)) == 1
+
+        locs = []
+        index = ET.fromstring(client.get(url_for('public.sitemap')).data)
+        for sitemap in index.iter('{http://www.sitemaps.org/schemas/sitemap/0.9}loc'):
+            urlset = ET.fromstring(client.get(sitemap.text).data)
+            locs += [loc.text for loc in urlset.iter('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
+        assert any(loc.endswith(f'/p/{post}/what-s-new/') for loc in locs)
+        assert any(loc.endswith('/t/news/') for loc in locs)
+
+
+class TestStaticSiteBuilder:
+    """Static builds only re-render what changed."""
+
+    def test_incremental_build(self, authenticated_client, post, tmp_path):
+        output = str(tmp_path)
+        # Post, author and tag pages, two feeds, sitemap index, post and listing sitemaps
+        first = StaticSiteBuilder(output).build()
+        assert first == {'written': 8, 'unchanged': 0, 'removed': 0}
+        assert os.path.exists(os.path.join(output, f'p/{post}/what-s-new/index.html'))
+        assert os.path.exists(os.path.join(output, 't/news/index.html'))
+        assert os.path.exists(os.path.join(output, 'feed.xml.gz'))
+        assert os.path.exists(os.path.join(output, f'p/{post}/what-s-new/index.html.gz'))
+
+        assert StaticSiteBuilder(output).build() == {'written': 0, 'unchanged': 8, 'removed': 0}
+
+        tag_page = os.path.join(output, 't/news/index.html')
+        tag_mtime = os.stat(tag_page).st_mtime_ns
+        authenticated_client.post(url_for('posts.create_blog'), data={'title': 'Second', 'content': 'x'})
+        # New post, author index, feeds and the post sitemap (plus the index if its lastmod moved)
+        stats = StaticSiteBuilder(output).build()
+        assert stats['written'] in (5, 6) and stats['removed'] == 0
+        assert os.stat(tag_page).st_mtime_ns == tag_mtime
+
+        tag_service.set_published(db.session.get(Blog, post), False)
+        db.session.commit()
+        stats = StaticSiteBuilder(output).build()
+        assert stats['removed'] == 2
+        assert not os.path.exists(os.path.join(output, f'p/{post}'))
+        assert not os.path.exists(os.path.join(output, 't/news'))
+
+    def test_build_command(self, runner, post, tmp_path):
+        result = runner.invoke(args=['public', 'build', '-o', str(tmp_path)])
+        assert result.exit_code == 0
+        assert '8 written' in result.output
+        assert os.path.exists(os.path.join(str(tmp_path), 'sitemap.xml'))
@@ -0,0 +1,119 @@
+"""
+Tests for the shared SQLite rate limit storage and the cached limiter key.
+"""
+import threading
+
+import pytest
+from flask import g, session
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+from app import extensions
+from app.ratelimit import SQLiteStorage
+
+
+@pytest.fixture
+def storage_uri(tmp_path):
+    return f"sqlite:///{tmp_path / 'ratelimit.db'}"
+
+
+class TestSQLiteStorage:
+    """Counters live in one file, so every worker sees the same window."""
+
+    def test_registered_with_limits(self, storage_uri):
+        assert isinstance(storage_from_string(storage_uri), SQLiteStorage)
+
+    def test_rejects_in_memory_database(self):
+        with pytest.raises(ValueError):
+            SQLiteStorage('sqlite://')
+
+    def test_moving_window_allows_up_to_limit(self, storage_uri):
+        limiter = MovingWindowRateLimiter(SQLiteStorage(storage_uri))
+        limit = parse('5/minute')
+        assert [limiter.hit(limit, 'user:1') for _ in range(6)] == [True] * 5 + [False]
+        assert limiter.hit(limit, 'user:2')
+        stats = limiter.get_window_stats(limit, 'user:1')
+        assert stats.remaining == 0
+
+    def test_workers_share_one_window(self, storage_uri):
+        # Two storages on one file stand in for two gunicorn workers
+        worker_a = MovingWindowRateLimiter(SQLiteStorage(storage_uri))
+        worker_b = MovingWindowRateLimiter(SQLiteStorage(storage_uri))
+        limit = parse('5/minute')
+        results = [(worker_a if i % 2 else worker_b).hit(limit, 'user:1') for i in range(8)]
+        assert results.count(True) == 5
+
+    def test_concurrent_hits_never_exceed_limit(self, storage_uri):
+        limit = parse('20/minute')
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            limiter = MovingWindowRateLimiter(SQLiteStorage(storage_uri))
+            for _ in range(10):
+                allowed = limiter.hit(limit, 'shared')
+                with lock:
+                    results.append(allowed)
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 50
+        assert results.count(True) == 20
+
+    def test_fixed_window_counters(self, storage_uri):
+        storage = SQLiteStorage(storage_uri)
+        limiter = FixedWindowRateLimiter(storage)
+        limit = parse('2/minute')
+        assert [limiter.hit(limit, 'ip') for _ in range(3)] == [True, True, False]
+        assert storage.get(limit.key_for('ip')) == 3
+        assert storage.get_expiry(limit.key_for('ip')) > 0
+
+    def test_expired_counter_starts_over(self, storage_uri):
+        storage = SQLiteStorage(storage_uri)
+        storage.incr('key', expiry=0)
+        assert storage.get('key') == 0
+        assert storage.incr('key', expiry=60) == 1
+
+    def test_clear_and_reset(self, storage_uri):
+        storage = SQLiteStorage(storage_uri)
+        limiter = MovingWindowRateLimiter(storage)
+        limit = parse('1/minute')
+        limiter.hit(limit, 'a')
+        limiter.hit(limit, 'b')
+        storage.clear(limit.key_for('a'))
+        assert limiter.hit(limit, 'a')
+        assert not limiter.hit(limit, 'b')
+        assert storage.reset() == 2
+        assert limiter.hit(limit, 'b')
+        assert storage.check()
+
+
+class TestRateLimitKey:
+    """The key is resolved once per request without loading the user."""
+
+    def test_anonymous_request_uses_address(self, app):
+        with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            assert extensions._rate_limit_key_func() == '10.0.0.1'
+
+    def test_signed_in_user_from_session(self, app):
+        with app.test_request_context(headers={'Cookie': 'session=unsigned'}):
+            session['_user_id'] = '42'
+            assert extensions._rate_limit_key_func() == 'user:42'
+            # Only the session was read; Flask-Login never loaded the user
+            assert g.get('_login_user') is None
+
+    def test_key_resolved_once_per_request(self, app, monkeypatch):
+        calls = []
+
+        def resolve():
+            calls.append(1)
+            return 'key'
+
+        monkeypatch.setattr(extensions, '_resolve_rate_limit_key', resolve)
+        with app.test_request_context():
+            assert extensions._rate_limit_key_func() == 'key'
+            assert extensions._rate_limit_key_func() == 'key'
+        assert len(calls) == 1
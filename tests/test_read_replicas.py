@@ -0,0 +1,119 @@
+"""
+Tests for read-replica routing using the local two-database setup
+('testing-replica' config: one primary and one replica SQLite file).
+"""
+import os
+import pytest
+from datetime import datetime
+from flask import url_for
+
+from app import create_app
+from app.models import db, User, Blog
+from app.replicas import engines, read_only
+
+
+@pytest.fixture
+def app():
+    """App wired to a primary and a replica database."""
+    app = create_app('testing-replica')
+
+    with app.app_context():
+        replica = engines(app)[0]
+        db.create_all()
+        db.metadata.create_all(replica)
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.metadata.drop_all(replica)
+        db.engine.dispose()
+        replica.dispose()
+
+    for name in ('testing-primary.db', 'testing-replica.db'):
+        path = os.path.join(app.instance_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _insert(engine, table, **values):
+    with engine.begin() as conn:
+        conn.execute(table.insert().values(**values))
+
+
+@pytest.fixture
+def replicated_user(app):
+    """Create the same user row on both databases and log in as it."""
+    values = dict(
+        id=1,
+        google_sub='replica-user',
+        email='replica@example.com',
+        name='Replica User',
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
+    )
+    _insert(db.engines[None], User.__table__, **values)
+    _insert(engines(app)[0], User.__table__, **values)
+    return 1
+
+
+@pytest.fixture
+def primary_only_blog(app, replicated_user):
+    """A published blog that has not reached the replica yet."""
+    _insert(
+        db.engines[None],
+        Blog.__table__,
+        id=1,
+        user_id=replicated_user,
+        title='Fresh Post',
+        slug='fresh-post',
+        content_markdown='# Fresh',
+        is_published=True,
+        published_at=datetime.utcnow(),
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
+    )
+    return 1
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+
+class TestReadReplicaRouting:
+    """GET endpoints read from the replica, writes go to the primary."""
+
+    def test_get_reads_from_replica(self, client, replicated_user, primary_only_blog):
+        _login(client, replicated_user)
+
+        response = client.get(url_for('main.get_blog_content', blog_id=primary_only_blog))
+
+        # The blog only exists on the primary, so the replica read misses it.
+        assert response.status_code == 404
+
+    def test_write_goes_to_primary_and_pins_reads(self, client, replicated_user, primary_only_blog):
+        _login(client, replicated_user)
+
+        response = client.post(
+            url_for('posts.auto_save'),
+            json={'blog_id': primary_only_blog, 'title': 'Saved Title', 'content': 'Saved'},
+        )
+        assert response.status_code == 200
+
+        with db.engines[None].connect() as conn:
+            title = conn.execute(db.select(Blog.title).where(Blog.id == primary_only_blog)).scalar()
+        assert title == 'Saved Title'
+
+        # Read-your-writes: the next GET is pinned to the primary.
+        response = client.get(url_for('main.get_blog_content', blog_id=primary_only_blog))
+        assert response.status_code == 200
+        assert response.get_json()['title'] == 'Saved Title'
+
+    def test_read_only_service_uses_replica(self, app, primary_only_blog):
+        @read_only
+        def count_blogs():
+            return Blog.query.count()
+
+        with app.test_request_context(method='POST'):
+            assert count_blogs() == 0
+            assert Blog.query.count() == 1
@@ -0,0 +1,233 @@
+"""
+Tests for the precomputed related-posts index.
+"""
+import json
+import random
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('scipy')
+
+from app import search
+from app.models import db, Blog, RelatedPosts, RelatedTerm, SearchDocument, Tag
+from app.posts import hooks, tags as tag_service
+from app.public import related
+
+
+def add_post(user_id, title, content, tags=(), published=True):
+    blog = Blog(
+        user_id=user_id, title=title, slug=title.lower().replace(' ', '-'), content_markdown=content,
+        is_published=published, published_at=datetime.utcnow() if published else None,
+    )
+    db.session.add(blog)
+    db.session.flush()
+    if tags:
+        tag_service.sync_blog_tags(blog, tag_ids(user_id, tags))
+    related.mark_stale([blog.id])
+    db.session.commit()
+    return blog.id
+
+
+def tag_ids(user_id, names):
+    tag_service.create_tags(user_id, names)
+    return [tag.id for tag in Tag.query.filter(Tag.user_id == user_id, Tag.name.in_(names))]
+
+
+def neighbors(blog_id):
+    return json.loads(db.session.get(RelatedPosts, blog_id).neighbors)
+
+
+def all_lists():
+    db.session.expire_all()
+    return {row.blog_id: [entry[0] for entry in json.loads(row.neighbors)] for row in RelatedPosts.query}
+
+
+@pytest.fixture
+def corpus(app, test_user):
+    """Two posts each about Python, cooking and gardening; returns their ids by topic."""
+    posts = {
+        'python': [
+            add_post(test_user, 'Python generators', 'Python generators yield values lazily; iterators and generators save memory in Python.'),
+            add_post(test_user, 'Python decorators', 'Decorators wrap Python functions; closures and generators pair well with decorators.'),
+        ],
+        'cooking': [
+            add_post(test_user, 'Sourdough bread', 'Bake sourdough bread with flour, water and a starter; the oven must be hot.'),
+            add_post(test_user, 'Pizza dough', 'Pizza dough needs flour, water, yeast and a very hot oven to bake.'),
+        ],
+        'garden': [
+            add_post(test_user, 'Tomato seedlings', 'Plant tomato seedlings in spring soil, water daily and stake the tomato plants.'),
+            add_post(test_user, 'Raised beds', 'Raised beds drain soil well; plant seedlings and water them in spring.'),
+        ],
+    }
+    related.refresh()
+    db.session.commit()
+    return posts
+
+
+class TestIndex:
+    """Lists are computed once and read back with a primary-key lookup."""
+
+    def test_posts_relate_by_topic(self, corpus):
+        for first, second in corpus.values():
+            assert neighbors(first)[0][0] == second
+            assert neighbors(second)[0][0] == first
+        assert related.refresh() == {'indexed': 0, 'updated': 0}
+
+    def test_lookup_skips_drafts_and_keeps_order(self, corpus):
+        first, second = corpus['python']
+        assert [post.id for post in related.related_posts(first)][0] == second
+        db.session.get(Blog, second).is_published = False
+        db.session.commit()
+        assert second not in [post.id for post in related.related_posts(first)]
+
+    def test_tag_overlap_boosts(self, app, test_user):
+        text = 'Notes on shipping software releases every week.'
+        base = add_post(test_user, 'Release notes', text, tags=['ops'])
+        plain = add_post(test_user, 'Release log', text)
+        tagged = add_post(test_user, 'Release diary', text, tags=['ops'])
+        related.refresh()
+        assert [entry[0] for entry in neighbors(base)] == [tagged, plain]
+
+    def test_list_length_and_minimum_score(self, app, test_user, corpus):
+        app.config['RELATED_COUNT'] = 1
+        app.config['RELATED_MIN_SCORE'] = 0.99
+        related.rebuild()
+        assert all(len(neighbors(blog_id)) == 0 for pair in corpus.values() for blog_id in pair)
+        app.config['RELATED_MIN_SCORE'] = 0
+        related.rebuild()
+        assert all(len(neighbors(blog_id)) == 1 for pair in corpus.values() for blog_id in pair)
+
+
+class TestIncrementalUpdates:
+    """Writes flag posts; a refresh touches only them and the lists they affect."""
+
+    def test_edit_moves_a_post_between_topics(self, authenticated_client, corpus):
+        moved = corpus['python'][1]
+        response = authenticated_client.post(f'/posts/{moved}', data={
+            'title': 'Focaccia', 'description': '', 'content': 'Focaccia dough: flour, water, yeast, olive oil; bake in a hot oven.',
+        })
+        assert response.status_code == 302
+        assert related.refresh()['indexed'] == 1
+        db.session.expire_all()
+        assert neighbors(moved)[0][0] in corpus['cooking']
+        assert moved not in [entry[0] for entry in neighbors(corpus['python'][0])][:1]
+        assert moved in [entry[0] for entry in neighbors(corpus['cooking'][0])][:2]
+
+    def test_unpublished_post_leaves_every_list(self, app, corpus):
+        app.config['RELATED_COUNT'] = 2
+        app.config['RELATED_MIN_SCORE'] = 0
+        related.rebuild()
+        gone = corpus['garden'][0]
+        tag_service.set_published(db.session.get(Blog, gone), False)
+        db.session.commit()
+        related.refresh()
+        lists = all_lists()
+        assert lists[gone] == []
+        assert all(gone not in ids for ids in lists.values())
+        # Lists that lost it were refilled
+        assert all(len(ids) == 2 for blog_id, ids in lists.items() if blog_id != gone)
+
+    def test_incremental_matches_rebuild(self, app, test_user):
+        app.config['RELATED_COUNT'] = 3
+        rng = random.Random(7)
+        vocabulary = [f'word{i}' for i in range(60)]
+        names = ['alpha', 'beta', 'gamma', 'delta']
+        ids = [
+            add_post(test_user, f'Post {i}', ' '.join(rng.choices(vocabulary, k=40)), tags=rng.sample(names, 2))
+            for i in range(30)
+        ]
+        related.refresh()
+        # Retagging moves tag overlap but not the IDF weights, so patched lists must equal recomputed ones
+        for blog_id in rng.sample(ids, 6):
+            tag_service.sync_blog_tags(db.session.get(Blog, blog_id), tag_ids(test_user, rng.sample(names, 1)))
+        db.session.commit()
+        assert related.refresh()['indexed'] == 6
+        incremental = all_lists()
+        related.rebuild()
+        assert all_lists() == incremental
+
+    def test_nearby_refresh_loads_only_the_posts_around(self, app, authenticated_client, corpus, monkeypatch):
+        app.config['RELATED_COUNT'] = 1
+        related.rebuild()
+        loaded = []
+        original = related.Corpus.__init__
+
+        def recording(self, rows, frequencies=None):
+            loaded.append({row.blog_id for row in rows})
+            original(self, rows, frequencies)
+
+        monkeypatch.setattr(related.Corpus, '__init__', recording)
+        edited = corpus['python'][1]
+        authenticated_client.post(f'/posts/{edited}', data={
+            'title': 'Python iterators', 'description': '', 'content': 'Python iterators and generators yield values lazily.',
+        })
+        assert related.refresh(nearby=True)['indexed'] == 1
+        assert loaded == [set(corpus['python'])]
+        incremental = all_lists()
+        # The stored document frequencies followed the edit
+        stored = dict(db.session.execute(db.select(RelatedTerm.term, RelatedTerm.posts)).all())
+        frequency = related.Corpus.load().document_frequency
+        assert {term: posts for term, posts in stored.items() if posts} == {int(t): int(frequency[t]) for t in frequency.nonzero()[0]}
+        related.rebuild()
+        assert all_lists() == incremental
+
+
+class TestBackgroundRefresh:
+    """Commits that change posts wake the refresher of the process that made them."""
+
+    @pytest.fixture
+    def scheduled(self, app, monkeypatch):
+        calls = []
+        monkeypatch.setattr(app.extensions['index_refresher'], 'schedule', lambda: calls.append(1))
+        return calls
+
+    def test_commit_schedules_a_refresh(self, authenticated_client, corpus, scheduled):
+        authenticated_client.post(f'/posts/{corpus["garden"][0]}', data={'title': 'Tomatoes', 'description': '', 'content': 'Tomato plants.'})
+        assert scheduled == [1]
+
+    def test_rollback_schedules_nothing(self, app, corpus, scheduled):
+        hooks.posts_changed([corpus['garden'][0]])
+        db.session.rollback()
+        db.session.commit()
+        assert scheduled == []
+
+    def test_refresh_brings_both_indexes_up_to_date(self, app, corpus, tmp_path):
+        app.config['SEARCH_INDEX_DIR'] = str(tmp_path / 'search')
+        hooks.posts_changed([corpus['garden'][0]])
+        db.session.commit()
+        app.extensions['index_refresher'].refresh()
+        assert not RelatedPosts.query.filter(RelatedPosts.version != RelatedPosts.built_version).count()
+        index = search.open_index()
+        assert set(index.ids[index.ids > 0]) == {document.blog_id for document in SearchDocument.query}
+
+
+class TestPages:
+    """Post pages, the overlay API and the CLI use the index."""
+
+    def test_post_page_lists_related_posts(self, client, corpus):
+        first, second = corpus['cooking']
+        html = client.get(f'/p/{first}/sourdough-bread/').get_data(as_text=True)
+        assert 'Related posts' in html
+        assert f'/p/{second}/pizza-dough/' in html
+
+    def test_etag_changes_with_the_list(self, client, test_user, corpus):
+        url = f"/p/{corpus['cooking'][0]}/sourdough-bread/"
+        etag = client.get(url).headers['ETag']
+        add_post(test_user, 'Baguette', 'Baguette bread from flour, water and yeast; sourdough starter optional, hot oven.')
+        related.refresh()
+        db.session.commit()
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+    def test_overlay_includes_related(self, authenticated_client, corpus):
+        first, second = corpus['garden']
+        data = authenticated_client.get(f'/api/blog/{first}').get_json()
+        assert data['related'][0] == {'id': second, 'title': 'Raised beds', 'url': f'/p/{second}/raised-beds/'}
+
+    def test_command(self, runner, test_user, corpus):
+        add_post(test_user, 'Compost', 'Compost feeds garden soil before you plant seedlings in spring.')
+        result = runner.invoke(args=['public', 'related'])
+        assert result.exit_code == 0
+        assert 'Indexed 1 posts' in result.output
+        result = runner.invoke(args=['public', 'related', '--rebuild'])
+        assert 'Indexed 7 posts' in result.output
@@ -0,0 +1,235 @@
+"""
+Tests for semantic search and its vector index.
+"""
+import fcntl
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import search
+from app.ai import routes as ai_routes
+from app.models import db, Blog
+from app.posts import tags as tag_service
+
+TOPICS = {
+    'cars': [
+        ('Car repair', 'Change the car engine oil at the garage; a mechanic checks the brakes.'),
+        ('Automobile engines', 'An automobile engine needs oil; the garage mechanic tunes it.'),
+    ],
+    'baking': [
+        ('Sourdough bread', 'Bake bread with flour, salt and a starter in a hot oven.'),
+        ('Pizza dough', 'Pizza dough needs flour, yeast and a very hot oven to bake.'),
+    ],
+    'garden': [
+        ('Tomato seedlings', 'Plant tomato seedlings in garden soil and water them daily.'),
+        ('Raised beds', 'Raised garden beds drain the soil; plant and water in spring.'),
+    ],
+}
+
+
+class FakeEmbeddings:
+    """Stands in for ``google.genai``: texts about ovens point one way, everything else another."""
+
+    def __init__(self):
+        self.calls = []
+
+    def Client(self, api_key=None):
+        return SimpleNamespace(models=SimpleNamespace(embed_content=self.embed_content))
+
+    def embed_content(self, model, contents, config):
+        self.calls.append(contents)
+        return SimpleNamespace(embeddings=[
+            SimpleNamespace(values=[1.0, 0.0, 0.0] if 'oven' in text else [0.0, 1.0, 0.0]) for text in contents
+        ])
+
+
+def add_post(user_id, title, content, published=True):
+    blog = Blog(
+        user_id=user_id, title=title, slug=title.lower().replace(' ', '-'), content_markdown=content,
+        is_published=published, published_at=datetime.utcnow() if published else None,
+    )
+    db.session.add(blog)
+    db.session.flush()
+    search.mark_stale([blog.id])
+    db.session.commit()
+    return blog.id
+
+
+@pytest.fixture
+def index_dir(app, tmp_path):
+    app.config['SEARCH_INDEX_DIR'] = str(tmp_path / 'search')
+    # One dimension per topic, so related words are folded together
+    app.config['SEARCH_DIMENSIONS'] = 3
+    return tmp_path / 'search'
+
+
+@pytest.fixture
+def corpus(index_dir, test_user):
+    posts = {topic: [add_post(test_user, title, content) for title, content in pairs] for topic, pairs in TOPICS.items()}
+    search.refresh()
+    return posts
+
+
+class TestEmbedding:
+    """Posts and queries land near posts on the same topic."""
+
+    def test_finds_posts_without_the_query_word(self, corpus):
+        assert set(search.search('automobile')) == set(corpus['cars'])
+        assert set(search.search('oven')) == set(corpus['baking'])
+        assert set(search.search('seedlings')) == set(corpus['garden'])
+
+    def test_unknown_words_find_nothing(self, corpus):
+        assert search.search('zzyzx') == []
+
+    def test_no_index_means_no_semantic_search(self, index_dir):
+        assert search.search('oven') is None
+
+    def test_changing_the_embedder_needs_a_rebuild(self, app, corpus):
+        app.config['SEARCH_DIMENSIONS'] = 4
+        assert search.search('oven') is None
+        assert search.refresh()['indexed'] == 6
+        assert search.search('oven')
+
+    def test_gemini_embedder(self, app, index_dir, test_user, monkeypatch):
+        fake = FakeEmbeddings()
+        monkeypatch.setattr(ai_routes, 'genai', fake)
+        app.config['SEARCH_EMBEDDER'] = 'gemini'
+        bread = add_post(test_user, 'Bread', 'Bake it in the oven.')
+        add_post(test_user, 'Soil', 'Dig the garden.')
+        assert search.refresh()['indexed'] == 2
+        assert search.search('oven') == [bread]
+        assert len(fake.calls) == 2
+
+
+class TestIndex:
+    """The index is updated in place and approximate search matches a full scan."""
+
+    def test_edits_are_indexed_incrementally(self, authenticated_client, corpus):
+        assert search.refresh() == {'indexed': 0, 'removed': 0}
+        moved = corpus['garden'][1]
+        authenticated_client.post(f'/posts/{moved}', data={
+            'title': 'Focaccia', 'description': '', 'content': 'Focaccia dough: flour, yeast and a hot oven.',
+        })
+        assert search.refresh() == {'indexed': 1, 'removed': 0}
+        assert moved in search.search('bread oven')
+        assert moved not in search.search('garden soil')
+
+    def test_unpublished_posts_leave_and_free_their_row(self, test_user, corpus):
+        gone = corpus['baking'][0]
+        tag_service.set_published(db.session.get(Blog, gone), False)
+        db.session.commit()
+        assert search.refresh() == {'indexed': 0, 'removed': 1}
+        assert gone not in search.search('oven')
+        add_post(test_user, 'Bagels', 'Boil bagels, then bake them in the oven.')
+        search.refresh()
+        index = search.open_index()
+        assert len(index.ids) == 6 and gone not in index.ids
+
+    def test_tag_renames_reindex_tagged_posts(self, test_user, corpus):
+        blog = db.session.get(Blog, corpus['cars'][0])
+        tag = tag_service.create_tags(test_user, ['diy'])[0]
+        tag_service.sync_blog_tags(blog, [tag.id])
+        db.session.commit()
+        assert search.refresh()['indexed'] == 1
+        tag_service.rename_tags(test_user, {tag.id: 'maintenance'})
+        db.session.commit()
+        assert search.refresh()['indexed'] == 1
+
+    def test_refresh_skips_while_another_process_writes(self, index_dir, corpus):
+        with open(index_dir / 'write.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            assert search.refresh(blocking=False) is None
+        assert search.refresh(blocking=False) == {'indexed': 0, 'removed': 0}
+
+    def test_index_grows_past_its_capacity(self, app, index_dir, test_user):
+        app.config['SEARCH_DIMENSIONS'] = 8
+        search.rebuild()
+        rows = [
+            {'user_id': test_user, 'title': f'Post {i}', 'slug': f'post-{i}', 'content_markdown': f'word{i % 40} word{i % 7}', 'is_published': True}
+            for i in range(1100)
+        ]
+        db.session.execute(Blog.__table__.insert(), rows)
+        search.mark_stale(range(1, 1101))
+        db.session.commit()
+        assert search.refresh()['indexed'] == 1100
+        index = search.open_index()
+        assert index.meta['capacity'] >= 1100
+        assert index.vectors.shape[0] == index.meta['capacity']
+
+    def test_partitions_match_a_full_scan(self, app, tmp_path):
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 16))
+        vectors = search._normalize(centers[rng.integers(0, 20, 2000)] + rng.normal(scale=0.3, size=(2000, 16)))
+        app.config['SEARCH_IVF_MIN_POSTS'] = 1000
+        writer = search.IndexWriter(str(tmp_path / 'ivf'), 'hashing', 16)
+        for blog_id, vector in enumerate(vectors, 1):
+            writer.put(blog_id, 1, vector)
+        writer.save()
+        meta = search._read_meta(str(tmp_path / 'ivf'))
+        index = search.VectorIndex(str(tmp_path / 'ivf'), meta)
+        assert meta['partitions'] == 44
+        found = total = 0
+        for query in search._normalize(centers + rng.normal(scale=0.3, size=centers.shape)):
+            exact = {blog_id for blog_id, _ in index.search(query, 20)}
+            approximate = index.search(query, 20, probes=6)
+            found += len(exact & {blog_id for blog_id, _ in approximate})
+            total += len(exact)
+            assert len(index.rows(query, 6)) < len(vectors) / 2
+        assert found / total > 0.9
+
+    def test_new_rows_join_a_partition(self, app, tmp_path):
+        rng = np.random.default_rng(2)
+        app.config['SEARCH_IVF_MIN_POSTS'] = 100
+        directory = str(tmp_path / 'ivf')
+        writer = search.IndexWriter(directory, 'hashing', 8)
+        for blog_id, vector in enumerate(search._normalize(rng.normal(size=(200, 8))), 1):
+            writer.put(blog_id, 1, vector)
+        writer.save()
+        writer = search.IndexWriter(directory, 'hashing', 8)
+        vector = search._normalize(rng.normal(size=8))
+        writer.put(500, 1, vector)
+        writer.remove(3)
+        writer.save()
+        index = search.VectorIndex(directory, search._read_meta(directory))
+        assert index.search(vector, 1, probes=1) == [(500, pytest.approx(1.0))]
+        assert 3 not in {blog_id for blog_id, _ in index.search(index.vectors[2], 200)}
+
+
+class TestDashboard:
+    """The feed searches by keyword, meaning or both."""
+
+    def test_semantic_mode(self, authenticated_client, corpus):
+        html = authenticated_client.get('/dashboard?q=automobile&mode=semantic').get_data(as_text=True)
+        assert 'Car repair' in html and 'Automobile engines' in html
+        assert 'Sourdough bread' not in html
+
+    def test_keyword_mode_is_unchanged(self, authenticated_client, corpus):
+        html = authenticated_client.get('/dashboard?q=automobile').get_data(as_text=True)
+        assert 'Automobile engines' in html and 'Car repair' not in html
+
+    def test_hybrid_ranks_keyword_and_semantic_hits(self, authenticated_client, test_user, corpus):
+        add_post(test_user, 'Automobile history', 'The first automobile was built in 1886.')
+        search.refresh()
+        html = authenticated_client.get('/dashboard?q=automobile&mode=hybrid').get_data(as_text=True)
+        assert 'Automobile history' in html and 'Car repair' in html
+        assert html.index('Automobile engines') < html.index('Car repair')
+
+    def test_falls_back_to_keywords_without_an_index(self, authenticated_client, index_dir, test_user):
+        add_post(test_user, 'Automobile engines', 'Engine oil.')
+        response = authenticated_client.get('/dashboard?q=automobile&mode=semantic')
+        assert 'Automobile engines' in response.get_data(as_text=True)
+
+    def test_hybrid_order(self):
+        assert search.hybrid([1, 2, 3], [3, 4]) == [3, 1, 2, 4]
+
+
+class TestCommand:
+    def test_index_command(self, runner, index_dir, test_user):
+        add_post(test_user, 'Bread', 'Bake bread.')
+        result = runner.invoke(args=['search', 'index'])
+        assert result.exit_code == 0
+        assert 'Indexed 1 posts, removed 0.' in result.output
+        assert 'Indexed 0 posts' in runner.invoke(args=['search', 'index']).output
+        assert 'Indexed 1 posts' in runner.invoke(args=['search', 'index', '--rebuild']).output
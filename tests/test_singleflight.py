@@ -0,0 +1,198 @@
+"""
+Tests for single-flight coalescing of identical concurrent work.
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import singleflight
+from app.ai import routes as ai_routes
+from app.main import routes as main_routes
+from app.models import db, AIUsage, Blog, SingleFlightLock
+from app.posts import channel
+from tests.test_asgi import SlowGenai, app, bridge, call, session_cookie  # noqa: F401
+
+
+class Slow:
+    """A call that blocks until released and counts how often it ran."""
+
+    def __init__(self, result='done', error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def run_concurrently(app, group, key, fn, callers=5, timeout=5):
+    """Start ``callers`` threads calling ``group.do``; the first is in flight before the rest start."""
+    results, errors = [], []
+
+    def worker():
+        with app.app_context():
+            try:
+                results.append(group.do(key, fn, timeout))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(callers)]
+    threads[0].start()
+    while not group.in_flight():
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    fn.release.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+class TestGroup:
+    """Concurrent calls with one key run once and share the outcome."""
+
+    def test_followers_share_the_result(self, app):
+        fn = Slow()
+        results, errors = run_concurrently(app, singleflight.Group(), 'k', fn)
+        assert results == ['done'] * 5 and not errors
+        assert fn.calls == 1
+
+    def test_followers_share_the_exception(self, app):
+        fn = Slow(error=ValueError('boom'))
+        results, errors = run_concurrently(app, singleflight.Group(), 'k', fn)
+        assert not results and len(errors) == 5
+        assert fn.calls == 1
+
+    def test_results_are_not_cached(self, app):
+        group = singleflight.Group()
+        fn = Slow()
+        fn.release.set()
+        group.do('k', fn)
+        group.do('k', fn)
+        assert fn.calls == 2 and not group.in_flight()
+
+    def test_followers_stop_waiting_after_the_timeout(self, app):
+        fn = Slow()
+        results, errors = run_concurrently(app, singleflight.Group(), 'k', fn, callers=2, timeout=0.01)
+        assert results == ['done', 'done']
+        assert fn.calls == 2
+
+    def test_keys_are_stable(self):
+        assert singleflight.key('ai', 1, 'prompt') == singleflight.key('ai', 1, 'prompt')
+        assert singleflight.key('ai', 1, 'prompt') != singleflight.key('ai', 2, 'prompt')
+
+
+class TestSharedLock:
+    """With SINGLEFLIGHT_SHARED, other processes' calls are found through the lock table."""
+
+    @pytest.fixture(autouse=True)
+    def shared(self, app):
+        app.config['SINGLEFLIGHT_SHARED'] = True
+
+    def lock(self, parts, **values):
+        values.setdefault('expires_at', datetime.utcnow() + timedelta(minutes=1))
+        db.session.add(SingleFlightLock(key=singleflight.key('test', *parts), owner='other', **values))
+        db.session.commit()
+
+    def test_result_of_another_process_is_reused(self, app):
+        self.lock(['a'], done=True, result=json.dumps({'text': 'theirs'}))
+        assert singleflight.do('test', ['a'], lambda: pytest.fail('should not run'), shared=True) == {'text': 'theirs'}
+
+    def test_leader_publishes_its_result(self, app):
+        assert singleflight.do('test', ['b'], lambda: 'mine', shared=True) == 'mine'
+        row = SingleFlightLock.query.one()
+        assert row.done and json.loads(row.result) == 'mine'
+
+    def test_expired_lock_is_taken_over(self, app):
+        self.lock(['c'], done=False, expires_at=datetime.utcnow() - timedelta(seconds=1))
+        assert singleflight.do('test', ['c'], lambda: 'mine', shared=True) == 'mine'
+        assert SingleFlightLock.query.one().owner != 'other'
+
+    def test_held_lock_times_out(self, app):
+        app.config['SINGLEFLIGHT_TIMEOUT'] = 0.2
+        self.lock(['d'], done=False)
+        assert singleflight.do('test', ['d'], lambda: 'mine', shared=True) == 'mine'
+
+    def test_failure_releases_the_lock(self, app):
+        with pytest.raises(RuntimeError):
+            singleflight.do('test', ['e'], lambda: (_ for _ in ()).throw(RuntimeError('down')), shared=True)
+        assert SingleFlightLock.query.count() == 0
+
+
+class TestRoutes:
+    """AI calls, markdown previews and overlay loads are coalesced."""
+
+    def test_identical_ai_calls_on_the_loop_run_once(self, app, bridge, session_cookie, monkeypatch):  # noqa: F811
+        fake = SlowGenai(delay=0.2)
+        monkeypatch.setattr(ai_routes, 'genai', fake)
+        headers = (('Content-Type', 'application/json'), ('Cookie', session_cookie))
+        body = b'{"title": "Title", "content": "Body"}'
+
+        async def burst():
+            return await asyncio.gather(*(
+                call(bridge, 'POST', '/api/ai/generate-description', body, headers) for _ in range(5)
+            ))
+
+        results = asyncio.run(burst())
+        assert [status for status, _, _ in results] == [200] * 5
+        assert len({b''.join(chunk['body'] for chunk in chunks) for _, _, chunks in results}) == 1
+        assert len(fake.calls) == 1
+        # One reservation and one settlement: the followers weren't charged
+        assert AIUsage.query.count() == 2
+
+    def test_identical_previews_render_once(self, app, monkeypatch):
+        renders = []
+        release = threading.Event()
+
+        class Renderer:
+            def render(self, text):
+                renders.append(text)
+                release.wait(5)
+                return '<p>hi</p>'
+
+        monkeypatch.setattr(channel, 'renderer', Renderer)
+        responses = []
+
+        def preview():
+            responses.append(app.test_client().get('/posts/render-markdown?text=hi').get_json())
+
+        threads = [threading.Thread(target=preview) for _ in range(4)]
+        threads[0].start()
+        while not renders:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert responses == [{'html': '<p>hi</p>'}] * 4
+        assert renders == ['hi']
+
+    def test_overlay_loads_are_keyed_by_version(self, authenticated_client, test_user, monkeypatch):
+        blog = Blog(user_id=test_user, title='Post', slug='post', content_markdown='Body', is_published=True)
+        db.session.add(blog)
+        db.session.commit()
+        keys = []
+        original = singleflight.do
+
+        def recording(name, parts, fn, shared=False):
+            keys.append((name, parts))
+            return original(name, parts, fn, shared)
+
+        monkeypatch.setattr(main_routes.singleflight, 'do', recording)
+        assert authenticated_client.get(f'/api/blog/{blog.id}').get_json()['title'] == 'Post'
+        authenticated_client.post(f'/posts/{blog.id}', data={'title': 'Post', 'content': 'Edited'})
+        authenticated_client.get(f'/api/blog/{blog.id}')
+        assert [name for name, _ in keys] == ['api-blog', 'api-blog']
+        assert keys[0][1][0] == blog.id and keys[0][1] != keys[1][1]
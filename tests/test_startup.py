@@ -0,0 +1,68 @@
+"""
+Import-time budget for the application factory.
+
+Runs ``create_app`` in a fresh interpreter under ``python -X importtime`` so
+heavy dependencies creeping back into the startup path fail the suite.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Loaded on first use only: the AI SDKs, Alembic, the markdown renderer and numpy/scipy
+LAZY_MODULES = ('google.genai', 'openai', 'alembic', 'flask_migrate', 'markdown_it', 'numpy', 'scipy')
+# Modules computing with numpy/scipy, which they take from app.numeric
+NUMERIC_MODULES = ('app.search', 'app.public.related', 'app.posts.duplicates')
+# Total self time of every import, generous enough for slow CI machines
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '1500'))
+
+
+@pytest.fixture(scope='module')
+def import_times():
+    """Map each module imported by ``create_app`` to its self time in microseconds."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', "from app import create_app; create_app('testing')"],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_us)
+    return times
+
+
+class TestStartup:
+    """Cold start stays cheap for workers, CLI commands and test collection."""
+
+    @pytest.mark.parametrize('module', LAZY_MODULES)
+    def test_heavy_module_not_imported(self, import_times, module):
+        assert module not in import_times
+
+    def test_import_time_budget(self, import_times):
+        total_ms = sum(import_times.values()) / 1000
+        assert total_ms < IMPORT_BUDGET_MS, f'imports took {total_ms:.0f} ms'
+
+    @pytest.mark.parametrize('module', NUMERIC_MODULES)
+    def test_numeric_modules_import_numpy_on_first_use(self, module):
+        script = (
+            'import importlib, sys\n'
+            f'module = importlib.import_module({module!r})\n'
+            "assert not {'numpy', 'scipy'} & set(sys.modules), 'imported at start-up'\n"
+            'from app import numeric\n'
+            'assert module.np is numeric.np\n'
+            'module.np.zeros(1)\n'
+            "assert 'numpy' in sys.modules\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+
+    def test_migrate_commands_still_available(self, runner):
+        result = runner.invoke(args=['db', '--help'])
+        assert result.exit_code == 0
+        assert 'upgrade' in result.output
@@ -0,0 +1,143 @@
+"""
+Tests for the denormalized tag usage counters and the tag cloud endpoint.
+"""
+import pytest
+from datetime import datetime
+from flask import url_for
+from app.models import db, Blog, Tag, TagNameCount, User
+from app.posts import tags as tag_service
+
+
+@pytest.fixture
+def tags(app, test_user):
+    created = [Tag(user_id=test_user, name=name) for name in ('python', 'pytest', 'flask')]
+    db.session.add_all(created)
+    db.session.commit()
+    return {tag.name: tag.id for tag in created}
+
+
+def _blog(user_id, title, published=True):
+    blog = Blog(
+        user_id=user_id,
+        title=title,
+        slug=title.lower().replace(' ', '-'),
+        content_markdown='content',
+        is_published=published,
+        published_at=datetime.utcnow() if published else None,
+    )
+    db.session.add(blog)
+    db.session.commit()
+    return blog.id
+
+
+def _counts(tag_id):
+    tag = db.session.get(Tag, tag_id)
+    return tag.blog_count, tag.published_count
+
+
+def _global(name):
+    row = db.session.get(TagNameCount, name)
+    return row.published_count if row else 0
+
+
+class TestTagCounters:
+    """Counters move in the same transaction as the change that caused them."""
+
+    def test_update_blog_counts_tags(self, authenticated_client, test_user, tags):
+        blog_id = _blog(test_user, 'First')
+
+        authenticated_client.post(
+            url_for('posts.update_blog', blog_id=blog_id),
+            data={'title': 'First', 'content': 'c', 'tags': [str(tags['python']), str(tags['flask'])]},
+        )
+        assert _counts(tags['python']) == (1, 1)
+        assert _global('python') == 1
+
+        authenticated_client.post(
+            url_for('posts.update_blog', blog_id=blog_id),
+            data={'title': 'First', 'content': 'c', 'tags': [str(tags['flask'])]},
+        )
+        assert _counts(tags['python']) == (0, 0)
+        assert _counts(tags['flask']) == (1, 1)
+        assert _global('python') == 0
+
+    def test_publish_moves_published_counts(self, authenticated_client, test_user, tags):
+        blog_id = _blog(test_user, 'Draft', published=False)
+        blog = db.session.get(Blog, blog_id)
+        tag_service.sync_blog_tags(blog, [tags['python']])
+        db.session.commit()
+        assert _counts(tags['python']) == (1, 0)
+        assert _global('python') == 0
+
+        # Auto-save publishes the draft
+        authenticated_client.post(
+            url_for('posts.auto_save'),
+            json={'blog_id': blog_id, 'title': 'Draft', 'content': 'c'},
+        )
+        assert _counts(tags['python']) == (1, 1)
+        assert _global('python') == 1
+
+    def test_global_counts_span_users(self, app, test_user, tags):
+        other = User(google_sub='other', email='other@example.com')
+        db.session.add(other)
+        db.session.commit()
+        other_tag = Tag(user_id=other.id, name='python')
+        db.session.add(other_tag)
+        db.session.commit()
+
+        for user_id, tag_id in ((test_user, tags['python']), (other.id, other_tag.id)):
+            blog = db.session.get(Blog, _blog(user_id, f'Post {user_id}'))
+            tag_service.sync_blog_tags(blog, [tag_id])
+        db.session.commit()
+
+        assert _global('python') == 2
+
+    def test_bulk_operations_keep_counters_exact(self, app, test_user, tags):
+        blogs = [_blog(test_user, f'Post {i}') for i in range(3)]
+        tag_service.retag_blogs(test_user, blogs, add_ids=[tags['pytest'], tags['flask']])
+        db.session.commit()
+        assert _counts(tags['pytest']) == (3, 3)
+
+        tag_service.merge_tags(test_user, [tags['pytest']], tags['python'])
+        tag_service.rename_tags(test_user, {tags['flask']: 'web'})
+        db.session.commit()
+
+        assert _counts(tags['python']) == (3, 3)
+        assert _global('python') == 3
+        assert _global('pytest') == 0
+        assert _global('flask') == 0
+        assert _global('web') == 3
+
+        tag_service.refresh_all_counts()
+        db.session.commit()
+        assert _counts(tags['python']) == (3, 3)
+        assert _global('web') == 3
+
+
+class TestTagCloudEndpoint:
+    """The tag cloud reads counters with a prefix range scan."""
+
+    def test_prefix_lookup_sorted_by_usage(self, authenticated_client, test_user, tags):
+        blogs = [_blog(test_user, f'Post {i}') for i in range(2)]
+        tag_service.retag_blogs(test_user, blogs, add_ids=[tags['python']])
+        tag_service.retag_blogs(test_user, blogs[:1], add_ids=[tags['pytest'], tags['flask']])
+        db.session.commit()
+
+        response = authenticated_client.get(url_for('posts.tag_cloud', q='Py'))
+        assert response.status_code == 200
+        assert response.get_json()['tags'] == [
+            {'name': 'python', 'count': 2},
+            {'name': 'pytest', 'count': 1},
+        ]
+
+    def test_mine_scope_includes_unused_tags(self, authenticated_client, tags):
+        response = authenticated_client.get(url_for('posts.tag_cloud', scope='mine', q='fl'))
+        assert response.get_json()['tags'] == [{'name': 'flask', 'count': 0}]
+
+    def test_tags_page_shows_counts(self, authenticated_client, test_user, tags):
+        blog = db.session.get(Blog, _blog(test_user, 'Counted'))
+        tag_service.sync_blog_tags(blog, [tags['flask']])
+        db.session.commit()
+
+        response = authenticated_client.get(url_for('posts.list_tags'))
+        assert b'1 post' in response.data
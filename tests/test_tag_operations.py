@@ -0,0 +1,176 @@
+"""
+Tests for set-difference tag syncing and the bulk tag endpoints.
+"""
+import pytest
+from datetime import datetime
+from flask import url_for
+from sqlalchemy import event, select
+from app.models import db, Blog, RelatedPosts, Tag, blog_tags
+
+
+@pytest.fixture
+def tags(app, test_user):
+    """Create a few tags for the test user and return their ids by name."""
+    created = [Tag(user_id=test_user, name=name) for name in ('python', 'flask', 'web', 'ai')]
+    db.session.add_all(created)
+    db.session.commit()
+    return {tag.name: tag.id for tag in created}
+
+
+@pytest.fixture
+def blogs(app, test_user):
+    """Create three blogs for the test user and return their ids."""
+    created = [
+        Blog(
+            user_id=test_user,
+            title=f'Post {i}',
+            slug=f'post-{i}',
+            content_markdown='content',
+            is_published=True,
+            published_at=datetime.utcnow(),
+        )
+        for i in range(3)
+    ]
+    db.session.add_all(created)
+    db.session.commit()
+    return [blog.id for blog in created]
+
+
+def _pairs(blog_id=None):
+    query = select(blog_tags.c.blog_id, blog_tags.c.tag_id)
+    if blog_id is not None:
+        query = query.where(blog_tags.c.blog_id == blog_id)
+    return {tuple(row) for row in db.session.execute(query)}
+
+
+def _set_tags(blog_id, tag_ids):
+    db.session.execute(blog_tags.insert(), [{'blog_id': blog_id, 'tag_id': t} for t in tag_ids])
+    db.session.commit()
+
+
+class TestSyncBlogTags:
+    """update_blog only touches association rows that changed."""
+
+    def test_update_inserts_and_deletes_only_the_difference(self, authenticated_client, blogs, tags):
+        blog_id = blogs[0]
+        _set_tags(blog_id, [tags['python'], tags['flask']])
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'blog_tags' in statement and not statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement.split()[0].upper())
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = authenticated_client.post(
+                url_for('posts.update_blog', blog_id=blog_id),
+                data={'title': 'Post 0', 'content': 'content', 'tags': [str(tags['python']), str(tags['web'])]},
+            )
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        assert response.status_code == 302
+        assert _pairs(blog_id) == {(blog_id, tags['python']), (blog_id, tags['web'])}
+        assert statements == ['DELETE', 'INSERT']
+
+    def test_unchanged_tags_issue_no_writes(self, authenticated_client, blogs, tags):
+        blog_id = blogs[0]
+        _set_tags(blog_id, [tags['python']])
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'blog_tags' in statement and not statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            authenticated_client.post(
+                url_for('posts.update_blog', blog_id=blog_id),
+                data={'title': 'Post 0', 'content': 'content', 'tags': [str(tags['python'])]},
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert statements == []
+        assert _pairs(blog_id) == {(blog_id, tags['python'])}
+
+
+class TestBulkTagEndpoints:
+    """Bulk create/rename/merge/delete and retag many posts."""
+
+    def test_bulk_create_dedupes(self, authenticated_client, tags, test_user):
+        response = authenticated_client.post(
+            url_for('posts.bulk_tags'),
+            json={'create': ['Python', 'rust', ' Rust ', 'go', '']},
+        )
+        assert response.status_code == 200
+        names = sorted(tag['name'] for tag in response.get_json()['created'])
+        assert names == ['go', 'rust']
+        assert Tag.query.filter_by(user_id=test_user).count() == 6
+
+    def test_bulk_rename_conflict_rolls_back(self, authenticated_client, tags):
+        response = authenticated_client.post(
+            url_for('posts.bulk_tags'),
+            json={'create': ['new-tag'], 'rename': {str(tags['web']): 'python'}},
+        )
+        assert response.status_code == 400
+        assert Tag.query.filter_by(name='new-tag').first() is None
+        assert db.session.get(Tag, tags['web']).name == 'web'
+
+    def test_bulk_merge_and_delete(self, authenticated_client, blogs, tags):
+        _set_tags(blogs[0], [tags['python'], tags['flask']])
+        _set_tags(blogs[1], [tags['flask']])
+        _set_tags(blogs[2], [tags['ai']])
+
+        response = authenticated_client.post(
+            url_for('posts.bulk_tags'),
+            json={
+                'rename': {str(tags['web']): 'webdev'},
+                'merge': {'into': tags['python'], 'from': [tags['flask']]},
+                'delete': [tags['ai']],
+            },
+        )
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['merged'] == [tags['flask']]
+        assert data['deleted'] == [tags['ai']]
+
+        assert _pairs() == {(blogs[0], tags['python']), (blogs[1], tags['python'])}
+        assert db.session.get(Tag, tags['web']).name == 'webdev'
+        assert db.session.get(Tag, tags['flask']) is None
+        assert db.session.get(Tag, tags['ai']) is None
+
+    def test_rename_flags_only_the_tagged_posts(self, authenticated_client, blogs, tags):
+        _set_tags(blogs[0], [tags['web']])
+
+        response = authenticated_client.post(url_for('posts.bulk_tags'), json={'rename': {str(tags['web']): 'webdev'}})
+        assert response.status_code == 200
+        stale = {row.blog_id for row in RelatedPosts.query if row.version > row.built_version}
+        assert stale == {blogs[0]}
+
+    def test_bulk_retag(self, authenticated_client, blogs, tags):
+        _set_tags(blogs[0], [tags['python'], tags['ai']])
+
+        response = authenticated_client.post(
+            url_for('posts.bulk_retag'),
+            json={'blog_ids': blogs, 'add': [tags['python']], 'remove': [tags['ai']]},
+        )
+        assert response.status_code == 200
+        assert response.get_json() == {'added': 2, 'removed': 1}
+        assert _pairs() == {(blog_id, tags['python']) for blog_id in blogs}
+
+    def test_bulk_retag_ignores_other_users_tags(self, authenticated_client, blogs, tags):
+        other = Tag(user_id=999, name='foreign')
+        db.session.add(other)
+        db.session.commit()
+
+        response = authenticated_client.post(
+            url_for('posts.bulk_retag'),
+            json={'blog_ids': blogs, 'add': [other.id]},
+        )
+        assert response.status_code == 200
+        assert response.get_json() == {'added': 0, 'removed': 0}
+        assert _pairs() == set()